@@ -32,6 +32,7 @@ MODULE_TITLE_DICT = {
     "caprieval": "CAPRI Evaluation module",
     "contactmap": "Contact Map module",
     "clustrmsd": "RMSD Clustering module",
+    "clustleader": "Matrix-free RMSD Clustering module",
     "rmsdmatrix": "RMSD Matrix calculation module",
     "seletop": "Selection of top models module",
     "seletopclusts": "Selection of top clusters module",
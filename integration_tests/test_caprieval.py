@@ -360,9 +360,6 @@ def evaluate_caprieval_execution(
 
     # Check if the files were written
     expected_files = [
-        "blosum62.izone",
-        "blosum62_A.aln",
-        "blosum62_B.aln",
         "capri_clt.tsv",
         "capri_ss.tsv",
     ]
@@ -371,6 +368,9 @@ def evaluate_caprieval_execution(
         assert Path(module.path, file).exists(), f"{file} does not exist"
         assert Path(module.path, file).stat().st_size > 0, f"{file} is empty"
 
+    # the alignment files are only written with `write_alignment`
+    assert not Path(module.path, "blosum62.izone").exists()
+
     # Check if the `output_models` are the same as the `input_models`
     #  they will change locations, so check the filenames
     assert module.output_models[0].file_name == model_list[0].file_name
@@ -425,3 +425,30 @@ def test_ss_clt_relation(caprieval_module):
             target_metric=metric,
             top_n=caprieval_module.params["clt_threshold"],
         )
+
+
+def test_caprieval_references(caprieval_module):
+    """Check the models are evaluated against an ensemble of references."""
+    ensemble = Path(caprieval_module.path, "references.pdb")
+    with open(ensemble, "w") as fh:
+        for i, name in enumerate(
+            ("protprot_complex_1.pdb", "protprot_complex_2.pdb"), start=1
+        ):
+            fh.write(f"MODEL        {i}\n")
+            lines = Path(UNITTESTS_GOLDEN_DATA, name).read_text().splitlines(True)
+            fh.writelines(line for line in lines if line.startswith("ATOM"))
+            fh.write("ENDMDL\n")
+        fh.write("END\n")
+    caprieval_module.params["reference_fname"] = str(ensemble)
+    caprieval_module.previous_io = MockPreviousIO(path=caprieval_module.path)
+    caprieval_module.run()
+
+    capri_ss_l = Path(caprieval_module.path, "capri_ss.tsv").read_text().splitlines()
+    header = capri_ss_l[0].split("\t")
+    for line in capri_ss_l[1:]:
+        data = dict(zip(header, line.split("\t")))
+        # each model is one of the references
+        assert float(data["irmsd"]) == pytest.approx(0.0)
+        assert float(data["dockq"]) == pytest.approx(1.0)
+        assert sorted([data["irmsd_ref1"], data["irmsd_ref2"]])[0] == "0.000"
+        assert float(data["irmsd_ref1"]) != float(data["irmsd_ref2"])
@@ -50,6 +50,7 @@ class MockPreviousIO:
 def fixture_output_list():
     """Clustfcc output list."""
     return [
+        "fcc.npy",
         "fcc.matrix",
         "cluster.out",
         "protprot_complex_1.con",
@@ -72,6 +73,8 @@ def test_clustfcc(fcc_module, output_list):
     """Test clustfcc output."""
     fcc_module.previous_io = MockPreviousIO(path=fcc_module.path)
     fcc_module.params["plot_matrix"] = True
+    fcc_module.params["text_matrix"] = True
+    fcc_module.params["write_contacts"] = True
 
     fcc_module.run()
 
@@ -92,7 +95,7 @@ def test_clustfcc(fcc_module, output_list):
     assert observed_fcc_matrix == expected_fcc_output
 
     # Check .con files
-    expected_output_length = [100, 119]
+    expected_output_length = [20, 16]
 
     observed_contact_files = [
         Path(fcc_module.path, "protprot_complex_1.con"),
@@ -76,6 +76,7 @@ class MockPreviousIO_protprot:
 def test_ilrmsdmatrix_default(ilrmsdmatrix_module, mocker):
     """Test the topoaa module."""
     ilrmsdmatrix_module.previous_io = MockPreviousIO(path=ilrmsdmatrix_module.path)
+    ilrmsdmatrix_module.params["text_matrix"] = True
     mocker.patch(
         "haddock.modules.BaseHaddockModule.export_io_models",
         return_value=None,
@@ -105,6 +106,7 @@ def test_ilrmsdmatrix_run(ilrmsdmatrix_module, mocker):
     ilrmsdmatrix_module.previous_io = MockPreviousIO_protprot(
         path=ilrmsdmatrix_module.path
     )
+    ilrmsdmatrix_module.params["text_matrix"] = True
     mocker.patch(
         "haddock.modules.BaseHaddockModule.export_io_models",
         return_value=None,
@@ -139,6 +141,7 @@ def test_ilrmsdmatrix_run_swappedchains(ilrmsdmatrix_module, mocker):
     ilrmsdmatrix_module.previous_io = MockPreviousIO_protprot(
         path=ilrmsdmatrix_module.path
     )
+    ilrmsdmatrix_module.params["text_matrix"] = True
     ilrmsdmatrix_module.params["receptor_chain"] = "B"
     ilrmsdmatrix_module.params["ligand_chains"] = ["A"]
 
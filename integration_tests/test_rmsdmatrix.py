@@ -46,6 +46,7 @@ class MockPreviousIO:
 def test_rmsdmatrix_default(rmsdmatrix_module, mocker):
     """Test the rmsdmatrix module."""
     rmsdmatrix_module.previous_io = MockPreviousIO(path=rmsdmatrix_module.path)
+    rmsdmatrix_module.params["text_matrix"] = True
     mocker.patch(
         "haddock.modules.BaseHaddockModule.export_io_models", return_value=None
     )
@@ -53,6 +54,7 @@ def test_rmsdmatrix_default(rmsdmatrix_module, mocker):
     # expected paths
     exp_rmsd_matrix = Path(rmsdmatrix_module.path, "rmsd.matrix")
     assert exp_rmsd_matrix.exists(), "rmsd.matrix does not exist"
+    assert Path(rmsdmatrix_module.path, "rmsd.npy").exists()
     # open files and check content
     with open(exp_rmsd_matrix) as f:
         assert f.readline() == "1 2 3.326\n"
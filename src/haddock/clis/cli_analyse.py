@@ -266,10 +266,6 @@ def run_capri_analysis(
     io = ModuleIO()
     filename = Path("..", f"{step}/io.json")
     io.load(filename)
-    # unpack the files if they are compressed
-    if is_cleaned:
-        path_to_unpack = io.output[0].path
-        haddock3_unpack(path_to_unpack, ncores=ncores)
     # define step_order. We add one to it, as the caprieval module will
     # interpret itself as being after the selected step
     step_order = int(step.split("_")[0]) + 1
@@ -283,12 +279,19 @@ def run_capri_analysis(
     # updating mode and ncores
     caprieval_module.params["mode"] = mode
     caprieval_module.params["ncores"] = ncores
+    # gzipped models are read directly, only the structural alignment
+    #  needs the files to be unpacked
+    alignment_method = caprieval_module.params["alignment_method"]
+    unpack = is_cleaned and alignment_method == "structure"
+    if unpack:
+        path_to_unpack = io.output[0].path
+        haddock3_unpack(path_to_unpack, ncores=ncores)
     # update model info
     caprieval_module.previous_io = io
     # run capri module
     caprieval_module._run()
     # compress files if they should be compressed
-    if is_cleaned:
+    if unpack:
         haddock3_clean(path_to_unpack, ncores=ncores)
 
 
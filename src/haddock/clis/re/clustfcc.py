@@ -16,9 +16,13 @@ from haddock.libs.libclust import (
     rank_clusters,
     write_structure_list,
     )
-from haddock.libs.libfcc import read_matrix
+from haddock.libs.libfcc import read_neighbor_graph
 from haddock.libs.libinteractive import look_for_capri, rewrite_capri_tables
 from haddock.libs.libontology import ModuleIO
+from haddock.modules.analysis.clustfcc import (
+    FCC_MATRIX_FNAME,
+    FCC_TEXT_MATRIX_FNAME,
+    )
 from haddock.modules.analysis.clustfcc.clustfcc import (
     get_cluster_centers,
     iterate_clustering,
@@ -134,16 +138,19 @@ def reclustfcc(
         clustfcc_params["min_population"] = min_population
     clustfcc_params["plot_matrix"] = plot_matrix
 
-    # load the fcc matrix
-    pool = read_matrix(
-        Path(clustfcc_dir, "fcc.matrix"),
+    # load the fcc matrix, binary or text for runs of former versions
+    fcc_matrix_f = Path(clustfcc_dir, FCC_MATRIX_FNAME)
+    if not fcc_matrix_f.exists():
+        fcc_matrix_f = Path(clustfcc_dir, FCC_TEXT_MATRIX_FNAME)
+    graph = read_neighbor_graph(
+        fcc_matrix_f,
         clustfcc_params["clust_cutoff"],
         clustfcc_params["strictness"],
     )
 
     # iterate clustering until at least one cluster is found
     clusters, min_population = iterate_clustering(
-        pool, clustfcc_params["min_population"]
+        graph, clustfcc_params["min_population"]
     )
     clustfcc_params["min_population"] = min_population
     log.info(f"Updated clustering parameters: {clustfcc_params}")
@@ -201,7 +208,7 @@ def reclustfcc(
         html_matrix_basepath = Path(outdir, "fcc_matrix")
         # Plot matrix
         html_matrixpath = plot_cluster_matrix(
-            Path(clustfcc_dir, "fcc.matrix"),
+            fcc_matrix_f,
             final_order_idx,
             labels,
             dttype="FCC",
@@ -1,6 +1,5 @@
 """haddock3-re clustrmsd subcommand."""
 from pathlib import Path
-import numpy as np
 
 from haddock import log
 from haddock.core.defaults import INTERACTIVE_RE_SUFFIX
@@ -22,7 +21,10 @@ from haddock.modules.analysis.clustrmsd.clustrmsd import (
     get_clusters,
     get_matrix_path,
     iterate_min_population,
+    load_dendrogram,
     order_clusters,
+    scan_clust_cutoffs,
+    write_clust_cutoffs_scan,
     write_clusters,
     write_clustrmsd_file,
     )
@@ -68,6 +70,19 @@ def add_clustrmsd_arguments(clustrmsd_subcommand):
         action='store_true',
         )
 
+    clustrmsd_subcommand.add_argument(
+        "-s",
+        "--scan_cutoffs",
+        help=(
+            "clustering cutoff distances to scan. The number of clusters and "
+            "their populations are reported for each distance, without "
+            "reclustering."
+            ),
+        required=False,
+        nargs="+",
+        type=float,
+        )
+
     return clustrmsd_subcommand
 
 
@@ -77,6 +92,7 @@ def reclustrmsd(
         clust_cutoff: Union[bool, float] = None,
         min_population: Union[bool, int] = None,
         plot_matrix: bool = True,
+        scan_cutoffs: Optional[list[float]] = None,
         ) -> Path:
     """
     Recluster the models in the clustrmsd directory.
@@ -97,6 +113,11 @@ def reclustrmsd(
     
     plot_matrix : bool
         Should the corresponding matrix plot be generated.
+
+    scan_cutoffs : list[float], optional
+        Clustering cutoff distances to scan. If given, the number of
+        clusters and their populations at each distance are written to
+        `clustrmsd_scan.tsv` and the models are not reclustered.
     
     Returns
     -------
@@ -144,14 +165,31 @@ def reclustrmsd(
 
     clustrmsd_params["plot_matrix"] = plot_matrix
 
+    # load the clustering dendrogram
+    dendrogram = load_dendrogram(clustrmsd_dir)
+
+    if scan_cutoffs:
+        scan = scan_clust_cutoffs(
+            dendrogram,
+            scan_cutoffs,
+            clustrmsd_params["min_population"],
+            )
+        for cut in scan:
+            log.info(
+                f"clust_cutoff = {cut['clust_cutoff']}: "
+                f"{cut['n_valid_clusters']} clusters with at least "
+                f"{clustrmsd_params['min_population']} models "
+                f"({cut['n_clusters']} in total), populations "
+                f"{cut['populations']}"
+                )
+        write_clust_cutoffs_scan(scan, Path(outdir, "clustrmsd_scan.tsv"))
+        return outdir
+
     log.info(
         f"Clustering with {tolerance_param_name} = {tolerance}, "
         f"and criterion {clustrmsd_params['criterion']}"
         )
     
-    # load the clustering dendrogram
-    dendrogram = np.loadtxt(Path(clustrmsd_dir, "dendrogram.txt"))
-
     # get the clusters
     cluster_arr = get_clusters(
         dendrogram,
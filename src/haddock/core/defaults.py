@@ -24,7 +24,6 @@ if not cns_exec.exists():
     else:
         cns_exec = Path(_cns_exec)
 
-CONTACT_FCC_EXEC = Path(files("haddock").joinpath("bin/contact_fcc"))  # type: ignore
 FAST_RMSDMATRIX_EXEC = Path(files("haddock").joinpath("bin/fast-rmsdmatrix"))  # type: ignore
 
 MODULE_PATH_NAME = "step_"
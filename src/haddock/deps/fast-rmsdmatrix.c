@@ -8,6 +8,15 @@
 #include <unistd.h>
 #include <limits.h>
 #include <stdbool.h>
+#include <stdint.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+/* binary trajectory: 8 bytes magic, int32 frames, int32 atoms, float32 xyz */
+#define BINARY_TRAJ_MAGIC "HDTRAJ01"
+#define BINARY_TRAJ_MAGIC_SIZE 8
+#define BINARY_TRAJ_HEADER_SIZE 16
 
 typedef struct traj{
     int frames;             /*!< number of frames in the trajectory */
@@ -803,6 +812,88 @@ void read_TrajectoryFile(char *TrajFileName, traj *Trajectory){
 }
 
 
+int is_binary_trajectory(char *TrajFileName){
+    /**
+    * routine that checks whether the trajectory file starts with the binary magic string
+    *
+    * Parameters
+    * ----------
+    *
+    * `TrajFileName` : trajectory filename
+    */
+    char magic[BINARY_TRAJ_MAGIC_SIZE];
+    FILE *ft = fopen(TrajFileName, "rb");
+    if (ft == NULL) {
+        printf("Error. Cannot open trajectory file %s\n", TrajFileName);
+        exit(EXIT_FAILURE);
+    }
+    size_t nread = fread(magic, 1, BINARY_TRAJ_MAGIC_SIZE, ft);
+    fclose(ft);
+    return nread == BINARY_TRAJ_MAGIC_SIZE && memcmp(magic, BINARY_TRAJ_MAGIC, BINARY_TRAJ_MAGIC_SIZE) == 0;
+}
+
+void read_BinaryTrajectoryFile(char *TrajFileName, traj *Trajectory){
+    /**
+    * routine that memory-maps a binary trajectory file, as written by haddock3
+    *
+    * Parameters
+    * ----------
+    *
+    * `TrajFileName` : trajectory filename
+    *
+    * `Trajectory` : traj object
+    */
+    int fd, i, j;
+    struct stat st;
+    int32_t header[2];
+    size_t expected_size;
+
+    printf("Reading binary Trajectory FILE %s\n", TrajFileName);
+    fd = open(TrajFileName, O_RDONLY);
+    if (fd == -1 || fstat(fd, &st) == -1) {
+        printf("Error. Cannot open trajectory file %s\n", TrajFileName);
+        exit(EXIT_FAILURE);
+    }
+    unsigned char *data = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (data == MAP_FAILED) {
+        printf("Error. Cannot map trajectory file %s\n", TrajFileName);
+        exit(EXIT_FAILURE);
+    }
+    memcpy(header, data + BINARY_TRAJ_MAGIC_SIZE, sizeof(header));
+    if (header[0] != Trajectory->frames || header[1] != Trajectory->n_at) {
+        printf("Error. Binary trajectory has %d frames of %d atoms, expected %d frames of %d atoms.\nAborting\n",
+                header[0], header[1], Trajectory->frames, Trajectory->n_at);
+        exit(EXIT_FAILURE);
+    }
+    expected_size = BINARY_TRAJ_HEADER_SIZE + (size_t) Trajectory->frames * Trajectory->n_at * 3 * sizeof(float);
+    if ((size_t) st.st_size != expected_size) {
+        printf("Error. Binary trajectory size %ld, expected %ld. Trajectory incomplete.\nAborting\n",
+                (long) st.st_size, (long) expected_size);
+        exit(EXIT_FAILURE);
+    }
+    float *coords = (float *) (data + BINARY_TRAJ_HEADER_SIZE);
+    for (i = 0; i < Trajectory->frames; i++) {
+        for (j = 0; j < 3 * Trajectory->n_at; j++) {
+            Trajectory->traj_coords[i][j] = coords[(size_t) i * 3 * Trajectory->n_at + j];
+        }
+    }
+    munmap(data, st.st_size);
+    close(fd);
+}
+
+void read_Trajectory(char *TrajFileName, traj *Trajectory){
+    /**
+    * routine that reads a binary or xyz trajectory file
+    */
+    if (is_binary_trajectory(TrajFileName)) {
+        read_BinaryTrajectoryFile(TrajFileName, Trajectory);
+    }
+    else {
+        read_TrajectoryFile(TrajFileName, Trajectory);
+    }
+}
+
+
 int main(int argc, char *argv[]) {
     /**
     * main file of the program
@@ -834,7 +925,7 @@ int main(int argc, char *argv[]) {
     printf("overall pairs = %d\n", Trajectory->pairs);
     
     // read trajectory
-    read_TrajectoryFile(argv[1], Trajectory);
+    read_Trajectory(argv[1], Trajectory);
     alignments *align = malloc (sizeof(alignments));
     align->rmsd_mat = d1t(Trajectory->pairs);
     align->ref_structs = i1t(Trajectory->pairs);
@@ -851,7 +942,7 @@ int main(int argc, char *argv[]) {
         Ligand_Trajectory->frames = rec_frames;
         Ligand_Trajectory->n_at = ligand_atomnum;
         Ligand_Trajectory->traj_coords = d2t(rec_frames, 3 * ligand_atomnum);
-        read_TrajectoryFile(argv[8], Ligand_Trajectory);
+        read_Trajectory(argv[8], Ligand_Trajectory);
         cycle_ilrmsd(Trajectory, Ligand_Trajectory, align, start_pair);
         sprintf(out_filename, "ilrmsd_%s.matrix", argv[2]);
     }
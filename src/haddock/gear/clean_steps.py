@@ -175,6 +175,8 @@ def _unpack_gz(gz_file: Path) -> None:
     with gzip.open(gz_file, "rb") as fin, \
             open(out_file, "wb") as fout:
         shutil.copyfileobj(fin, fout, 2 * 10**8)
+    # keep the modification time, as the coordinates stores check it
+    shutil.copystat(gz_file, out_file)
 
     gz_file.unlink()
 
@@ -1,52 +1,87 @@
 """Represent an Haddock model."""
 
+import re
 
-from haddock.core.typing import FilePath
+from haddock.core.typing import Any, FilePath, Iterable, Optional
+from haddock.libs.libio import open_pdb
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libparallel import GenericTask, get_index_list
+from haddock.libs.libutil import parse_ncores
+
+
+ENERGY_KEYS = (
+    'total',
+    'bonds',
+    'angles',
+    'improper',
+    'dihe',
+    'vdw',
+    'elec',
+    'air',
+    'cdih',
+    'coup',
+    'rdcs',
+    'vean',
+    'dani',
+    'xpcs',
+    'rg',
+    )
+"""Order of the terms in the ``REMARK energies:`` line written by CNS."""
+
+ENERGY_REMARK_RE = re.compile(
+    r"^REMARK.*?"
+    r"(?P<term>energies|buried surface area|Desolvation energy|Symmetry energy)"
+    r".*:(?P<value>[^:]*)$"
+    )
+"""Matches the REMARK lines holding the energy terms of a model."""
+
+_single_terms = {
+    'buried surface area': 'bsa',
+    'Desolvation energy': 'desolv',
+    'Symmetry energy': 'sym',
+    }
 
 
 class HaddockModel:
     """Represent HADDOCK model."""
 
-    def __init__(self, pdb_f: FilePath) -> None:
-        self.energies = self._load_energies(pdb_f)
+    def __init__(
+            self,
+            pdb_f: FilePath,
+            energies: Optional[dict[str, float]] = None,
+            ) -> None:
+        if energies is None:
+            energies = self._load_energies(pdb_f)
+        self.energies = energies
 
     @staticmethod
     def _load_energies(pdb_f: FilePath) -> dict[str, float]:
+        """
+        Read the energy terms from the header of a model.
+
+        CNS writes the energies as REMARK lines before the coordinates,
+        reading stops at the first coordinate record.
+        """
         energy_dic: dict[str, float] = {}
-        with open(pdb_f) as fh:
-            for line in fh.readlines():
-                if line.startswith('REMARK'):
-                    # TODO: use regex to do this
-                    if 'energies' in line:
-                        energy_values = map(
-                            float,
-                            line.rstrip().split(':')[-1].split(',')
+        with open_pdb(pdb_f) as fh:
+            for line in fh:
+                if line.startswith(('ATOM', 'HETATM')):
+                    break
+                match = ENERGY_REMARK_RE.match(line.rstrip())
+                if match is None:
+                    continue
+                term = match.group('term')
+                value = match.group('value')
+                if term == 'energies':
+                    energy_values = [float(e) for e in value.split(',')]
+                    if len(energy_values) != len(ENERGY_KEYS):
+                        raise ValueError(
+                            f"Expected {len(ENERGY_KEYS)} energy terms in "
+                            f"{pdb_f}, found {len(energy_values)}."
                             )
-                        total, bonds, angles, improper, dihe, vdw, elec, air, cdih, coup, rdcs, vean, dani, xpcs, rg = energy_values  # noqa: E501
-                        energy_dic['total'] = total
-                        energy_dic['bonds'] = bonds
-                        energy_dic['angles'] = angles
-                        energy_dic['improper'] = improper
-                        energy_dic['dihe'] = dihe
-                        energy_dic['vdw'] = vdw
-                        energy_dic['elec'] = elec
-                        energy_dic['air'] = air
-                        energy_dic['cdih'] = cdih
-                        energy_dic['coup'] = coup
-                        energy_dic['rdcs'] = rdcs
-                        energy_dic['vean'] = vean
-                        energy_dic['dani'] = dani
-                        energy_dic['xpcs'] = xpcs
-                        energy_dic['rg'] = rg
-                    if 'buried surface area' in line:
-                        bsa = float(line.rstrip().split(':')[-1])
-                        energy_dic['bsa'] = bsa
-                    if 'Desolvation energy' in line:
-                        desolv = float(line.rstrip().split(':')[-1])
-                        energy_dic['desolv'] = desolv
-                    if 'Symmetry energy' in line:
-                        sym = float(line.rstrip().split(':')[-1])
-                        energy_dic['sym'] = sym
+                    energy_dic.update(zip(ENERGY_KEYS, energy_values))
+                else:
+                    energy_dic[_single_terms[term]] = float(value)
 
         return energy_dic
 
@@ -61,3 +96,85 @@ class HaddockModel:
         # the haddock score is simply the sum of the weighted terms
         haddock_score = sum(weighted_terms)
         return haddock_score
+
+
+def load_energies(
+        fnames: list[FilePath],
+        core: int = 0,
+        ) -> tuple[int, list[dict[str, float]]]:
+    """
+    Load the energies of a chunk of models.
+
+    Parameters
+    ----------
+    fnames : list
+        The models to read, see :py:meth:`HaddockModel._load_energies`.
+    core : int
+        The index of the chunk, returned with the energies.
+
+    Returns
+    -------
+    core : int
+        The index of the chunk.
+    energies : list[dict[str, float]]
+        The energies of each model.
+    """
+    return core, [HaddockModel._load_energies(fname) for fname in fnames]
+
+
+def score_models(
+        models: Iterable[PDBFile],
+        weights: dict[str, float],
+        Engine: Any,
+        ncores: Optional[int] = 1,
+        ) -> None:
+    """
+    Load the energies of the models present on disk and score them.
+
+    Sets the ``unw_energies`` and ``score`` attributes of each model. The
+    energies are read by chunks of models, one job per core.
+
+    Parameters
+    ----------
+    models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+        The models to score, missing models are skipped.
+    weights : dict[str, float]
+        The weights of the HADDOCK score, e.g. ``{"w_vdw": 1.0}``.
+    Engine : callable
+        The engine running the jobs, see :py:func:`haddock.modules.get_engine`.
+    ncores : int
+        Number of jobs the models are split into.
+
+    Raises
+    ------
+    RuntimeError
+        If the energies of some models could not be read.
+    """
+    present = [model for model in models if model.is_present()]
+    if not present:
+        return
+    fnames = [model.file_name for model in present]
+    ncores = parse_ncores(n=ncores, njobs=len(fnames))
+    index_list = get_index_list(len(fnames), ncores)
+    energy_jobs = [
+        GenericTask(
+            load_energies,
+            fnames[index_list[core]:index_list[core + 1]],
+            core=core,
+            )
+        for core in range(ncores)
+        ]
+    engine = Engine(energy_jobs)
+    engine.run()
+    if len(engine.results) != ncores or None in engine.results:
+        raise RuntimeError("The energies of the models could not be read.")
+    all_energies = [
+        energies
+        for _, chunk in sorted(engine.results, key=lambda result: result[0])
+        for energies in chunk
+        ]
+
+    for model, energies in zip(present, all_energies):
+        haddock_model = HaddockModel(model.file_name, energies=energies)
+        model.unw_energies = haddock_model.energies
+        model.score = haddock_model.calc_haddock_score(**weights)
@@ -19,6 +19,7 @@ Main functions
 
 import os
 import shlex
+import shutil
 import subprocess
 from functools import partial
 from pathlib import Path
@@ -29,7 +30,16 @@ from Bio.Align import substitution_matrices
 from Bio.Seq import Seq
 
 from haddock import log
-from haddock.core.typing import AtomsDict, FilePath, Literal, NDFloat, Optional
+from haddock.core.typing import (
+    AtomsDict,
+    FilePath,
+    Iterable,
+    Literal,
+    NDFloat,
+    Optional,
+    Sequence,
+    )
+from haddock.libs.libcache import get_coord_records
 from haddock.libs.libio import pdb_path_exists
 from haddock.libs.libontology import PDBFile, PDBPath
 from haddock.libs.libpdb import (
@@ -421,6 +431,105 @@ def kabsch(P: NDFloat, Q: NDFloat) -> NDFloat:
     return U
 
 
+def kabsch_rmsd_batch(P: NDFloat, Q: NDFloat) -> NDFloat:
+    """
+    Calculate the RMSD after optimal superposition for a batch of pairs.
+
+    The structures must be centered on the origin. The rotation matrices
+    are never built: the RMSD is obtained from the singular values of the
+    covariance matrices, with the same reflection correction as
+    :py:func:`kabsch`.
+
+    Parameters
+    ----------
+    P : np.array dtype=float, shape=(n_atoms,3) or (n_pairs,n_atoms,3)
+        Reference structure(s), broadcast against ``Q``.
+    Q : np.array dtype=float, shape=(n_pairs,n_atoms,3)
+        Mobile structures.
+
+    Returns
+    -------
+    rmsd : np.array dtype=float, shape=(n_pairs,)
+    """
+    P = np.asarray(P, dtype=np.float64)
+    Q = np.asarray(Q, dtype=np.float64)
+    n_atoms = Q.shape[-2]
+    # batched covariance matrices
+    C = np.matmul(np.swapaxes(P, -1, -2), Q)
+    S = np.linalg.svd(C, compute_uv=False)
+    # reflection correction
+    S[np.linalg.det(C) < 0.0, -1] *= -1
+    sq_dev = (
+        np.einsum("...ij,...ij->...", P, P)
+        + np.einsum("...ij,...ij->...", Q, Q)
+        - 2 * S.sum(axis=-1)
+        )
+    return np.sqrt(np.clip(sq_dev / n_atoms, 0.0, None))
+
+
+def kabsch_rotation_batch(P: NDFloat, Q: NDFloat) -> NDFloat:
+    """
+    Find the optimal rotations for a batch of pairs.
+
+    The structures must be centered on the origin. ``np.matmul(Q, R)``
+    superposes the mobile structures on the reference ones, the reflection
+    correction is the same as in :py:func:`kabsch`.
+
+    Parameters
+    ----------
+    P : np.array dtype=float, shape=(n_atoms,3) or (n_pairs,n_atoms,3)
+        Reference structure(s), broadcast against ``Q``.
+    Q : np.array dtype=float, shape=(n_pairs,n_atoms,3)
+        Mobile structures.
+
+    Returns
+    -------
+    R : np.array dtype=float, shape=(n_pairs,3,3)
+    """
+    P = np.asarray(P, dtype=np.float64)
+    Q = np.asarray(Q, dtype=np.float64)
+    H = np.matmul(np.swapaxes(Q, -1, -2), P)
+    U, _, Vt = np.linalg.svd(H)
+    # reflection correction
+    U[np.linalg.det(H) < 0.0, :, -1] *= -1
+    return np.matmul(U, Vt)
+
+
+def kabsch_ilrmsd_batch(
+        P: NDFloat,
+        Q: NDFloat,
+        P_lig: NDFloat,
+        Q_lig: NDFloat,
+        ) -> NDFloat:
+    """
+    Calculate the ligand RMSD after superposition on the receptor.
+
+    The receptor structures must be centered on the origin and the ligands
+    translated by the same vectors as their receptors. The mobile ligands are
+    rotated by the optimal rotation of the receptors, without refitting.
+
+    Parameters
+    ----------
+    P : np.array dtype=float, shape=(n_atoms,3)
+        Reference receptor.
+    Q : np.array dtype=float, shape=(n_pairs,n_atoms,3)
+        Mobile receptors.
+    P_lig : np.array dtype=float, shape=(n_lig_atoms,3)
+        Reference ligand.
+    Q_lig : np.array dtype=float, shape=(n_pairs,n_lig_atoms,3)
+        Mobile ligands.
+
+    Returns
+    -------
+    ilrmsd : np.array dtype=float, shape=(n_pairs,)
+    """
+    # rotations superposing each mobile receptor on the reference
+    R = kabsch_rotation_batch(P, Q)
+    delta = np.matmul(np.asarray(Q_lig, dtype=np.float64), R) - P_lig
+    n_atoms = delta.shape[-2]
+    return np.sqrt(np.einsum("...ij,...ij->...", delta, delta) / n_atoms)
+
+
 def centroid(X: NDFloat) -> NDFloat:
     """
     Get the centroid.
@@ -478,73 +587,72 @@ def load_coords(
     # Check filetype
     if isinstance(pdb_f, PDBFile):
         pdb_f = pdb_f.rel_path
-    # Read file
-    with open(pdb_f, "r") as fh:
-        for line in fh.readlines():
-            # Skip non ATOM records lines
-            if not line.startswith("ATOM"):
+    # Read file (through the process-wide structure cache)
+    for line in get_coord_records(pdb_f):
+        # Skip non ATOM records lines
+        if not line.startswith("ATOM"):
+            continue
+        # Extract PDB line data
+        atom_name = line[slc_name].strip()
+        resname = line[slc_resname].strip()
+        # Skip entries to be ignored
+        if resname in RES_TO_BE_IGNORED:
+            continue
+        else:
+            if atom_name not in atoms[resname]:
                 continue
-            # Extract PDB line data
-            atom_name = line[slc_name].strip()
-            resname = line[slc_resname].strip()
-            # Skip entries to be ignored
-            if resname in RES_TO_BE_IGNORED:
+        # Continue parsing of the PDB line
+        chain = line[slc_chainid]
+        resnum = int(line[slc_resseq])
+        x = float(line[slc_x])
+        y = float(line[slc_y])
+        z = float(line[slc_z])
+        coords = np.asarray([x, y, z])
+        # Remap chain name
+        if model2ref_chain_dict:
+            # Skip chain matching if not present in reference structure
+            if chain not in model2ref_chain_dict.keys():
                 continue
-            else:
-                if atom_name not in atoms[resname]:
-                    continue
-            # Continue parsing of the PDB line
-            chain = line[slc_chainid]
-            resnum = int(line[slc_resseq])
-            x = float(line[slc_x])
-            y = float(line[slc_y])
-            z = float(line[slc_z])
-            coords = np.asarray([x, y, z])
-            # Remap chain name
-            if model2ref_chain_dict:
-                # Skip chain matching if not present in reference structure
-                if chain not in model2ref_chain_dict.keys():
+            chain = model2ref_chain_dict[chain]
+
+            if numbering_dic:
+                try:
+                    resnum = numbering_dic[chain][resnum]
+                except KeyError:
+                    # this residue is not matched, and so it should
+                    #  not be considered
+                    # self.log(
+                    #     f"WARNING: {chain}.{resnum}.{atom_name}"
+                    #     " was not matched!"
+                    #     )
                     continue
-                chain = model2ref_chain_dict[chain]
-
-                if numbering_dic:
-                    try:
-                        resnum = numbering_dic[chain][resnum]
-                    except KeyError:
-                        # this residue is not matched, and so it should
-                        #  not be considered
-                        # self.log(
-                        #     f"WARNING: {chain}.{resnum}.{atom_name}"
-                        #     " was not matched!"
-                        #     )
-                        continue
-
-            # Create identifier tuple
-            if add_resname is True:
-                identifier = (chain, resnum, atom_name, resname)
-            else:
-                identifier = (chain, resnum, atom_name)
-            # Create empty chain entries
-            if chain not in chain_dic.keys():
-                if filter_resdic:
-                    if chain in filter_resdic.keys():
-                        chain_dic[chain] = []
-                else:
-                    chain_dic[chain] = []
 
-            # Check if must eventually filter this entry
+        # Create identifier tuple
+        if add_resname is True:
+            identifier = (chain, resnum, atom_name, resname)
+        else:
+            identifier = (chain, resnum, atom_name)
+        # Create empty chain entries
+        if chain not in chain_dic.keys():
             if filter_resdic:
-                # Only retrieve coordinates from the filter_resdic
                 if chain in filter_resdic.keys():
-                    if resnum in filter_resdic[chain]:
-                        coord_dic[identifier] = coords
-                        chain_dic[chain].append(idx)
-                        idx += 1
+                    chain_dic[chain] = []
             else:
-                # retrieve everything
-                coord_dic[identifier] = coords
-                chain_dic[chain].append(idx)
-                idx += 1
+                chain_dic[chain] = []
+
+        # Check if must eventually filter this entry
+        if filter_resdic:
+            # Only retrieve coordinates from the filter_resdic
+            if chain in filter_resdic.keys():
+                if resnum in filter_resdic[chain]:
+                    coord_dic[identifier] = coords
+                    chain_dic[chain].append(idx)
+                    idx += 1
+        else:
+            # retrieve everything
+            coord_dic[identifier] = coords
+            chain_dic[chain].append(idx)
+            idx += 1
 
     # Obtain chain ranges
     chain_ranges: ChainsRange = {}
@@ -605,33 +713,32 @@ def get_atoms(pdb: PDBPath, full: bool = False) -> AtomsDict:
     if not exists:
         raise Exception(msg)
 
-    with open(pdb) as fh:
-        for line in fh.readlines():
-            if line.startswith(("ATOM", "HETATM")):
-                resname = line[slc_resname].strip()
-                atom_name = line[slc_name].strip()
-                element = line[slc_element].strip()
-                if all(
-                    [
-                        resname not in PROT_RES,
-                        resname not in DNA_RES,
-                        resname not in RNA_RES,
-                        resname not in RES_TO_BE_IGNORED,
-                    ]
-                ):
-                    # its neither DNA/RNA nor protein, use the heavy atoms
-                    # WARNING: Atoms that belong to unknown residues must
-                    #  be bound to a residue name;
-                    #   For example: residue NEP, also contains
-                    #  CB and CG atoms, if we do not bind it to the
-                    #  residue name, the next functions will include
-                    #  CG and CG atoms in the calculations for all
-                    #  other residue names
-                    if element != "H":
-                        if resname not in atom_dic:
-                            atom_dic[resname] = []
-                        if atom_name not in atom_dic[resname]:
-                            atom_dic[resname].append(atom_name)
+    for line in get_coord_records(pdb):
+        if line.startswith(("ATOM", "HETATM")):
+            resname = line[slc_resname].strip()
+            atom_name = line[slc_name].strip()
+            element = line[slc_element].strip()
+            if all(
+                [
+                    resname not in PROT_RES,
+                    resname not in DNA_RES,
+                    resname not in RNA_RES,
+                    resname not in RES_TO_BE_IGNORED,
+                ]
+            ):
+                # its neither DNA/RNA nor protein, use the heavy atoms
+                # WARNING: Atoms that belong to unknown residues must
+                #  be bound to a residue name;
+                #   For example: residue NEP, also contains
+                #  CB and CG atoms, if we do not bind it to the
+                #  residue name, the next functions will include
+                #  CG and CG atoms in the calculations for all
+                #  other residue names
+                if element != "H":
+                    if resname not in atom_dic:
+                        atom_dic[resname] = []
+                    if atom_name not in atom_dic[resname]:
+                        atom_dic[resname].append(atom_name)
     return atom_dic
 
 
@@ -742,24 +849,46 @@ def pdb2fastadic(pdb_f: PDBPath) -> dict[str, dict[int, str]]:
     if isinstance(pdb_f, PDBFile):
         pdb_f = pdb_f.rel_path
 
-    with open(pdb_f) as fh:
-        for line in fh.readlines():
-            if line.startswith("ATOM"):
-                res_num = int(line[slc_resseq])
-                res_name = line[slc_resname].strip()
-                chain = line[slc_chainid]
-                if res_name in RES_TO_BE_IGNORED:
-                    continue
-                try:
-                    one_letter = res_codes[res_name]
-                except KeyError:
-                    one_letter = "X"
-                if chain not in seq_dic:
-                    seq_dic[chain] = {}
-                seq_dic[chain][res_num] = one_letter
+    for line in get_coord_records(pdb_f):
+        if line.startswith("ATOM"):
+            res_num = int(line[slc_resseq])
+            res_name = line[slc_resname].strip()
+            chain = line[slc_chainid]
+            if res_name in RES_TO_BE_IGNORED:
+                continue
+            try:
+                one_letter = res_codes[res_name]
+            except KeyError:
+                one_letter = "X"
+            if chain not in seq_dic:
+                seq_dic[chain] = {}
+            seq_dic[chain][res_num] = one_letter
     return seq_dic
 
 
+def get_sequence_signature(pdb_f: PDBPath) -> tuple:
+    """
+    Get the signature of the sequences of a structure.
+
+    Two structures with the same signature have the same chains, residue
+    numbers and sequences, and thus the same sequence alignment to a
+    reference (see :py:func:`align_seq`).
+
+    Parameters
+    ----------
+    pdb_f : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+
+    Returns
+    -------
+    signature : tuple
+        The (chain, ((resnum, one_letter), ...)) of each chain, in order.
+    """
+    return tuple(
+        (chain, tuple(residues.items()))
+        for chain, residues in pdb2fastadic(pdb_f).items()
+    )
+
+
 def get_align(
     method: str, lovoalign_exec: FilePath
 ) -> partial[dict[str, dict[int, int]]]:
@@ -796,7 +925,7 @@ def get_align(
 def align_strct(
     reference: PDBFile,
     model: PDBFile,
-    output_path: FilePath,
+    output_path: Optional[FilePath],
     lovoalign_exec: Optional[FilePath] = None,
 ) -> dict[str, dict[int, int]]:
     """
@@ -808,7 +937,8 @@ def align_strct(
 
     model : :py:class:`haddock.libs.libontology.PDBFile`
 
-    output_path : Path
+    output_path : Path or None
+        Where to write the alignment files, not written if None.
 
     lovoalign_exec : Path
         lovoalign executable
@@ -888,10 +1018,11 @@ def align_strct(
         aln_l = lovoalign_out[alignment_start_index:alignment_end_index]
 
         # dump this alignment to a file
-        aln_fname = Path(output_path, f"lovoalign_{chain}.aln")
-        log.debug(f"Writing alignment to {aln_fname.name}")
-        with open(aln_fname, "w") as fh:
-            fh.write(os.linesep.join(aln_l))
+        if output_path is not None:
+            aln_fname = Path(output_path, f"lovoalign_{chain}.aln")
+            log.debug(f"Writing alignment to {aln_fname.name}")
+            with open(aln_fname, "w") as fh:
+                fh.write(os.linesep.join(aln_l))
 
         # remove the line between the alignment segments
         alignment = [aln_l[i : i + 3][:2] for i in range(0, len(aln_l), 3)]
@@ -932,9 +1063,10 @@ def align_strct(
                 if resname_a != "-" and resname_b != "-":
                     numbering_dic[chain][resnum_b] = resnum_a  # type: ignore
 
-    izone_fname = Path(output_path, "lovoalign.izone")
-    log.debug(f"Saving .izone to {izone_fname.name}")
-    dump_as_izone(izone_fname, numbering_dic)
+    if output_path is not None:
+        izone_fname = Path(output_path, "lovoalign.izone")
+        log.debug(f"Saving .izone to {izone_fname.name}")
+        dump_as_izone(izone_fname, numbering_dic)
 
     return numbering_dic
 
@@ -1092,7 +1224,8 @@ def align_seq(reference, model, output_path):
 
     model : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
 
-    output_path : Path
+    output_path : Path or None
+        Where to write the alignment files, not written if None.
 
     Returns
     -------
@@ -1153,7 +1286,8 @@ def align_seq(reference, model, output_path):
             SeqAln.top_alns.append(top_alns[max_idx])
 
             # writing the alignment
-            write_alignment(top_alns[max_idx], output_path, ref_ch)
+            if output_path is not None:
+                write_alignment(top_alns[max_idx], output_path, ref_ch)
 
             # postprocess alignment
             SeqAln.postprocess_alignment(ref_ch, mod_ch, matches)
@@ -1185,14 +1319,20 @@ def align_seq(reference, model, output_path):
             SeqAln.aln_ref_segs.append(aln_ref_seg)
             SeqAln.top_alns.append(top_aln)
             # write alignment
-            write_alignment(top_aln, output_path, ref_ch)
+            if output_path is not None:
+                write_alignment(top_aln, output_path, ref_ch)
             # postprocess alignment
             SeqAln.postprocess_alignment(ref_ch, ref_ch, matches)
             matches += 1
     # dump the .izone file
-    izone_fname = Path(output_path, "blosum62.izone")
-    log.debug(f"Saving .izone to {izone_fname.name}")
-    dump_as_izone(izone_fname, SeqAln.align_dic, SeqAln.ref2model_chain_dict)
+    if output_path is not None:
+        izone_fname = Path(output_path, "blosum62.izone")
+        log.debug(f"Saving .izone to {izone_fname.name}")
+        dump_as_izone(
+            izone_fname,
+            SeqAln.align_dic,
+            SeqAln.ref2model_chain_dict,
+        )
 
     return SeqAln.align_dic, SeqAln.model2ref_chain_dict
 
@@ -1250,9 +1390,78 @@ def dump_as_izone(fname, numbering_dic, model2ref_chain_dict=None):
                 fh.write(izone_str)
 
 
+BINARY_TRAJ_MAGIC = b"HDTRAJ01"
+"""Magic string starting a binary trajectory file."""
+
+BINARY_TRAJ_HEADER_SIZE = 16
+"""Size of the binary trajectory header: magic, frames and atoms (int32)."""
+
+
+def write_binary_traj(output_name: FilePath, coords: NDFloat) -> None:
+    """
+    Write coordinates to a binary trajectory file.
+
+    The file holds a 16 bytes header (the magic string, the number of
+    frames and the number of atoms as int32) followed by the coordinates
+    as float32, readable by ``fast-rmsdmatrix`` without text parsing.
+
+    Parameters
+    ----------
+    output_name : FilePath
+        output name
+
+    coords : np.array dtype=float, shape=(n_frames,n_atoms,3)
+        coordinates of the frames
+    """
+    coords = np.asarray(coords, dtype="<f4")
+    with open(output_name, "wb") as out_file:
+        out_file.write(BINARY_TRAJ_MAGIC)
+        np.array(coords.shape[:2], dtype="<i4").tofile(out_file)
+        coords.tofile(out_file)
+
+
+def read_binary_traj_header(traj_name: FilePath) -> tuple[int, int]:
+    """
+    Read the header of a binary trajectory file.
+
+    Returns
+    -------
+    n_frames : int
+    n_atoms : int
+    """
+    with open(traj_name, "rb") as traj_file:
+        header = traj_file.read(BINARY_TRAJ_HEADER_SIZE)
+    if not header.startswith(BINARY_TRAJ_MAGIC):
+        raise ALIGNError(f"{traj_name} is not a binary trajectory file.")
+    n_frames, n_atoms = np.frombuffer(header[len(BINARY_TRAJ_MAGIC):], "<i4")
+    return int(n_frames), int(n_atoms)
+
+
+def read_binary_traj(traj_name: FilePath) -> NDFloat:
+    """
+    Memory-map the coordinates of a binary trajectory file.
+
+    Returns
+    -------
+    coords : np.memmap dtype=float32, shape=(n_frames,n_atoms,3)
+    """
+    n_frames, n_atoms = read_binary_traj_header(traj_name)
+    return np.memmap(
+        traj_name,
+        dtype="<f4",
+        mode="r",
+        offset=BINARY_TRAJ_HEADER_SIZE,
+        shape=(n_frames, n_atoms, 3),
+    )
+
+
 def rearrange_xyz_files(output_name: FilePath, path: FilePath, ncores: int) -> None:
     """Combine different xyz outputs in a single file.
 
+    The files of each core are named after the output name, with the core
+    index appended to the stem. Binary trajectories (``.bin`` files) are
+    merged under a single header.
+
     Parameters
     ----------
     output_name : FilePath
@@ -1265,15 +1474,32 @@ def rearrange_xyz_files(output_name: FilePath, path: FilePath, ncores: int) -> N
         number of cores
     """
     output_fname = Path(path, output_name)
-    # take the name without the xyz extension
+    # take the name without the extension
     output_fname_str = output_fname.stem
+    tmp_files = [
+        Path(path, output_fname_str + "_" + str(core) + output_fname.suffix)
+        for core in range(ncores)
+    ]
     log.info(f"rearranging xyz files into {output_fname}")
+    binary = output_fname.suffix == ".bin"
+    if binary:
+        headers = [read_binary_traj_header(tmp_file) for tmp_file in tmp_files]
+        n_frames = sum(header[0] for header in headers)
+        n_atoms = {header[1] for header in headers}
+        if len(n_atoms) != 1:
+            raise ALIGNError(f"Binary trajectories of {output_fname} differ.")
     # Combine files
-    with open(output_fname, "w") as out_file:
-        for core in range(ncores):
-            tmp_file = Path(path, output_fname_str + "_" + str(core) + ".xyz")
-            with open(tmp_file) as infile:
-                out_file.write(infile.read())
+    with open(output_fname, "wb" if binary else "w") as out_file:
+        if binary:
+            out_file.write(BINARY_TRAJ_MAGIC)
+            np.array([n_frames, n_atoms.pop()], dtype="<i4").tofile(out_file)
+        for core, tmp_file in enumerate(tmp_files):
+            with open(tmp_file, "rb" if binary else "r") as infile:
+                if binary:
+                    infile.seek(BINARY_TRAJ_HEADER_SIZE)
+                    shutil.copyfileobj(infile, out_file)
+                else:
+                    out_file.write(infile.read())
             log.debug(f"File number {core} written")
             tmp_file.unlink()
     log.info("Completed reconstruction of xyz files.")
@@ -1304,24 +1530,56 @@ def check_common_atoms(models, filter_resdic, allatoms, atom_similarity):
         number of common atoms
 
     common_keys : list
-        list of common atom keys
+        list of common atom keys, in the order of the first model
+    """
+    def model_keys():
+        for mod in models:
+            atoms: AtomsDict = get_atoms(mod, allatoms)
+            ref_coord_dic, _ = load_coords(mod, atoms, filter_resdic)
+            yield ref_coord_dic.keys()
+
+    return find_common_keys(model_keys(), atom_similarity)
+
+
+def find_common_keys(model_keys: Iterable[Sequence], atom_similarity):
+    """
+    Find the atom keys common to all the models.
+
+    Parameters
+    ----------
+    model_keys : iterable
+        the unique atom keys of each model
+
+    atom_similarity : float
+        minimum atom similarity required between models
+
+    Returns
+    -------
+    n_atoms : int
+        number of common atoms
+
+    common_keys : list
+        list of common atom keys, in the order of the first model
     """
     # checking the common keys
-    common_keys: list[str] = []
-    coord_keys_lengths = []
-    for mod in models:
-        atoms: AtomsDict = get_atoms(mod, allatoms)
-
-        ref_coord_dic, _ = load_coords(mod, atoms, filter_resdic)
-        coord_keys_lengths.append(len(ref_coord_dic.keys()))
-        if common_keys != []:
-            common_keys = set(ref_coord_dic.keys()).intersection(common_keys)
+    first_keys: list = []
+    common_keys: set = set()
+    max_n_atoms = 0
+    for n, keys in enumerate(model_keys):
+        max_n_atoms = max(max_n_atoms, len(keys))
+        if n == 0:
+            first_keys = list(keys)
+            common_keys = set(first_keys)
         else:
-            common_keys = ref_coord_dic.keys()
+            common_keys.intersection_update(keys)
 
+    # keep the order of the first model, sets are not ordered
+    common_keys = [
+        key for key in first_keys
+        if key in common_keys
+        ]
     # checking the common atoms
     n_atoms = len(common_keys)  # common atoms
-    max_n_atoms = max(coord_keys_lengths)
     perc = (n_atoms / max_n_atoms) * 100
     if perc == 100.0:
         log.info("All the models share the same atoms.")
@@ -1341,7 +1599,7 @@ def check_common_atoms(models, filter_resdic, allatoms, atom_similarity):
             " Please check the input ensemble."
         )
         raise ALIGNError(_err_msg)
-    return n_atoms, list(common_keys)
+    return n_atoms, common_keys
 
 
 # TODO: Add type signature
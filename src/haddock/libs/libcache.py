@@ -0,0 +1,224 @@
+"""
+Process-wide cache of the coordinate records of PDB files.
+
+Within a single analysis step the same PDB files are read many times: the
+reference structure in every :py:class:`CAPRI` job, every model once by
+:py:func:`haddock.libs.libalign.check_common_atoms` and again by the
+trajectory writers, etc. This module keeps the ATOM and HETATM lines of the
+files already read in memory, so that the following readers can skip the
+disk access, the decompression and the line filtering. Only the file I/O is
+saved: the lines are kept as text and every reader still parses them.
+
+Gzipped models (``.pdb.gz``, as left by ``clean_output``) are read
+transparently when the plain file does not exist.
+
+Entries are keyed by ``(path, mtime, size)`` so that a file modified on disk
+(for instance by :py:meth:`CAPRI.add_chain_from_segid`) is transparently
+re-read. The cache has a memory budget and evicts the least recently used
+entries once the budget is exceeded.
+
+The cache is a module level object: worker processes forked by
+:py:class:`haddock.libs.libparallel.Scheduler` inherit its content, so
+pre-warming it in the main process with :py:func:`prewarm_cache` before
+spawning the workers avoids re-parsing shared files (such as a reference
+structure) in every worker. The workers only read from the inherited
+cache: the models they read once are not stored, so that the memory budget
+is not spent again in every worker.
+
+The cache is emptied at the end of every step, see
+:py:meth:`haddock.modules.BaseHaddockModule.run`.
+
+Main functions
+--------------
+
+* :py:func:`get_coord_records`
+* :py:func:`prewarm_cache`
+* :py:func:`clear_cache`
+"""
+
+import os
+import sys
+from collections import OrderedDict
+
+from haddock.core.typing import FilePath, Iterable, Optional
+from haddock.libs.libio import get_pdb_path, open_pdb
+from haddock.libs.libontology import PDBFile
+
+
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024
+"""Default memory budget of the structure cache, in bytes."""
+
+COORD_RECORDS = ("ATOM", "HETATM")
+"""PDB records kept in the cache."""
+
+CacheKey = tuple[str, int, int]
+
+
+class StructureCache:
+    """
+    Least recently used cache of PDB coordinate records.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget of the cache, in bytes. Setting it to 0 disables
+        the cache.
+
+    Notes
+    -----
+    Only the process that created the cache stores new entries, the
+    processes forked from it read the inherited entries.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BUDGET) -> None:
+        self.max_bytes = max_bytes
+        self.owner_pid = os.getpid()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[CacheKey, tuple[tuple[str, ...], int]] = (
+            OrderedDict()
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: FilePath) -> bool:
+        try:
+            return self.make_key(path) in self._entries
+        except OSError:
+            return False
+
+    @staticmethod
+    def make_key(path: FilePath) -> CacheKey:
+        """Build the cache key of a file from its path and status."""
+        path = get_pdb_path(path)
+        stat = os.stat(path)
+        return (
+            str(path.resolve()),
+            stat.st_mtime_ns,
+            stat.st_size,
+            )
+
+    @staticmethod
+    def read(path: FilePath) -> tuple[str, ...]:
+        """Read the coordinate records of a (possibly gzipped) PDB file."""
+        with open_pdb(path) as fh:
+            return tuple(line for line in fh if line.startswith(COORD_RECORDS))
+
+    @staticmethod
+    def sizeof(records: tuple[str, ...]) -> int:
+        """Estimate the memory footprint of an entry, in bytes."""
+        return sys.getsizeof(records) + sum(map(sys.getsizeof, records))
+
+    def get(self, path: FilePath) -> tuple[str, ...]:
+        """
+        Get the coordinate records of a PDB file.
+
+        The file is read and stored in the cache if not present yet, by
+        the process owning the cache only.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            Path to the PDB file.
+
+        Returns
+        -------
+        records : tuple[str]
+            The ATOM and HETATM lines of the file, in file order.
+        """
+        key = self.make_key(path)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        records = self.read(path)
+        if os.getpid() == self.owner_pid:
+            self.put(key, records)
+        return records
+
+    def put(self, key: CacheKey, records: tuple[str, ...]) -> None:
+        """Store an entry and evict the oldest ones if over budget."""
+        size = self.sizeof(records)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[key] = (records, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+
+    def clear(self) -> None:
+        """Remove all the entries of the cache."""
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+STRUCTURE_CACHE = StructureCache()
+"""The process-wide cache of coordinate records."""
+
+
+def _to_path(pdb_f: FilePath) -> FilePath:
+    if isinstance(pdb_f, PDBFile):
+        return pdb_f.rel_path
+    return pdb_f
+
+
+def get_coord_records(pdb_f: FilePath) -> tuple[str, ...]:
+    """
+    Get the ATOM and HETATM lines of a PDB file through the cache.
+
+    Parameters
+    ----------
+    pdb_f : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+        PDB file to read.
+
+    Returns
+    -------
+    records : tuple[str]
+        The coordinate records of the file.
+    """
+    return STRUCTURE_CACHE.get(_to_path(pdb_f))
+
+
+def prewarm_cache(pdb_files: Iterable[FilePath]) -> None:
+    """
+    Load a set of PDB files in the process-wide cache.
+
+    Call it before spawning the worker processes so that they inherit
+    the parsed structures. Files that cannot be read are skipped, the
+    error is left to be raised by the actual reader.
+
+    Parameters
+    ----------
+    pdb_files : iterable of PosixPath or PDBFile
+        PDB files to load.
+    """
+    for pdb_f in pdb_files:
+        try:
+            get_coord_records(pdb_f)
+        except OSError:
+            continue
+
+
+def clear_cache(max_bytes: Optional[int] = None) -> None:
+    """
+    Empty the process-wide cache and optionally change its budget.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        New memory budget of the cache, in bytes.
+    """
+    STRUCTURE_CACHE.clear()
+    if max_bytes is not None:
+        STRUCTURE_CACHE.max_bytes = max_bytes
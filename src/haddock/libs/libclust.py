@@ -13,6 +13,11 @@ from pathlib import Path
 
 from haddock import log
 from haddock.core.typing import FilePath, Union, ParamDictT, Optional
+from haddock.libs.libmatrix import (
+    condensed_index,
+    read_matrix_header,
+    read_matrix_values,
+    )
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libplots import heatmap_plotly
 
@@ -103,32 +108,14 @@ def plot_cluster_matrix(
     if len(final_order_idx) > MAX_NB_ENTRY_HTML_MATRIX:
         return None
 
-    upper_diag, lower_diag = [], []
-    # Read matrix
-    with open(matrix_path, 'r') as f:
-        # Loop over lines
-        for _ in f:
-            # Split line
-            s_ = _.strip().split()
-            # Point first value
-            uv = float(s_[2])
-            # Point second value (if exists)
-            lv = float(s_[3]) if len(s_) == 4 else uv
-            # Hold them
-            upper_diag.append(uv)
-            lower_diag.append(lv)
-
-    # Genereate full matrix from N*(N-1)/2 vector
-    upper_matrix = squareform(upper_diag)
-    lower_matrix = squareform(lower_diag)
-    # Update diagonal with data
-    np.fill_diagonal(upper_matrix, diag_fill)
-
-    # Full matrix (lower triangle + upper triangle)
-    full_matrix = np.tril(lower_matrix, k=-1) + np.triu(upper_matrix)
-
-    # Extract submatrix of selected models and re-order them
-    submat = full_matrix[np.ix_(final_order_idx, final_order_idx)]
+    if Path(matrix_path).suffix == '.npy':
+        submat = _read_binary_submatrix(
+            matrix_path,
+            final_order_idx,
+            diag_fill,
+            )
+    else:
+        submat = _read_text_submatrix(matrix_path, final_order_idx, diag_fill)
 
     # Check if must reverse the colorscale
     if reverse:
@@ -172,6 +159,73 @@ def plot_cluster_matrix(
     return output_fname_ext
 
 
+def _read_binary_submatrix(
+        matrix_path: Union[Path, FilePath, str],
+        final_order_idx: list[int],
+        diag_fill: Union[int, float],
+        ) -> np.ndarray:
+    """Read the square submatrix of some models from a binary matrix.
+
+    Only the pairs of the selected models are read, the full square matrix
+    of all the models is never built.
+    """
+    n_models = read_matrix_header(matrix_path)["n_models"]
+    idx = np.asarray(final_order_idx, dtype=int)
+    rows, cols = np.meshgrid(idx, idx, indexing='ij')
+    first = np.minimum(rows, cols)
+    second = np.maximum(rows, cols)
+    off_diag = first != second
+    values = read_matrix_values(
+        matrix_path,
+        condensed_index(first[off_diag], second[off_diag], n_models),
+        )
+    if values.ndim == 1:
+        upper_values = lower_values = values
+    else:
+        upper_values, lower_values = values[:, 0], values[:, 1]
+    # upper triangle holds the first value, lower triangle the second one
+    submat = np.full(rows.shape, diag_fill, dtype=float)
+    submat[off_diag] = np.where(
+        rows[off_diag] < cols[off_diag],
+        upper_values,
+        lower_values,
+        )
+    return submat
+
+
+def _read_text_submatrix(
+        matrix_path: Union[Path, FilePath, str],
+        final_order_idx: list[int],
+        diag_fill: Union[int, float],
+        ) -> np.ndarray:
+    """Read the square submatrix of some models from a text matrix."""
+    upper_diag, lower_diag = [], []
+    with open(matrix_path, 'r') as f:
+        # Loop over lines
+        for _ in f:
+            # Split line
+            s_ = _.strip().split()
+            # Point first value
+            uv = float(s_[2])
+            # Point second value (if exists)
+            lv = float(s_[3]) if len(s_) == 4 else uv
+            # Hold them
+            upper_diag.append(uv)
+            lower_diag.append(lv)
+
+    # Genereate full matrix from N*(N-1)/2 vector
+    upper_matrix = squareform(upper_diag)
+    lower_matrix = squareform(lower_diag)
+    # Update diagonal with data
+    np.fill_diagonal(upper_matrix, diag_fill)
+
+    # Full matrix (lower triangle + upper triangle)
+    full_matrix = np.tril(lower_matrix, k=-1) + np.triu(upper_matrix)
+
+    # Extract submatrix of selected models and re-order them
+    return full_matrix[np.ix_(final_order_idx, final_order_idx)]
+
+
 def get_cluster_matrix_plot_clt_dt(
         cluster_ids: list[int],
         ) -> tuple[list[list[list[int]]], list[dict[str, float]]]:
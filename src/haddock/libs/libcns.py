@@ -11,6 +11,7 @@ from haddock.core import cns_paths
 from haddock.core.typing import Any, FilePath, FilePathT, Optional, Union
 from haddock.libs import libpdb
 from haddock.libs.libfunc import false, true
+from haddock.libs.libio import unpack_if_gzipped
 from haddock.libs.libmath import RandomNumberGenerator
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libutil import transform_to_list
@@ -292,7 +293,12 @@ def prepare_cns_input(
     default_params += write_eval_line("ambig_fname", ambig_fname)
 
     # write the PDBs
-    pdb_list = [pdb.rel_path for pdb in transform_to_list(input_element)]
+    # CNS needs plain files: models of cleaned runs are decompressed in the
+    #  working directory, only for the selected input elements
+    pdb_list = [
+        unpack_if_gzipped(pdb.rel_path)
+        for pdb in transform_to_list(input_element)
+        ]
 
     # write the PSFs
     psf_list: list[Path] = []
@@ -322,6 +328,8 @@ def prepare_cns_input(
         psf_fname = pdb.topology.rel_path
         psf_list.append(psf_fname)
 
+    psf_list = [unpack_if_gzipped(psf_fname) for psf_fname in psf_list]
+
     input_str = prepare_multiple_input(
         pdb_input_list=[str(p) for p in pdb_list],
         psf_input_list=[str(p) for p in psf_list],
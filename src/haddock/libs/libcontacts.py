@@ -0,0 +1,142 @@
+"""
+Contacts between the chains of a structure.
+
+Atoms of two chains are in contact if their distance is strictly below a
+cutoff. Instead of calculating all the N x M distances between the atoms of
+the two chains, the candidate pairs are found with a KD-tree
+(:py:class:`scipy.spatial.cKDTree`) and only their distances are checked.
+
+Main functions
+--------------
+
+* :py:func:`find_atom_contacts`
+* :py:func:`get_residue_contacts`
+"""
+from itertools import combinations
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from haddock.core.typing import NDFloat, Sequence
+
+
+CONTACT_TOLERANCE = 1e-6
+"""Margin added to the KD-tree search radius before the exact check."""
+
+
+def find_atom_contacts(
+        xyz_a: NDFloat,
+        xyz_b: NDFloat,
+        cutoff: float,
+        dtype: type = np.float64,
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the pairs of atoms closer than a cutoff.
+
+    The candidate pairs found by the KD-tree are checked with the same
+    distance calculation as :py:func:`scipy.spatial.distance.cdist`, so that
+    pairs lying exactly on the cutoff are treated identically. With
+    ``dtype=np.float32``, the squared distances are compared to the squared
+    cutoff in single precision instead, as the ``contact_fcc`` executable
+    does.
+
+    Parameters
+    ----------
+    xyz_a : np.ndarray dtype=float, shape=(n_atoms_a, 3)
+        Coordinates of the first set of atoms.
+    xyz_b : np.ndarray dtype=float, shape=(n_atoms_b, 3)
+        Coordinates of the second set of atoms.
+    cutoff : float
+        Distance cutoff, in Angstrom.
+    dtype : type
+        Precision of the distance check, np.float64 or np.float32.
+
+    Returns
+    -------
+    idx_a : np.ndarray dtype=int
+        Indices of the atoms of the first set, sorted.
+    idx_b : np.ndarray dtype=int
+        Indices of the atoms of the second set in contact with ``idx_a``.
+    """
+    xyz_a = np.asarray(xyz_a, dtype=np.float64).reshape(-1, 3)
+    xyz_b = np.asarray(xyz_b, dtype=np.float64).reshape(-1, 3)
+    if len(xyz_a) == 0 or len(xyz_b) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    pairs = cKDTree(xyz_a).sparse_distance_matrix(
+        cKDTree(xyz_b),
+        cutoff + CONTACT_TOLERANCE,
+        output_type="ndarray",
+        )
+    idx_a = pairs["i"].astype(np.int64)
+    idx_b = pairs["j"].astype(np.int64)
+    if np.dtype(dtype) == np.float32:
+        delta = (
+            xyz_a[idx_a].astype(np.float32)
+            - xyz_b[idx_b].astype(np.float32)
+            )
+        square = delta * delta
+        dist2 = (square[:, 0] + square[:, 1]) + square[:, 2]
+        keep = dist2 < np.float32(cutoff) * np.float32(cutoff)
+    else:
+        delta = xyz_a[idx_a] - xyz_b[idx_b]
+        dist = np.sqrt((delta * delta).sum(axis=1))
+        keep = dist < cutoff
+    idx_a, idx_b = idx_a[keep], idx_b[keep]
+    order = np.lexsort((idx_b, idx_a))
+    return idx_a[order], idx_b[order]
+
+
+def get_residue_contacts(
+        chains: Sequence[str],
+        resids: Sequence[int],
+        coords: NDFloat,
+        cutoff: float = 5.0,
+        dtype: type = np.float64,
+        ) -> set[tuple[str, int, str, int]]:
+    """
+    Find the residues of different chains in contact.
+
+    Parameters
+    ----------
+    chains : list[str]
+        The chain of each atom.
+    resids : list[int]
+        The residue number of each atom.
+    coords : np.ndarray dtype=float, shape=(n_atoms, 3)
+        The coordinates of the atoms.
+    cutoff : float
+        Distance cutoff between two atoms, in Angstrom.
+    dtype : type
+        Precision of the distance check, see :py:func:`find_atom_contacts`.
+
+    Returns
+    -------
+    contacts : set[tuple[str, int, str, int]]
+        The (chain, resid, chain, resid) contacts, the first chain being the
+        lowest in alphabetical order.
+    """
+    chains = np.asarray(chains)
+    resids = np.asarray(resids)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    contacts: set[tuple[str, int, str, int]] = set()
+    for chain_a, chain_b in combinations(sorted(set(chains.tolist())), 2):
+        mask_a = chains == chain_a
+        mask_b = chains == chain_b
+        idx_a, idx_b = find_atom_contacts(
+            coords[mask_a],
+            coords[mask_b],
+            cutoff,
+            dtype=dtype,
+            )
+        if len(idx_a) == 0:
+            continue
+        res_pairs = np.unique(
+            np.stack([resids[mask_a][idx_a], resids[mask_b][idx_b]], axis=1),
+            axis=0,
+            )
+        contacts.update(
+            (chain_a, res_a, chain_b, res_b)
+            for res_a, res_b in res_pairs.tolist()
+            )
+    return contacts
@@ -0,0 +1,329 @@
+"""
+Per-step memory-mapped coordinate store.
+
+All the models produced by a sampling or refinement step share the same
+topology and atom ordering. When the ``coords_store`` parameter is enabled,
+the step writes, next to its models, a companion ``coords.npy`` file holding
+the coordinates of all the models (``n_models x n_atoms x 3``, float32) and
+a single atom-table file (``coords_atoms.json``) describing the atoms, the
+order of the models in the array and the modification time of each model
+file. A store whose models were modified after it was written is not used.
+Cleaning the step and unpacking it again keep the modification times of
+the models, so the store stays valid for restarted runs and for
+``haddock3-analyse``.
+
+The ``rmsdmatrix`` and ``clustleader`` modules memory-map the coordinates
+with :py:meth:`CoordsStore.from_models` instead of parsing the PDB files
+again, sharing the page cache across worker processes, when all their input
+models come from a single step with a store. The other modules read the
+models.
+
+Main functions
+--------------
+
+* :py:func:`read_model_coords`
+* :py:func:`write_coords_store`
+* :py:class:`CoordsStore`
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from haddock import log
+from haddock.core.typing import FilePath, NDFloat, Optional, Sequence
+from haddock.libs.libcache import get_coord_records
+from haddock.libs.libio import get_pdb_path
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libpdb import (
+    slc_chainid,
+    slc_name,
+    slc_resname,
+    slc_resseq,
+    slc_x,
+    slc_y,
+    slc_z,
+    )
+
+
+COORDS_FNAME = "coords.npy"
+"""Name of the coordinates array file of a step."""
+
+COORDS_ATOMS_FNAME = "coords_atoms.json"
+"""Name of the atom-table file of a step."""
+
+AtomRecord = tuple[str, int, str, str]
+"""An atom identifier: (chain, resnum, resname, atom name)."""
+
+
+def read_model_coords(
+        pdb_f: FilePath,
+        ) -> tuple[list[AtomRecord], NDFloat]:
+    """
+    Read the atoms and coordinates of the ATOM records of a PDB file.
+
+    Parameters
+    ----------
+    pdb_f : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+        PDB file to read.
+
+    Returns
+    -------
+    atoms : list[tuple[str, int, str, str]]
+        The (chain, resnum, resname, atom name) of each atom.
+    coords : np.ndarray dtype=float, shape=(n_atoms, 3)
+        The coordinates of each atom.
+    """
+    atoms: list[AtomRecord] = []
+    coords: list[tuple[float, float, float]] = []
+    for line in get_coord_records(pdb_f):
+        if not line.startswith("ATOM"):
+            continue
+        atoms.append((
+            line[slc_chainid],
+            int(line[slc_resseq]),
+            line[slc_resname].strip(),
+            line[slc_name].strip(),
+            ))
+        coords.append((
+            float(line[slc_x]),
+            float(line[slc_y]),
+            float(line[slc_z]),
+            ))
+    return atoms, np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+
+
+def get_model_mtime(model: PDBFile) -> int:
+    """
+    Get the modification time of a model file, possibly gzipped.
+
+    Parameters
+    ----------
+    model : :py:class:`haddock.libs.libontology.PDBFile`
+        The model.
+
+    Returns
+    -------
+    mtime : int
+        The modification time of the file, in nanoseconds.
+    """
+    return os.stat(get_pdb_path(Path(model.path, model.file_name))).st_mtime_ns
+
+
+def write_coords_store(
+        models: Sequence[PDBFile],
+        path: FilePath = ".",
+        ) -> bool:
+    """
+    Write the coordinates store of a list of models.
+
+    The store is written only if all the models share the same atoms, in
+    the same order.
+
+    Parameters
+    ----------
+    models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+        The models to store, in order.
+    path : str or pathlib.Path
+        Folder where to write the store.
+
+    Returns
+    -------
+    written : bool
+        Whether the store was written.
+    """
+    if not models:
+        return False
+
+    ref_atoms, ref_coords = read_model_coords(models[0])
+    coords = np.empty((len(models), len(ref_atoms), 3), dtype=np.float32)
+    coords[0] = ref_coords
+    for i, model in enumerate(models[1:], start=1):
+        atoms, model_coords = read_model_coords(model)
+        if atoms != ref_atoms:
+            log.warning(
+                f"Atoms of {model.file_name} differ from {models[0].file_name}"
+                ", the coordinates store will not be written."
+                )
+            return False
+        coords[i] = model_coords
+
+    np.save(Path(path, COORDS_FNAME), coords)
+    with open(Path(path, COORDS_ATOMS_FNAME), "w") as fh:
+        json.dump(
+            {
+                "models": [model.file_name for model in models],
+                "mtimes": [get_model_mtime(model) for model in models],
+                "atoms": ref_atoms,
+                },
+            fh,
+            )
+    log.info(f"Coordinates of {len(models)} models stored in {COORDS_FNAME}")
+    return True
+
+
+class CoordsStore:
+    """
+    Memory-mapped coordinates of the models of a step.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float32, shape=(n_models, n_atoms, 3)
+        The coordinates of the models.
+    atoms : list[tuple[str, int, str, str]]
+        The (chain, resnum, resname, atom name) of each atom.
+    models : list[str]
+        The file names of the models, in the order of ``coords``.
+    mtimes : list[int], optional
+        The modification times of the model files when the store was
+        written, in nanoseconds.
+    """
+
+    def __init__(
+            self,
+            coords: NDFloat,
+            atoms: list[AtomRecord],
+            models: list[str],
+            mtimes: Optional[list[int]] = None,
+            ) -> None:
+        self.coords = coords
+        self.atoms = atoms
+        self.models = models
+        self.mtimes = mtimes
+        self.model_index = {name: i for i, name in enumerate(models)}
+
+    @classmethod
+    def load(cls, path: FilePath) -> Optional["CoordsStore"]:
+        """
+        Memory-map the coordinates store of a step folder.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            The step folder.
+
+        Returns
+        -------
+        store : :py:class:`CoordsStore` or None
+            None if the folder has no coordinates store.
+        """
+        coords_f = Path(path, COORDS_FNAME)
+        atoms_f = Path(path, COORDS_ATOMS_FNAME)
+        if not (coords_f.exists() and atoms_f.exists()):
+            return None
+        with open(atoms_f) as fh:
+            table = json.load(fh)
+        return cls(
+            np.load(coords_f, mmap_mode="r"),
+            [tuple(atom) for atom in table["atoms"]],
+            table["models"],
+            table.get("mtimes"),
+            )
+
+    @classmethod
+    def from_models(cls, models: Sequence[PDBFile]) -> Optional["CoordsStore"]:
+        """
+        Get the coordinates store holding all the given models.
+
+        Parameters
+        ----------
+        models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+            The models to look for.
+
+        Returns
+        -------
+        store : :py:class:`CoordsStore` or None
+            None if the models do not come from the same step, if the step
+            has no coordinates store including all of them or if some of
+            them were modified after the store was written.
+        """
+        paths = {model.path for model in models}
+        if len(paths) != 1:
+            return None
+        store = cls.load(paths.pop())
+        if store is None:
+            return None
+        if not all(model.file_name in store.model_index for model in models):
+            return None
+        if not store.is_up_to_date(models):
+            log.warning(
+                "The models were modified after the coordinates store was "
+                "written, reading the models instead."
+                )
+            return None
+        return store
+
+    def is_up_to_date(self, models: Sequence[PDBFile]) -> bool:
+        """
+        Check the model files were not modified since the store was written.
+
+        Parameters
+        ----------
+        models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+            The models of the store to check.
+
+        Returns
+        -------
+        bool
+            Whether all the model files have the modification time recorded
+            in the store. False for stores without recorded times.
+        """
+        if self.mtimes is None:
+            return False
+        try:
+            return all(
+                get_model_mtime(model)
+                == self.mtimes[self.model_index[model.file_name]]
+                for model in models
+                )
+        except OSError:
+            return False
+
+    def atom_keys(self, add_resname: bool = False) -> list[tuple]:
+        """
+        Get the atom identifiers as used by :py:func:`load_coords`.
+
+        Parameters
+        ----------
+        add_resname : bool
+            Whether to add the residue name to the identifiers.
+
+        Returns
+        -------
+        keys : list[tuple]
+            The (chain, resnum, atom[, resname]) identifier of each atom.
+        """
+        if add_resname:
+            return [(ch, resnum, name, resname)
+                    for ch, resnum, resname, name in self.atoms]
+        return [(ch, resnum, name) for ch, resnum, _, name in self.atoms]
+
+    def get_coords(
+            self,
+            models: Sequence[PDBFile],
+            keys: Optional[Sequence[tuple]] = None,
+            ) -> NDFloat:
+        """
+        Get the coordinates of a set of models.
+
+        Parameters
+        ----------
+        models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+            The models to retrieve.
+        keys : list[tuple], optional
+            The (chain, resnum, atom) identifiers of the atoms to
+            retrieve, in the desired order. All atoms if not given.
+
+        Returns
+        -------
+        coords : np.ndarray dtype=float32, shape=(n_models, n_keys, 3)
+            The coordinates of the selected atoms.
+        """
+        model_idx = [self.model_index[model.file_name] for model in models]
+        coords = self.coords[model_idx]
+        if keys is None:
+            return coords
+        atom_index = {key: i for i, key in enumerate(self.atom_keys())}
+        return coords[:, [atom_index[tuple(key)] for key in keys]]
@@ -0,0 +1,384 @@
+"""
+Ensembles of models sharing a common set of atoms.
+
+Analysis modules often need "N models with a common atom set": the RMSD
+matrix, the interface-ligand RMSD matrix, the contact maps and the CAPRI
+metrics. :py:class:`Ensemble` holds the coordinates of such models in a
+single contiguous array, together with an index of the atoms allowing
+chain and residue selections, and the metadata of each model.
+
+An ensemble can be built from a list of PDB files
+(:py:meth:`Ensemble.from_pdbfiles`) or from the coordinates store of a step
+(:py:meth:`Ensemble.from_coords_store`), and shared with worker processes
+through :py:mod:`multiprocessing.shared_memory`
+(:py:meth:`Ensemble.to_shared_memory` and
+:py:meth:`Ensemble.from_shared_memory`).
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from haddock.core.typing import Any, NDFloat, Optional, Sequence
+from haddock.libs.libalign import ALIGNError, get_atoms, load_coords
+from haddock.libs.libcoords import AtomRecord, CoordsStore
+from haddock.libs.libontology import PDBFile
+
+
+class Ensemble:
+    """
+    A set of models sharing the same atoms.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        The coordinates of the models.
+    atoms : list[tuple[str, int, str, str]]
+        The (chain, resnum, resname, atom name) of each atom.
+    names : list[str]
+        The file name of each model.
+    scores : list[float], optional
+        The score of each model.
+    clt_ids : list, optional
+        The cluster id of each model.
+    """
+
+    def __init__(
+            self,
+            coords: NDFloat,
+            atoms: Sequence[AtomRecord],
+            names: Sequence[str],
+            scores: Optional[Sequence[float]] = None,
+            clt_ids: Optional[Sequence[Any]] = None,
+            ) -> None:
+        n_models = len(names)
+        if coords.shape != (n_models, len(atoms), 3):
+            raise ValueError(
+                f"Coordinates shape {coords.shape} does not match "
+                f"{n_models} models of {len(atoms)} atoms."
+                )
+        self.coords = coords
+        self.atoms = [tuple(atom) for atom in atoms]
+        self.names = list(names)
+        self.scores = np.full(n_models, np.nan) if scores is None \
+            else np.asarray(scores, dtype=float)
+        self.clt_ids = [None] * n_models if clt_ids is None \
+            else list(clt_ids)
+        self._shm: Optional[shared_memory.SharedMemory] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def n_atoms(self) -> int:
+        """Number of atoms of each model."""
+        return len(self.atoms)
+
+    @property
+    def chains(self) -> list[str]:
+        """Chains of the ensemble, in order of appearance."""
+        return list(dict.fromkeys(atom[0] for atom in self.atoms))
+
+    def atom_keys(self, add_resname: bool = False) -> list[tuple]:
+        """
+        Get the atom identifiers as used by :py:func:`load_coords`.
+
+        Parameters
+        ----------
+        add_resname : bool
+            Whether to add the residue name to the identifiers.
+
+        Returns
+        -------
+        keys : list[tuple]
+            The (chain, resnum, atom[, resname]) identifier of each atom.
+        """
+        if add_resname:
+            return [(ch, resnum, name, resname)
+                    for ch, resnum, resname, name in self.atoms]
+        return [(ch, resnum, name) for ch, resnum, _, name in self.atoms]
+
+    def select(
+            self,
+            chain: Optional[str] = None,
+            resnums: Optional[Sequence[int]] = None,
+            names: Optional[Sequence[str]] = None,
+            ) -> np.ndarray:
+        """
+        Get the indices of a selection of atoms.
+
+        Parameters
+        ----------
+        chain : str, optional
+            Chain of the atoms.
+        resnums : list[int], optional
+            Residue numbers of the atoms.
+        names : list[str], optional
+            Atom names.
+
+        Returns
+        -------
+        np.ndarray dtype=int
+            Indices of the selected atoms, in ensemble order.
+        """
+        _resnums = None if resnums is None else set(resnums)
+        _names = None if names is None else set(names)
+        return np.array(
+            [
+                i for i, (ch, resnum, _, name) in enumerate(self.atoms)
+                if (chain is None or ch == chain)
+                and (_resnums is None or resnum in _resnums)
+                and (_names is None or name in _names)
+                ],
+            dtype=int,
+            )
+
+    def select_resdic(self, resdic: dict[str, Sequence[int]]) -> np.ndarray:
+        """
+        Get the indices of the atoms of a residues dictionary.
+
+        Parameters
+        ----------
+        resdic : dict[str, list[int]]
+            Residue numbers to select, per chain.
+
+        Returns
+        -------
+        np.ndarray dtype=int
+            Indices of the selected atoms, in ensemble order.
+        """
+        _resdic = {chain: set(resnums) for chain, resnums in resdic.items()}
+        return np.array(
+            [
+                i for i, (ch, resnum, _, _) in enumerate(self.atoms)
+                if resnum in _resdic.get(ch, ())
+                ],
+            dtype=int,
+            )
+
+    def subset(
+            self,
+            atom_idx: Optional[Sequence[int]] = None,
+            model_idx: Optional[Sequence[int]] = None,
+            ) -> "Ensemble":
+        """
+        Get a new ensemble with a subset of the atoms and/or models.
+
+        Parameters
+        ----------
+        atom_idx : list[int], optional
+            Indices of the atoms to keep. All if not given.
+        model_idx : list[int], optional
+            Indices of the models to keep. All if not given.
+
+        Returns
+        -------
+        :py:class:`Ensemble`
+        """
+        if model_idx is None:
+            model_idx = range(len(self))
+        if atom_idx is None:
+            atom_idx = range(self.n_atoms)
+        model_idx = list(model_idx)
+        atom_idx = list(atom_idx)
+        coords = np.ascontiguousarray(self.coords[model_idx][:, atom_idx])
+        return Ensemble(
+            coords,
+            [self.atoms[i] for i in atom_idx],
+            [self.names[i] for i in model_idx],
+            scores=self.scores[model_idx],
+            clt_ids=[self.clt_ids[i] for i in model_idx],
+            )
+
+    @classmethod
+    def from_pdbfiles(
+            cls,
+            models: Sequence[PDBFile],
+            allatoms: bool = False,
+            filter_resdic: Optional[dict[str, list[int]]] = None,
+            keys: Optional[Sequence[tuple]] = None,
+            ) -> "Ensemble":
+        """
+        Build an ensemble from a list of models.
+
+        Only the atoms common to all the models are kept, in the order of
+        the first model, unless ``keys`` are given.
+
+        Parameters
+        ----------
+        models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+            The models.
+        allatoms : bool
+            Use all the heavy atoms instead of the backbone ones.
+        filter_resdic : dict, optional
+            Residues to load, one list per chain.
+        keys : list[tuple], optional
+            The (chain, resnum, atom) identifiers of the atoms to load, in
+            order, as returned by
+            :py:func:`haddock.libs.libalign.check_common_atoms`.
+
+        Returns
+        -------
+        :py:class:`Ensemble`
+        """
+        coord_dics: list[dict[tuple, NDFloat]] = []
+        for model in models:
+            atoms = get_atoms(model, allatoms)
+            coord_dic, _ = load_coords(
+                model,
+                atoms,
+                filter_resdic,
+                add_resname=True,
+                )
+            coord_dics.append(coord_dic)
+
+        if keys is None:
+            common = set(coord_dics[0]).intersection(*coord_dics[1:])
+            res_keys = [key for key in coord_dics[0] if key in common]
+        else:
+            # find the residue names in the first model
+            resnames = {key[:3]: key[3] for key in coord_dics[0]}
+            res_keys = [(*key, resnames[tuple(key)]) for key in keys]
+            # drop the residue names, they may differ between models
+            coord_dics = [
+                {key[:3]: coords for key, coords in coord_dic.items()}
+                for coord_dic in coord_dics
+                ]
+        if not res_keys:
+            raise ALIGNError("The models do not share any atom.")
+        _keys = res_keys if keys is None else [key[:3] for key in res_keys]
+        coords = np.array(
+            [[coord_dic[key] for key in _keys] for coord_dic in coord_dics],
+            dtype=np.float64,
+            ).reshape(len(models), len(_keys), 3)
+        return cls(
+            coords,
+            [
+                (ch, resnum, resname, name)
+                for ch, resnum, name, resname in res_keys
+                ],
+            [model.file_name for model in models],
+            scores=[model.score for model in models],
+            clt_ids=[model.clt_id for model in models],
+            )
+
+    @classmethod
+    def from_coords_store(
+            cls,
+            store: CoordsStore,
+            models: Optional[Sequence[PDBFile]] = None,
+            ) -> "Ensemble":
+        """
+        Build an ensemble from a coordinates store.
+
+        Parameters
+        ----------
+        store : :py:class:`haddock.libs.libcoords.CoordsStore`
+            The coordinates store.
+        models : list[:py:class:`haddock.libs.libontology.PDBFile`], optional
+            The models to take from the store, in order. All the models
+            of the store if not given; then no score and cluster
+            information is available.
+
+        Returns
+        -------
+        :py:class:`Ensemble`
+        """
+        if models is None:
+            return cls(np.asarray(store.coords), store.atoms, store.models)
+        return cls(
+            np.ascontiguousarray(store.get_coords(models)),
+            store.atoms,
+            [model.file_name for model in models],
+            scores=[model.score for model in models],
+            clt_ids=[model.clt_id for model in models],
+            )
+
+    def to_shared_memory(self) -> dict[str, Any]:
+        """
+        Move the coordinates to a shared memory block.
+
+        The returned descriptor is small and can be sent to other
+        processes, which attach to the coordinates with
+        :py:meth:`from_shared_memory`. The block is released by
+        :py:meth:`release_shared_memory`.
+
+        Returns
+        -------
+        descriptor : dict
+            Information needed to rebuild the ensemble.
+        """
+        if self._shm is None:
+            shm = shared_memory.SharedMemory(
+                create=True,
+                size=max(self.coords.nbytes, 1),
+                )
+            shared = np.ndarray(
+                self.coords.shape,
+                dtype=self.coords.dtype,
+                buffer=shm.buf,
+                )
+            shared[:] = self.coords
+            self.coords = shared
+            self._shm = shm
+        return {
+            "shm_name": self._shm.name,
+            "shape": self.coords.shape,
+            "dtype": self.coords.dtype.str,
+            "atoms": self.atoms,
+            "names": self.names,
+            "scores": self.scores.tolist(),
+            "clt_ids": self.clt_ids,
+            }
+
+    @classmethod
+    def from_shared_memory(cls, descriptor: dict[str, Any]) -> "Ensemble":
+        """
+        Attach to an ensemble shared by another process.
+
+        Parameters
+        ----------
+        descriptor : dict
+            As returned by :py:meth:`to_shared_memory`.
+
+        Returns
+        -------
+        :py:class:`Ensemble`
+            The coordinates are a view on the shared memory block.
+        """
+        shm = shared_memory.SharedMemory(name=descriptor["shm_name"])
+        coords = np.ndarray(
+            descriptor["shape"],
+            dtype=np.dtype(descriptor["dtype"]),
+            buffer=shm.buf,
+            )
+        ensemble = cls(
+            coords,
+            descriptor["atoms"],
+            descriptor["names"],
+            scores=descriptor["scores"],
+            clt_ids=descriptor["clt_ids"],
+            )
+        # keep a reference so that the block is not closed under our feet
+        ensemble._shm = shm
+        return ensemble
+
+    def release_shared_memory(self, unlink: bool = False) -> None:
+        """
+        Detach from the shared memory block.
+
+        The coordinates are copied back to private memory first.
+
+        Parameters
+        ----------
+        unlink : bool
+            Also destroy the block. Only the creator should do it, once
+            all the other processes are done.
+        """
+        if self._shm is None:
+            return
+        self.coords = np.array(self.coords)
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
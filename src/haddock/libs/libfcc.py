@@ -1,8 +1,53 @@
 """FCC related functions
 
 NOTE: This functions were ported directly from `https://github.com/haddocking/fcc`!
+
+The pairwise FCC matrix is calculated with sparse matrices: the contacts of
+each model are a row of a binary matrix ``C`` over all the distinct contacts,
+so that the numbers of common contacts of all the pairs are given by
+``C @ C.T``. The product is calculated by blocks of rows, and the neighbors of
+each model are found by thresholding the FCC values of each block
+(:py:func:`calc_fcc_neighbors`).
+
+Models produced continuously can be clustered while they are produced with
+:py:class:`IncrementalFCCClustering`, the final clusters being the same as
+clustering all the models at once.
+
+The residue contacts of the models are calculated in-process
+(:py:func:`load_fcc_contacts`), with the same definitions as the former
+``contact_fcc`` executable.
 """
 
+import heapq
+import math
+from itertools import chain, islice
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from haddock import log
+from haddock.core.typing import FilePath, NDFloat, Optional, Sequence
+from haddock.libs.libcache import get_coord_records
+from haddock.libs.libcontacts import get_residue_contacts
+from haddock.libs.libmatrix import (
+    condensed_index,
+    read_condensed_matrix,
+    read_matrix_header,
+    read_matrix_values,
+    stored_values,
+    write_matrix_block,
+    )
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libpdb import slc_name, slc_resseq, slc_x, slc_y, slc_z
+
+
+FCC_DECIMALS = [2, 3]
+"""Number of decimals of the two FCC values of each pair."""
+
+READ_BLOCK_SIZE = 1_000_000
+"""Number of pairs thresholded at once when reading a matrix."""
+
 
 class Element:
     """Defines a 'clusterable' Element"""
@@ -70,32 +115,31 @@ def cluster_elements(e_pool, threshold):
     """
     Groups Elements within a given threshold
     together in the same cluster.
+
+    The clusters are found by :py:func:`greedy_clustering` on the neighbors
+    of the elements not yet clustered.
     """
 
     cluster_list = []
-    threshold -= 1  # Account for center
     ep = e_pool
-    cn = 1  # Cluster Number
-    while 1:
-        # Clusterable elements
-        ce = [e for e in ep if not ep[e].cluster]
-        if not ce:  # No more elements to cluster
+    names = sorted(e for e in ep if not ep[e].cluster)
+    index = {ep[e]: i for i, e in enumerate(names)}
+    src, dst = [], []
+    for i, e in enumerate(names):
+        for neighbor in ep[e].neighbors:
+            if neighbor in index:
+                src.append(i)
+                dst.append(index[neighbor])
+    graph = build_neighbor_graph(
+        len(names),
+        [(np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64))],
+        )
+    centers, counts, _ = greedy_clustering(graph)
+    # the clusters are created in the same order, from the same centers
+    for cn, (ctr, ctr_nlist) in enumerate(zip(centers, counts), start=1):
+        if ctr_nlist < threshold - 1:  # Account for center
             break
-
-        # Select Cluster Center
-        # Element with largest neighbor list
-        ctr_nlist, ctr = sorted(
-            [(len([se for se in ep[e].neighbors if not se.cluster]), e) for e in ce]
-        )[-1]
-
-        # Cluster until length of remaining elements lists are above threshold
-        if ctr_nlist < threshold:
-            break
-
-        # Create Cluster
-        c = Cluster(cn, ep[ctr])
-        cn += 1
-        cluster_list.append(c)
+        cluster_list.append(Cluster(cn, ep[names[ctr]]))
 
     return ep, cluster_list
 
@@ -123,19 +167,15 @@ def read_matrix(path, cutoff_param, strictness):
     with anything remotely similar.
     """
 
+    if Path(path).suffix == ".npy":
+        return read_binary_matrix(path, cutoff_param, strictness)
+
     cutoff_param = float(cutoff_param)
     partner_cutoff = float(cutoff_param) * float(strictness)
 
     elements = {}
 
-    f = open(path, "r")
-    for line in f:
-        ref, mobi, d_rm, d_mr = line.split()
-        ref = int(ref)
-        mobi = int(mobi)
-        d_rm = float(d_rm)
-        d_mr = float(d_mr)
-
+    for ref, mobi, d_rm, d_mr in iter_matrix(path):
         # Create or Retrieve Elements
         if ref not in elements:
             r = Element(ref)
@@ -155,11 +195,63 @@ def read_matrix(path, cutoff_param, strictness):
         if d_mr >= cutoff_param and d_rm >= partner_cutoff:
             m.add_neighbor(r)
 
-    f.close()
-
     return elements
 
 
+def read_binary_matrix(path, cutoff_param, strictness):
+    """
+    Read a binary FCC matrix and create a dictionary of Elements.
+
+    Same as :py:func:`read_matrix`, the matrix being thresholded by blocks
+    of pairs.
+    """
+    n_models = read_matrix_header(path)["n_models"]
+    neighbors = list(read_binary_neighbors(path, cutoff_param, strictness))
+    return build_elements(n_models, neighbors)
+
+
+def read_binary_neighbors(path, cutoff_param, strictness):
+    """
+    Threshold a binary FCC matrix by blocks of pairs.
+
+    Yields the blocks of models and their neighbors, 0-based, see
+    :py:func:`get_fcc_neighbors`.
+    """
+    n_models = read_matrix_header(path)["n_models"]
+    for start_row, end_row in fcc_row_dispatcher(n_models, 1, READ_BLOCK_SIZE):
+        refs, mobis = get_block_pairs(start_row, end_row, n_models)
+        start = condensed_index(start_row, start_row + 1, n_models)
+        values = read_matrix_values(path, np.arange(start, start + len(refs)))
+        yield get_fcc_neighbors(refs, mobis, values, cutoff_param, strictness)
+
+
+def iter_matrix(path):
+    """
+    Iterates over the pairs of a four column matrix.
+
+    Reads binary condensed matrices (``.npy``, see
+    :py:mod:`haddock.libs.libmatrix`) as well as text ones.
+
+    Yields (ref, mobi, d_rm, d_mr) tuples, with 1-based indices.
+    """
+    if Path(path).suffix == ".npy":
+        n_models = read_matrix_header(path)["n_models"]
+        values = read_condensed_matrix(path).tolist()
+        refs, mobis = np.triu_indices(n_models, k=1)
+        for ref, mobi, (d_rm, d_mr) in zip(
+                (refs + 1).tolist(),
+                (mobis + 1).tolist(),
+                values,
+                ):
+            yield ref, mobi, d_rm, d_mr
+        return
+
+    with open(path, "r") as f:
+        for line in f:
+            ref, mobi, d_rm, d_mr = line.split()
+            yield int(ref), int(mobi), float(d_rm), float(d_mr)
+
+
 def parse_contact_file(f_list, ignore_chain):
     """Parses a list of contact files."""
 
@@ -179,6 +271,136 @@ def parse_contact_file(f_list, ignore_chain):
     return contacts
 
 
+def read_contact_atoms(pdb_f: FilePath) -> tuple[NDFloat, NDFloat, NDFloat]:
+    """
+    Read the heavy atoms of a PDB file used to calculate FCC contacts.
+
+    As in the ``contact_fcc`` executable, only the ATOM records are read, and
+    the atoms are grouped in segments by their segment ID (column 73): a new
+    segment starts at each change of segment ID, numbered from 1.
+
+    Returns
+    -------
+    segments : np.ndarray dtype=int
+        The segment of each atom.
+    resids : np.ndarray dtype=int
+        The residue number of each atom.
+    coords : np.ndarray dtype=float32, shape=(n_atoms, 3)
+        The coordinates of the atoms.
+    """
+    if isinstance(pdb_f, PDBFile):
+        pdb_f = pdb_f.rel_path
+    segments: list[int] = []
+    resids: list[int] = []
+    coords: list[tuple[float, float, float]] = []
+    curr_seg = None
+    seg_id = 0
+    for line in get_coord_records(pdb_f):
+        if not line.startswith("ATOM"):
+            continue
+        atom_name = line[slc_name].strip()
+        # ignore hydrogens
+        if atom_name[:1] == "H" or (
+                atom_name[:1].isdigit() and atom_name[1:2] == "H"):
+            continue
+        seg = line[72:73]
+        if seg != curr_seg:
+            curr_seg = seg
+            seg_id += 1
+        segments.append(seg_id)
+        resids.append(int(line[slc_resseq]))
+        coords.append(
+            (float(line[slc_x]), float(line[slc_y]), float(line[slc_z]))
+            )
+    return (
+        np.array(segments, dtype=np.int64),
+        np.array(resids, dtype=np.int64),
+        np.array(coords, dtype=np.float32).reshape(-1, 3),
+        )
+
+
+def get_fcc_contacts(
+        segments: NDFloat,
+        resids: NDFloat,
+        coords: NDFloat,
+        cutoff: float = 5.0,
+        ) -> set[int]:
+    """
+    Calculate the residue contacts between the segments of a model.
+
+    The distances are checked in single precision, as in the
+    ``contact_fcc`` executable, and the contacts are encoded in the same
+    way, as the integer formed by the residue number + 10000 and the segment
+    of each residue.
+
+    Returns
+    -------
+    contacts : set[int]
+        The encoded contacts, the first segment being the lowest.
+    """
+    contacts = get_residue_contacts(
+        segments,
+        resids + 10000,
+        coords,
+        cutoff,
+        dtype=np.float32,
+        )
+    return {
+        int(f"{res_a}{seg_a}{res_b}{seg_b}")
+        for seg_a, res_a, seg_b, res_b in contacts
+        }
+
+
+def write_contact_file(con_f: FilePath, contacts: set[int]) -> None:
+    """Write the contacts of a model, one per line."""
+    with open(con_f, "w") as fh:
+        fh.write("".join(f"{con}\n" for con in sorted(contacts)))
+
+
+def load_fcc_contacts(
+        model_list: Sequence[FilePath],
+        cutoff: float = 5.0,
+        write_contacts: bool = False,
+        core: int = 0,
+        ) -> tuple[int, list[Optional[set[int]]]]:
+    """
+    Calculate the FCC contacts of a list of models.
+
+    Parameters
+    ----------
+    model_list : list[PDBFile]
+        The models.
+    cutoff : float
+        Distance cutoff between two atoms, in Angstrom.
+    write_contacts : bool
+        Also write the contacts of each model to a ``.con`` file in the
+        current directory, named after the model.
+    core : int
+        The core, to restore the order of the chunks.
+
+    Returns
+    -------
+    core : int
+        The core.
+    contacts : list[set[int]]
+        The contacts of each model, None for models without atoms.
+    """
+    contacts: list[Optional[set[int]]] = []
+    for model in model_list:
+        segments, resids, coords = read_contact_atoms(model)
+        if len(coords) == 0:
+            log.warning(f"No atoms to calculate the contacts of {model}")
+            contacts.append(None)
+            continue
+        model_contacts = get_fcc_contacts(segments, resids, coords, cutoff)
+        if write_contacts:
+            name = model.file_name if isinstance(model, PDBFile) else model
+            con_f = Path(Path(name).name.replace(".pdb", ".con"))
+            write_contact_file(con_f, model_contacts)
+        contacts.append(model_contacts)
+    return core, contacts
+
+
 def calculate_fcc(list_a, list_b):
     """
     Calculates the fraction of common elements between two lists
@@ -231,3 +453,592 @@ def calculate_pairwise_matrix(contacts, ignore_chain):
             cc, cc_v = calc_fcc(contacts[i], contacts[k])
             fcc, fcc_v = cc * contact_lengths[i], cc * contact_lengths[k]
             yield i + 1, k + 1, fcc, fcc_v
+
+
+def build_contact_matrix(contacts: Sequence[set[int]]) -> sparse.csr_matrix:
+    """
+    Encode the contacts of each model as a row of a binary sparse matrix.
+
+    Parameters
+    ----------
+    contacts : list[set[int]]
+        The unique contacts of each model, as given by
+        :py:func:`parse_contact_file`.
+
+    Returns
+    -------
+    contact_matrix : scipy.sparse.csr_matrix, shape=(n_models, n_contacts)
+        One column per distinct contact of all the models.
+    """
+    lengths = np.array([len(con) for con in contacts], dtype=np.int64)
+    values = np.fromiter(
+        chain.from_iterable(contacts),
+        dtype=np.int64,
+        count=int(lengths.sum()),
+        )
+    vocabulary, columns = np.unique(values, return_inverse=True)
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    return sparse.csr_matrix(
+        (np.ones(len(values), dtype=np.int32), columns.ravel(), indptr),
+        shape=(len(contacts), len(vocabulary)),
+        )
+
+
+def fcc_row_dispatcher(
+        n_models: int,
+        ncores: int,
+        block_size: int,
+        ) -> list[tuple[int, int]]:
+    """
+    Split the rows of the condensed matrix in blocks of about equal pairs.
+
+    There are at least as many blocks as cores (unless there are less
+    rows), and enough blocks to hold about ``block_size`` pairs each, so
+    that the memory used by each block is bounded.
+
+    Returns
+    -------
+    blocks : list[tuple[int, int]]
+        The first and last (excluded) reference model of each block.
+    """
+    if n_models < 2:
+        return []
+    row_pairs = np.arange(n_models - 1, 0, -1)
+    cumulated = np.cumsum(row_pairs)
+    tot_npairs = int(cumulated[-1])
+    nblocks = max(ncores, math.ceil(tot_npairs / block_size))
+    nblocks = min(nblocks, n_models - 1)
+    bounds = np.searchsorted(
+        cumulated,
+        tot_npairs * np.arange(1, nblocks) / nblocks,
+        ) + 1
+    edges = np.unique(np.concatenate(([0], bounds, [n_models - 1])))
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def get_block_pairs(
+        start_row: int,
+        end_row: int,
+        n_models: int,
+        ) -> tuple[NDFloat, NDFloat]:
+    """
+    Get the pairs of a block of rows, in condensed matrix order.
+
+    Returns
+    -------
+    refs : np.ndarray dtype=int
+        The reference model of each pair.
+    mobis : np.ndarray dtype=int
+        The mobile model of each pair.
+    """
+    rows = np.arange(start_row, end_row)
+    refs, mobis = np.nonzero(np.arange(n_models)[None, :] > rows[:, None])
+    return refs + start_row, mobis
+
+
+def calc_fcc_block(
+        contact_matrix: sparse.csr_matrix,
+        start_row: int,
+        end_row: int,
+        ) -> NDFloat:
+    """
+    Calculate the FCC values of the pairs of a block of rows.
+
+    Parameters
+    ----------
+    contact_matrix : scipy.sparse.csr_matrix
+        The contacts of the models, see :py:func:`build_contact_matrix`.
+    start_row : int
+        First reference model of the block.
+    end_row : int
+        Last reference model of the block, excluded.
+
+    Returns
+    -------
+    values : np.ndarray dtype=float, shape=(n_pairs, 2)
+        FCC(ref/mobi) and FCC(mobi/ref) of each pair (ref, mobi > ref), in
+        condensed matrix order, as :py:func:`calculate_pairwise_matrix`.
+    """
+    n_models = contact_matrix.shape[0]
+    lengths = np.diff(contact_matrix.indptr)
+    contact_lengths = np.divide(
+        1.0,
+        lengths,
+        out=np.zeros(n_models),
+        where=lengths > 0,
+        )
+    common = contact_matrix[start_row:end_row] @ contact_matrix.T
+    common = common.toarray()
+    refs, mobis = get_block_pairs(start_row, end_row, n_models)
+    cc = common[refs - start_row, mobis]
+    return np.column_stack(
+        (cc * contact_lengths[refs], cc * contact_lengths[mobis])
+        )
+
+
+def get_fcc_neighbors(
+        refs: NDFloat,
+        mobis: NDFloat,
+        values: NDFloat,
+        cutoff_param: float,
+        strictness: float,
+        ) -> tuple[NDFloat, NDFloat]:
+    """
+    Threshold the FCC values of pairs of models, as :py:func:`read_matrix`.
+
+    Returns
+    -------
+    elements : np.ndarray dtype=int
+        The models having a neighbor.
+    neighbors : np.ndarray dtype=int
+        The neighbor of each of these models.
+    """
+    cutoff_param = float(cutoff_param)
+    partner_cutoff = float(cutoff_param) * float(strictness)
+    d_rm = values[:, 0]
+    d_mr = values[:, 1]
+    forward = (d_rm >= cutoff_param) & (d_mr >= partner_cutoff)
+    backward = (d_mr >= cutoff_param) & (d_rm >= partner_cutoff)
+    return (
+        np.concatenate((refs[forward], mobis[backward])),
+        np.concatenate((mobis[forward], refs[backward])),
+        )
+
+
+def calc_fcc_neighbors(
+        contact_matrix: sparse.csr_matrix,
+        start_row: int,
+        end_row: int,
+        cutoff_param: float,
+        strictness: float,
+        matrix_path: Optional[FilePath] = None,
+        block: int = 0,
+        ) -> tuple[int, tuple[NDFloat, NDFloat]]:
+    """
+    Calculate the FCC values and the neighbors of a block of rows.
+
+    The values are written in the binary condensed matrix if a
+    ``matrix_path`` is given, and thresholded as they would be read from it.
+
+    Returns
+    -------
+    block : int
+        The block, to restore the order of the blocks.
+    neighbors : tuple[np.ndarray, np.ndarray]
+        The models and their neighbors, see :py:func:`get_fcc_neighbors`.
+    """
+    n_models = contact_matrix.shape[0]
+    values = calc_fcc_block(contact_matrix, start_row, end_row)
+    if matrix_path is not None:
+        write_matrix_block(
+            matrix_path,
+            condensed_index(start_row, start_row + 1, n_models),
+            values,
+            decimals=FCC_DECIMALS,
+            )
+    refs, mobis = get_block_pairs(start_row, end_row, n_models)
+    return block, get_fcc_neighbors(
+        refs,
+        mobis,
+        stored_values(values, FCC_DECIMALS),
+        cutoff_param,
+        strictness,
+        )
+
+
+def build_elements(
+        n_models: int,
+        neighbors: Sequence[tuple[NDFloat, NDFloat]],
+        ) -> dict[int, Element]:
+    """
+    Create the dictionary of Elements from their neighbors.
+
+    Parameters
+    ----------
+    n_models : int
+        The number of models.
+    neighbors : list[tuple[np.ndarray, np.ndarray]]
+        Blocks of models and their neighbors, 0-based.
+
+    Returns
+    -------
+    elements : dict[int, Element]
+        The Elements, named after their 1-based index as in
+        :py:func:`read_matrix`.
+    """
+    # a matrix without pairs has no element
+    if n_models < 2:
+        return {}
+    elements = {name: Element(name) for name in range(1, n_models + 1)}
+    for models, model_neighbors in neighbors:
+        for name, neighbor in zip(
+                (models + 1).tolist(),
+                (model_neighbors + 1).tolist(),
+                ):
+            elements[name].add_neighbor(elements[neighbor])
+    return elements
+
+
+def build_neighbor_graph(
+        n_models: int,
+        neighbors: Sequence[tuple[NDFloat, NDFloat]],
+        ) -> sparse.csr_matrix:
+    """
+    Create the neighbor graph of the models.
+
+    Parameters
+    ----------
+    n_models : int
+        The number of models.
+    neighbors : list[tuple[np.ndarray, np.ndarray]]
+        Blocks of models and their neighbors, 0-based.
+
+    Returns
+    -------
+    graph : scipy.sparse.csr_matrix dtype=bool, shape=(n_models, n_models)
+        ``graph[i, j]`` is true if the model ``j`` is a neighbor of ``i``.
+    """
+    # a matrix without pairs has no element
+    if n_models < 2:
+        n_models = 0
+        neighbors = []
+    models = np.concatenate(
+        [np.empty(0, dtype=np.int64)] + [block[0] for block in neighbors]
+        )
+    model_neighbors = np.concatenate(
+        [np.empty(0, dtype=np.int64)] + [block[1] for block in neighbors]
+        )
+    graph = sparse.csr_matrix(
+        (np.ones(len(models), dtype=bool), (models, model_neighbors)),
+        shape=(n_models, n_models),
+        )
+    graph.sum_duplicates()
+    graph.sort_indices()
+    return graph
+
+
+def read_neighbor_graph(
+        path: FilePath,
+        cutoff_param: float,
+        strictness: float,
+        ) -> sparse.csr_matrix:
+    """
+    Read the neighbor graph of the models from an FCC matrix.
+
+    Same neighbors as :py:func:`read_matrix`, for binary and text matrices.
+    """
+    if Path(path).suffix == ".npy":
+        n_models = read_matrix_header(path)["n_models"]
+        return build_neighbor_graph(
+            n_models,
+            list(read_binary_neighbors(path, cutoff_param, strictness)),
+            )
+
+    n_models = 0
+    neighbors = []
+    pairs = iter_matrix(path)
+    while True:
+        block = np.array(list(islice(pairs, READ_BLOCK_SIZE)), ndmin=2)
+        if block.size == 0:
+            break
+        refs = block[:, 0].astype(np.int64) - 1
+        mobis = block[:, 1].astype(np.int64) - 1
+        n_models = max(n_models, int(mobis.max()) + 1, int(refs.max()) + 1)
+        neighbors.append(get_fcc_neighbors(
+            refs,
+            mobis,
+            block[:, 2:],
+            cutoff_param,
+            strictness,
+            ))
+    return build_neighbor_graph(n_models, neighbors)
+
+
+def greedy_clustering(
+        graph: sparse.csr_matrix,
+        ) -> tuple[NDFloat, NDFloat, NDFloat]:
+    """
+    Cluster all the models of a neighbor graph.
+
+    The center of each new cluster is the model with the most unclustered
+    neighbors, the highest index on ties, and its unclustered neighbors are
+    its members, as in :py:func:`cluster_elements`. The numbers of
+    unclustered neighbors are updated from the transposed graph each time
+    models are clustered, and the model with the most is taken from a heap.
+
+    The number of members of the successive clusters never increases, so
+    that the clusters obtained with a ``threshold`` are the first clusters
+    having at least ``threshold - 1`` members.
+
+    Parameters
+    ----------
+    graph : scipy.sparse.csr_matrix
+        The neighbor graph, see :py:func:`build_neighbor_graph`.
+
+    Returns
+    -------
+    centers : np.ndarray dtype=int
+        The center of each cluster.
+    counts : np.ndarray dtype=int
+        The number of members of each cluster, besides its center.
+    labels : np.ndarray dtype=int
+        The cluster of each model.
+    """
+    graph = sparse.csr_matrix(graph, dtype=bool)
+    graph.eliminate_zeros()
+    reverse = graph.transpose().tocsr()
+    n_models = graph.shape[0]
+    counts = np.diff(graph.indptr).astype(np.int64)
+    labels = np.full(n_models, -1, dtype=np.int64)
+    heap = list(zip((-counts).tolist(), range(0, -n_models, -1)))
+    heapq.heapify(heap)
+    centers: list[int] = []
+    center_counts: list[int] = []
+    while heap:
+        neg_count, neg_center = heapq.heappop(heap)
+        center = -neg_center
+        # skip the outdated entries
+        if labels[center] != -1 or counts[center] != -neg_count:
+            continue
+        members = graph.indices[graph.indptr[center]:graph.indptr[center + 1]]
+        members = members[labels[members] == -1]
+        clustered = np.append(members, center)
+        labels[clustered] = len(centers)
+        centers.append(center)
+        center_counts.append(len(members))
+
+        # the clustered models are no longer neighbors of the others
+        affected = np.concatenate([
+            reverse.indices[reverse.indptr[model]:reverse.indptr[model + 1]]
+            for model in clustered.tolist()
+            ])
+        affected = affected[labels[affected] == -1]
+        if len(affected) == 0:
+            continue
+        models, lost = np.unique(affected, return_counts=True)
+        counts[models] -= lost
+        for model, count in zip(models.tolist(), counts[models].tolist()):
+            heapq.heappush(heap, (-count, -model))
+    return (
+        np.array(centers, dtype=np.int64),
+        np.array(center_counts, dtype=np.int64),
+        labels,
+        )
+
+
+def make_clusters(
+        centers: NDFloat,
+        counts: NDFloat,
+        labels: NDFloat,
+        threshold: int,
+        ) -> list[Cluster]:
+    """
+    Create the Clusters found with a population threshold.
+
+    Parameters
+    ----------
+    centers, counts, labels : np.ndarray
+        The clusters of all the models, see :py:func:`greedy_clustering`.
+    threshold : int
+        The minimum population of a cluster.
+
+    Returns
+    -------
+    clusters : list[Cluster]
+        The Clusters, their Elements being named after the 1-based index of
+        the models, as :py:func:`cluster_elements` would give.
+    """
+    n_clusters = int(np.count_nonzero(counts >= threshold - 1))
+    order = np.argsort(labels, kind="stable")
+    sizes = np.bincount(labels, minlength=len(centers))
+    bounds = np.concatenate(([0], np.cumsum(sizes)))
+    clusters = []
+    for name in range(1, n_clusters + 1):
+        center = int(centers[name - 1])
+        cluster = Cluster(name, Element(center + 1))
+        for model in order[bounds[name - 1]:bounds[name]].tolist():
+            if model != center:
+                cluster.add_member(Element(model + 1))
+        clusters.append(cluster)
+    return clusters
+
+
+def get_min_population(counts: NDFloat, min_population_param: int) -> int:
+    """
+    Lower the min_population until a cluster is found.
+
+    Parameters
+    ----------
+    counts : np.ndarray dtype=int
+        The number of members of each cluster, see
+        :py:func:`greedy_clustering`.
+    min_population_param : int
+        The min_population parameter.
+
+    Returns
+    -------
+    min_population : int
+        The largest min_population, at most ``min_population_param``, giving
+        at least one cluster, 1 if there are no models.
+    """
+    # the largest cluster is the first one
+    if len(counts) == 0:
+        return 1
+    return min(min_population_param, int(counts[0]) + 1)
+
+
+class IncrementalFCCClustering:
+    """
+    Cluster models by FCC while they are produced.
+
+    The contacts of the models are given in batches. The FCC values between
+    the models of each batch and all the previous models are calculated as
+    in :py:func:`calc_fcc_block`, and their neighbors are accumulated, so
+    that each model is compared only once to the others. Provisional
+    clusters can be obtained at any time, and are the clusters of the
+    ``clustfcc`` module once all the models are given.
+
+    Parameters
+    ----------
+    cutoff_param : float
+        The FCC cutoff of the neighbors (``clust_cutoff``).
+    strictness : float
+        The strictness factor.
+
+    Examples
+    --------
+    >>> clustering = IncrementalFCCClustering(0.6, 0.75)
+    >>> for batch in batches:
+    ...     clustering.add_contacts(batch)
+    ...     clusters, min_population = clustering.get_clusters(4)
+    """
+
+    def __init__(self, cutoff_param: float, strictness: float) -> None:
+        self.cutoff_param = cutoff_param
+        self.strictness = strictness
+        self.contact_matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.neighbors: list[tuple[NDFloat, NDFloat]] = []
+        self._columns: dict[int, int] = {}
+
+    @property
+    def n_models(self) -> int:
+        """Number of models given so far."""
+        return self.contact_matrix.shape[0]
+
+    def add_contacts(
+            self,
+            contacts: Sequence[set[int]],
+            ) -> tuple[NDFloat, NDFloat]:
+        """
+        Add a batch of models.
+
+        Parameters
+        ----------
+        contacts : list[set[int]]
+            The contacts of each new model, see :py:func:`load_fcc_contacts`.
+
+        Returns
+        -------
+        neighbors : tuple[np.ndarray, np.ndarray]
+            The new pairs of neighbors, see :py:func:`get_fcc_neighbors`.
+        """
+        if not contacts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        columns = self._columns
+        indices = [
+            columns.setdefault(con, len(columns))
+            for model_contacts in contacts
+            for con in sorted(model_contacts)
+            ]
+        lengths = [len(model_contacts) for model_contacts in contacts]
+        new_rows = sparse.csr_matrix(
+            (
+                np.ones(len(indices), dtype=np.int32),
+                np.array(indices, dtype=np.int64),
+                np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                ),
+            shape=(len(contacts), len(columns)),
+            )
+        first_model = self.n_models
+        self.contact_matrix.resize((first_model, len(columns)))
+        self.contact_matrix = sparse.vstack(
+            (self.contact_matrix, new_rows),
+            format="csr",
+            )
+
+        # the new models are the mobile models of the pairs, by chunks of
+        #  about READ_BLOCK_SIZE pairs
+        chunk = max(1, READ_BLOCK_SIZE // self.n_models)
+        new_neighbors = []
+        for start in range(first_model, self.n_models, chunk):
+            end = min(start + chunk, self.n_models)
+            new_neighbors.append(self._calc_neighbors(start, end))
+        neighbors = (
+            np.concatenate(
+                [np.empty(0, dtype=np.int64)]
+                + [block[0] for block in new_neighbors]
+                ),
+            np.concatenate(
+                [np.empty(0, dtype=np.int64)]
+                + [block[1] for block in new_neighbors]
+                ),
+            )
+        self.neighbors.append(neighbors)
+        return neighbors
+
+    def _calc_neighbors(self, start: int, end: int) -> tuple[NDFloat, NDFloat]:
+        """Find the neighbors of the pairs of mobile models start to end."""
+        matrix = self.contact_matrix
+        lengths = np.diff(matrix.indptr)
+        contact_lengths = np.divide(
+            1.0,
+            lengths,
+            out=np.zeros(len(lengths)),
+            where=lengths > 0,
+            )
+        common = (matrix[:end] @ matrix[start:end].T).toarray()
+        refs, mobis = np.nonzero(
+            np.arange(end)[:, None] < np.arange(start, end)[None, :]
+            )
+        cc = common[refs, mobis]
+        mobis = mobis + start
+        values = np.column_stack(
+            (cc * contact_lengths[refs], cc * contact_lengths[mobis])
+            )
+        return get_fcc_neighbors(
+            refs,
+            mobis,
+            stored_values(values, FCC_DECIMALS),
+            self.cutoff_param,
+            self.strictness,
+            )
+
+    def get_neighbor_graph(self) -> sparse.csr_matrix:
+        """Get the neighbor graph of the models given so far."""
+        return build_neighbor_graph(self.n_models, self.neighbors)
+
+    def get_clusters(
+            self,
+            min_population_param: int,
+            ) -> tuple[list[Cluster], int]:
+        """
+        Cluster the models given so far.
+
+        Parameters
+        ----------
+        min_population_param : int
+            The min_population parameter, lowered until a cluster is found.
+
+        Returns
+        -------
+        clusters : list[Cluster]
+            The clusters.
+        min_population : int
+            The min_population used to obtain the clusters.
+        """
+        centers, counts, labels = greedy_clustering(self.get_neighbor_graph())
+        min_population = get_min_population(counts, min_population_param)
+        clusters = make_clusters(centers, counts, labels, min_population)
+        return clusters, min_population
@@ -6,10 +6,12 @@ import os
 import stat
 import tarfile
 import re
+import shutil
 from functools import partial
 from multiprocessing import Pool
 from pathlib import Path
 
+import pandas as pd
 import yaml
 
 from haddock import log
@@ -21,11 +23,16 @@ from haddock.core.typing import (
     Iterable,
     Mapping,
     Optional,
+    TextIO,
     )
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libutil import sort_numbered_paths
 
 
+UNPACKED_DIRNAME = "unpacked"
+"""Folder, relative to the working directory, of decompressed inputs."""
+
+
 def clean_suffix(ext: str) -> str:
     """
     Remove the preffix dot of an extension if exists.
@@ -209,6 +216,32 @@ def add_suffix_to_files(
         yield path
 
 
+def format_table_value(value: Any) -> str:
+    """
+    Format a value of the tables written by the ``write_*_to_file`` functions.
+
+    Parameters
+    ----------
+    value : Any
+        The value to format.
+
+    Returns
+    -------
+    str
+        The path for paths and models, the value for integers and strings,
+        ``-`` for None, and the value with three decimals otherwise.
+    """
+    if isinstance(value, Path):
+        return str(value)
+    elif isinstance(value, PDBFile):
+        return str(value.rel_path)
+    elif isinstance(value, (int, str)):
+        return f"{value}"
+    elif value is None:
+        return "-"
+    return f"{value:.3f}"
+
+
 def write_dic_to_file(
         data_dict: Mapping[Any, Any],
         output_fname: FilePath,
@@ -234,21 +267,7 @@ def write_dic_to_file(
 
     with open(output_fname, "w") as out_fh:
         out_fh.write(header + os.linesep)
-        row_l: list[str] = []
-        for element in data_dict:
-            value = data_dict[element]
-            if isinstance(value, Path):
-                row_l.append(str(value))
-            elif isinstance(value, PDBFile):
-                row_l.append(str(value.rel_path))
-            elif isinstance(value, int):
-                row_l.append(f"{value}")
-            elif isinstance(value, str):
-                row_l.append(f"{value}")
-            elif value is None:
-                row_l.append("-")
-            else:
-                row_l.append(f"{value:.3f}")
+        row_l = [format_table_value(value) for value in data_dict.values()]
         out_fh.write(sep.join(row_l) + os.linesep)
 
 
@@ -282,21 +301,55 @@ def write_nested_dic_to_file(
     with open(output_fname, "w") as out_fh:
         out_fh.write(header + os.linesep)
         for row in data_dict:
-            row_l: list[str] = []
-            for element in data_dict[row]:
-                value = data_dict[row][element]
-                if isinstance(value, Path):
-                    row_l.append(str(value))
-                elif isinstance(value, PDBFile):
-                    row_l.append(str(value.rel_path))
-                elif isinstance(value, int):
-                    row_l.append(f"{value}")
-                elif isinstance(value, str):
-                    row_l.append(f"{value}")
-                elif value is None:
-                    row_l.append("-")
-                else:
-                    row_l.append(f"{value:.3f}")
+            row_l = [
+                format_table_value(value)
+                for value in data_dict[row].values()
+                ]
+            out_fh.write(sep.join(row_l) + os.linesep)
+
+
+def write_dataframe_to_file(
+        table: pd.DataFrame,
+        output_fname: FilePath,
+        info_header: str = "",
+        sep: str = "\t",
+        ) -> None:
+    """
+    Create a table from a data frame.
+
+    Writes the same table as :py:func:`write_nested_dic_to_file`, but
+    formats each column at once: float columns with three decimals, integer
+    columns as such, and the values of the other columns one by one with
+    :py:func:`format_table_value`. The index is not written.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        Table to write.
+    output_fname : str or Path
+        Name of the output file.
+    info_header : str
+        Header to write before the table.
+    sep : str
+        Column separator.
+    """
+    columns: list[Iterable[str]] = []
+    for name in table.columns:
+        values = table[name].to_numpy()
+        if values.dtype.kind == "f":
+            columns.append(map("{:.3f}".format, values.tolist()))
+        elif values.dtype.kind in "iub":
+            columns.append(map(str, values.tolist()))
+        else:
+            columns.append(map(format_table_value, values))
+
+    header = sep.join(map(str, table.columns))
+    if info_header:
+        header = info_header + os.linesep + header
+
+    with open(output_fname, "w") as out_fh:
+        out_fh.write(header + os.linesep)
+        for row_l in zip(*columns):
             out_fh.write(sep.join(row_l) + os.linesep)
 
 
@@ -374,6 +427,11 @@ def gzip_files(
 
     compresslevel : int
         The compress level. Defaults to 9.
+
+    Notes
+    -----
+    As with the ``gzip`` command, the compressed file keeps the permissions
+    and modification time of the original file.
     """
     if block_size is None:
         block_size = 2 * 10**8
@@ -386,6 +444,7 @@ def gzip_files(
         while content:
             gout.write(content)
             content = fin.read(block_size)
+    shutil.copystat(file_, gfile)
 
     if remove_original:
         Path(file_).unlink()
@@ -561,12 +620,115 @@ def file_exists(
     raise exception(emsg.format(str(path)))
 
 
+def get_pdb_path(pdb_path: FilePath) -> Path:
+    """
+    Get the path of a PDB file, or of its gzipped version.
+
+    Models of cleaned runs are gzipped (``.pdb.gz``). If the plain file
+    does not exist but the gzipped one does, the path to the gzipped
+    file is returned.
+
+    Parameters
+    ----------
+    pdb_path : str or pathlib.Path
+        Path to the PDB file.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the existing file; ``pdb_path`` itself if none exists.
+    """
+    pdb_path = Path(pdb_path)
+    if not pdb_path.exists():
+        gz_pdb_path = pdb_path.with_suffix(pdb_path.suffix + ".gz")
+        if gz_pdb_path.exists():
+            return gz_pdb_path
+    return pdb_path
+
+
+def open_pdb(pdb_path: FilePath) -> TextIO:
+    """
+    Open a PDB file for reading, decompressing it on the fly if gzipped.
+
+    Parameters
+    ----------
+    pdb_path : str or pathlib.Path
+        Path to the PDB file, either plain or gzipped. If the plain file
+        does not exist, its ``.gz`` version is read.
+
+    Returns
+    -------
+    file object
+        Text stream of the PDB file.
+    """
+    pdb_path = get_pdb_path(pdb_path)
+    if pdb_path.suffix == ".gz":
+        return gzip.open(pdb_path, "rt")
+    return open(pdb_path, "r")
+
+
+def unpack_if_gzipped(
+        pdb_path: FilePath,
+        dest: FilePath = UNPACKED_DIRNAME,
+        ) -> Path:
+    """
+    Get a plain version of a possibly gzipped file.
+
+    To be used only by consumers needing a plain file on disk, such as
+    CNS. A gzipped file is decompressed in `dest`, under a subfolder named
+    after its own folder, so the (cleaned) step folder it belongs to is
+    left untouched. The caller owns the decompressed copies and removes
+    them with :py:func:`remove_unpacked` once they have been read.
+
+    Parameters
+    ----------
+    pdb_path : str or pathlib.Path
+        Path to the plain file (without the ``.gz`` extension).
+
+    dest : str or pathlib.Path
+        Folder where gzipped files are decompressed.
+
+    Returns
+    -------
+    pathlib.Path
+        The path to the plain file: `pdb_path` itself if it is not
+        gzipped, the decompressed copy otherwise.
+    """
+    pdb_path = Path(pdb_path)
+    gz_pdb_path = get_pdb_path(pdb_path)
+    if gz_pdb_path == pdb_path:
+        return pdb_path
+
+    plain_path = Path(dest, pdb_path.parent.name, pdb_path.name)
+    if not plain_path.exists():
+        plain_path.parent.mkdir(parents=True, exist_ok=True)
+        # inputs may be prepared in parallel, the copy appears atomically
+        tmp_path = Path(f"{plain_path}.{os.getpid()}.tmp")
+        with gzip.open(gz_pdb_path, "rb") as fin, \
+                open(tmp_path, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+        os.replace(tmp_path, plain_path)
+    return plain_path
+
+
+def remove_unpacked(dest: FilePath = UNPACKED_DIRNAME) -> None:
+    """
+    Remove the files decompressed by :py:func:`unpack_if_gzipped`.
+
+    Parameters
+    ----------
+    dest : str or pathlib.Path
+        Folder where gzipped files were decompressed.
+    """
+    shutil.rmtree(dest, ignore_errors=True)
+
+
 def pdb_path_exists(pdb_path: Path) -> tuple[bool, Optional[str]]:
     """
     Check if a pdb path exists.
 
-    If not, checks for the existence of a gzipped pdb file and informs the user
-    that the file is gzipped
+    The gzipped version of the file (``.pdb.gz``) is also accepted, as it
+    can be read with :py:func:`open_pdb`.
 
     Parameters
     ----------
@@ -581,12 +743,8 @@ def pdb_path_exists(pdb_path: Path) -> tuple[bool, Optional[str]]:
         the error message
     """
     exists, msg = True, None
-    if not pdb_path.exists():
+    if not get_pdb_path(pdb_path).exists():
         msg = f"PDB file {pdb_path} not found."
-        gz_pdb_path = pdb_path.with_suffix(pdb_path.suffix + ".gz")
-        if gz_pdb_path.exists():
-            msg += f" A compressed file ({gz_pdb_path}) exists though."
-            msg += "Use haddock3-unpack to unpack the run."
         exists = False
     return exists, msg
 
@@ -0,0 +1,645 @@
+"""
+Binary condensed pairwise matrices.
+
+The analysis modules produce pairwise matrices between all the models of a
+step: ``rmsdmatrix`` and ``ilrmsdmatrix`` the (interface-ligand) RMSD,
+``clustfcc`` the fraction of common contacts. With ``N`` models these
+matrices hold ``N * (N - 1) / 2`` pairs, ordered as the condensed matrices
+of :py:func:`scipy.spatial.distance.squareform`.
+
+The matrices are stored as ``.npy`` files (float32, one row per pair and one
+column per value) that can be memory-mapped, with a companion header file
+(``<name>.header.json``) recording the number of models, their order and
+the number of decimals of each column. Values are rounded to these decimals
+when written and restored when read, so that the clustering modules see
+exactly the values of the former text matrices.
+
+Large matrices do not need to fit in memory: they can be allocated on disk
+with :py:func:`create_condensed_matrix` and filled block by block, possibly
+from several processes at once, with :py:func:`write_matrix_block`.
+
+The header can also record a hash of the coordinates of each model and a
+signature of the calculation (e.g. the atoms used). A later calculation on a
+set of models overlapping the ones of an existing matrix can then reuse the
+pairs already computed (:py:func:`find_reusable_matrix` and
+:py:func:`copy_reused_pairs`) and only calculate the pairs involving new
+models.
+
+The text format (one ``i j value [value]`` line per pair, 1-based indices)
+can still be written for humans with :py:func:`write_text_matrix`.
+
+Main functions
+--------------
+
+* :py:func:`write_condensed_matrix`
+* :py:func:`create_condensed_matrix`
+* :py:func:`write_matrix_block`
+* :py:func:`write_matrix_header`
+* :py:func:`read_matrix_header`
+* :py:func:`load_condensed_matrix`
+* :py:func:`read_condensed_matrix`
+* :py:func:`read_matrix_values`
+* :py:func:`stored_values`
+* :py:func:`copy_text_matrix`
+* :py:func:`find_reusable_matrix`
+* :py:func:`copy_reused_pairs`
+* :py:func:`write_text_matrix`
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from haddock.core.typing import Any, FilePath, NDFloat, Optional, Sequence
+
+
+MATRIX_HEADER_SUFFIX = ".header.json"
+"""Suffix replacing ``.npy`` in the name of the header of a matrix."""
+
+READ_BLOCK_SIZE = 1_000_000
+"""Number of pairs converted at once when reading a matrix."""
+
+
+def get_header_path(matrix_path: FilePath) -> Path:
+    """Get the path of the header file of a binary matrix."""
+    return Path(matrix_path).with_suffix(MATRIX_HEADER_SUFFIX)
+
+
+def condensed_index(i: NDFloat, j: NDFloat, n_models: int) -> NDFloat:
+    """
+    Get the condensed indices of pairs of models.
+
+    Parameters
+    ----------
+    i : np.ndarray dtype=int
+        Indices of the first models.
+    j : np.ndarray dtype=int
+        Indices of the second models, greater than ``i``.
+    n_models : int
+        Number of models of the matrix.
+
+    Returns
+    -------
+    np.ndarray dtype=int
+        The index of each (i, j) pair in the condensed matrix.
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    return n_models * i - i * (i + 1) // 2 + j - i - 1
+
+
+def round_decimals(values: NDFloat, decimal: int) -> NDFloat:
+    """
+    Round values as when formatting them with a number of decimals.
+
+    :py:func:`numpy.round` scales the values and may round differently
+    than the text formatting for values lying at half a unit of the last
+    decimal. Those values are rounded with :py:func:`round`, which matches
+    the formatting.
+    """
+    rounded = np.round(values, decimal)
+    scaled = values * 10.0 ** decimal
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [
+            round(value, decimal) for value in values[near_half].tolist()
+            ]
+    return rounded
+
+
+def _round_columns(values: NDFloat, decimals: Sequence[int]) -> NDFloat:
+    """Round each column of values to its number of decimals."""
+    if values.ndim == 1:
+        return round_decimals(values, decimals[0])
+    rounded = np.empty_like(values)
+    for col, decimal in enumerate(decimals):
+        rounded[:, col] = round_decimals(values[:, col], decimal)
+    return rounded
+
+
+def stored_values(values: NDFloat, decimals: Sequence[int]) -> NDFloat:
+    """
+    Get the values as read back from a binary condensed matrix.
+
+    Gives the values seen by the readers of a matrix without writing and
+    reading it, e.g. to threshold them while the matrix is written.
+
+    Parameters
+    ----------
+    values : np.ndarray dtype=float, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of the pairs.
+    decimals : list[int]
+        Number of decimals kept for each column of values.
+
+    Returns
+    -------
+    values : np.ndarray dtype=float64
+    """
+    values = np.asarray(values, dtype=np.float64)
+    stored = _round_columns(values, decimals).astype(np.float32)
+    return _round_columns(stored.astype(np.float64), decimals)
+
+
+def hash_coords(coords: NDFloat) -> list[str]:
+    """
+    Hash the coordinates of each model.
+
+    The coordinates are hashed in single precision, so that the same model
+    read from a PDB file, a coordinates store or a binary trajectory gets the
+    same hash.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        The (not centered) coordinates of the models.
+
+    Returns
+    -------
+    hashes : list[str]
+        The MD5 hash of the coordinates of each model.
+    """
+    hashes: list[str] = []
+    for model in coords:
+        data = np.ascontiguousarray(model, dtype=np.float32).tobytes()
+        hashes.append(hashlib.md5(data).hexdigest())
+    return hashes
+
+
+def hash_signature(*items: Any) -> str:
+    """Hash JSON serializable items, such as the atoms of a calculation."""
+    serialized = json.dumps(items, default=str)
+    return hashlib.md5(serialized.encode()).hexdigest()
+
+
+def write_condensed_matrix(
+        matrix_path: FilePath,
+        values: NDFloat,
+        models: Sequence[str],
+        decimals: Optional[Sequence[int]] = None,
+        ) -> None:
+    """
+    Write a binary condensed matrix and its header.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file to write.
+    values : np.ndarray dtype=float, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of each pair, in condensed matrix order.
+    models : list[str]
+        The names of the models, in the order of the matrix.
+    decimals : list[int], optional
+        Number of decimals kept for each column of values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    npairs = len(models) * (len(models) - 1) // 2
+    if len(values) != npairs:
+        raise ValueError(
+            f"{len(values)} values given for the {npairs} pairs "
+            f"of {len(models)} models."
+            )
+    if decimals is not None:
+        values = _round_columns(values, decimals)
+    np.save(matrix_path, values.astype(np.float32))
+    write_matrix_header(matrix_path, models, decimals)
+
+
+def write_matrix_header(
+        matrix_path: FilePath,
+        models: Sequence[str],
+        decimals: Optional[Sequence[int]] = None,
+        hashes: Optional[Sequence[str]] = None,
+        signature: Optional[dict[str, Any]] = None,
+        ) -> None:
+    """
+    Write the header of a binary condensed matrix.
+
+    See :py:func:`create_condensed_matrix` for the parameters.
+    """
+    if hashes is not None and len(hashes) != len(models):
+        raise ValueError(
+            f"{len(hashes)} hashes given for {len(models)} models."
+            )
+    header = {
+        "n_models": len(models),
+        "npairs": len(models) * (len(models) - 1) // 2,
+        "models": list(models),
+        "decimals": None if decimals is None else list(decimals),
+        "hashes": None if hashes is None else list(hashes),
+        "signature": signature,
+        }
+    with open(get_header_path(matrix_path), "w") as fh:
+        json.dump(header, fh)
+
+
+def create_condensed_matrix(
+        matrix_path: FilePath,
+        models: Sequence[str],
+        decimals: Optional[Sequence[int]] = None,
+        n_values: int = 1,
+        hashes: Optional[Sequence[str]] = None,
+        signature: Optional[dict[str, Any]] = None,
+        ) -> None:
+    """
+    Allocate a binary condensed matrix on disk and write its header.
+
+    The matrix is then filled block by block with
+    :py:func:`write_matrix_block`, without holding it in memory.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file to create.
+    models : list[str]
+        The names of the models, in the order of the matrix.
+    decimals : list[int], optional
+        Number of decimals kept for each column of values.
+    n_values : int
+        Number of values of each pair.
+    hashes : list[str], optional
+        The hash of the coordinates of each model, see
+        :py:func:`hash_coords`.
+    signature : dict, optional
+        What else the values depend on, reuse of the pairs requires the
+        same signature.
+    """
+    npairs = len(models) * (len(models) - 1) // 2
+    shape = (npairs,) if n_values == 1 else (npairs, n_values)
+    if npairs:
+        matrix = np.lib.format.open_memmap(
+            matrix_path,
+            mode="w+",
+            dtype=np.float32,
+            shape=shape,
+            )
+        matrix.flush()
+        del matrix
+    else:
+        # an empty file cannot be memory-mapped
+        np.save(matrix_path, np.empty(shape, dtype=np.float32))
+    write_matrix_header(matrix_path, models, decimals, hashes, signature)
+
+
+def write_matrix_block(
+        matrix_path: FilePath,
+        start: int,
+        values: NDFloat,
+        decimals: Optional[Sequence[int]] = None,
+        ) -> None:
+    """
+    Write a block of pairs into a binary condensed matrix.
+
+    Blocks are written through a memory map of the file, so that several
+    processes can fill distinct blocks of the same matrix concurrently.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file, as created by
+        :py:func:`create_condensed_matrix`.
+    start : int
+        Condensed index of the first pair of the block.
+    values : np.ndarray dtype=float, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of the pairs of the block.
+    decimals : list[int], optional
+        Number of decimals kept for each column of values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if decimals is not None:
+        values = _round_columns(values, decimals)
+    matrix = np.load(matrix_path, mmap_mode="r+")
+    if start + len(values) > len(matrix):
+        raise ValueError(
+            f"Block of {len(values)} pairs starting at {start} exceeds "
+            f"the {len(matrix)} pairs of the matrix."
+            )
+    matrix[start:start + len(values)] = values
+    matrix.flush()
+    del matrix
+
+
+def write_matrix_values(
+        matrix_path: FilePath,
+        indices: NDFloat,
+        values: NDFloat,
+        decimals: Optional[Sequence[int]] = None,
+        ) -> None:
+    """
+    Write the values of scattered pairs into a binary condensed matrix.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file, as created by
+        :py:func:`create_condensed_matrix`.
+    indices : np.ndarray dtype=int
+        Condensed indices of the pairs, see :py:func:`condensed_index`.
+    values : np.ndarray dtype=float, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of the pairs.
+    decimals : list[int], optional
+        Number of decimals kept for each column of values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if decimals is not None:
+        values = _round_columns(values, decimals)
+    matrix = np.load(matrix_path, mmap_mode="r+")
+    matrix[np.asarray(indices)] = values
+    matrix.flush()
+    del matrix
+
+
+def find_reusable_matrix(
+        candidates: Sequence[FilePath],
+        hashes: Sequence[str],
+        signature: dict[str, Any],
+        ) -> Optional[tuple[Path, NDFloat]]:
+    """
+    Find the existing matrix sharing the most models with a new one.
+
+    A matrix can be reused if its header has the same signature and holds a
+    hash for each of its models, in the order of the matrix.
+
+    Parameters
+    ----------
+    candidates : list[str or pathlib.Path]
+        Paths of the existing ``.npy`` matrices.
+    hashes : list[str]
+        The hash of the coordinates of each model of the new matrix.
+    signature : dict
+        The signature of the new matrix.
+
+    Returns
+    -------
+    tuple or None
+        The path of the best matrix and, for each new model, its index in
+        that matrix (-1 if absent). None if no matrix shares models with
+        the new one.
+    """
+    best: Optional[tuple[Path, NDFloat]] = None
+    best_shared = 0
+    for candidate in candidates:
+        try:
+            header = read_matrix_header(candidate)
+        except (OSError, ValueError):
+            continue
+        old_hashes = header.get("hashes")
+        if (
+                header.get("signature") != signature
+                or old_hashes is None
+                or len(old_hashes) != header["n_models"]
+                or len(old_hashes) != len(header["models"])
+                ):
+            continue
+        old_index = {value: i for i, value in enumerate(old_hashes)}
+        old_idx = np.array(
+            [old_index.get(value, -1) for value in hashes],
+            dtype=np.int64,
+            )
+        shared = int(np.count_nonzero(old_idx >= 0))
+        if shared > best_shared:
+            best, best_shared = (Path(candidate), old_idx), shared
+    return best
+
+
+def copy_reused_pairs(
+        old_path: FilePath,
+        new_path: FilePath,
+        old_idx: NDFloat,
+        block_size: int = READ_BLOCK_SIZE,
+        ) -> int:
+    """
+    Copy the pairs of the models already in an existing matrix.
+
+    Parameters
+    ----------
+    old_path : str or pathlib.Path
+        Path of the existing ``.npy`` matrix.
+    new_path : str or pathlib.Path
+        Path of the new ``.npy`` matrix, as created by
+        :py:func:`create_condensed_matrix`.
+    old_idx : np.ndarray dtype=int
+        For each model of the new matrix, its index in the existing one, -1
+        if absent. As returned by :py:func:`find_reusable_matrix`.
+    block_size : int
+        Approximate number of pairs copied at once.
+
+    Returns
+    -------
+    npairs : int
+        Number of pairs copied.
+    """
+    old_idx = np.asarray(old_idx, dtype=np.int64)
+    n_old = read_matrix_header(old_path)["n_models"]
+    n_models = len(old_idx)
+    old_matrix = load_condensed_matrix(old_path)
+    reused = np.flatnonzero(old_idx >= 0)
+    npairs = 0
+    new_indices: list[NDFloat] = []
+    values: list[NDFloat] = []
+    nbuffered = 0
+    for row, i in enumerate(reused[:-1]):
+        js = reused[row + 1:]
+        first = np.minimum(old_idx[i], old_idx[js])
+        second = np.maximum(old_idx[i], old_idx[js])
+        row_values = np.zeros((len(js),) + old_matrix.shape[1:], np.float32)
+        # the same coordinates may appear twice, their distance is 0
+        off_diag = first != second
+        row_values[off_diag] = old_matrix[
+            condensed_index(first[off_diag], second[off_diag], n_old)
+            ]
+        new_indices.append(condensed_index(i, js, n_models))
+        values.append(row_values)
+        nbuffered += len(js)
+        if nbuffered >= block_size or row == len(reused) - 2:
+            write_matrix_values(
+                new_path,
+                np.concatenate(new_indices),
+                np.concatenate(values),
+                )
+            npairs += nbuffered
+            new_indices, values, nbuffered = [], [], 0
+    return npairs
+
+
+def read_matrix_header(matrix_path: FilePath) -> dict[str, Any]:
+    """
+    Read the header of a binary condensed matrix.
+
+    Returns
+    -------
+    header : dict
+        With the ``n_models``, ``npairs``, ``models`` and ``decimals``
+        keys.
+    """
+    with open(get_header_path(matrix_path)) as fh:
+        return json.load(fh)
+
+
+def load_condensed_matrix(matrix_path: FilePath) -> NDFloat:
+    """
+    Memory-map a binary condensed matrix.
+
+    Returns
+    -------
+    values : np.memmap dtype=float32
+        The values as stored, in condensed matrix order.
+    """
+    return np.load(matrix_path, mmap_mode="r")
+
+
+def read_condensed_matrix(matrix_path: FilePath) -> NDFloat:
+    """
+    Read a binary condensed matrix, restoring the stored decimals.
+
+    Returns
+    -------
+    values : np.ndarray dtype=float64
+        The values in condensed matrix order.
+    """
+    header = read_matrix_header(matrix_path)
+    stored = load_condensed_matrix(matrix_path)
+    if len(stored) != header["npairs"]:
+        raise ValueError(
+            f"number of pairs {len(stored)} != expected ({header['npairs']})"
+            )
+    # convert by blocks to limit the temporaries on large matrices
+    values = np.empty(stored.shape, dtype=np.float64)
+    for start in range(0, len(stored), READ_BLOCK_SIZE):
+        block = stored[start:start + READ_BLOCK_SIZE].astype(np.float64)
+        if header["decimals"] is not None:
+            block = _round_columns(block, header["decimals"])
+        values[start:start + READ_BLOCK_SIZE] = block
+    return values
+
+
+def read_matrix_values(matrix_path: FilePath, indices: NDFloat) -> NDFloat:
+    """
+    Read the values of a subset of the pairs of a binary condensed matrix.
+
+    Only the requested pairs are read from the memory-mapped file.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file.
+    indices : np.ndarray dtype=int
+        Condensed indices of the pairs, see :py:func:`condensed_index`.
+
+    Returns
+    -------
+    values : np.ndarray dtype=float64
+        The values of the pairs, with the stored decimals restored.
+    """
+    decimals = read_matrix_header(matrix_path)["decimals"]
+    values = load_condensed_matrix(matrix_path)[np.asarray(indices)]
+    values = values.astype(np.float64)
+    if decimals is None:
+        return values
+    return _round_columns(values, decimals)
+
+
+def read_text_matrix(matrix_path: FilePath) -> NDFloat:
+    """
+    Read the values of a text matrix.
+
+    Returns
+    -------
+    values : np.ndarray dtype=float64, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of each line, without the model indices.
+    """
+    if os.path.getsize(matrix_path) == 0:
+        return np.empty(0, dtype=np.float64)
+    return _table_values(pd.read_csv(matrix_path, sep=" ", header=None))
+
+
+def _table_values(table: pd.DataFrame) -> NDFloat:
+    """Get the values of a text matrix table, without the model indices."""
+    values = table.iloc[:, 2:].to_numpy(dtype=np.float64)
+    return values[:, 0] if values.shape[1] == 1 else values
+
+
+def copy_text_matrix(
+        text_path: FilePath,
+        matrix_path: FilePath,
+        start: int = 0,
+        decimals: Optional[Sequence[int]] = None,
+        ) -> int:
+    """
+    Copy the values of a text matrix into a binary condensed matrix.
+
+    The text file is read by chunks, it can be larger than the memory.
+
+    Parameters
+    ----------
+    text_path : str or pathlib.Path
+        Path of the text matrix.
+    matrix_path : str or pathlib.Path
+        Path of the ``.npy`` file, as created by
+        :py:func:`create_condensed_matrix`.
+    start : int
+        Condensed index where to write the first pair of the text matrix.
+    decimals : list[int], optional
+        Number of decimals kept for each column of values.
+
+    Returns
+    -------
+    npairs : int
+        Number of pairs copied.
+    """
+    if os.path.getsize(text_path) == 0:
+        return 0
+    npairs = 0
+    with pd.read_csv(
+            text_path,
+            sep=" ",
+            header=None,
+            chunksize=READ_BLOCK_SIZE,
+            ) as reader:
+        for table in reader:
+            values = _table_values(table)
+            write_matrix_block(matrix_path, start + npairs, values, decimals)
+            npairs += len(values)
+    return npairs
+
+
+def write_text_matrix(
+        matrix_path: FilePath,
+        values: NDFloat,
+        n_models: int,
+        fmt: Sequence[str] = ("{:.3f}",),
+        ) -> None:
+    """
+    Write a condensed matrix in text form.
+
+    Each line holds the (1-based) indices of the two models and the values
+    of the pair.
+
+    Parameters
+    ----------
+    matrix_path : str or pathlib.Path
+        Path of the text file to write.
+    values : np.ndarray dtype=float, shape=(n_pairs,) or (n_pairs, n_values)
+        The values of each pair, in condensed matrix order.
+    n_models : int
+        Number of models of the matrix.
+    fmt : list[str]
+        Format of each column of values.
+    """
+    values = np.asarray(values).reshape(len(values), -1)
+    line_fmt = "{} {} " + " ".join(fmt) + os.linesep
+    start = 0
+    with open(matrix_path, "w") as out_file:
+        for ref in range(n_models - 1):
+            nrow = n_models - ref - 1
+            out_file.write("".join(
+                line_fmt.format(ref + 1, mod, *row)
+                for mod, row in zip(
+                    range(ref + 2, n_models + 1),
+                    values[start:start + nrow].tolist(),
+                    )
+                ))
+            start += nrow
@@ -10,7 +10,14 @@ from pathlib import Path
 import jsonpickle
 
 from haddock.core.defaults import MODULE_IO_FILE
-from haddock.core.typing import FilePath, Literal, Optional, TypeVar, Union
+from haddock.core.typing import (
+    FilePath,
+    Literal,
+    NDFloat,
+    Optional,
+    TypeVar,
+    Union,
+)
 from typing import List, Any
 
 
@@ -58,8 +65,9 @@ class Persistent:
         return rep
 
     def is_present(self) -> bool:
-        """Check if the persisent file exists on disk."""
-        return self.rel_path.resolve().exists()
+        """Check if the persisent file exists on disk, possibly gzipped."""
+        path = self.rel_path.resolve()
+        return path.exists() or path.with_suffix(path.suffix + ".gz").exists()
 
 
 class PDBFile(Persistent):
@@ -110,6 +118,13 @@ class RMSDFile(Persistent):
     def __hash__(self) -> int:
         return id(self)
 
+    def load(self) -> NDFloat:
+        """Memory-map the binary condensed matrix of this file."""
+        # avoid importing pandas with the ontology
+        from haddock.libs.libmatrix import load_condensed_matrix
+
+        return load_condensed_matrix(Path(self.path, self.file_name))
+
 
 class TopologyFile(Persistent):
     """Represent a CNS-generated topology file."""
@@ -17,7 +17,7 @@ from haddock.core.typing import (
     Optional,
     Union,
     )
-from haddock.libs.libio import working_directory
+from haddock.libs.libio import open_pdb, working_directory
 from haddock.libs.libutil import get_result_or_same_in_list, sort_numbered_paths
 
 
@@ -202,7 +202,7 @@ def identify_chainseg(pdb_file_path: FilePath,
     """Return segID OR chainID."""
     segids: list[str] = []
     chains: list[str] = []
-    with open(pdb_file_path) as input_handler:
+    with open_pdb(pdb_file_path) as input_handler:
         for line in input_handler:
             if line.startswith(("ATOM  ", "HETATM")):
                 try:
@@ -27,6 +27,8 @@ from haddock.gear.clean_steps import clean_output
 from haddock.gear.known_cns_errors import find_all_cns_errors
 from haddock.gear.parameters import config_mandatory_general_parameters
 from haddock.gear.yaml2cfg import read_from_yaml_config, find_incompatible_parameters
+from haddock.libs.libcache import clear_cache
+from haddock.libs.libcoords import write_coords_store
 from haddock.libs.libhpc import HPCScheduler
 from haddock.libs.libio import folder_exists, working_directory
 from haddock.libs.libmpi import MPIScheduler
@@ -242,7 +244,11 @@ class BaseHaddockModule(ABC):
         self.add_parent_to_paths()
 
         with working_directory(self.path):
-            self._run()
+            try:
+                self._run()
+            finally:
+                # the files read by this step are not cached for the next ones
+                clear_cache()
 
         log.info(f"Module [{self.name}] finished.")
 
@@ -294,6 +300,9 @@ class BaseHaddockModule(ABC):
         faulty = io.check_faulty()
         # Save outputs
         io.save()
+        # Write the coordinates store of the models generated by this step
+        if self.params.get("coords_store"):
+            self._write_coords_store(io.output)
         # Check if number of generated outputs is under the tolerance threshold
         if faulty > faulty_tolerance:
             _msg = (
@@ -308,6 +317,18 @@ class BaseHaddockModule(ABC):
             # Show final error message
             self.finish_with_error(_msg)
 
+    @staticmethod
+    def _write_coords_store(output: list[Any]) -> None:
+        """Write the coordinates store of the models created in this step."""
+        cwd = str(Path.cwd())
+        models = [
+            model
+            for model in output
+            if isinstance(model, PDBFile) and model.path == cwd
+        ]
+        if models:
+            write_coords_store(models)
+
     def finish_with_error(self, reason: object = "Module has failed.") -> None:
         """Finish with error message."""
         if isinstance(reason, Exception):
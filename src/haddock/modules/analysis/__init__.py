@@ -1,9 +1,18 @@
 """HADDOCK3 modules related to model analysis."""
 
+from pathlib import Path
 from typing import Iterable
 
+from haddock.modules import get_module_steps_folders
 
-modules_using_resdic = ("caprieval", "rmsdmatrix", "alascan", "sasascore")
+
+modules_using_resdic = (
+    "caprieval",
+    "rmsdmatrix",
+    "clustleader",
+    "alascan",
+    "sasascore",
+    )
 
 
 def confirm_resdic_chainid_length(params: Iterable[str]) -> None:
@@ -50,4 +59,34 @@ def get_analysis_exec_mode(mode: str) -> str:
         exec_mode = mode
     else:
         exec_mode = "local"
-    return exec_mode
\ No newline at end of file
+    return exec_mode
+
+
+def get_previous_matrices(module_name: str, matrix_fname: str) -> list[Path]:
+    """
+    Get the matrices written by previous steps of the same module.
+
+    The step folders preceding the current one are searched in the parent
+    folder (the run directory), from the most recent step to the oldest.
+
+    Parameters
+    ----------
+    module_name : str
+        The name of the module, e.g. ``rmsdmatrix``.
+    matrix_fname : str
+        The name of the matrix file in the step folders.
+
+    Returns
+    -------
+    list[Path]
+        The paths of the existing matrices.
+    """
+    current = Path.cwd().name.split("_", 1)[0]
+    current_step = int(current) if current.isdigit() else None
+    steps = [
+        step for step in get_module_steps_folders(Path(".."))
+        if step.split("_", 1)[1] == module_name
+        and (current_step is None or int(step.split("_", 1)[0]) < current_step)
+        ]
+    matrices = [Path("..", step, matrix_fname) for step in reversed(steps)]
+    return [matrix for matrix in matrices if matrix.exists()]
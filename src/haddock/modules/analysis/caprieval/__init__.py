@@ -19,6 +19,17 @@ By default the following metrics are calculated:
     upon superposition of the interface of the receptor.
 - GLOBAL_RMSD, the full RMSD between the reference and the model.
 
+When all the models have the same atoms once aligned to the reference, as
+after a refinement step, their coordinates are read in a single array and the
+metrics of all the models are calculated at once. Otherwise, for example
+during CAPRI scoring, each model is evaluated on its own.
+
+Several references can be given as an ensemble (a multi-model PDB file), for
+example alternative crystal forms or NMR models. Each model is read once and
+evaluated against all the references: the metrics columns of `capri_ss.tsv`
+then hold the best value over the references (lowest RMSDs, highest FNAT and
+DockQ), and the `<metric>_ref<n>` columns the metrics against each reference.
+
 The following files are generated:
 
 - **capri_ss.tsv**: a table with the CAPRI metrics for each model.
@@ -27,16 +38,27 @@ The following files are generated:
 
 from pathlib import Path
 
+import numpy as np
+
 from haddock.core.defaults import MODULE_DEFAULT_YAML
-from haddock.core.typing import FilePath, Union
+from haddock.core.typing import FilePath, Optional, Union
+from haddock.libs.libcache import prewarm_cache
 from haddock.libs.libontology import PDBFile
-from haddock.libs.libparallel import Scheduler
+from haddock.libs.libparallel import GenericTask, Scheduler, get_index_list
+from haddock.libs.libpdb import split_ensemble
+from haddock.libs.libutil import parse_ncores
 from haddock.modules import BaseHaddockModule
 from haddock.modules.analysis.caprieval.capri import (
     CAPRI,
+    CAPRIBatch,
+    CAPRIReference,
+    CAPRIResult,
     capri_cluster_analysis,
     dump_weights,
     extract_data_from_capri_class,
+    get_best_results,
+    parse_capri_models,
+    sample_has_same_atoms,
     )
 
 
@@ -92,14 +114,150 @@ class HaddockModule(BaseHaddockModule):
         best_model_fname = best_model.rel_path
 
         if self.params["reference_fname"]:
-            reference = Path(self.params["reference_fname"])
+            references = self.get_references(self.params["reference_fname"])
         else:
             self.log(
                 "No reference was given. "
                 "Using the structure with the lowest score from previous step"
             )
-            reference = best_model_fname
+            references = [best_model_fname]
+
+        # The references are the same for all the models; parse them, find
+        #  their contacts and interfaces and align the first model once here,
+        #  so that the workers inherit them
+        prewarm_cache(references)
+        capri_references: list[CAPRIReference] = []
+        for ref_idx, reference in enumerate(references, start=1):
+            if len(references) > 1:
+                self.log(f"Reference {ref_idx}: {reference}")
+            capri_reference = CAPRIReference(reference)
+            capri_reference.prepare(self.params, model=models[0])
+            capri_references.append(capri_reference)
+
+        # Homogeneous models are evaluated all at once; the models that do not
+        #  have the same atoms, for example during CAPRI scoring, are
+        #  evaluated one by one
+        results = self._evaluate_batch(models, capri_references)
+        if results is None:
+            self.log("The models have different atoms, evaluating each model")
+            results = [
+                self._evaluate_models(models, capri_reference)
+                for capri_reference in capri_references
+            ]
+        if len(results) == 1:
+            capri_results = results[0]
+        else:
+            # best metrics over the references, with the metrics against
+            #  each reference in the `_ref<n>` columns
+            capri_results = get_best_results(results)
+        for result, model in zip(capri_results, models):
+            result.model = model
+
+        extract_data_from_capri_class(
+            capri_objects=capri_results,
+            output_fname=Path(".", "capri_ss.tsv"),
+            sort_key=self.params["sortby"],
+            sort_ascending=self.params["sort_ascending"],
+        )
+
+        capri_cluster_analysis(
+            capri_list=capri_results,
+            model_list=models,  # type: ignore # ignore this here only if we are checking the return type of `retrieve_models` is not nested!!
+            output_fname="capri_clt.tsv",
+            clt_threshold=self.params["clt_threshold"],
+            # output_count=len(capri_jobs),
+            sort_key=self.params["sortby"],
+            sort_ascending=self.params["sort_ascending"],
+            path=Path("."),
+        )
+
+        # Send models to the next step,
+        #  no operation is done on them
+        self.output_models = models  # type: ignore # ignore this here only if we are checking the return type of `retrieve_models` is not nested!!
+        self.export_io_models()
+
+    @staticmethod
+    def get_references(
+        reference_fname: Union[FilePath, list[FilePath]],
+    ) -> list[Path]:
+        """
+        Get the reference structures.
+
+        Parameters
+        ----------
+        reference_fname : str, Path or list
+            One or several reference files, each one possibly an ensemble.
+
+        Returns
+        -------
+        references : list[Path]
+            The reference structures, the models of the ensembles being
+            split in the current directory.
+        """
+        if isinstance(reference_fname, (str, Path)):
+            reference_fname = [reference_fname]
+        references: list[Path] = []
+        for fname in reference_fname:
+            references.extend(split_ensemble(Path(fname), dest=Path.cwd()))
+        return references
+
+    def _evaluate_batch(
+        self,
+        models: list[PDBFile],
+        capri_references: list[CAPRIReference],
+    ) -> Optional[list[list[CAPRIResult]]]:
+        """Evaluate the models at once, None if they are heterogeneous."""
+        if not sample_has_same_atoms(models):
+            return None
+        ncores = parse_ncores(
+            n=self.params["ncores"],
+            njobs=len(models),
+            max_cpus=self.params["max_cpus"],
+        )
+        index_list = get_index_list(len(models), ncores)
+        parse_jobs = [
+            GenericTask(
+                parse_capri_models,
+                models[index_list[core] : index_list[core + 1]],
+                capri_references,
+                self.params,
+                core=core,
+            )
+            for core in range(ncores)
+        ]
+        engine = Scheduler(
+            tasks=parse_jobs,
+            ncores=ncores,
+            max_cpus=self.params["max_cpus"],
+        )
+        engine.run()
+        if len(engine.results) != ncores or None in engine.results:
+            return None
+        chunks = sorted(engine.results, key=lambda result: result[0])
+        keys = chunks[0][1]
+        if any(chunk[1] is None or chunk[1] != keys for chunk in chunks):
+            return None
+
+        self.log(f"Evaluating {len(models)} homogeneous models at once")
+        results: list[list[CAPRIResult]] = []
+        for ref_idx, capri_reference in enumerate(capri_references):
+            batch = CAPRIBatch(
+                capri_reference,
+                self.params,
+                keys[ref_idx],
+                np.concatenate([chunk[2][ref_idx] for chunk in chunks]),
+                np.concatenate([chunk[3][ref_idx] for chunk in chunks]),
+            )
+            batch.run()
+            results.append(batch.get_results())
+        return results
 
+    def _evaluate_models(
+        self,
+        models: list[PDBFile],
+        capri_reference: CAPRIReference,
+    ) -> list[CAPRIResult]:
+        """Evaluate each model in its own job."""
         # Each model is a job; this is not the most efficient way
         #  but by assigning each model to an individual job
         #  we can handle scenarios in which the models are hetergoneous
@@ -117,7 +275,7 @@ class HaddockModule(BaseHaddockModule):
                     identificator=i,
                     model=model_to_be_evaluated,
                     path=Path("."),
-                    reference=reference,
+                    reference=capri_reference,
                     params=self.params,
                 )
             )
@@ -127,28 +285,10 @@ class HaddockModule(BaseHaddockModule):
         )
         engine.run()
 
-        jobs = engine.results
-        jobs = sorted(jobs, key=lambda capri: capri.identificator)
-
-        extract_data_from_capri_class(
-            capri_objects=jobs,
-            output_fname=Path(".", "capri_ss.tsv"),
-            sort_key=self.params["sortby"],
-            sort_ascending=self.params["sort_ascending"],
-        )
-
-        capri_cluster_analysis(
-            capri_list=jobs,
-            model_list=models,  # type: ignore # ignore this here only if we are checking the return type of `retrieve_models` is not nested!!
-            output_fname="capri_clt.tsv",
-            clt_threshold=self.params["clt_threshold"],
-            # output_count=len(capri_jobs),
-            sort_key=self.params["sortby"],
-            sort_ascending=self.params["sort_ascending"],
-            path=Path("."),
-        )
-
-        # Send models to the next step,
-        #  no operation is done on them
-        self.output_models = models  # type: ignore # ignore this here only if we are checking the return type of `retrieve_models` is not nested!!
-        self.export_io_models()
+        # The jobs return small records with the metrics of each model
+        results = {
+            result.identificator: result
+            for result in engine.results
+            if result is not None
+        }
+        return [results.get(i, CAPRIResult(i)) for i in range(1, len(models) + 1)]
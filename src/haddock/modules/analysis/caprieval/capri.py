@@ -1,19 +1,17 @@
 """CAPRI module."""
 
-import copy
 import json
 import os
 import shutil
 import tempfile
-from itertools import combinations
 from pathlib import Path
 
 
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
 import numpy as np
+import pandas as pd
 from pdbtools import pdb_segxchain
-from scipy.spatial.distance import cdist
 
 from haddock import log
 from haddock.core.defaults import CNS_MODULES
@@ -24,7 +22,6 @@ from haddock.core.typing import (
     Iterable,
     NDFloat,
     Optional,
-    ParamDict,
     ParamMap,
     Union,
     )
@@ -36,16 +33,24 @@ from haddock.libs.libalign import (
     check_chains,
     get_align,
     get_atoms,
+    get_sequence_signature,
     kabsch,
+    kabsch_ilrmsd_batch,
     load_coords,
     make_range,
     )
-from haddock.libs.libio import write_dic_to_file, write_nested_dic_to_file
+from haddock.libs.libcontacts import get_residue_contacts
+from haddock.libs.libcoords import read_model_coords
+from haddock.libs.libio import write_dataframe_to_file
 from haddock.libs.libontology import PDBFile, PDBPath
 from haddock.modules import get_module_steps_folders
 
 
 WEIGHTS = ["w_elec", "w_vdw", "w_desolv", "w_bsa", "w_air"]
+CAPRI_METRICS = ["irmsd", "fnat", "lrmsd", "ilrmsd", "dockq", "rmsd"]
+HOMOGENEITY_SAMPLE_SIZE = 10
+"""Number of models compared before evaluating the models at once."""
+HIGHER_IS_BETTER = ["fnat", "dockq"]
 
 
 def get_previous_cns_step(sel_steps: list, st_order: int) -> Union[str, None]:
@@ -114,6 +119,9 @@ def load_contacts(
 ) -> set[tuple]:
     """Load residue-based contacts.
 
+    The contacts between the atoms of each pair of chains are found with a
+    KD-tree, see :py:mod:`haddock.libs.libcontacts`.
+
     Parameters
     ----------
     pdb_f : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
@@ -136,35 +144,326 @@ def load_contacts(
         numbering_dic=numbering_dic,
         model2ref_chain_dict=model2ref_chain_dict,
     )
-    # create coordinate arrays
-    coord_arrays: dict[str, NDFloat] = {}
-    coord_ids: dict[str, list[int]] = {}
-    for atom in ref_coord_dic.keys():
-        chain = atom[0]
-        if chain not in coord_arrays.keys():  # initialize lists
-            coord_arrays[chain], coord_ids[chain] = [], []  # type: ignore
-        coord_arrays[chain].append(ref_coord_dic[atom])  # type: ignore
-        coord_ids[chain].append(atom[1])  # only the resid is appended
-    for chain in coord_arrays.keys():
-        coord_arrays[chain] = np.array(coord_arrays[chain])
-
-    # combinations of chains
-    unique_chain_combs = list(combinations(sorted(coord_arrays.keys()), 2))
-
-    # calculating contacts
-    con_list: list[tuple] = []
-    for pair in unique_chain_combs:
-        # cycling over each coordinate of the first chain
-        for s in range(coord_arrays[pair[0]].shape[0]):
-            s_xyz = coord_arrays[pair[0]][s].reshape(1, 3)
-            s_cid = coord_ids[pair[0]][s]
-            dist = cdist(s_xyz, coord_arrays[pair[1]])
-            npw = np.where(dist < cutoff)
-            del dist
-            for k in range(npw[0].shape[0]):
-                con = (pair[0], s_cid, pair[1], coord_ids[pair[1]][npw[1][k]])
-                con_list.append(con)
-    return set(con_list)
+    chains = [atom[0] for atom in ref_coord_dic]
+    resids = [atom[1] for atom in ref_coord_dic]
+    coords = np.array(list(ref_coord_dic.values()), dtype=np.float64)
+    return get_residue_contacts(chains, resids, coords, cutoff)
+
+
+def get_interface_resdic(contacts: Iterable[tuple]) -> dict[str, list[int]]:
+    """Get the residues of each chain involved in residue contacts.
+
+    Parameters
+    ----------
+    contacts : set[tuple]
+        The (chain, resid, chain, resid) contacts, see :py:func:`load_contacts`.
+
+    Returns
+    -------
+    interface_resdic : dict[str, list[int]]
+        Dictionary holding list of interface residues ids for each chains.
+    """
+    interface_resdic: dict[str, list[int]] = {}
+    for contact in contacts:
+        first_chain, first_resid, sec_chain, sec_resid = contact
+
+        if first_chain not in interface_resdic:
+            interface_resdic[first_chain] = []
+        if sec_chain not in interface_resdic:
+            interface_resdic[sec_chain] = []
+
+        if first_resid not in interface_resdic[first_chain]:
+            interface_resdic[first_chain].append(first_resid)
+        if sec_resid not in interface_resdic[sec_chain]:
+            interface_resdic[sec_chain].append(sec_resid)
+
+    return interface_resdic
+
+
+class CAPRIReference:
+    """
+    Reference structure of the CAPRI evaluation.
+
+    The reference is the same for all the models: its atoms, coordinates,
+    contacts and interfaces are calculated once, on first use, and shared by
+    all the :py:class:`CAPRI` objects evaluating the models against it.
+
+    The sequence alignments to the reference are also kept, one per distinct
+    set of model sequences (see :py:func:`get_sequence_signature`).
+    """
+
+    def __init__(self, reference: PDBPath) -> None:
+        """
+        Initialize the class.
+
+        Parameters
+        ----------
+        reference : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+            The reference structure.
+        """
+        self.reference = reference
+        self._atoms: dict[bool, AtomsDict] = {}
+        self._coords: dict[tuple[bool, Optional[float]], dict] = {}
+        self._chain_ranges: dict[bool, dict[str, tuple[int, int]]] = {}
+        self._contacts: dict[float, set[tuple]] = {}
+        self._interfaces: dict[float, dict[str, list[int]]] = {}
+        self._alignments: dict[tuple, tuple[dict, dict]] = {}
+
+    def prepare(self, params: ParamMap, model: Optional[PDBPath] = None) -> None:
+        """
+        Calculate the reference data needed with a set of parameters.
+
+        Parameters
+        ----------
+        params : dict
+            The parameters of the CAPRI evaluation.
+        model : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+            A model to align to the reference beforehand, so that the models
+            with the same sequences reuse its alignment.
+        """
+        if model is not None:
+            output_path = Path(".") if params.get("write_alignment") else None
+            try:
+                self.align(model, params, output_path)
+            except ALIGNError:
+                # reported when the model itself is evaluated
+                pass
+        full = params["allatoms"]
+        self.get_coords(full)
+        self.get_chain_ranges(full)
+        if params["fnat"]:
+            self.get_contacts(params["fnat_cutoff"])
+        if params["irmsd"] or params["ilrmsd"]:
+            self.get_coords(full, params["irmsd_cutoff"])
+
+    def align(
+        self,
+        model: PDBPath,
+        params: ParamMap,
+        output_path: Optional[FilePath] = None,
+    ) -> tuple[dict, dict]:
+        """
+        Align a model to the reference.
+
+        The sequence alignment only depends on the sequences of the model, it
+        is calculated once for all the models sharing the same sequences. The
+        structural alignment depends on the coordinates and is calculated for
+        each model.
+
+        Parameters
+        ----------
+        model : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+            The model.
+        params : dict
+            The parameters of the CAPRI evaluation.
+        output_path : Path, optional
+            Where to write the alignment files, not written if None.
+
+        Returns
+        -------
+        model2ref_numbering : dict
+            The residue numbering of the reference for each model chain.
+        model2ref_chain_dict : dict
+            The reference chain of each model chain.
+
+        Raises
+        ------
+        ALIGNError
+            If the model cannot be aligned to the reference.
+        """
+        align_func = get_align(
+            method=params["alignment_method"],
+            lovoalign_exec=params["lovoalign_exec"],
+        )
+        if params["alignment_method"] != "sequence":
+            return align_func(self.reference, model, output_path)
+        signature = get_sequence_signature(model)
+        if signature not in self._alignments:
+            self._alignments[signature] = align_func(
+                self.reference, model, output_path
+            )
+        return self._alignments[signature]
+
+    def get_atoms(self, full: bool = False) -> AtomsDict:
+        """Get the atoms of the reference, see :py:func:`get_atoms`."""
+        if full not in self._atoms:
+            self._atoms[full] = get_atoms(self.reference, full=full)
+        return self._atoms[full]
+
+    def get_contacts(self, cutoff: float = 5.0) -> set[tuple]:
+        """Get the residue contacts of the reference, see :py:func:`load_contacts`."""
+        if cutoff not in self._contacts:
+            self._contacts[cutoff] = load_contacts(self.reference, cutoff)
+        return self._contacts[cutoff]
+
+    def get_interface(self, cutoff: float = 5.0) -> dict[str, list[int]]:
+        """Get the interface residues of the reference."""
+        if cutoff not in self._interfaces:
+            self._interfaces[cutoff] = get_interface_resdic(
+                self.get_contacts(cutoff)
+            )
+        return self._interfaces[cutoff]
+
+    def get_coords(
+        self,
+        full: bool = False,
+        cutoff: Optional[float] = None,
+    ) -> dict[tuple[str, int, str], NDFloat]:
+        """
+        Get the coordinates of the reference.
+
+        Parameters
+        ----------
+        full : bool
+            Use all the heavy atoms instead of the backbone atoms.
+        cutoff : float, optional
+            Only keep the interface residues at this cutoff.
+
+        Returns
+        -------
+        coord_dic : dict
+            The coordinates, as given by :py:func:`load_coords`.
+        """
+        if (full, cutoff) in self._coords:
+            return self._coords[(full, cutoff)]
+        if cutoff is None:
+            coord_dic, _ = load_coords(self.reference, self.get_atoms(full))
+        else:
+            # same selection as load_coords with the interface residues
+            interface = self.get_interface(cutoff)
+            coord_dic = self.get_coords(full)
+            if interface:
+                coord_dic = {
+                    key: xyz
+                    for key, xyz in coord_dic.items()
+                    if key[1] in interface.get(key[0], ())
+                }
+        self._coords[(full, cutoff)] = coord_dic
+        return coord_dic
+
+    def get_chain_ranges(self, full: bool = False) -> dict[str, tuple[int, int]]:
+        """
+        Get the first and last indices of each chain in the sorted atoms.
+
+        Parameters
+        ----------
+        full : bool
+            Use all the heavy atoms instead of the backbone atoms.
+
+        Returns
+        -------
+        chain_ranges : dict[str, tuple[int, int]]
+            The receptor and ligand ranges, as calculated for the L-RMSD.
+        """
+        if full not in self._chain_ranges:
+            chain_ranges: dict[str, list[int]] = {}
+            for i, (chain, _, _) in enumerate(sorted(self.get_coords(full))):
+                chain_ranges.setdefault(chain, []).append(i)
+            self._chain_ranges[full] = make_range(chain_ranges)
+        return self._chain_ranges[full]
+
+
+def get_dockq(fnat: float, irmsd: float, lrmsd: float) -> float:
+    """
+    Calculate the DockQ metric.
+
+    Parameters
+    ----------
+    fnat : float
+        The fraction of native contacts.
+    irmsd : float
+        The interface RMSD.
+    lrmsd : float
+        The ligand RMSD.
+
+    Returns
+    -------
+    dockq : float
+        The DockQ metric, see Basu and Wallner 2016, 11 (8), e0161879.
+    """
+    dockq = 0.0
+    if fnat:
+        dockq += float(fnat) / 3
+    if irmsd:
+        irmsd_denom = 1 + (irmsd / 1.5) * (irmsd / 1.5)
+        dockq += (1 / irmsd_denom) / 3
+    if lrmsd:
+        lrmsd_denom = 1 + (lrmsd / 8.5) * (lrmsd / 8.5)
+        dockq += (1 / lrmsd_denom) / 3
+    return dockq
+
+
+class CAPRIResult:
+    """
+    CAPRI metrics of a model.
+
+    The record returned by the CAPRI jobs, holding only the metrics so that
+    the workers send back a few floats per model. The model is set back in
+    the main process.
+
+    With several references, the metrics are the best over the references
+    and ``references`` holds the results against each reference, see
+    :py:func:`get_best_results`.
+    """
+
+    __slots__ = ["identificator", "model", "references"] + CAPRI_METRICS
+
+    def __init__(
+        self,
+        identificator: int,
+        model: Optional[PDBFile] = None,
+        **metrics: float,
+    ) -> None:
+        self.identificator = identificator
+        self.model = model
+        self.references: list[CAPRIResult] = []
+        for metric in CAPRI_METRICS:
+            setattr(self, metric, float(metrics.get(metric, float("nan"))))
+
+    @property
+    def md5(self) -> Optional[str]:
+        """MD5 hash of the model."""  # noqa: D401
+        return self.model.md5 if isinstance(self.model, PDBFile) else ""
+
+    @property
+    def score(self) -> float:
+        """Score of the model."""  # noqa: D401
+        if isinstance(self.model, PDBFile):
+            return self.model.score
+        return float("nan")
+
+
+def get_best_results(results: list[list[CAPRIResult]]) -> list[CAPRIResult]:
+    """
+    Combine the results of the models against several references.
+
+    Parameters
+    ----------
+    results : list[list[CAPRIResult]]
+        For each reference, the results of all the models.
+
+    Returns
+    -------
+    best_results : list[CAPRIResult]
+        For each model, the best value of each metric over the references:
+        the lowest RMSDs and the highest FNAT and DockQ. The results against
+        each reference are kept in ``references``.
+    """
+    best_results: list[CAPRIResult] = []
+    for model_results in zip(*results):
+        best = CAPRIResult(model_results[0].identificator)
+        for metric in CAPRI_METRICS:
+            values = [
+                getattr(result, metric)
+                for result in model_results
+                if not np.isnan(getattr(result, metric))
+            ]
+            if values:
+                best_value = max if metric in HIGHER_IS_BETTER else min
+                setattr(best, metric, best_value(values))
+        best.references = list(model_results)
+        best_results.append(best)
+    return best_results
 
 
 class CAPRI:
@@ -175,7 +474,7 @@ class CAPRI:
         identificator: int,
         model: PDBPath,
         path: Path,
-        reference: PDBPath,
+        reference: Union[PDBPath, CAPRIReference],
         params: ParamMap,
     ) -> None:
         """
@@ -189,12 +488,17 @@ class CAPRI:
             The model to be evaluated.
         path : Path
             Reference that defines where output should be saved.
-        reference : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
-            The reference structure.
+        reference : PosixPath, :py:class:`haddock.libs.libontology.PDBFile`
+            or :py:class:`CAPRIReference`
+            The reference structure, shared by all the models if given as a
+            :py:class:`CAPRIReference`.
         params : dict
             The parameters for the CAPRI evaluation.
         """
-        self.reference = reference
+        if not isinstance(reference, CAPRIReference):
+            reference = CAPRIReference(reference)
+        self.capri_reference = reference
+        self.reference = reference.reference
         if not isinstance(model, PDBFile):
             self.model = PDBFile(model)
             self.md5 = ""
@@ -212,7 +516,11 @@ class CAPRI:
         self.dockq = float("nan")
         self.rmsd = float("nan")
         self.allatoms = params["allatoms"]
-        self.atoms = self._load_atoms(model, reference, full=self.allatoms)
+        self.atoms = self._load_atoms(
+            model,
+            self.capri_reference,
+            full=self.allatoms,
+        )
         self.r_chain = params["receptor_chain"]
         self.l_chains = params["ligand_chains"]
         self.model2ref_numbering = None
@@ -232,15 +540,13 @@ class CAPRI:
             The cutoff distance for the intermolecular contacts.
         """
         # Identify reference interface
-        ref_interface_resdic = self.identify_interface(self.reference, cutoff)
+        ref_interface_resdic = self.capri_reference.get_interface(cutoff)
 
         if len(ref_interface_resdic) == 0:
             log.warning("No reference interface found")
         else:
             # Load interface coordinates
-            ref_coord_dic, _ = load_coords(
-                self.reference, self.atoms, ref_interface_resdic
-            )
+            ref_coord_dic = self.capri_reference.get_coords(self.allatoms, cutoff)
             try:
                 mod_coord_dic, _ = load_coords(
                     self.model,
@@ -282,7 +588,7 @@ class CAPRI:
 
     def calc_lrmsd(self) -> None:
         """Calculate the L-RMSD."""
-        ref_coord_dic, _ = load_coords(self.reference, self.atoms)
+        ref_coord_dic = self.capri_reference.get_coords(self.allatoms)
         try:
             mod_coord_dic, _ = load_coords(
                 self.model,
@@ -387,12 +693,10 @@ class CAPRI:
             The cutoff distance for the intermolecular contacts.
         """
         # Identify interface
-        ref_interface_resdic = self.identify_interface(self.reference, cutoff)
+        ref_interface_resdic = self.capri_reference.get_interface(cutoff)
         # Load interface coordinates
 
-        ref_int_coord_dic, _ = load_coords(
-            self.reference, self.atoms, ref_interface_resdic
-        )
+        ref_int_coord_dic = self.capri_reference.get_coords(self.allatoms, cutoff)
         try:
             mod_int_coord_dic, _ = load_coords(
                 self.model,
@@ -488,7 +792,7 @@ class CAPRI:
         cutoff : float
             The cutoff distance for the intermolecular contacts.
         """
-        ref_contacts = load_contacts(self.reference, cutoff)
+        ref_contacts = self.capri_reference.get_contacts(cutoff)
         if len(ref_contacts) != 0:
             try:
                 model_contacts = load_contacts(
@@ -508,7 +812,7 @@ class CAPRI:
     def calc_global_rmsd(self) -> None:
         """Calculate the full structure RMSD."""
         # Load reference atomic coordinates
-        ref_coord_dic, _ = load_coords(self.reference, self.atoms)
+        ref_coord_dic = self.capri_reference.get_coords(self.allatoms)
         # Load model atomic coordinates
         try:
             model_coord_dic, _ = load_coords(
@@ -543,15 +847,7 @@ class CAPRI:
 
     def calc_dockq(self) -> None:
         """Calculate the DockQ metric."""
-        self.dockq = 0.0
-        if self.fnat:
-            self.dockq += float(self.fnat) / 3
-        if self.irmsd:
-            irmsd_denom = 1 + (self.irmsd / 1.5) * (self.irmsd / 1.5)
-            self.dockq += (1 / irmsd_denom) / 3
-        if self.lrmsd:
-            lrmsd_denom = 1 + (self.lrmsd / 8.5) * (self.lrmsd / 8.5)
-            self.dockq += (1 / lrmsd_denom) / 3
+        self.dockq = get_dockq(self.fnat, self.irmsd, self.lrmsd)
 
     def has_cluster_info(self) -> bool:
         """
@@ -568,22 +864,27 @@ class CAPRI:
         return has_cluster_info
 
 
-    def run(self) -> Union[None, "CAPRI"]:
+    def get_result(self) -> CAPRIResult:
+        """Get the record of the CAPRI metrics of the model."""
+        return CAPRIResult(
+            self.identificator,
+            **{metric: getattr(self, metric) for metric in CAPRI_METRICS},
+        )
+
+    def run(self) -> CAPRIResult:
         """Get the CAPRI metrics."""
+        output_path = self.path if self.params.get("write_alignment") else None
         try:
-            align_func = get_align(
-                method=self.params["alignment_method"],
-                lovoalign_exec=self.params["lovoalign_exec"],
-            )
-            self.model2ref_numbering, self.model2ref_chain_dict = align_func(
-                self.reference, self.model, self.path
-            )
+            (
+                self.model2ref_numbering,
+                self.model2ref_chain_dict,
+            ) = self.capri_reference.align(self.model, self.params, output_path)
         except ALIGNError:
             log.warning(
                 f"Alignment failed between {self.reference} "
                 f"and {self.model}, skipping..."
             )
-            return
+            return self.get_result()
         # print(f"model2ref_numbering {self.model2ref_numbering}")
         # print(f"model2ref_chain_dict {self.model2ref_chain_dict}")
         if self.params["fnat"]:
@@ -617,12 +918,12 @@ class CAPRI:
             self.calc_global_rmsd()
 
         # The scheduler will use the return of the `run` method as the output of the tasks
-        return copy.deepcopy(self)
+        return self.get_result()
 
     @staticmethod
     def _load_atoms(
         model: PDBPath,
-        reference: PDBPath,
+        reference: Union[PDBPath, CAPRIReference],
         full: bool = False,
     ) -> AtomsDict:
         """
@@ -632,7 +933,8 @@ class CAPRI:
         ----------
         model : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
             PDB file of the model to have its atoms identified
-        reference : PosixPath or :py:class:`haddock.libs.libontology.PDBFile`
+        reference : PosixPath, :py:class:`haddock.libs.libontology.PDBFile`
+            or :py:class:`CAPRIReference`
             PDB file of the model to have its atoms identified
         full : bool
             If False, only backbone atoms will be retrieved, otherwise all atoms
@@ -643,7 +945,10 @@ class CAPRI:
             Dictionary containing atoms observed in model and reference
         """
         model_atoms = get_atoms(model, full=full)
-        reference_atoms = get_atoms(reference, full=full)
+        if isinstance(reference, CAPRIReference):
+            reference_atoms = reference.get_atoms(full)
+        else:
+            reference_atoms = get_atoms(reference, full=full)
         atoms_dict: AtomsDict = {}
         atoms_dict.update(model_atoms)
         atoms_dict.update(reference_atoms)
@@ -671,23 +976,7 @@ class CAPRI:
         if isinstance(pdb_f, PDBFile):
             pdb_f = pdb_f.rel_path
 
-        interface_resdic: dict[str, list[int]] = {}
-        contacts = load_contacts(pdb_f, cutoff)
-
-        for contact in contacts:
-            first_chain, first_resid, sec_chain, sec_resid = contact
-
-            if first_chain not in interface_resdic:
-                interface_resdic[first_chain] = []
-            if sec_chain not in interface_resdic:
-                interface_resdic[sec_chain] = []
-
-            if first_resid not in interface_resdic[first_chain]:
-                interface_resdic[first_chain].append(first_resid)
-            if sec_resid not in interface_resdic[sec_chain]:
-                interface_resdic[sec_chain].append(sec_resid)
-
-        return interface_resdic
+        return get_interface_resdic(load_contacts(pdb_f, cutoff))
 
     @staticmethod
     def add_chain_from_segid(pdb_path: PDBPath) -> Path:
@@ -711,63 +1000,540 @@ class CAPRI:
         return new_pdb_path
 
 
-def rank_according_to_score(
-    data: dict[int, ParamDict], sort_key: str, sort_ascending: bool
-) -> dict[int, ParamDict]:
+def map_to_reference(
+    atom_keys: Iterable[tuple],
+    numbering_dic: Optional[dict[str, dict[int, int]]],
+    model2ref_chain_dict: Optional[dict[str, str]],
+) -> list[tuple[int, tuple]]:
     """
-    Ranks a dictionary of data based on a specified sort key and sort order,
-    and assigns a rank to each entry based on its 'score' attribute.
+    Renumber the atoms of a model as the reference, as :py:func:`load_coords`.
 
-    Args:
-        data (dict[int, ParamDict]): Dictionary where each key is an index and each
-                                     value is a ParamDict containing data attributes.
-        sort_key (str): Key by which to sort the data within the ParamDict.
-                        Must correspond to a valid attribute in ParamDict.
-        sort_ascending (bool): If True, sorts the data in ascending order based on
-                               the sort_key; if False, sorts in descending order.
+    Parameters
+    ----------
+    atom_keys : list[tuple]
+        The (chain, resnum, atom_name, resname) keys of the model atoms.
+    numbering_dic : dict
+        The reference residue number of each model residue, per chain.
+    model2ref_chain_dict : dict
+        The reference chain of each model chain.
 
-    Returns:
-        dict[int, ParamDict]: A new dictionary where entries are sorted according
-                              to the sort_key and optionally sorted order. Each entry
-                              also includes a 'caprieval_rank' attribute indicating
-                              its rank based on the 'score'.
+    Returns
+    -------
+    mapped : list[tuple[int, tuple]]
+        The index and the renumbered key of the atoms matched in the
+        reference.
+    """
+    mapped: list[tuple[int, tuple]] = []
+    for row, (chain, resnum, atom_name, resname) in enumerate(atom_keys):
+        if model2ref_chain_dict:
+            # skip the chains not present in the reference
+            if chain not in model2ref_chain_dict:
+                continue
+            chain = model2ref_chain_dict[chain]
+            if numbering_dic:
+                try:
+                    resnum = numbering_dic[chain][resnum]
+                except KeyError:
+                    # this residue is not matched
+                    continue
+        mapped.append((row, (chain, resnum, atom_name, resname)))
+    return mapped
+
+
+def sample_has_same_atoms(
+    model_list: list[PDBFile],
+    sample_size: int = HOMOGENEITY_SAMPLE_SIZE,
+) -> bool:
+    """
+    Check whether a sample of the models have the same atoms.
+
+    The models are compared on their atom table only, without aligning
+    them, to detect heterogeneous ensembles before :py:func:`parse_capri_models`.
+
+    Parameters
+    ----------
+    model_list : list[PDBFile]
+        The models.
+    sample_size : int
+        The number of models compared, spread over the list.
+
+    Returns
+    -------
+    bool
+        Whether the sampled models have the same atoms, in the same order.
+    """
+    sample = np.unique(
+        np.linspace(0, len(model_list) - 1, num=min(len(model_list), sample_size))
+        .round()
+        .astype(int)
+    )
+    first_atoms, _ = read_model_coords(model_list[sample[0]])
+    return all(
+        read_model_coords(model_list[idx])[0] == first_atoms for idx in sample[1:]
+    )
+
+
+def parse_capri_models(
+    model_list: list[PDBFile],
+    references: list[CAPRIReference],
+    params: ParamMap,
+    core: int = 0,
+) -> tuple[
+    int,
+    Optional[list[tuple[tuple, tuple]]],
+    Optional[list[NDFloat]],
+    Optional[list[NDFloat]],
+]:
+    """
+    Read the coordinates of a list of models for their batch evaluation.
+
+    Each model is read once and its atoms are renumbered as each reference.
+    The atoms are selected as in :py:class:`CAPRI`: the atoms used for the
+    RMSDs, and the heavy atoms of the residues of the reference contacts for
+    the FNAT.
+
+    Parameters
+    ----------
+    model_list : list[PDBFile]
+        The models.
+    references : list[:py:class:`CAPRIReference`]
+        The references.
+    params : dict
+        The parameters of the CAPRI evaluation.
+    core : int
+        The core, to restore the order of the chunks.
+
+    Returns
+    -------
+    core : int
+        The core.
+    keys : list[tuple[tuple, tuple]] or None
+        For each reference, the (chain, resnum, atom_name) keys of the RMSD and
+        of the FNAT atoms, in the reference numbering. None if the models do
+        not have the same atoms or if a model cannot be aligned to a
+        reference.
+    rmsd_coords : list[np.ndarray dtype=float, shape=(n_models, n_atoms, 3)]
+        For each reference, the coordinates of the RMSD atoms.
+    fnat_coords : list[np.ndarray dtype=float, shape=(n_models, n_atoms, 3)]
+        For each reference, the coordinates of the FNAT atoms.
     """
-    score_rankkey_values = [(k, v["score"]) for k, v in data.items()]
-    score_rankkey_values.sort(key=lambda x: x[1])
-
-    for i, k in enumerate(score_rankkey_values):
-        data_idx, _ = k
-        data[data_idx]["caprieval_rank"] = i + 1
-
-    # Sort according to the sort key
-    rankkey_values = [(k, v[sort_key]) for k, v in data.items()]
-    rankkey_values.sort(
-        key=lambda x: x[1],
-        reverse=True if not sort_ascending else False,
+    allatoms = params["allatoms"]
+    contact_residues: list[set[tuple[str, int]]] = []
+    for reference in references:
+        residues: set[tuple[str, int]] = set()
+        if params["fnat"]:
+            for contact in reference.get_contacts(params["fnat_cutoff"]):
+                residues.update((contact[:2], contact[2:]))
+        contact_residues.append(residues)
+
+    keys: Optional[list[tuple[tuple, tuple]]] = None
+    rmsd_coords: list[list[NDFloat]] = [[] for _ in references]
+    fnat_coords: list[list[NDFloat]] = [[] for _ in references]
+    for model in model_list:
+        try:
+            alignments = [reference.align(model, params) for reference in references]
+            # heavy atoms for the contacts, as in `load_contacts`
+            fnat_atoms = get_atoms(model, full=True)
+            model_atoms = get_atoms(model, full=allatoms)
+            rmsd_atoms = [
+                {**model_atoms, **reference.get_atoms(allatoms)}
+                for reference in references
+            ]
+            atoms: dict[str, set[str]] = {}
+            for atoms_dic in [fnat_atoms] + rmsd_atoms:
+                for resname, atom_names in atoms_dic.items():
+                    atoms.setdefault(resname, set()).update(atom_names)
+            coord_dic, _ = load_coords(model, atoms, add_resname=True)
+        except ALIGNError:
+            return core, None, None, None
+        xyz = np.array(list(coord_dic.values()), dtype=np.float64)
+
+        model_keys: list[tuple[tuple, tuple]] = []
+        for ref_idx, (numbering_dic, chain_dict) in enumerate(alignments):
+            mapped = map_to_reference(coord_dic, numbering_dic, chain_dict)
+            if not mapped:
+                # no atom matched, as the `ALIGNError` of `load_coords`
+                return core, None, None, None
+            # same keys as `load_coords` without the residue names
+            rmsd_rows = {
+                key[:3]: row
+                for row, key in mapped
+                if key[2] in rmsd_atoms[ref_idx].get(key[3], ())
+            }
+            fnat_rows = {
+                key[:3]: row
+                for row, key in mapped
+                if key[2] in fnat_atoms.get(key[3], ())
+            }
+            fnat_rows = {
+                key: row
+                for key, row in fnat_rows.items()
+                if key[:2] in contact_residues[ref_idx]
+            }
+            model_keys.append((tuple(rmsd_rows), tuple(fnat_rows)))
+            rmsd_coords[ref_idx].append(
+                xyz[list(rmsd_rows.values())].reshape(-1, 3)
+            )
+            fnat_coords[ref_idx].append(
+                xyz[list(fnat_rows.values())].reshape(-1, 3)
+            )
+        if keys is None:
+            keys = model_keys
+        elif model_keys != keys:
+            return core, None, None, None
+    log.info(f"core {core}, {len(model_list)} models parsed")
+    return (
+        core,
+        keys,
+        [np.array(coords) for coords in rmsd_coords],
+        [np.array(coords) for coords in fnat_coords],
     )
 
-    _data = {}
-    for i, (data_idx, _) in enumerate(rankkey_values):
-        _data[i + 1] = data[data_idx]
-    data = _data
 
-    return _data
+class CAPRIBatch:
+    """
+    CAPRI evaluation of a homogeneous ensemble of models.
+
+    All the models have the same atoms once aligned to the reference, as after
+    a refinement step. Their coordinates are stacked in arrays (see
+    :py:func:`parse_capri_models`) and each metric is calculated for all the
+    models at once, with the same atoms as :py:class:`CAPRI`.
+    """
+
+    def __init__(
+        self,
+        reference: CAPRIReference,
+        params: ParamMap,
+        keys: tuple[tuple, tuple],
+        rmsd_coords: NDFloat,
+        fnat_coords: NDFloat,
+    ) -> None:
+        """
+        Initialize the class.
+
+        Parameters
+        ----------
+        reference : :py:class:`CAPRIReference`
+            The reference.
+        params : dict
+            The parameters of the CAPRI evaluation.
+        keys : tuple[tuple, tuple]
+            The keys of the RMSD and of the FNAT atoms.
+        rmsd_coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+            The coordinates of the RMSD atoms.
+        fnat_coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+            The coordinates of the FNAT atoms.
+        """
+        self.capri_reference = reference
+        self.params = params
+        self.allatoms = params["allatoms"]
+        self.r_chain = params["receptor_chain"]
+        self.l_chains = params["ligand_chains"]
+        self.rmsd_keys, self.fnat_keys = keys
+        self.rmsd_coords = rmsd_coords
+        self.fnat_coords = fnat_coords
+        self.n_models = len(rmsd_coords)
+        self.irmsd = np.full(self.n_models, np.nan)
+        self.lrmsd = np.full(self.n_models, np.nan)
+        self.ilrmsd = np.full(self.n_models, np.nan)
+        self.fnat = np.full(self.n_models, np.nan)
+        self.dockq = np.full(self.n_models, np.nan)
+        self.rmsd = np.full(self.n_models, np.nan)
+
+    def _get_common_coords(
+        self,
+        ref_coord_dic: dict[tuple[str, int, str], NDFloat],
+        sort: bool = False,
+    ) -> tuple[list[tuple], NDFloat, NDFloat]:
+        """Get the coordinates of the atoms of the reference and the models."""
+        rows = [
+            row for row, key in enumerate(self.rmsd_keys) if key in ref_coord_dic
+        ]
+        if sort:
+            rows.sort(key=lambda row: self.rmsd_keys[row])
+        common_keys = [self.rmsd_keys[row] for row in rows]
+        Q = np.array([ref_coord_dic[key] for key in common_keys]).reshape(-1, 3)
+        P = self.rmsd_coords[:, rows]
+        return common_keys, Q, P
+
+    def _superpose_rmsd(
+        self,
+        ref_coord_dic: dict[tuple[str, int, str], NDFloat],
+    ) -> Optional[NDFloat]:
+        """Calculate the RMSDs of the models after superposition."""
+        _, Q, P = self._get_common_coords(ref_coord_dic)
+        if len(Q) == 0:
+            return None
+        Q = Q - centroid(Q)
+        P = P - P.mean(axis=1, keepdims=True)
+        # the models are rotated, as in `CAPRI`, rather than using
+        #  `kabsch_rmsd_batch`, which is not accurate for small RMSDs
+        return kabsch_ilrmsd_batch(Q, P, Q, P)
+
+    def _ligand_rmsd(
+        self,
+        ref_coord_dic: dict[tuple[str, int, str], NDFloat],
+        metric: str,
+    ) -> Optional[NDFloat]:
+        """Calculate the ligand RMSDs after superposition of the receptors."""
+        # sorted to separate the receptor and the ligand coordinates
+        common_keys, Q, P = self._get_common_coords(ref_coord_dic, sort=True)
+        chain_ranges: dict[Any, Any] = {}
+        for i, (chain, _, _) in enumerate(common_keys):
+            chain_ranges.setdefault(chain, []).append(i)
+        chain_ranges = make_range(chain_ranges)
+        obs_chains = list(chain_ranges.keys())
+        if len(obs_chains) < 2:
+            log.warning(f"Not enough chains for calculating {metric}")
+            return None
+        r_chain, l_chains = check_chains(obs_chains, self.r_chain, self.l_chains)
+        r_start, r_end = chain_ranges[r_chain]
+        l_rows = np.concatenate(
+            [
+                np.arange(chain_ranges[l_chain][0], chain_ranges[l_chain][1] + 1)
+                for l_chain in l_chains
+            ]
+        )
+        # move to the origin of the receptors
+        Q_r_center = centroid(Q[r_start : r_end + 1])
+        P_r_center = P[:, r_start : r_end + 1].mean(axis=1, keepdims=True)
+        Q = Q - Q_r_center
+        P = P - P_r_center
+        return kabsch_ilrmsd_batch(
+            Q[r_start : r_end + 1],
+            P[:, r_start : r_end + 1],
+            Q[l_rows],
+            P[:, l_rows],
+        )
+
+    def calc_irmsd(self, cutoff: float = 5.0) -> None:
+        """Calculate the I-RMSD of the models, see :py:meth:`CAPRI.calc_irmsd`."""
+        if len(self.capri_reference.get_interface(cutoff)) == 0:
+            log.warning("No reference interface found")
+            return
+        irmsd = self._superpose_rmsd(
+            self.capri_reference.get_coords(self.allatoms, cutoff)
+        )
+        if irmsd is not None:
+            self.irmsd = irmsd
+
+    def calc_lrmsd(self) -> None:
+        """Calculate the L-RMSD of the models, see :py:meth:`CAPRI.calc_lrmsd`."""
+        lrmsd = self._ligand_rmsd(
+            self.capri_reference.get_coords(self.allatoms),
+            "lrmsd",
+        )
+        if lrmsd is not None:
+            self.lrmsd = lrmsd
+
+    def calc_ilrmsd(self, cutoff: float = 10.0) -> None:
+        """Calculate the ILRMSD of the models, see :py:meth:`CAPRI.calc_ilrmsd`."""
+        ilrmsd = self._ligand_rmsd(
+            self.capri_reference.get_coords(self.allatoms, cutoff),
+            "ilrmsd",
+        )
+        if ilrmsd is not None:
+            self.ilrmsd = ilrmsd
+
+    def calc_fnat(self, cutoff: float = 5.0) -> None:
+        """
+        Calculate the FNAT of the models, see :py:meth:`CAPRI.calc_fnat`.
+
+        Only the atom pairs of the reference contacts are checked: a contact
+        is found in a model if one of its atom pairs is closer than the cutoff.
+
+        Parameters
+        ----------
+        cutoff : float
+            The cutoff distance for the intermolecular contacts.
+        """
+        ref_contacts = self.capri_reference.get_contacts(cutoff)
+        if len(ref_contacts) == 0:
+            log.warning("No reference contacts found")
+            return
+        residue_rows: dict[tuple[str, int], list[int]] = {}
+        for row, (chain, resnum, _) in enumerate(self.fnat_keys):
+            residue_rows.setdefault((chain, resnum), []).append(row)
+
+        # the atom pairs of each contact, one contact after the other
+        rows_a: list[NDFloat] = []
+        rows_b: list[NDFloat] = []
+        starts: list[int] = []
+        n_pairs = 0
+        for contact in sorted(ref_contacts):
+            res_a = residue_rows.get(contact[:2], [])
+            res_b = residue_rows.get(contact[2:], [])
+            if not res_a or not res_b:
+                continue
+            starts.append(n_pairs)
+            rows_a.append(np.repeat(res_a, len(res_b)))
+            rows_b.append(np.tile(res_b, len(res_a)))
+            n_pairs += len(res_a) * len(res_b)
+
+        n_native = np.zeros(self.n_models, dtype=int)
+        if starts:
+            idx_a = np.concatenate(rows_a)
+            idx_b = np.concatenate(rows_b)
+            # about 10 million distances at a time
+            step = max(1, 10_000_000 // n_pairs)
+            for first in range(0, self.n_models, step):
+                chunk = self.fnat_coords[first : first + step]
+                # same distance check as `find_atom_contacts`
+                delta = chunk[:, idx_a] - chunk[:, idx_b]
+                dist = np.sqrt((delta * delta).sum(axis=-1))
+                in_contact = np.logical_or.reduceat(dist < cutoff, starts, axis=1)
+                n_native[first : first + step] = in_contact.sum(axis=1)
+        self.fnat = n_native / float(len(ref_contacts))
+
+    def calc_global_rmsd(self) -> None:
+        """Calculate the full structure RMSD of the models."""
+        rmsd = self._superpose_rmsd(self.capri_reference.get_coords(self.allatoms))
+        if rmsd is not None:
+            self.rmsd = rmsd
+
+    def calc_dockq(self) -> None:
+        """Calculate the DockQ metric of the models."""
+        self.dockq = np.array(
+            [
+                get_dockq(fnat, irmsd, lrmsd)
+                for fnat, irmsd, lrmsd in zip(self.fnat, self.irmsd, self.lrmsd)
+            ]
+        )
+
+    def run(self) -> None:
+        """Get the CAPRI metrics of the models."""
+        if self.params["fnat"]:
+            log.debug("Calculating FNAT")
+            self.calc_fnat(cutoff=self.params["fnat_cutoff"])
+
+        if self.params["irmsd"]:
+            log.debug("Calculating I-RMSD")
+            self.calc_irmsd(cutoff=self.params["irmsd_cutoff"])
+
+        if self.params["lrmsd"]:
+            log.debug("Calculating L-RMSD")
+            self.calc_lrmsd()
+
+        if self.params["ilrmsd"]:
+            log.debug("Calculating I-L-RMSD")
+            self.calc_ilrmsd(cutoff=self.params["irmsd_cutoff"])
+
+        if self.params["dockq"]:
+            log.debug("Calculating DockQ metric")
+            self.calc_dockq()
+
+        if self.params["global_rmsd"]:
+            log.debug("Calculating global RMSD")
+            self.calc_global_rmsd()
+
+    def get_results(self) -> list[CAPRIResult]:
+        """Get the records of the CAPRI metrics, numbered from 1."""
+        return [
+            CAPRIResult(
+                i + 1,
+                **{metric: float(getattr(self, metric)[i]) for metric in CAPRI_METRICS},
+            )
+            for i in range(self.n_models)
+        ]
+
+
+def get_sort_order(values: Iterable[Any], ascending: bool = True) -> np.ndarray:
+    """
+    Get the stable sorting order of a list of values.
+
+    Parameters
+    ----------
+    values : list
+        The values, the ones that are not numbers (None, NaN) go last.
+    ascending : bool
+        Sort in ascending order, otherwise in descending order.
+
+    Returns
+    -------
+    order : np.ndarray dtype=int
+        The indices of the values in sorted order, the equal values keeping
+        their order.
+    """
+    numbers = pd.to_numeric(
+        pd.Series(list(values), dtype=object),
+        errors="coerce",
+    ).to_numpy(dtype=float)
+    if not ascending:
+        numbers = -numbers
+    return np.argsort(numbers, kind="stable")
+
+
+def rank_table(
+    table: pd.DataFrame, sort_key: str, sort_ascending: bool
+) -> pd.DataFrame:
+    """
+    Rank the rows of a table by score and sort them by a key.
+
+    Parameters
+    ----------
+    table : pd.DataFrame
+        The table, with a `score` column.
+    sort_key : str
+        Column by which to sort the rows.
+    sort_ascending : bool
+        Sort the rows in ascending order, otherwise in descending order.
+
+    Returns
+    -------
+    pd.DataFrame
+        The sorted table, with the rank of the score of each row in the
+        `caprieval_rank` column.
+    """
+    ranks = np.empty(len(table), dtype=int)
+    ranks[get_sort_order(table["score"])] = np.arange(1, len(table) + 1)
+    table = table.assign(caprieval_rank=ranks)
+    order = get_sort_order(table[sort_key], sort_ascending)
+    return table.iloc[order].reset_index(drop=True)
+
+
+def get_optional_column(values: Iterable[Any]) -> pd.Series:
+    """Keep the values of a column as they are, None meaning not available."""
+    return pd.Series(list(values), dtype=object)
+
+
+def get_energies_table(models: list[PDBFile]) -> pd.DataFrame:
+    """
+    Gather the unweighted energies of the models in a table.
+
+    Parameters
+    ----------
+    models : list[PDBFile]
+        The models.
+
+    Returns
+    -------
+    pd.DataFrame
+        One column per energy term, NaN for the models without this term.
+    """
+    return pd.DataFrame(
+        [model.unw_energies or {} for model in models],
+        index=pd.RangeIndex(len(models)),
+    )
 
 
 def extract_data_from_capri_class(
-    capri_objects: list[CAPRI],
+    capri_objects: list[Union[CAPRI, CAPRIResult]],
     sort_key: str,
     sort_ascending: bool,
     output_fname: Path,
-) -> Union[dict[int, ParamDict], None]:
+) -> Optional[pd.DataFrame]:
     """
-    Extracts data attributes from a list of CAPRI objects into a structured dictionary,
+    Extracts data attributes from a list of CAPRI objects into a table,
     optionally sorts the data based on a specified key, and writes the sorted data to
     a file.
 
+    The table has one column per attribute, it is ranked with
+    :py:func:`rank_table` and written with
+    :py:func:`haddock.libs.libio.write_dataframe_to_file`.
+
     Args:
-        capri_objects (list[CAPRI]): List of CAPRI objects containing data attributes
-                                     to be extracted.
+        capri_objects (list[CAPRIResult]): List of CAPRI results (or objects)
+                                     containing data attributes to be extracted.
         sort_key (str): Key by which to sort the extracted data. Must correspond to
                         a valid attribute in the CAPRI object (e.g., 'score', 'irmsd').
         sort_ascending (bool): If True, sorts the data in ascending order based on
@@ -775,73 +1541,58 @@ def extract_data_from_capri_class(
         output_fname (Path): Path to the output file where the sorted data will be written.
 
     Returns:
-        Optional[dict[int, ParamDict]]: The sorted and structured data dictionary if
-                                        successful, None if no data was processed.
-
-    Raises:
-        (Include any specific exceptions the function may raise)
+        Optional[pd.DataFrame]: The sorted table, indexed from 1, if successful,
+                                None if no data was processed.
     """
-
-    data: dict[int, ParamDict] = {}
-    for i, c in enumerate(capri_objects, start=1):
-        data[i] = {
-            "model": c.model,
-            "md5": c.md5,
-            "caprieval_rank": None,
-            "score": c.score,
-            "irmsd": c.irmsd,
-            "fnat": c.fnat,
-            "lrmsd": c.lrmsd,
-            "ilrmsd": c.ilrmsd,
-            "dockq": c.dockq,
-            "rmsd": c.rmsd,
-            "cluster_id": c.model.clt_id if c.model.clt_id else None,
-            "cluster_ranking": c.model.clt_rank if c.model.clt_rank else None,
-            "model-cluster_ranking": (
-                c.model.clt_model_rank if c.model.clt_model_rank else None
-            ),
+    capri_objects = list(capri_objects)
+    if not capri_objects:
+        # This means no files have been collected
+        return None
+
+    models = [c.model for c in capri_objects]
+    table = pd.DataFrame(
+        {
+            "model": get_optional_column(models),
+            "md5": get_optional_column(c.md5 for c in capri_objects),
+            "caprieval_rank": get_optional_column([None] * len(models)),
+            "score": pd.Series([c.score for c in capri_objects]),
         }
-        if c.model.unw_energies is not None:
-            data[i].update(c.model.unw_energies)
-
-    ranked_data = rank_according_to_score(
-        data, sort_key=sort_key, sort_ascending=sort_ascending
     )
-    if not ranked_data:
-        # This means no files have been collected
-        return
-    else:
-        write_nested_dic_to_file(data_dict=ranked_data, output_fname=output_fname)
-        return ranked_data
-
-
-def calc_stats(data: list) -> tuple[float, float]:
-    """
-    Calculate the mean and stdev.
-
-    Parameters
-    ----------
-    data : list
-        List of values.
+    for metric in CAPRI_METRICS:
+        table[metric] = pd.Series([getattr(c, metric) for c in capri_objects])
+    table["cluster_id"] = get_optional_column(m.clt_id or None for m in models)
+    table["cluster_ranking"] = get_optional_column(m.clt_rank or None for m in models)
+    table["model-cluster_ranking"] = get_optional_column(
+        m.clt_model_rank or None for m in models
+    )
+    # the metrics against each reference, the ones above being the best
+    n_references = max(len(getattr(c, "references", [])) for c in capri_objects)
+    for ref_idx in range(n_references):
+        for metric in CAPRI_METRICS:
+            table[f"{metric}_ref{ref_idx + 1}"] = pd.Series(
+                [getattr(c.references[ref_idx], metric) for c in capri_objects]
+            )
+    energies = get_energies_table(models)
+    for term in energies.columns:
+        table[term] = energies[term]
 
-    Returns
-    -------
-    mean : float
-        Mean of the values.
-    stdev : float
-        Standard deviation of the values.
-    """
-    mean = np.mean(data)
-    stdev = np.std(data)
-    return mean, stdev
+    ranked_table = rank_table(table, sort_key=sort_key, sort_ascending=sort_ascending)
+    write_dataframe_to_file(ranked_table, output_fname=output_fname)
+    ranked_table.index += 1
+    return ranked_table
 
 
-# Define dict types
-CltData = dict[tuple[Optional[int], Union[int, str, None]], list[tuple[CAPRI, PDBFile]]]
+def get_metric_values(objects: list[Any], attribute: str) -> NDFloat:
+    """Get one value per object, NaN for the objects without the attribute."""
+    try:
+        values = [getattr(obj, attribute) for obj in objects]
+    except AttributeError:
+        return np.full(len(objects), np.nan)
+    return np.array(values, dtype=float).reshape(len(objects))
 
 
 def capri_cluster_analysis(
-    capri_list: Iterable[CAPRI],
+    capri_list: Iterable[Union[CAPRI, CAPRIResult]],
     model_list: Iterable[PDBFile],
     output_fname: FilePath,
     clt_threshold: int,
@@ -849,85 +1600,73 @@ def capri_cluster_analysis(
     sort_ascending: bool,
     path: FilePath,
 ) -> None:
-    """Consider the cluster results for the CAPRI evaluation."""
+    """
+    Consider the cluster results for the CAPRI evaluation.
+
+    The models are grouped by (cluster rank, cluster id), in the order of the
+    model list, and the mean and standard deviation of the score, the CAPRI
+    metrics and the energies of the first ``clt_threshold`` models of each
+    cluster are computed for all the clusters at once. A missing value among
+    these models gives a NaN statistic.
+    """
     capri_keys = ["irmsd", "fnat", "lrmsd", "dockq", "ilrmsd", "rmsd"]
     model_keys = ["air", "bsa", "desolv", "elec", "total", "vdw"]
     log.info(f"Rearranging cluster information into {output_fname}")
-    # get the cluster data
-    clt_data: CltData = dict(((m.clt_rank, m.clt_id), []) for m in model_list)
-
-    # add models to each cluster
-    for capri, model in zip(capri_list, model_list):
-        clt_data[(model.clt_rank, model.clt_id)].append((capri, model))
-
-    output_dic: dict[int, ParamDict] = {}
-
-    for i, element in enumerate(clt_data):
-        data: ParamDict = {}
-        number_of_models_in_cluster = len(clt_data[element])
-        # rank, cluster id, number of models in cluster
-        data["cluster_rank"] = element[0]
-        data["cluster_id"] = element[1]
-        data["n"] = number_of_models_in_cluster
-        if number_of_models_in_cluster < clt_threshold:
-            # under-evaluated, the mean was divided by a value
-            #  larger than the total number of models in the cluster
-            data["under_eval"] = "yes"
-        else:
-            data["under_eval"] = "-"
-        # score
-        try:
-            score_array = [e[1].score for e in clt_data[element][:clt_threshold]]
-            data["score"], data["score_std"] = calc_stats(score_array)
-        except KeyError:
-            data["score"] = float("nan")
-            data["score_std"] = float("nan")
-
-        # capri keys
-        for key in capri_keys:
-            std_key = f"{key}_std"
-            try:
-                key_array = [vars(e[0])[key] for e in clt_data[element][:clt_threshold]]
-                data[key], data[std_key] = calc_stats(key_array)
-            except KeyError:
-                data[key] = float("nan")
-                data[std_key] = float("nan")
-
-        # model keys
-        for key in model_keys:
-            std_key = f"{key}_std"
-            if clt_data[element][0][1].unw_energies:
-                try:
-                    key_array = [
-                        vars(e[1])["unw_energies"][key]
-                        for e in clt_data[element][:clt_threshold]
-                    ]
-                    data[key], data[std_key] = calc_stats(key_array)
-                except KeyError:
-                    data[key] = float("nan")
-                    data[std_key] = float("nan")
-
-        output_dic[i] = data
-
-    # Rank according to the score
-    score_rankkey_values = [(key, v["score"]) for key, v in output_dic.items()]
-    score_rankkey_values.sort(key=lambda x: x[1])
-    for i, k in enumerate(score_rankkey_values):
-        idx, _ = k
-        output_dic[idx]["caprieval_rank"] = i + 1
-
-    # Rank according to the sorting key
-    rankkey_values = [(key, v[sort_key]) for key, v in output_dic.items()]
-    rankkey_values.sort(
-        key=lambda x: x[1],
-        reverse=True if not sort_ascending else False,
-    )
+    capri_list = list(capri_list)
+    model_list = list(model_list)
+    if not model_list:
+        # This means there were only "dummy" values
+        return
 
-    _output_dic = {}
-    for i, k in enumerate(rankkey_values):
-        idx, _ = k
-        _output_dic[i + 1] = output_dic[idx]
-    output_dic = _output_dic
+    # one row per model
+    clusters = pd.DataFrame(
+        {
+            "cluster_rank": get_optional_column(m.clt_rank for m in model_list),
+            "cluster_id": get_optional_column(m.clt_id for m in model_list),
+        }
+    )
+    groups = clusters.groupby(
+        ["cluster_rank", "cluster_id"],
+        sort=False,
+        dropna=False,
+    )
+    # clusters numbered in order of appearance
+    cluster_idx = groups.ngroup().to_numpy()
+    _, first_models = np.unique(cluster_idx, return_index=True)
+    population = np.bincount(cluster_idx)
+
+    values = pd.DataFrame({"score": [m.score for m in model_list]}, dtype=float)
+    for key in capri_keys:
+        values[key] = get_metric_values(capri_list, key)
+    has_energies = np.array([bool(m.unw_energies) for m in model_list])
+    energy_keys = model_keys if has_energies[first_models].any() else []
+    energies = get_energies_table(model_list)
+    for key in energy_keys:
+        values[key] = energies[key] if key in energies else np.nan
+
+    # the values of the top models of each cluster
+    top_values = values.groupby(cluster_idx, sort=False).head(clt_threshold)
+    top_clusters = cluster_idx[top_values.index]
+    top_groups = top_values.groupby(top_clusters)
+    # a missing value gives NaN
+    missing = top_values.isna().groupby(top_clusters).any()
+    means = top_groups.mean().mask(missing)
+    stdevs = top_groups.std(ddof=0).mask(missing)
+    # the energies of a cluster are taken only if its first model has some
+    no_energies = ~has_energies[first_models]
+    means.loc[no_energies, energy_keys] = np.nan
+    stdevs.loc[no_energies, energy_keys] = np.nan
+
+    output_table = clusters.iloc[first_models].reset_index(drop=True)
+    output_table["n"] = population
+    # under-evaluated, the mean was divided by a value
+    #  larger than the total number of models in the cluster
+    output_table["under_eval"] = np.where(population < clt_threshold, "yes", "-")
+    for key in values.columns:
+        output_table[key] = means[key].to_numpy()
+        output_table[f"{key}_std"] = stdevs[key].to_numpy()
+
+    output_table = rank_table(output_table, sort_key, sort_ascending)
 
     output_fname = Path(path, output_fname)
 
@@ -953,15 +1692,11 @@ def capri_cluster_analysis(
     info_header += "#" + os.linesep
     info_header += "#" * 40
 
-    if not data:
-        # This means there were only "dummy" values
-        return
-    else:
-        write_nested_dic_to_file(
-            output_dic,
-            output_fname,
-            info_header=info_header,
-        )
+    write_dataframe_to_file(
+        output_table,
+        output_fname,
+        info_header=info_header,
+    )
 
 
 class CAPRIError(Exception):
@@ -4,16 +4,36 @@ The module takes the models generated in the previous step and calculates the
 contacts between them. Then, the module calculates the FCC matrix and clusters
 the models based on the calculated contacts.
 
+The residue contacts of each model are calculated in parallel, in-process,
+between the atoms of its different segments closer than
+`contact_distance_cutoff`. They are written to `.con` files only if
+`write_contacts` is true, for debugging.
+
+The contacts of each model are encoded as a row of a sparse binary matrix over
+all the distinct contacts, and the numbers of common contacts of all the pairs
+of models are obtained from sparse matrix products, calculated in parallel by
+blocks of at most `block_size` pairs. The `clust_cutoff` and `strictness`
+thresholds are applied to each block to find the neighbors of each model.
+
+The models are then clustered greedily: the model with the most unclustered
+neighbors becomes the center of a new cluster, with its unclustered neighbors
+as members. All the models are clustered in a single pass, and the clusters
+of at least `min_population` models are kept, `min_population` being lowered
+until at least one cluster is found.
+
+The FCC matrix is saved as a binary condensed matrix (`fcc.npy`, see
+:py:mod:`haddock.libs.libmatrix`), and in text form (`fcc.matrix`) if
+`text_matrix` is true.
+
 For more details please check *Rodrigues, J. P. et al. Proteins: Struct. Funct. Bioinform. 80, 1810–1817 (2012)*
 """  # noqa: E501
 
 import importlib.resources
-import os
 from pathlib import Path
 
-from haddock import FCC_path, log
-from haddock.core.defaults import CONTACT_FCC_EXEC, MODULE_DEFAULT_YAML
-from haddock.core.typing import Union
+from haddock import log
+from haddock.core.defaults import MODULE_DEFAULT_YAML
+from haddock.core.typing import Optional, Union
 from haddock.fcc import calc_fcc_matrix, cluster_fcc
 from haddock.libs.libclust import (
     add_cluster_info,
@@ -23,12 +43,22 @@ from haddock.libs.libclust import (
     write_structure_list,
     )
 from haddock.libs.libfcc import (
-    calculate_pairwise_matrix,
-    parse_contact_file,
-    read_matrix,
+    FCC_DECIMALS,
+    build_contact_matrix,
+    build_neighbor_graph,
+    calc_fcc_neighbors,
+    fcc_row_dispatcher,
+    load_fcc_contacts,
+    )
+from haddock.libs.libmatrix import (
+    create_condensed_matrix,
+    read_condensed_matrix,
+    write_text_matrix,
     )
-from haddock.libs.libsubprocess import JobInputFirst
-from haddock.modules import BaseHaddockModule, get_engine, read_from_yaml_config
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libparallel import GenericTask, get_index_list
+from haddock.libs.libutil import parse_ncores
+from haddock.modules import BaseHaddockModule, get_engine
 from haddock.modules.analysis import get_analysis_exec_mode
 from haddock.modules.analysis.clustfcc.clustfcc import (
     get_cluster_centers,
@@ -40,6 +70,8 @@ from haddock.modules.analysis.clustfcc.clustfcc import (
 
 RECIPE_PATH = Path(__file__).resolve().parent
 DEFAULT_CONFIG = Path(RECIPE_PATH, MODULE_DEFAULT_YAML)
+FCC_MATRIX_FNAME = "fcc.npy"
+FCC_TEXT_MATRIX_FNAME = "fcc.matrix"
 
 
 class HaddockModule(BaseHaddockModule):
@@ -57,87 +89,89 @@ class HaddockModule(BaseHaddockModule):
 
     @classmethod
     def confirm_installation(cls) -> None:
-        """Confirm if FCC is installed and available."""
-        # The FCC binary can be either in the default binary path or in the
-
-        dcfg = read_from_yaml_config(DEFAULT_CONFIG)
-        dcfg["executable"] = CONTACT_FCC_EXEC
+        """Confirm installation, the contacts are calculated in-process."""
+        return
 
     def _run(self) -> None:
         """Execute module."""
-        contact_executable = Path(FCC_path, self.params["executable"])
-
         # Get the models generated in previous step
         models_to_clust = self.previous_io.retrieve_models(individualize=True)
 
         # Calculate the contacts for each model
         log.info("Calculating contacts")
-        contact_jobs: list[JobInputFirst] = []
-        for model in models_to_clust:
-            pdb_f = Path(model.rel_path)  # type: ignore
-            contact_f = Path(model.file_name.replace(".pdb", ".con"))  # type: ignore  # noqa : E501
-            job = JobInputFirst(
-                pdb_f,
-                contact_f,
-                CONTACT_FCC_EXEC,
-                self.params["contact_distance_cutoff"],
-            )
-            contact_jobs.append(job)
-
         exec_mode = get_analysis_exec_mode(self.params["mode"])
-
         Engine = get_engine(exec_mode, self.params)
-        engine = Engine(contact_jobs)
-        engine.run()
-
-        contact_file_l: list[str] = []
-        not_found: list[str] = []
-        for job in contact_jobs:
-            if not job.output.exists():
-                # NOTE: If there is no output, most likely the models are not in
-                # contact there is no way of knowing how many models are not in
-                # contact, it can be only one, or could be all of them.
-                not_found.append(job.input.name)
-                log.warning(f"Contact was not calculated for {job.input.name}")
-            else:
-                contact_file_l.append(str(job.output))
-
-        if not_found:
+        parsed_contacts = self._calc_contacts(Engine, models_to_clust)
+
+        without_atoms = [
+            model.file_name
+            for model, contacts in zip(models_to_clust, parsed_contacts)
+            if contacts is None
+        ]
+        if without_atoms:
             # No contacts were calculated, we cannot cluster
-            self.finish_with_error("Several files were not generated:" f" {not_found}")
+            self.finish_with_error(f"No atoms found in the models: {without_atoms}")
 
         log.info("Calculating the FCC matrix")
-        parsed_contacts = parse_contact_file(
-            contact_file_l,
-            False,
-        )
+        contact_matrix = build_contact_matrix(parsed_contacts)
 
-        # Imporant: matrix is a generator object, be careful with it
-        matrix = calculate_pairwise_matrix(
-            parsed_contacts,
-            False,
+        # the matrix is filled on disk block by block, while the neighbors
+        #  of each model are found
+        nmodels = len(models_to_clust)
+        fcc_matrix_f = Path(FCC_MATRIX_FNAME)
+        create_condensed_matrix(
+            fcc_matrix_f,
+            [model.file_name for model in models_to_clust],
+            decimals=FCC_DECIMALS,
+            n_values=2,
         )
-
-        # write the matrix to a file, so we can read it afterwards and don't
-        #  need to reinvent the wheel handling this
-        fcc_matrix_f = Path("fcc.matrix")
-        with open(fcc_matrix_f, "w") as fh:
-            for data in list(matrix):
-                data_str = f"{data[0]} {data[1]} {data[2]:.2f} {data[3]:.3f}"
-                data_str += os.linesep
-                fh.write(data_str)
+        ncores = parse_ncores(n=self.params["ncores"], njobs=nmodels)
+        blocks = fcc_row_dispatcher(
+            nmodels,
+            ncores,
+            self.params["block_size"],
+        )
+        fcc_jobs = [
+            GenericTask(
+                calc_fcc_neighbors,
+                contact_matrix,
+                start_row,
+                end_row,
+                self.params["clust_cutoff"],
+                self.params["strictness"],
+                matrix_path=fcc_matrix_f,
+                block=block,
+            )
+            for block, (start_row, end_row) in enumerate(blocks)
+        ]
+        neighbors = []
+        if fcc_jobs:
+            engine = Engine(fcc_jobs)
+            engine.run()
+            if len(engine.results) != len(fcc_jobs) or None in engine.results:
+                self.finish_with_error("FCC values were not all calculated.")
+            neighbors = [
+                block_neighbors
+                for _, block_neighbors in sorted(
+                    engine.results,
+                    key=lambda result: result[0],
+                )
+            ]
+        if self.params["text_matrix"]:
+            write_text_matrix(
+                FCC_TEXT_MATRIX_FNAME,
+                read_condensed_matrix(fcc_matrix_f),
+                nmodels,
+                fmt=("{:.2f}", "{:.3f}"),
+            )
 
         # Cluster
         log.info("Clustering...")
-        pool = read_matrix(
-            fcc_matrix_f,
-            self.params["clust_cutoff"],
-            self.params["strictness"],
-        )
+        graph = build_neighbor_graph(nmodels, neighbors)
 
         # iterate clustering until at least one cluster is found
         clusters, min_population = iterate_clustering(
-            pool,
+            graph,
             self.params["min_population"],
         )
         self.params["min_population"] = min_population
@@ -206,3 +240,31 @@ class HaddockModule(BaseHaddockModule):
 
         # Export models for next module
         self.export_io_models()
+
+    def _calc_contacts(
+        self,
+        Engine,
+        models: list[PDBFile],
+    ) -> list[Optional[set[int]]]:
+        """Calculate the contacts of the models in parallel."""
+        ncores = parse_ncores(n=self.params["ncores"], njobs=len(models))
+        index_list = get_index_list(len(models), ncores)
+        contact_jobs = [
+            GenericTask(
+                load_fcc_contacts,
+                models[index_list[core] : index_list[core + 1]],
+                self.params["contact_distance_cutoff"],
+                write_contacts=self.params["write_contacts"],
+                core=core,
+            )
+            for core in range(ncores)
+        ]
+        engine = Engine(contact_jobs)
+        engine.run()
+        if len(engine.results) != ncores or None in engine.results:
+            self.finish_with_error("Contacts were not all calculated.")
+        return [
+            contacts
+            for _, chunk in sorted(engine.results, key=lambda result: result[0])
+            for contacts in chunk
+        ]
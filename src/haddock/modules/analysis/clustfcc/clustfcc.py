@@ -6,17 +6,27 @@ from pathlib import Path
 import numpy as np
 
 from haddock import log
-from haddock.libs.libfcc import cluster_elements, output_clusters
+from haddock.libs.libfcc import (
+    get_min_population,
+    greedy_clustering,
+    make_clusters,
+    output_clusters,
+)
 
 
-def iterate_clustering(pool, min_population_param):
+def iterate_clustering(graph, min_population_param):
     """
-    Iterate over the clustering process until a cluster is found.
+    Lower the min_population until a cluster is found.
+
+    All the models are clustered in a single pass, and the clusters of each
+    min_population are the first clusters large enough, so that lowering
+    the min_population does not require clustering again.
 
     Parameters
     ----------
-    pool : fcc.Pool
-        The pool object containing the fcc matrix.
+    graph : scipy.sparse.csr_matrix
+        The neighbor graph of the models, see
+        :py:func:`haddock.libs.libfcc.build_neighbor_graph`.
 
     min_population_param : int
         The min_population parameter to start the clustering process.
@@ -29,24 +39,15 @@ def iterate_clustering(pool, min_population_param):
     min_population : int
         The min_population used to obtain the clusters.
     """
-    cluster_check = False
-    while not cluster_check:
-        for min_population in range(min_population_param, 0, -1):
-            log.info(f"Clustering with min_population={min_population}")
-            _, clusters = cluster_elements(
-                pool,
-                threshold=min_population,
+    centers, counts, labels = greedy_clustering(graph)
+    min_population = get_min_population(counts, min_population_param)
+    if min_population < min_population_param:
+        log.info(
+            "[WARNING] No cluster was found with min_population="
+            f"{min_population_param}, decreasing min_population!"
             )
-            if not clusters:
-                log.info("[WARNING] No cluster was found, decreasing min_population!")
-            else:
-                cluster_check = True
-                # pass the actual min_population back to the param dict
-                #  because it will be used in the detailed output
-                break
-        if not cluster_check:
-            # No cluster was obtained in any min_population
-            cluster_check = True
+    log.info(f"Clustering with min_population={min_population}")
+    clusters = make_clusters(centers, counts, labels, min_population)
     return clusters, min_population
 
 
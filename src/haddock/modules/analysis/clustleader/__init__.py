@@ -0,0 +1,203 @@
+"""
+Matrix-free RMSD clustering module.
+
+This module clusters the models of the previous step by RMSD without
+calculating the pairwise RMSD matrix, which becomes too large for very large
+sampling stages. It is an alternative to the `rmsdmatrix` + `clustrmsd`
+combination scaling as O(N·K), with N models and K clusters.
+
+The models are visited from the best to the worst score. Each model joins the
+closest cluster center within `clust_cutoff`, otherwise it becomes the center
+of a new cluster (leader clustering). The RMSDs between a model and all the
+centers are calculated at once with a batched Kabsch algorithm, and the
+centers that cannot be within the cutoff by triangle inequality are skipped.
+
+The clusters can then be refined with `kmedoids_iter` k-medoids iterations,
+moving each center to the member closest to the average structure of its
+cluster and assigning each model to its closest center.
+
+The clusters are ranked as in `clustrmsd`, and the same attributes are set to
+the models (cluster id and rank), so that `seletopclusts` and `caprieval` can
+follow this module.
+
+The module accepts the following parameters in input, namely:
+
+* `clust_cutoff`: maximum RMSD between a model and its cluster center
+* `min_population`: minimum number of models in a cluster, lowered until at
+  least one cluster is found
+* `kmedoids_iter`: number of k-medoids iterations (default 0)
+* `resdic_`, `allatoms` and `atom_similarity`: the atoms considered for the
+  superposition and the RMSD calculation, as in the `rmsdmatrix` module
+"""
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+from haddock.core.defaults import MODULE_DEFAULT_YAML
+from haddock.core.typing import Any, FilePath, NDFloat, Optional
+from haddock.libs.libalign import check_common_atoms
+from haddock.libs.libclust import (
+    add_cluster_info,
+    rank_clusters,
+    write_structure_list,
+    )
+from haddock.libs.libcoords import CoordsStore
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libparallel import get_index_list
+from haddock.libs.libutil import parse_ncores
+from haddock.modules import BaseHaddockModule, get_engine
+from haddock.modules.analysis import (
+    confirm_resdic_chainid_length,
+    get_analysis_exec_mode,
+    )
+from haddock.modules.analysis.clustleader.clustleader import (
+    leader_clustering,
+    refine_clusters,
+    write_clustleader_file,
+    )
+from haddock.modules.analysis.clustrmsd.clustrmsd import (
+    iterate_min_population,
+    order_clusters,
+    write_clusters,
+    )
+from haddock.modules.analysis.rmsdmatrix.rmsd import load_models_coords
+
+
+RECIPE_PATH = Path(__file__).resolve().parent
+DEFAULT_CONFIG = Path(RECIPE_PATH, MODULE_DEFAULT_YAML)
+
+
+class HaddockModule(BaseHaddockModule):
+    """HADDOCK3 module for matrix-free RMSD clustering."""
+
+    name = RECIPE_PATH.name
+
+    def __init__(
+            self,
+            order: int,
+            path: Path,
+            initial_params: FilePath = DEFAULT_CONFIG,
+            ) -> None:
+        super().__init__(order, path, initial_params)
+
+    @classmethod
+    def confirm_installation(cls) -> None:
+        """Confirm if module is installed."""
+        return
+
+    def update_params(self, *args: Any, **kwargs: Any) -> None:
+        """Update parameters."""
+        super().update_params(*args, **kwargs)
+        with contextlib.suppress(KeyError):
+            self.params.pop("resdic_")
+
+        confirm_resdic_chainid_length(self._params)
+
+    def _run(self) -> None:
+        """Execute module."""
+        models = self.previous_io.retrieve_models(individualize=True)
+
+        filter_resdic = {
+            key[-1]: value
+            for key, value in self.params.items()
+            if key.startswith("resdic")
+            }
+        coords_store = CoordsStore.from_models(models)
+        if coords_store is not None:
+            self.log("Reading coordinates from the coordinates store")
+        _n_atoms, common_keys = check_common_atoms(
+            models if coords_store is None else models[:1],
+            filter_resdic,
+            self.params["allatoms"],
+            self.params["atom_similarity"],
+            )
+        coords = self._load_coords(
+            models,
+            common_keys,
+            filter_resdic,
+            coords_store,
+            )
+        coords -= coords.mean(axis=1, keepdims=True)
+
+        # the best models become the cluster centers
+        order = np.argsort([model.score for model in models], kind="stable")
+        self.log(
+            f"Clustering {len(models)} models with "
+            f"clust_cutoff = {self.params['clust_cutoff']}"
+            )
+        labels, centers = leader_clustering(
+            coords,
+            self.params["clust_cutoff"],
+            order=order,
+            )
+        if self.params["kmedoids_iter"] > 0:
+            labels, centers = refine_clusters(
+                coords,
+                labels,
+                centers,
+                self.params["kmedoids_iter"],
+                )
+
+        # same numbering as clustrmsd, starting from 1
+        cluster_arr, min_population = iterate_min_population(
+            labels + 1,
+            self.params["min_population"],
+            )
+        self.params["min_population"] = min_population
+        clusters, cluster_arr = order_clusters(cluster_arr)
+        self.log(f"clusters = {clusters}")
+
+        clt_dic, _ = write_clusters(
+            clusters,
+            cluster_arr,
+            models,
+            None,
+            Path("cluster.out"),
+            )
+        cluster_centers = {
+            int(cluster_arr[center]): models[center].file_name
+            for center in centers
+            if cluster_arr[center] != -1
+            }
+
+        score_dic, sorted_score_dic = rank_clusters(clt_dic, min_population)
+        self.output_models = add_cluster_info(sorted_score_dic, clt_dic)
+        write_structure_list(
+            models,
+            self.output_models,
+            out_fname="clustleader.tsv",
+            )
+        write_clustleader_file(
+            clusters,
+            clt_dic,
+            cluster_centers,
+            score_dic,
+            sorted_score_dic,
+            self.params,
+            )
+        self.export_io_models()
+
+    def _load_coords(
+            self,
+            models: list[PDBFile],
+            common_keys: list[tuple],
+            filter_resdic: dict[str, list[int]],
+            coords_store: Optional[CoordsStore],
+            ) -> NDFloat:
+        """Load the coordinates of the common atoms of the models."""
+        ncores = parse_ncores(n=self.params["ncores"], njobs=len(models))
+        Engine = get_engine(get_analysis_exec_mode(self.params["mode"]),
+                            self.params)
+        coords = load_models_coords(
+            Engine,
+            models,
+            get_index_list(len(models), ncores),
+            common_keys,
+            filter_resdic,
+            allatoms=self.params["allatoms"],
+            coords_store=coords_store,
+            )
+        if coords is None:
+            self.finish_with_error("Could not load the model coordinates.")
+        return coords
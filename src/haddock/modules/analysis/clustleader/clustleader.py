@@ -0,0 +1,286 @@
+"""Matrix-free RMSD clustering."""
+import os
+
+import numpy as np
+
+from haddock import log
+from haddock.core.typing import NDFloat, Optional
+from haddock.libs.libalign import kabsch_rmsd_batch, kabsch_rotation_batch
+
+
+def leader_clustering(
+        coords: NDFloat,
+        cutoff: float,
+        order: Optional[NDFloat] = None,
+        n_anchors: int = 8,
+        ) -> tuple[NDFloat, NDFloat]:
+    """
+    Cluster models around leaders.
+
+    Models are visited in ``order``. Each model joins the closest leader
+    within ``cutoff``, or becomes the leader of a new cluster. The RMSD
+    being a metric, the distances between the leaders and the first
+    ``n_anchors`` leaders give a lower bound of the distance between a
+    model and each leader: leaders whose bound exceeds the cutoff are never
+    superposed on the model.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        Coordinates of the models, centered on the origin.
+    cutoff : float
+        Maximum RMSD between a model and the leader of its cluster.
+    order : np.ndarray dtype=int, optional
+        Order in which the models are visited. Input order if not given.
+    n_anchors : int
+        Number of leaders used to prune the other ones.
+
+    Returns
+    -------
+    labels : np.ndarray dtype=int, shape=(n_models,)
+        The cluster of each model, in order of creation.
+    centers : np.ndarray dtype=int
+        The index of the leader of each cluster.
+    """
+    nmodels = len(coords)
+    if order is None:
+        order = np.arange(nmodels)
+    labels = np.full(nmodels, -1, dtype=np.int64)
+    centers = np.empty(nmodels, dtype=np.int64)
+    # distance between each leader and the anchors
+    anchor_dist = np.zeros((nmodels, n_anchors))
+    n_centers = 0
+    n_calc = 0
+    for idx in order:
+        n_anch = min(n_centers, n_anchors)
+        to_anchors = kabsch_rmsd_batch(
+            coords[idx],
+            coords[centers[:n_anch]],
+            )
+        dist = np.full(n_centers, np.inf)
+        dist[:n_anch] = to_anchors
+        if n_centers > n_anch:
+            lower = np.abs(
+                anchor_dist[n_anch:n_centers, :n_anch] - to_anchors
+                ).max(axis=1)
+            cand = np.flatnonzero(lower <= cutoff) + n_anch
+            if len(cand) > 0:
+                dist[cand] = kabsch_rmsd_batch(
+                    coords[idx],
+                    coords[centers[cand]],
+                    )
+            n_calc += len(cand)
+        n_calc += n_anch
+
+        closest = int(np.argmin(dist)) if n_centers else -1
+        if closest >= 0 and dist[closest] <= cutoff:
+            labels[idx] = closest
+            continue
+        # new leader
+        labels[idx] = n_centers
+        centers[n_centers] = idx
+        anchor_dist[n_centers, :n_anch] = to_anchors
+        if n_centers < n_anchors:
+            anchor_dist[:n_centers, n_centers] = to_anchors
+        n_centers += 1
+    log.info(
+        f"{n_centers} leaders found with {n_calc} RMSD calculations "
+        f"instead of {nmodels * n_centers}"
+        )
+    return labels, centers[:n_centers].copy()
+
+
+def get_medoid(coords: NDFloat, center: int, members: NDFloat) -> int:
+    """
+    Find the member closest to the average structure of a cluster.
+
+    The members are superposed on the current center before averaging.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        Coordinates of the models, centered on the origin.
+    center : int
+        Index of the current center.
+    members : np.ndarray dtype=int
+        Indices of the members of the cluster.
+
+    Returns
+    -------
+    int
+        Index of the new center.
+    """
+    rotations = kabsch_rotation_batch(coords[center], coords[members])
+    average = np.matmul(coords[members], rotations).mean(axis=0)
+    dist = kabsch_rmsd_batch(average, coords[members])
+    return int(members[np.argmin(dist)])
+
+
+def assign_to_centers(
+        coords: NDFloat,
+        centers: NDFloat,
+        labels: NDFloat,
+        ) -> tuple[NDFloat, NDFloat]:
+    """
+    Assign each model to its closest center.
+
+    Starting from the current assignment, a center ``c`` is only superposed
+    on the models ``m`` for which ``rmsd(c, c_m) < 2 * rmsd(m, c_m)``, with
+    ``c_m`` the closest center found so far: by triangle inequality, the
+    other models cannot be closer to ``c``.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        Coordinates of the models, centered on the origin.
+    centers : np.ndarray dtype=int
+        Index of the center of each cluster.
+    labels : np.ndarray dtype=int
+        Current cluster of each model.
+
+    Returns
+    -------
+    labels : np.ndarray dtype=int
+        The closest center of each model.
+    dist : np.ndarray dtype=float
+        The RMSD between each model and its center.
+    """
+    labels = labels.copy()
+    dist = np.empty(len(coords))
+    for k, center in enumerate(centers):
+        members = np.flatnonzero(labels == k)
+        dist[members] = kabsch_rmsd_batch(coords[center], coords[members])
+    center_dist = np.array([
+        kabsch_rmsd_batch(coords[center], coords[centers])
+        for center in centers
+        ])
+    for k, center in enumerate(centers):
+        cand = np.flatnonzero(center_dist[k, labels] < 2 * dist)
+        cand = cand[labels[cand] != k]
+        if len(cand) == 0:
+            continue
+        new_dist = kabsch_rmsd_batch(coords[center], coords[cand])
+        closer = new_dist < dist[cand]
+        labels[cand[closer]] = k
+        dist[cand[closer]] = new_dist[closer]
+    # a center always belongs to its own cluster
+    labels[centers] = np.arange(len(centers))
+    dist[centers] = 0.0
+    return labels, dist
+
+
+def refine_clusters(
+        coords: NDFloat,
+        labels: NDFloat,
+        centers: NDFloat,
+        n_iter: int,
+        ) -> tuple[NDFloat, NDFloat]:
+    """
+    Refine clusters with k-medoids iterations.
+
+    Each iteration moves the centers to the member closest to the average
+    structure of their cluster, and assigns each model to its closest
+    center. Models can thus end up farther than the clustering cutoff from
+    their center.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        Coordinates of the models, centered on the origin.
+    labels : np.ndarray dtype=int
+        Initial cluster of each model.
+    centers : np.ndarray dtype=int
+        Initial center of each cluster.
+    n_iter : int
+        Maximum number of iterations.
+
+    Returns
+    -------
+    labels : np.ndarray dtype=int
+        The cluster of each model.
+    centers : np.ndarray dtype=int
+        The center of each cluster.
+    """
+    centers = centers.copy()
+    for iteration in range(1, n_iter + 1):
+        new_centers = np.array([
+            get_medoid(coords, center, np.flatnonzero(labels == k))
+            for k, center in enumerate(centers)
+            ], dtype=np.int64)
+        if np.array_equal(new_centers, centers):
+            log.info(f"Centers converged after {iteration - 1} iterations")
+            break
+        centers = new_centers
+        labels, _ = assign_to_centers(coords, centers, labels)
+    return labels, centers
+
+
+def write_clustleader_file(
+        clusters,
+        clt_dic,
+        cluster_centers,
+        score_dic,
+        sorted_score_dic,
+        params,
+        output_fname="clustleader.txt",
+        ):
+    """
+    Write the clustleader.txt file.
+
+    The layout is the one of clustrmsd.txt.
+
+    Parameters
+    ----------
+    clusters : list
+        List of clusters.
+    clt_dic : dict
+        Dictionary with the clusters.
+    cluster_centers : dict
+        Dictionary with the cluster centers.
+    score_dic : dict
+        Dictionary with the scores.
+    sorted_score_dic : dict
+        Dictionary with the sorted scores.
+    params : dict
+        Dictionary with the clustering parameters.
+    output_fname : str
+        Output filename.
+    """
+    output_str = f'### clustleader output ###{os.linesep}'
+    output_str += os.linesep
+    output_str += f'Clustering parameters {os.linesep}'
+    output_str += f"> clust_cutoff={params['clust_cutoff']:.2f}{os.linesep}"
+    output_str += f"> kmedoids_iter={params['kmedoids_iter']}{os.linesep}"
+    output_str += f"> min_population={params['min_population']}{os.linesep}"
+    output_str += os.linesep
+    output_str += (
+        f"-----------------------------------------------{os.linesep}")
+    output_str += os.linesep
+    output_str += f'Total # of clusters: {len(clusters)}{os.linesep}'
+    for cluster_rank, (cluster_id, _) in enumerate(sorted_score_dic, start=1):
+        model_score_l = sorted(
+            ((e.score, e) for e in clt_dic[cluster_id]),
+            key=lambda element: element[0],
+            )
+        top_score = score_dic[cluster_id]
+        output_str += (
+            f"{os.linesep}"
+            "-----------------------------------------------"
+            f"{os.linesep}"
+            f"Cluster {cluster_rank} (#{cluster_id}, "
+            f"n={len(model_score_l)}, "
+            f"top{params['min_population']}_avg_score = {top_score:.2f})"
+            f"{os.linesep}")
+        output_str += os.linesep
+        output_str += f'clt_rank\tmodel_name\tscore{os.linesep}'
+        for model_ranking, (score, pdb) in enumerate(model_score_l, start=1):
+            output_str += f"{model_ranking}\t{pdb.file_name}\t{score:.2f}"
+            if pdb.file_name == cluster_centers[cluster_id]:
+                output_str += "\t*"
+            output_str += os.linesep
+    output_str += (
+        "-----------------------------------------------"
+        f"{os.linesep}")
+    log.info(f'Saving detailed output to {output_fname}')
+    with open(output_fname, 'w') as out_fh:
+        out_fh.write(output_str)
@@ -21,6 +21,9 @@ Four parameters can be defined in this context:
   of models that should be present in a cluster to consider it. If criterion is
   `maxclust`, the value is ignored.
 
+The dendrogram is saved in binary form (`dendrogram.npy`) so that `haddock3-re
+clustrmsd` can cut it again with other parameters without recalculating it.
+
 This module passes the path to the RMSD matrix is to the next step of the
 workflow through the `rmsd_matrix.json` file, thus allowing to execute several
 `clustrmsd` modules (possibly with different parameters) on the same RMSD
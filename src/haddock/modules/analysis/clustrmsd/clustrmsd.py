@@ -6,9 +6,15 @@ import numpy as np
 from scipy.cluster.hierarchy import fcluster, linkage
 
 from haddock import log
+from haddock.core.typing import Any, FilePath, Iterator, Sequence
+from haddock.libs.libmatrix import condensed_index, read_condensed_matrix
 from haddock.libs.libontology import RMSDFile
 
 
+DENDROGRAM_FNAME = "dendrogram.npy"
+DENDROGRAM_TEXT_FNAME = "dendrogram.txt"
+
+
 def get_matrix_path(rmsd_matrix: RMSDFile) -> Path:
     """From an RMSDFile object returns the rmsd matrix path.
 
@@ -67,10 +73,11 @@ def write_clusters(clusters, cluster_arr, models, rmsd_matrix, out_filename="clu
     clt_dic = {}
     log.info(f'Saving output to {out_filename}')
     cluster_out = Path(out_filename)
+    members = dict(iter_cluster_members(cluster_arr))
     with open(cluster_out, 'w') as fh:
         for cl_id in clusters:
             if cl_id != -1:
-                npw = np.where(cluster_arr == cl_id)[0]
+                npw = members[cl_id]
                 clt_dic[cl_id] = [models[n] for n in npw]
                 fh.write(f"Cluster {cl_id} -> ")
 
@@ -92,6 +99,9 @@ def read_matrix(rmsd_matrix: RMSDFile) -> np.ndarray:
     """
     Read the RMSD matrix.
 
+    Binary condensed matrices (``.npy``) are read through their header, text
+    matrices are parsed line by line.
+
     Parameters
     ----------
     rmsd_matrix : :obj:`RMSDFile`
@@ -103,6 +113,17 @@ def read_matrix(rmsd_matrix: RMSDFile) -> np.ndarray:
         Numpy array with the RMSD matrix.
     """
     filename = get_matrix_path(rmsd_matrix)
+    if filename.suffix == ".npy":
+        matrix = read_condensed_matrix(filename)
+        log.info(f"input rmsd matrix has {len(matrix)} entries")
+        if len(matrix) != rmsd_matrix.npairs:
+            err = (
+                f"number of pairs {len(matrix)} != expected "
+                f"({rmsd_matrix.npairs})"
+                )
+            raise ValueError(err)
+        return matrix
+    # legacy text matrix
     # count lines
     nlines = sum(1 for line in open(filename))
     log.info(f"input rmsd matrix has {nlines} entries")
@@ -130,6 +151,9 @@ def read_matrix(rmsd_matrix: RMSDFile) -> np.ndarray:
 
 def get_dendrogram(rmsd_matrix, linkage_type):
     """Get and save the dendrogram.
+
+    The linkage matrix is saved in binary form (`dendrogram.npy`), reused
+    as is by `haddock3-re clustrmsd`, and in text form (`dendrogram.txt`).
     
     Parameters
     ----------
@@ -145,10 +169,34 @@ def get_dendrogram(rmsd_matrix, linkage_type):
         Numpy array with the dendrogram.
     """
     Z = linkage(rmsd_matrix, linkage_type)
-    np.savetxt("dendrogram.txt", Z, fmt='%.5f')
+    np.save(DENDROGRAM_FNAME, Z)
+    np.savetxt(DENDROGRAM_TEXT_FNAME, Z, fmt='%.5f')
     return Z
 
 
+def load_dendrogram(clustrmsd_dir: FilePath) -> np.ndarray:
+    """
+    Load the dendrogram saved in a clustrmsd step folder.
+
+    The binary linkage matrix is used if present, the text one otherwise
+    (steps run with older versions).
+
+    Parameters
+    ----------
+    clustrmsd_dir : str or Path
+        Path to the clustrmsd step folder.
+
+    Returns
+    -------
+    Z : :obj:`numpy.ndarray`
+        Numpy array with the dendrogram.
+    """
+    dendrogram_path = Path(clustrmsd_dir, DENDROGRAM_FNAME)
+    if dendrogram_path.exists():
+        return np.load(dendrogram_path)
+    return np.loadtxt(Path(clustrmsd_dir, DENDROGRAM_TEXT_FNAME), ndmin=2)
+
+
 def get_clusters(dendrogram, tolerance, criterion):
     """Obtain the clusters."""
     log.info("Clustering dendrogram...")
@@ -156,6 +204,77 @@ def get_clusters(dendrogram, tolerance, criterion):
     return cluster_arr
 
 
+def scan_clust_cutoffs(
+        dendrogram: np.ndarray,
+        cutoffs: Sequence[float],
+        min_population: int,
+        ) -> list[dict[str, Any]]:
+    """
+    Cut the dendrogram at several distances.
+
+    Parameters
+    ----------
+    dendrogram : np.ndarray
+        The linkage matrix.
+    cutoffs : list[float]
+        The clustering cutoff distances.
+    min_population : int
+        Minimum population of a cluster.
+
+    Returns
+    -------
+    scan : list[dict]
+        For each cutoff, the total number of clusters, the number of
+        clusters with at least min_population models, the number of models
+        in smaller clusters and the populations of the valid clusters, in
+        decreasing order.
+    """
+    scan: list[dict[str, Any]] = []
+    for cutoff in cutoffs:
+        cluster_arr = fcluster(dendrogram, t=cutoff, criterion="distance")
+        populations = np.bincount(cluster_arr)[1:]
+        populations = np.sort(populations[populations > 0])[::-1]
+        valid = populations[populations >= min_population]
+        scan.append({
+            "clust_cutoff": cutoff,
+            "n_clusters": len(populations),
+            "n_valid_clusters": len(valid),
+            "n_unclustered": int(populations.sum() - valid.sum()),
+            "populations": valid.tolist(),
+            })
+    return scan
+
+
+def write_clust_cutoffs_scan(
+        scan: list[dict[str, Any]],
+        output_fname: FilePath = "clustrmsd_scan.tsv",
+        ) -> None:
+    """
+    Write the results of :py:func:`scan_clust_cutoffs` in a table.
+
+    Parameters
+    ----------
+    scan : list[dict]
+        The scan results.
+    output_fname : str or Path
+        Output filename.
+    """
+    output_str = (
+        "clust_cutoff\tn_clusters\tn_valid_clusters\tn_unclustered\t"
+        f"populations{os.linesep}"
+        )
+    for cut in scan:
+        populations = ",".join(map(str, cut["populations"])) or "-"
+        output_str += (
+            f"{cut['clust_cutoff']:.3f}\t{cut['n_clusters']}\t"
+            f"{cut['n_valid_clusters']}\t{cut['n_unclustered']}\t"
+            f"{populations}{os.linesep}"
+            )
+    log.info(f"Saving the clustering cutoffs scan to {output_fname}")
+    with open(output_fname, "w") as out_fh:
+        out_fh.write(output_str)
+
+
 def apply_min_population(
         cluster_arr: np.ndarray,
         min_population: int,
@@ -175,31 +294,34 @@ def apply_min_population(
     cluster_arr : np.ndarray
         Array of clusters (unclustered structures are labelled with -1)
     """
-    new_cluster_arr = cluster_arr.copy()
     log.info(f"Applying min_population {min_population} to cluster list")
-    cluster_pops = np.unique(cluster_arr, return_counts=True)
-    uncl_idx = np.where(cluster_pops[1] < min_population)[0]
-    invalid_clusters = cluster_pops[0][uncl_idx]
-    log.info(f"Invalid clusters: {invalid_clusters}")
+    cluster_ids, inverse, cluster_pops = np.unique(
+        cluster_arr,
+        return_inverse=True,
+        return_counts=True,
+        )
+    invalid = cluster_pops < min_population
+    log.info(f"Invalid clusters: {cluster_ids[invalid]}")
     # replacing invalid clusters with -1
-    uncl_models = 0
-    for cl_idx, cl_id in enumerate(new_cluster_arr):
-        if cl_id in invalid_clusters:
-            new_cluster_arr[cl_idx] = -1
-            uncl_models += 1
-    log.info(f"min_population applied, {uncl_models} models left unclustered")
+    uncl_mask = invalid[inverse]
+    new_cluster_arr = np.where(uncl_mask, -1, cluster_arr)
+    log.info(
+        f"min_population applied, {np.count_nonzero(uncl_mask)} models left "
+        "unclustered"
+        )
     return new_cluster_arr
 
 
 def iterate_min_population(
         cluster_arr: np.ndarray,
         min_population: int,
-        ) -> np.ndarray:
+        ) -> tuple[np.ndarray, int]:
     """
     Find one valid valuster satisfying the min_population parameter.
 
-    Logic: Iterate over the min_population values until we find
-    at least one valid cluster.
+    Logic: lower the min_population value until we find at least one valid
+    cluster, that is to the population of the largest cluster if it is below
+    min_population.
 
     Parameters
     ----------
@@ -212,19 +334,21 @@ def iterate_min_population(
     -------
     new_cluster_arr : np.ndarray
         Array of clusters (unclustered structures are labelled with -1)
+    min_population : int
+        The min_population value used.
     """
-    new_cluster_arr: np.ndarray = np.ndarray([])
-    for curr_thr in range(min_population, 0, -1):
-        log.info(f"Clustering with min_population={curr_thr}")
-        new_cluster_arr = apply_min_population(cluster_arr, curr_thr)
-        ncl = len(np.unique(new_cluster_arr))
-        if -1 in new_cluster_arr:  # contains -1 (unclustered)
-            ncl -= 1
-        # if no clusters found, try with a lower min_population
-        if ncl == 0:
-            log.warning(f'No clusters found with min_population={curr_thr}')
-        else:
-            break
+    _, inverse = np.unique(cluster_arr, return_inverse=True)
+    cluster_pops = np.bincount(inverse)
+    # unclustered structures do not count as a cluster
+    cluster_pops[np.unique(inverse[cluster_arr == -1])] = 0
+    curr_thr = max(min(min_population, int(cluster_pops.max())), 1)
+    if curr_thr < min_population:
+        log.warning(
+            f"No clusters found with min_population={min_population}, "
+            f"lowering it to {curr_thr}"
+            )
+    log.info(f"Clustering with min_population={curr_thr}")
+    new_cluster_arr = apply_min_population(cluster_arr, curr_thr)
     return new_cluster_arr, curr_thr
 
 
@@ -244,14 +368,44 @@ def cond_index(i: int, j: int, n: int) -> float:
     return n * (n - 1) / 2 - (n - i) * (n - i - 1) / 2 + j - i - 1
 
 
+def iter_cluster_members(
+        cluster_arr: np.ndarray,
+        ) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Iterate over the members of each cluster.
+
+    Parameters
+    ----------
+    cluster_arr : np.ndarray
+        Array of clusters.
+
+    Yields
+    ------
+    cl_id : int
+        The cluster ID, in increasing order.
+    npw : np.ndarray
+        Indexes of the members of the cluster, in increasing order.
+    """
+    cluster_arr = np.asarray(cluster_arr)
+    order = np.argsort(cluster_arr, kind="stable")
+    cluster_ids, starts = np.unique(cluster_arr[order], return_index=True)
+    for cl_id, npw in zip(cluster_ids, np.split(order, starts[1:])):
+        yield cl_id.item(), npw
+
+
 def get_cluster_center(
         npw: np.ndarray,
         n_obs: int,
         rmsd_matrix: np.ndarray,
+        block_size: int = 1000000,
         ) -> int:
     """
     Get the cluster centers.
 
+    The center is the member with the lowest sum of RMSDs to the other
+    members. The sums are accumulated pair by pair in the same order as a
+    double loop over the members, to find the same center in case of ties.
+
     Parameters
     ----------
     npw: np.ndarray
@@ -260,22 +414,35 @@ def get_cluster_center(
         Number of overall observations (models).
     rmsd_matrix : np.ndarray
         RMSD matrix.
+    block_size : int
+        Maximum number of pairs processed at once.
 
     Returns
     -------
     cluster_center : int
         Index of cluster center
     """
-    intra_cl_distances = {el: 0.0 for el in npw}
-
-    # iterating over the elements of the cluster
-    for m_idx in range(len(npw)):
-        npws = npw[m_idx + 1:]
-        pairs = [int(cond_index(npw[m_idx], npw_el, n_obs)) for npw_el in npws]
-        for pair_idx in range(len(pairs)):
-            intra_cl_distances[npw[m_idx]] += rmsd_matrix[pairs[pair_idx]]
-            intra_cl_distances[npws[pair_idx]] += rmsd_matrix[pairs[pair_idx]]
-    cluster_center = min(intra_cl_distances, key=intra_cl_distances.get)  # type: ignore  # noqa : E501
+    npw = np.asarray(npw, dtype=np.int64)
+    intra_cl_distances = np.zeros(len(npw))
+    rows_per_block = max(1, block_size // max(len(npw), 1))
+    for first_row in range(0, len(npw), rows_per_block):
+        rows = np.arange(first_row, min(first_row + rows_per_block, len(npw)))
+        # pairs (m_idx, el) of the rows, el > m_idx
+        row_pairs = len(npw) - 1 - rows
+        m_idx = np.repeat(rows, row_pairs)
+        offsets = np.arange(len(m_idx)) - np.repeat(
+            np.cumsum(row_pairs) - row_pairs,
+            row_pairs,
+            )
+        el = m_idx + 1 + offsets
+        distances = rmsd_matrix[condensed_index(npw[m_idx], npw[el], n_obs)]
+        # each pair is added to both its members, in loop order
+        np.add.at(
+            intra_cl_distances,
+            np.stack([m_idx, el], axis=1).ravel(),
+            np.repeat(distances, 2),
+            )
+    cluster_center = int(npw[np.argmin(intra_cl_distances)])
     return cluster_center
 
 
@@ -378,23 +545,23 @@ def order_clusters(cluster_arr):
     cluster_arr : np.ndarray
         Array of clusters.
     """
-    unique_clusters, cluster_counts = np.unique(cluster_arr, return_counts=True)
+    unique_clusters, inverse, cluster_counts = np.unique(
+        cluster_arr,
+        return_inverse=True,
+        return_counts=True,
+        )
     
     sorted_indices = np.argsort(-cluster_counts)  # must use negative to sort ascending
-    sorted_clusters = unique_clusters[sorted_indices]
     
-    # delete -1 from sorted_clusters if present
-    sorted_clusters = sorted_clusters[sorted_clusters != -1]
-    clusters = []
-    # for every element of sorted_clusters I want to assign a new ID
-    # to the elements of cluster_arr that match the order of sorted_clusters
-    index_dict = {}
-    for c in sorted_clusters:
-        # index of cluster_arr where the cluster is equal to c
-        idx = np.where(cluster_arr == c)
-        index_dict[c] = idx
+    # new ID of each cluster, following the order of sorted_indices
+    new_ids = np.empty(len(unique_clusters), dtype=cluster_arr.dtype)
+    new_ids[sorted_indices] = np.arange(1, len(unique_clusters) + 1)
+    # delete -1 from the clusters if present
+    unclustered = unique_clusters == -1
+    if unclustered.any():
+        new_ids[new_ids > new_ids[unclustered][0]] -= 1
+        new_ids[unclustered] = -1
+    clusters = list(range(1, len(unique_clusters) - unclustered.sum() + 1))
     # now the assignment
-    for i, c in enumerate(sorted_clusters):
-        clusters.append(i + 1)
-        cluster_arr[index_dict[c]] = i + 1
+    cluster_arr[:] = new_ids[inverse]
     return clusters, cluster_arr
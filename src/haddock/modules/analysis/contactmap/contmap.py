@@ -14,6 +14,7 @@ import plotly.graph_objs as go
 from scipy.spatial.distance import pdist, squareform
 
 from haddock import log
+from haddock.libs.libcache import get_coord_records
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libpdb import (
     slc_name,
@@ -678,55 +679,53 @@ def extract_pdb_dt(path: Path) -> dict:
         A dictionary of the pdb file accesible using chains as keys.
     """
     pdb_chains: dict = {'chain_order': []}
-    # Read file
-    with open(path, 'r') as f:
-        # Loop over lines
-        for _ in f:
-            # Skip non ATOM / HETATM lines
-            if not any([
-               _.startswith('ATOM'),
-               _.startswith('HETATM'),
-               ]):
-                continue
+    # Loop over coordinates lines (read through the structure cache)
+    for _ in get_coord_records(path):
+        # Skip non ATOM / HETATM lines
+        if not any([
+           _.startswith('ATOM'),
+           _.startswith('HETATM'),
+           ]):
+            continue
 
-            # Extract residue name
-            resname = _[slc_resname]
-            # Extract chain id
-            chainid = _[slc_chainid]
-            # Extract resid
-            resid = _[slc_resseq].strip()
-
-            # Check if chain already parsed
-            if chainid not in pdb_chains.keys():
-                # Add to ordered chains
-                pdb_chains['chain_order'].append(chainid)
-                # Initiate new chain holder
-                pdb_chains[chainid] = {'order': []}
-
-            # Check if new resid id
-            if resid not in pdb_chains[chainid].keys():
-                # Add to oredered resids
-                pdb_chains[chainid]['order'].append(resid)
-                # Initiate new residue holder
-                pdb_chains[chainid][resid] = {
-                    'index': len(pdb_chains[chainid]['order']) - 1,
-                    'resname': resname,
-                    'chainid': chainid,
-                    'resid': resid,
-                    'position': len(pdb_chains[chainid]['order']),
-                    'atoms_order': [],
-                    'atoms': {},
-                    }
-            # extract atome name
-            atname = _[slc_name].strip()
-            # check if not an hydrogen
-            if atname[0] == 'H':
-                continue
+        # Extract residue name
+        resname = _[slc_resname]
+        # Extract chain id
+        chainid = _[slc_chainid]
+        # Extract resid
+        resid = _[slc_resseq].strip()
+
+        # Check if chain already parsed
+        if chainid not in pdb_chains.keys():
+            # Add to ordered chains
+            pdb_chains['chain_order'].append(chainid)
+            # Initiate new chain holder
+            pdb_chains[chainid] = {'order': []}
+
+        # Check if new resid id
+        if resid not in pdb_chains[chainid].keys():
+            # Add to oredered resids
+            pdb_chains[chainid]['order'].append(resid)
+            # Initiate new residue holder
+            pdb_chains[chainid][resid] = {
+                'index': len(pdb_chains[chainid]['order']) - 1,
+                'resname': resname,
+                'chainid': chainid,
+                'resid': resid,
+                'position': len(pdb_chains[chainid]['order']),
+                'atoms_order': [],
+                'atoms': {},
+                }
+        # extract atome name
+        atname = _[slc_name].strip()
+        # check if not an hydrogen
+        if atname[0] == 'H':
+            continue
 
-            # extact atome coordinates
-            coords = extract_pdb_coords(_)
-            pdb_chains[chainid][resid]['atoms_order'].append(atname)
-            pdb_chains[chainid][resid]['atoms'][atname] = coords
+        # extact atome coordinates
+        coords = extract_pdb_coords(_)
+        pdb_chains[chainid][resid]['atoms_order'].append(atname)
+        pdb_chains[chainid][resid]['atoms'][atname] = coords
 
     return pdb_chains
 
@@ -4,12 +4,27 @@ ilRMSD matrix module.
 This module calculates of the interface-ligand RMSD (ilRMSD) matrix between all
 the models generated in the previous step.
 
-As all the pairwise ilRMSD calculations are independent, the module distributes
-them over all the available cores in an optimal way.
+Each model is parsed a single time, in parallel: the residue contacts between
+its chains and the coordinates of the atoms used for the ilRMSDs are read at
+once. The interface residues of the receptor and of the ligand chains are
+gathered over all the models (and written to `receptor_contacts.con`), and the
+coordinates of the interface atoms common to all the models are kept in
+memory.
 
-Once created, the ilRMSD matrix is saved in text form in the current
-`ilrmsdmatrix` folder. The path to this file is then shared with the following
-step of the workflow by means of the json file `rmsd_matrix.json`.
+As all the pairwise ilRMSD calculations are independent, the module distributes
+them over all the available cores in an optimal way. By default they are
+calculated with a batched implementation of the Kabsch algorithm in numpy,
+superposing the receptor interfaces and measuring the RMSD of the ligand
+interfaces. Setting `rmsd_engine = "c"` writes the coordinates to binary
+trajectory files processed by the `fast-rmsdmatrix` executable instead.
+
+Once created, the ilRMSD matrix is saved as a binary condensed matrix
+(`ilrmsd.npy`, see :py:mod:`haddock.libs.libmatrix`) in the current
+`ilrmsdmatrix` folder, and in text form (`ilrmsd.matrix`) if `text_matrix` is
+true. The outputs of the parallel jobs are copied to the matrix on disk by
+chunks, so that the matrix never needs to fit in memory. The path to the
+binary matrix is then shared with the following step of the workflow by means
+of the json file `rmsd_matrix.json`.
 
 IMPORTANT: the module assumes coherent numbering for all the receptor and ligand
 chains, as no alignment is performed. The user must ensure that the numbering
@@ -23,26 +38,45 @@ import numpy as np
 
 from haddock import RMSD_path, log
 from haddock.core.defaults import FAST_RMSDMATRIX_EXEC, MODULE_DEFAULT_YAML
-from haddock.libs.libalign import (
-    check_chains,
-    check_common_atoms,
-    get_atoms,
-    load_coords,
-    rearrange_xyz_files,
+from haddock.libs.libalign import check_chains, write_binary_traj
+from haddock.libs.libmatrix import (
+    copy_reused_pairs,
+    copy_text_matrix,
+    create_condensed_matrix,
+    find_reusable_matrix,
+    hash_coords,
+    hash_signature,
+    load_condensed_matrix,
+    write_text_matrix,
     )
 from haddock.libs.libontology import ModuleIO, RMSDFile
-from haddock.libs.libparallel import get_index_list
+from haddock.libs.libparallel import GenericTask, get_index_list
 from haddock.libs.libutil import parse_ncores
 from haddock.modules import BaseHaddockModule, get_engine
-from haddock.modules.analysis import get_analysis_exec_mode
-from haddock.modules.analysis.ilrmsdmatrix.ilrmsd import Contact, ContactJob
-from haddock.modules.analysis.rmsdmatrix import RMSDJob, rmsd_dispatcher
-from haddock.modules.analysis.rmsdmatrix.rmsd import XYZWriter, XYZWriterJob
+from haddock.modules.analysis import (
+    get_analysis_exec_mode,
+    get_previous_matrices,
+    )
+from haddock.modules.analysis.ilrmsdmatrix.ilrmsd import (
+    get_common_coords,
+    get_interface_residues,
+    parse_ilrmsd_models,
+    )
+from haddock.modules.analysis.rmsdmatrix.rmsd import (
+    RMSDJob,
+    RMSDMatrixJob,
+    RMSDUpdateJob,
+    block_dispatcher,
+    rmsd_dispatcher,
+    update_dispatcher,
+    )
 
 
 RECIPE_PATH = Path(__file__).resolve().parent
 DEFAULT_CONFIG = Path(RECIPE_PATH, MODULE_DEFAULT_YAML)
 EXEC_PATH = FAST_RMSDMATRIX_EXEC
+ILRMSD_MATRIX_FNAME = "ilrmsd.npy"
+ILRMSD_TEXT_MATRIX_FNAME = "ilrmsd.matrix"
 
 
 class HaddockModule(BaseHaddockModule):
@@ -68,72 +102,17 @@ class HaddockModule(BaseHaddockModule):
         return
 
     @staticmethod
-    def _rearrange_output(output_name, path, ncores):
-        """Combine different ilrmsd outputs in a single file."""
+    def _rearrange_output(output_name, path, ncores, starts):
+        """Copy the different ilrmsd outputs in the binary matrix."""
         output_fname = Path(path, output_name)
         log.info(f"rearranging output files into {output_fname}")
-        # Combine files
-        with open(output_fname, "w") as out_file:
-            for core in range(ncores):
-                tmp_file = Path(path, "ilrmsd_" + str(core) + ".matrix")
-                with open(tmp_file) as infile:
-                    out_file.write(infile.read())
-                log.debug(f"File number {core} written")
-                tmp_file.unlink()
-        log.info("Completed reconstruction of rmsd files.")
-        log.info(f"{output_fname} created.")
-
-    @staticmethod
-    def _rearrange_contact_output(output_name, path, ncores):
-        """Combine different contact outputs in a single file.
-
-        Parameters
-        ----------
-        output_name : str
-            Name of the output file.
-        path : str
-            Path to the output file.
-        ncores : int
-            Number of cores used in the calculation.
-
-        Returns
-        -------
-        res_resdic_npu : dict
-            Dictionary of the unique residues in the interfaces.
-        """
-        output_fname = Path(path, output_name)
-        log.info(f"rearranging contact files into {output_fname}")
-        # Combine residues
-        res_resdic = {}
         for core in range(ncores):
-            tmp_file = Path(path, "interface_contacts_" + str(core) + ".con")
-            for ln in tmp_file.read_text().split(os.linesep)[:-1]:
-                ch = ln.split()[0]
-                resids = [int(el) for el in ln.split()[1:]]
-                if ch not in res_resdic:
-                    res_resdic[ch] = [resids]
-                else:
-                    res_resdic[ch].append(resids)
+            tmp_file = Path(path, "ilrmsd_" + str(core) + ".matrix")
+            copy_text_matrix(tmp_file, output_fname, starts[core], [3])
+            log.debug(f"File number {core} written")
             tmp_file.unlink()
-
-        # Unique residues
-        npu_resdic = {}
-        for ch in res_resdic.keys():
-            resids = np.concatenate(res_resdic[ch])
-            resids_npu = np.unique(resids)
-            npu_resdic[ch] = resids_npu
-        log.info(f"Overall interface residues: {npu_resdic}")
-
-        # Write to file
-        with open(output_fname, "w") as out_file:
-            for chain in npu_resdic.keys():
-                out_file.write(f"{chain} ")
-                out_file.write(" ".join([str(el) for el in npu_resdic[chain]]))
-                out_file.write(os.linesep)
-
-        log.info("Completed reconstruction of contact files.")
+        log.info("Completed reconstruction of rmsd files.")
         log.info(f"{output_fname} created.")
-        return npu_resdic
 
     def _run(self) -> None:
         """Execute module."""
@@ -156,14 +135,19 @@ class HaddockModule(BaseHaddockModule):
                 "for ilRMSD matrix calculation"
             )
 
-        # find the existing chains
-        model_atoms = get_atoms(models[0])
-        mod_coord_dic, _ = load_coords(
-            models[0],
-            model_atoms,
+        exec_mode = get_analysis_exec_mode(self.params["mode"])
+        Engine = get_engine(exec_mode, self.params)
+
+        # a single pass over the models gives both the interfaces and the
+        #  coordinates of the atoms used for the ilRMSDs
+        interfaces, atom_keys, key_ids, model_coords = self._parse_models(
+            Engine,
+            models,
+            ncores,
         )
-        obs_chains = np.unique([el[0] for el in mod_coord_dic.keys()])
-        obs_chains = list(obs_chains)
+
+        # find the existing chains
+        obs_chains = sorted({key[0] for key in atom_keys[key_ids[0]]})
         log.info(f"Observed chains: {obs_chains}")
         # assigning the chains to the receptor and ligand
         r_chain, l_chains = check_chains(
@@ -175,56 +159,8 @@ class HaddockModule(BaseHaddockModule):
         self.params["ligand_chains"] = l_chains
 
         # Find the common residues making contacts for the receptor and ligand.
-        index_list = get_index_list(nmodels, ncores)
-        # contact jobs
-        contact_jobs = []
-        for core in range(ncores):
-            output_name = "interface_contacts_" + str(core) + ".con"
-            contact_obj = Contact(
-                model_list=models[index_list[core] : index_list[core + 1]],
-                output_name=output_name,
-                core=core,
-                path=Path("."),
-                contact_distance_cutoff=self.params["contact_distance_cutoff"],
-                params=self.params,
-            )
-            # running now the ContactJob
-            job_f = Path(output_name)
-            # init RMSDJob
-            job = ContactJob(
-                job_f,
-                self.params,
-                contact_obj,
-            )
-            contact_jobs.append(job)
-
-        exec_mode = get_analysis_exec_mode(self.params["mode"])
-        Engine = get_engine(exec_mode, self.params)
-        contact_engine = Engine(contact_jobs)
-        contact_engine.run()
-
-        # check if all the jobs have been completed
-        contact_file_l = []
-        not_found = []
-        for job in contact_jobs:
-            if not job.output.exists():
-                not_found.append(job.output.name)
-                wrn = f"Contacts were not calculated for {job.output.name}"
-                log.warning(wrn)
-            else:
-                contact_file_l.append(str(job.output))
-
-        if not_found:
-            # Not all contacts were calculated, cannot proceed
-            self.finish_with_error(
-                "Several contact files were not generated:" f" {not_found}"
-            )
-
-        # Post-processing : single file
-        output_name = "receptor_contacts.con"
-        res_resdic = self._rearrange_contact_output(
-            output_name, path=contact_obj.path, ncores=ncores
-        )
+        res_resdic = get_interface_residues(interfaces, r_chain, l_chains)
+        self._write_contacts("receptor_contacts.con", res_resdic)
 
         # if the receptor chain in res_resdic is empty, then the receptor has made no contacts and
         # the ilrmsd matrix cannot be calculated. This probably means that single chains structures
@@ -234,81 +170,188 @@ class HaddockModule(BaseHaddockModule):
             _msg += " Please check your input and make sure that there are at least two chains in contact."
             self.finish_with_error(_msg)
 
-        rec_traj_filename = Path("traj_rec.xyz")
-        lig_traj_filename = Path("traj_lig.xyz")
-
-        res_resdic_rec = {k: res_resdic[k] for k in res_resdic if k[0] == r_chain}
+        res_resdic_rec = {r_chain: res_resdic[r_chain]}
         # ligand_chains is a list of chains
         res_resdic_lig = {k: res_resdic[k] for k in l_chains}
 
         log.info(
             f"Check common atoms for receptor (chain {list(res_resdic_rec.keys())})"
         )
-        n_atoms_rec, common_keys_rec = check_common_atoms(
-            models,
+        rec_coords, common_keys_rec = get_common_coords(
+            atom_keys,
+            key_ids,
+            model_coords,
             res_resdic_rec,
-            self.params["allatoms"],
             self.params["atom_similarity"],
         )
-
         log.info(
             f"Check common atoms for ligand (chains {list(res_resdic_lig.keys())})"
         )
-        n_atoms_lig, common_keys_lig = check_common_atoms(
-            models,
+        lig_coords, common_keys_lig = get_common_coords(
+            atom_keys,
+            key_ids,
+            model_coords,
             res_resdic_lig,
-            self.params["allatoms"],
             self.params["atom_similarity"],
         )
+        del model_coords
 
-        xyzwriter_jobs: list[XYZWriterJob] = []
-        for core in range(ncores):
-            output_name_rec = Path("traj_rec_" + str(core) + ".xyz")
-            # init XYZWriter
-            xyzwriter_obj_rec = XYZWriter(
-                model_list=models[index_list[core] : index_list[core + 1]],
-                output_name=output_name_rec,
-                core=core,
-                n_atoms=n_atoms_rec,
-                common_keys=common_keys_rec,
-                filter_resdic=res_resdic_rec,
-                allatoms=self.params["allatoms"],
+        tot_npairs = nmodels * (nmodels - 1) // 2
+        log.info(f"total number of pairs {tot_npairs}")
+        # the ilRMSDs depend on the receptor and ligand atoms
+        signature = {
+            "module": self.name,
+            "atoms": hash_signature(common_keys_rec, common_keys_lig),
+        }
+        hashes = hash_coords(np.concatenate([rec_coords, lig_coords], axis=1))
+        reuse = None
+        if self.params["incremental"]:
+            reuse = find_reusable_matrix(
+                get_previous_matrices(self.name, ILRMSD_MATRIX_FNAME),
+                hashes,
+                signature,
             )
-            # job_rec
-            job_rec = XYZWriterJob(
-                xyzwriter_obj_rec,
+
+        # the matrix is filled on disk
+        create_condensed_matrix(
+            ILRMSD_MATRIX_FNAME,
+            [model.file_name for model in models],
+            decimals=[3],
+            hashes=hashes,
+            signature=signature,
+        )
+        if reuse is not None:
+            self._update_ilrmsd_matrix(Engine, rec_coords, lig_coords, *reuse)
+        elif self.params["rmsd_engine"] == "numpy":
+            self._calc_ilrmsd_matrix(Engine, rec_coords, lig_coords, tot_npairs)
+        else:
+            self._run_fast_ilrmsdmatrix(Engine, rec_coords, lig_coords)
+
+        if self.params["text_matrix"]:
+            write_text_matrix(
+                ILRMSD_TEXT_MATRIX_FNAME,
+                load_condensed_matrix(ILRMSD_MATRIX_FNAME),
+                nmodels,
             )
 
-            xyzwriter_jobs.append(job_rec)
+        # Sending models to the next step of the workflow
+        self.output_models = models
+        self.export_io_models()
+        # Sending matrix path to the next step of the workflow
+        matrix_io = ModuleIO()
+        ilrmsd_matrix_file = RMSDFile(ILRMSD_MATRIX_FNAME, npairs=tot_npairs)
+        matrix_io.add(ilrmsd_matrix_file)
+        matrix_io.save(filename="rmsd_matrix.json")
+
+    def _parse_models(self, Engine, models, ncores):
+        """
+        Parse the models in parallel.
 
-            output_name_lig = Path("traj_lig_" + str(core) + ".xyz")
-            # init XYZWriter
-            xyzwriter_obj_lig = XYZWriter(
-                model_list=models[index_list[core] : index_list[core + 1]],
-                output_name=output_name_lig,
-                core=core,
-                n_atoms=n_atoms_lig,
-                common_keys=common_keys_lig,
-                filter_resdic=res_resdic_lig,
+        Returns
+        -------
+        interfaces : list[dict]
+            The residues of each chain in contact with each other chain.
+        atom_keys : list[tuple]
+            The distinct lists of atom keys of the models.
+        key_ids : list[int]
+            The index of the atom keys of each model in ``atom_keys``.
+        coords : list[np.ndarray]
+            The coordinates of the atoms of each model.
+        """
+        index_list = get_index_list(len(models), ncores)
+        parse_jobs = [
+            GenericTask(
+                parse_ilrmsd_models,
+                models[index_list[core]:index_list[core + 1]],
+                contact_distance_cutoff=self.params["contact_distance_cutoff"],
                 allatoms=self.params["allatoms"],
+                core=core,
             )
-            # job_lig
-            job_lig = XYZWriterJob(
-                xyzwriter_obj_lig,
-            )
-            xyzwriter_jobs.append(job_lig)
-
-        # run jobs
-        engine = Engine(xyzwriter_jobs)
+            for core in range(ncores)
+        ]
+        engine = Engine(parse_jobs)
         engine.run()
+        if len(engine.results) != ncores or None in engine.results:
+            self.finish_with_error("Could not parse the models.")
+
+        interfaces = []
+        atom_keys = []
+        key_ids = []
+        coords = []
+        known_keys = {}
+        for _, chunk_interfaces, chunk_keys, chunk_ids, chunk_coords in sorted(
+            engine.results,
+            key=lambda result: result[0],
+        ):
+            # the chunks have their own lists of distinct keys
+            new_ids = []
+            for keys in chunk_keys:
+                if keys not in known_keys:
+                    known_keys[keys] = len(atom_keys)
+                    atom_keys.append(keys)
+                new_ids.append(known_keys[keys])
+            interfaces.extend(chunk_interfaces)
+            key_ids.extend(new_ids[key_id] for key_id in chunk_ids)
+            coords.extend(chunk_coords)
+        return interfaces, atom_keys, key_ids, coords
 
-        rearrange_xyz_files(rec_traj_filename, path=Path("."), ncores=ncores)
-        rearrange_xyz_files(lig_traj_filename, path=Path("."), ncores=ncores)
+    @staticmethod
+    def _write_contacts(output_name, res_resdic):
+        """Write the interface residues of each chain."""
+        log.info(f"Overall interface residues: {res_resdic}")
+        with open(output_name, "w") as out_file:
+            for chain, resids in res_resdic.items():
+                out_file.write(f"{chain} ")
+                out_file.write(" ".join([str(el) for el in resids]))
+                out_file.write(os.linesep)
+        log.info(f"{output_name} created.")
+
+    def _calc_ilrmsd_matrix(self, Engine, rec_coords, lig_coords, tot_npairs):
+        """Calculate the condensed ilRMSD matrix in parallel, block by block."""
+        # superpose on the receptors, the ligands follow
+        centers = rec_coords.mean(axis=1, keepdims=True)
+        rec_coords = rec_coords - centers
+        lig_coords = lig_coords - centers
+        ncores = parse_ncores(n=self.params["ncores"], njobs=tot_npairs)
+        npairs, ref_structs, mod_structs, starts = block_dispatcher(
+            len(rec_coords),
+            tot_npairs,
+            ncores,
+            self.params["block_size"],
+        )
+        self.log(
+            f"running {len(npairs)} ilRMSDMatrix Jobs with {ncores} cores"
+        )
+        ilrmsd_jobs = [
+            RMSDMatrixJob(
+                rec_coords,
+                block,
+                npairs[block],
+                ref_structs[block],
+                mod_structs[block],
+                matrix_path=ILRMSD_MATRIX_FNAME,
+                start=starts[block],
+                lig_coords=lig_coords,
+            )
+            for block in range(len(npairs))
+        ]
+        engine = Engine(ilrmsd_jobs)
+        engine.run()
+        if len(engine.results) != len(ilrmsd_jobs):
+            self.finish_with_error("ilRMSD results were not all calculated.")
+
+    def _run_fast_ilrmsdmatrix(self, Engine, rec_coords, lig_coords):
+        """Calculate the ilRMSD matrix with the fast-rmsdmatrix executable."""
+        nmodels, n_atoms_rec, _ = rec_coords.shape
+        n_atoms_lig = lig_coords.shape[1]
+        rec_traj_filename = Path("traj_rec.bin")
+        lig_traj_filename = Path("traj_lig.bin")
+        write_binary_traj(rec_traj_filename, rec_coords)
+        write_binary_traj(lig_traj_filename, lig_coords)
 
         # Parallelisation : optimal dispatching of models
         tot_npairs = nmodels * (nmodels - 1) // 2
         ncores = parse_ncores(n=self.params["ncores"], njobs=tot_npairs)
-        log.info(f"total number of pairs {tot_npairs}")
         npairs, ref_structs, mod_structs = rmsd_dispatcher(nmodels, tot_npairs, ncores)
 
         # Calculate the rmsd for each set of models
@@ -326,7 +369,7 @@ class HaddockModule(BaseHaddockModule):
                 npairs[core],
                 ref_structs[core],
                 mod_structs[core],
-                len(models),
+                nmodels,
                 n_atoms_rec,
                 lig_traj_filename,
                 n_atoms_lig,
@@ -352,20 +395,60 @@ class HaddockModule(BaseHaddockModule):
             # Not all distances were calculated, cannot create the full matrix
             self.finish_with_error("Several files were not generated:" f" {not_found}")
 
-        # Post-processing : single file
-        output_name = "ilrmsd.matrix"
-        self._rearrange_output(output_name, path=Path("."), ncores=ncores)
+        # Post-processing : fill the binary matrix on disk
+        self._rearrange_output(
+            ILRMSD_MATRIX_FNAME,
+            path=Path("."),
+            ncores=ncores,
+            starts=np.cumsum([0] + npairs[:-1]).tolist(),
+        )
         # Delete the trajectory files
-        if rec_traj_filename.exists():
-            os.unlink(rec_traj_filename)
-        if lig_traj_filename.exists():
-            os.unlink(lig_traj_filename)
-
-        # Sending models to the next step of the workflow
-        self.output_models = models
-        self.export_io_models()
-        # Sending matrix path to the next step of the workflow
-        matrix_io = ModuleIO()
-        ilrmsd_matrix_file = RMSDFile(output_name, npairs=tot_npairs)
-        matrix_io.add(ilrmsd_matrix_file)
-        matrix_io.save(filename="rmsd_matrix.json")
+        rec_traj_filename.unlink()
+        lig_traj_filename.unlink()
+
+    def _update_ilrmsd_matrix(
+        self,
+        Engine,
+        rec_coords,
+        lig_coords,
+        previous_matrix,
+        old_idx,
+    ):
+        """Reuse the pairs of a previous matrix and calculate the others."""
+        reused = old_idx >= 0
+        n_reused = int(np.count_nonzero(reused))
+        self.log(
+            f"Reusing the ilRMSDs of {n_reused} models from {previous_matrix}"
+        )
+        copy_reused_pairs(
+            previous_matrix,
+            ILRMSD_MATRIX_FNAME,
+            old_idx,
+            self.params["block_size"],
+        )
+        n_new = len(rec_coords) - n_reused
+        missing = n_reused * n_new + n_new * (n_new - 1) // 2
+        if missing == 0:
+            return
+        # superpose on the receptors, the ligands follow
+        centers = rec_coords.mean(axis=1, keepdims=True)
+        rec_coords = rec_coords - centers
+        lig_coords = lig_coords - centers
+        ncores = parse_ncores(n=self.params["ncores"], njobs=missing)
+        self.log(f"calculating {missing} missing ilRMSDs with {ncores} cores")
+        update_jobs = [
+            RMSDUpdateJob(
+                rec_coords,
+                core,
+                refs,
+                reused,
+                ILRMSD_MATRIX_FNAME,
+                lig_coords=lig_coords,
+                block_size=self.params["block_size"],
+            )
+            for core, refs in enumerate(update_dispatcher(reused, ncores))
+        ]
+        engine = Engine(update_jobs)
+        engine.run()
+        if sum(npairs for _, npairs in engine.results) != missing:
+            self.finish_with_error("ilRMSD results were not all calculated.")
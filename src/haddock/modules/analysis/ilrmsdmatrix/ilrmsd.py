@@ -1,110 +1,231 @@
 """ilRMSD calculations."""
-import os
-from pathlib import Path
-
 import numpy as np
 
 from haddock import log
-from haddock.core.typing import NDFloat, Any
+from haddock.core.typing import AtomsDict, NDFloat
 from haddock.libs.libalign import (
+    DNA_ATOMS,
+    DNA_RES,
+    PROT_ATOMS,
+    PROT_RES,
+    RNA_ATOMS,
+    RNA_RES,
+    find_common_keys,
     get_atoms,
+    load_coords,
     )
+from haddock.libs.libcontacts import get_residue_contacts
 from haddock.libs.libontology import PDBFile
-from haddock.modules.analysis.caprieval.capri import load_contacts
-
-
-class ContactJob:
-    """A Job dedicated to the fast retrieval of receptor contacts."""
-
-    def __init__(
-            self,
-            output,
-            params,
-            contact_obj):
-
-        log.info(f"core {contact_obj.core}, initialising Contact...")
-        self.params = params
-        self.output = output
-        self.contact_obj = contact_obj
-        log.info(f"core {contact_obj.core}, Contact initialised")
-
-    def run(self):
-        """Run this ContactJob."""
-        log.info(f"core {self.contact_obj.core}, running Contact...")
-        self.contact_obj.run()
-        self.contact_obj.output()
-        return
-
-
-class Contact:
-    """Contact class."""
-
-    def __init__(
-            self,
-            model_list: list[PDBFile],
-            output_name: str,
-            core: int,
-            path: Path,
-            contact_distance_cutoff: float = 5.0,
-            **params: dict[str, Any],
-            ):
-        """Initialise Contact class."""
-        self.model_list = model_list
-        self.output_name = output_name
-        self.core = core
-        self.path = path
-        self.contact_distance_cutoff = contact_distance_cutoff
-        self.atoms = {}
-        self.receptor_chain = params["params"]["receptor_chain"]
-        self.ligand_chains = params["params"]["ligand_chains"]
-        self.unique_rec_res: NDFloat = []
-        self.unique_lig_res: NDFloat = []
-        for m in model_list:
-            self.atoms.update(get_atoms(m))
-        
-    def run(self):
-        """Run contact calculations."""
-        nmodels = len(self.model_list)
-        # create empty set of receptor interface residues
-        receptor_interface_residues = []
-        ligand_interface_residues = []
-        for n in range(nmodels):
-            contacts = load_contacts(
-                self.model_list[n],
-                cutoff=self.contact_distance_cutoff,
+
+
+InterfaceDict = dict[str, dict[str, set[int]]]
+
+
+def get_rmsd_atoms(full_atoms: AtomsDict, allatoms: bool) -> AtomsDict:
+    """
+    Restrict the heavy atoms of a model to the atoms used for the RMSDs.
+
+    Gives the same atoms as :py:func:`haddock.libs.libalign.get_atoms`
+    without reading the model again.
+
+    Parameters
+    ----------
+    full_atoms : dict
+        The atoms returned by ``get_atoms(model, full=True)``.
+    allatoms : bool
+        Use all the heavy atoms.
+
+    Returns
+    -------
+    atoms : dict
+        The atoms of each residue used for the RMSDs.
+    """
+    if allatoms:
+        return full_atoms
+    atoms = dict(full_atoms)
+    atoms.update((r, PROT_ATOMS) for r in PROT_RES)
+    atoms.update((r, DNA_ATOMS) for r in DNA_RES)
+    atoms.update((r, RNA_ATOMS) for r in RNA_RES)
+    return atoms
+
+
+def parse_ilrmsd_models(
+        model_list: list[PDBFile],
+        contact_distance_cutoff: float = 5.0,
+        allatoms: bool = False,
+        core: int = 0,
+        ) -> tuple[
+            int,
+            list[InterfaceDict],
+            list[tuple],
+            list[int],
+            list[NDFloat],
+            ]:
+    """
+    Read the interfaces and the coordinates of a list of models at once.
+
+    Each model is parsed a single time: its heavy atoms give the residue
+    contacts between its chains, and the coordinates of the atoms used for
+    the RMSDs are kept for the ilRMSD calculations.
+
+    Parameters
+    ----------
+    model_list : list[PDBFile]
+        The models.
+    contact_distance_cutoff : float
+        Distance cutoff defining a contact, in Angstrom.
+    allatoms : bool
+        Keep all the heavy atoms instead of the backbone atoms.
+    core : int
+        The core, to restore the order of the chunks.
+
+    Returns
+    -------
+    core : int
+        The core.
+    interfaces : list[dict]
+        For each model, the residues of each chain in contact with each other
+        chain, as ``interfaces[chain][partner_chain]``.
+    atom_keys : list[tuple]
+        The distinct lists of (chain, resid, atom_name) keys of the models.
+    key_ids : list[int]
+        For each model, the index of its keys in ``atom_keys``.
+    coords : list[np.ndarray dtype=float32, shape=(n_atoms, 3)]
+        For each model, the coordinates of its atoms.
+    """
+    interfaces: list[InterfaceDict] = []
+    atom_keys: list[tuple] = []
+    key_ids: list[int] = []
+    known_keys: dict[tuple, int] = {}
+    coords: list[NDFloat] = []
+    for model in model_list:
+        full_atoms = get_atoms(model, full=True)
+        coord_dic, _ = load_coords(model, full_atoms, add_resname=True)
+        keys = list(coord_dic)
+        xyz = np.array(list(coord_dic.values()), dtype=np.float64)
+
+        contacts = get_residue_contacts(
+            [key[0] for key in keys],
+            [key[1] for key in keys],
+            xyz,
+            contact_distance_cutoff,
+            )
+        interface: InterfaceDict = {}
+        for chain_a, res_a, chain_b, res_b in contacts:
+            interface.setdefault(chain_a, {}).setdefault(chain_b, set())
+            interface.setdefault(chain_b, {}).setdefault(chain_a, set())
+            interface[chain_a][chain_b].add(res_a)
+            interface[chain_b][chain_a].add(res_b)
+        interfaces.append(interface)
+
+        # same keys as load_coords without the residue names
+        rmsd_atoms = get_rmsd_atoms(full_atoms, allatoms)
+        rows = {
+            key[:3]: row
+            for row, key in enumerate(keys)
+            if key[2] in rmsd_atoms[key[3]]
+            }
+        model_keys = tuple(rows)
+        if model_keys not in known_keys:
+            known_keys[model_keys] = len(atom_keys)
+            atom_keys.append(model_keys)
+        key_ids.append(known_keys[model_keys])
+        coords.append(xyz[list(rows.values())].astype(np.float32))
+    log.info(f"core {core}, {len(model_list)} models parsed")
+    return core, interfaces, atom_keys, key_ids, coords
+
+
+def get_interface_residues(
+        interfaces: list[InterfaceDict],
+        receptor_chain: str,
+        ligand_chains: list[str],
+        ) -> dict[str, NDFloat]:
+    """
+    Gather the interface residues of all the models.
+
+    Parameters
+    ----------
+    interfaces : list[dict]
+        The interfaces of the models, see :py:func:`parse_ilrmsd_models`.
+    receptor_chain : str
+        The receptor chain.
+    ligand_chains : list[str]
+        The ligand chains.
+
+    Returns
+    -------
+    res_resdic : dict[str, np.ndarray]
+        The receptor residues in contact with the ligand chains and the
+        residues of each ligand chain in contact with the receptor, in at
+        least one model.
+    """
+    rec_res: set[int] = set()
+    lig_res: dict[str, set[int]] = {chain: set() for chain in ligand_chains}
+    for interface in interfaces:
+        rec_interface = interface.get(receptor_chain, {})
+        for chain in ligand_chains:
+            rec_res.update(rec_interface.get(chain, ()))
+            lig_res[chain].update(
+                interface.get(chain, {}).get(receptor_chain, ())
                 )
-            rec_resids = [
-                con[1] if con[0] == self.receptor_chain
-                else con[3] for con in contacts
-                ]
-            lig_resids = [
-                con[1] if con[0] in self.ligand_chains
-                else con[3] for con in contacts
-                ]
-            if rec_resids != []:
-                receptor_interface_residues.append(np.unique(rec_resids))
-            if lig_resids != []:
-                ligand_interface_residues.append(np.unique(lig_resids))
-        # concatenate all the receptor residues
-        if receptor_interface_residues != []:
-            rec_np_arr = np.concatenate(receptor_interface_residues)
-            self.unique_rec_res = np.unique(rec_np_arr)
-        # now the ligand residues
-        if ligand_interface_residues != []:
-            lig_np_arr = np.concatenate(ligand_interface_residues)
-            self.unique_lig_res = np.unique(lig_np_arr)
-       
-    def output(self):
-        """Write down unique contacts to file."""
-        output_fname = Path(self.path, self.output_name)
-        with open(output_fname, "w") as out_fh:
-            # first the receptor
-            out_fh.write(f"{self.receptor_chain} ")
-            out_fh.write(" ".join([str(res) for res in self.unique_rec_res]))
-            out_fh.write(f"{os.linesep}")
-            # now the ligand
-            for chain in self.ligand_chains:
-                out_fh.write(f"{chain} ")
-                res_str = " ".join([str(res) for res in self.unique_lig_res])
-                out_fh.write(res_str)
-                out_fh.write(f"{os.linesep}")
+    res_resdic = {receptor_chain: np.array(sorted(rec_res), dtype=int)}
+    res_resdic.update(
+        (chain, np.array(sorted(resids), dtype=int))
+        for chain, resids in lig_res.items()
+        )
+    return res_resdic
+
+
+def get_common_coords(
+        atom_keys: list[tuple],
+        key_ids: list[int],
+        coords: list[NDFloat],
+        filter_resdic: dict[str, NDFloat],
+        atom_similarity: float,
+        ) -> tuple[NDFloat, list[tuple]]:
+    """
+    Gather the coordinates of the selected atoms common to all the models.
+
+    Parameters
+    ----------
+    atom_keys : list[tuple]
+        The distinct lists of atom keys of the models.
+    key_ids : list[int]
+        For each model, the index of its keys in ``atom_keys``.
+    coords : list[np.ndarray]
+        For each model, the coordinates of its atoms.
+    filter_resdic : dict
+        The residues to be selected (one list per chain).
+    atom_similarity : float
+        Minimum atom similarity required between models.
+
+    Returns
+    -------
+    common_coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        The coordinates of the common atoms.
+    common_keys : list[tuple]
+        The common atom keys, in the order of the first model.
+    """
+    filter_sets = {
+        chain: set(np.asarray(resids).tolist())
+        for chain, resids in filter_resdic.items()
+        }
+    selected = [
+        [
+            key for key in keys
+            if key[1] in filter_sets.get(key[0], ())
+            ]
+        for keys in atom_keys
+        ]
+    # the distinct keys are numbered in the order of the models
+    _, common_keys = find_common_keys(selected, atom_similarity)
+    indices = []
+    for keys in atom_keys:
+        positions = {key: pos for pos, key in enumerate(keys)}
+        indices.append(
+            np.array([positions[key] for key in common_keys], dtype=int)
+            )
+    common_coords = np.empty((len(coords), len(common_keys), 3))
+    for model, (key_id, xyz) in enumerate(zip(key_ids, coords)):
+        common_coords[model] = xyz[indices[key_id]]
+    return common_coords, common_keys
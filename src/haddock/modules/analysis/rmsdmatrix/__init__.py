@@ -7,13 +7,34 @@ generated in the previous step.
 As all the pairwise RMSD calculations are independent, the module distributes
 them over all the available cores in an optimal way.
 
-Once created, the RMSD matrix is saved in text form in the current `rmsdmatrix`
-folder. The path to this file is then shared with the following step of the
-workflow by means of the json file `rmsd_matrix.json`.
+Once created, the RMSD matrix is saved as a binary condensed matrix
+(`rmsd.npy`, see :py:mod:`haddock.libs.libmatrix`) in the current `rmsdmatrix`
+folder, and in text form (`rmsd.matrix`) if `text_matrix` is true. The path to
+the binary matrix is then shared with the following step of the workflow by
+means of the json file `rmsd_matrix.json`.
 
-The module accepts two parameters in input, namely:
+By default the coordinates of the models are loaded in memory and the RMSD
+matrix is calculated with a batched implementation of the Kabsch algorithm in
+numpy. Setting `rmsd_engine = "c"` writes the coordinates to a binary
+trajectory file processed by the `fast-rmsdmatrix` executable instead.
+
+The matrix itself is never held in memory: it is allocated on disk and the
+pairs are calculated in blocks of at most `block_size` pairs, each block being
+written to the memory-mapped matrix as soon as it is done.
+
+With `incremental = true`, the matrices of the previous `rmsdmatrix` steps of
+the run (e.g. before a `--extend-run`) are searched for models with identical
+coordinates, identified by the hashes stored in the matrix header. The RMSDs
+between those models are copied and only the pairs involving new models are
+calculated.
+
+The module accepts the following parameters in input, namely:
 
 * `max_models` (default = 10000)
+* `rmsd_engine` (default = "numpy")
+* `text_matrix` (default = False)
+* `block_size` (default = 1000000)
+* `incremental` (default = False)
 * `resdic_` : an expandable parameter to specify which residues must be
   considered for the alignment and the RMSD calculation. If there are
   two proteins denoted by chain IDs A and B, then the user can operate
@@ -30,29 +51,55 @@ import contextlib
 import os
 from pathlib import Path
 
+import numpy as np
+
 from haddock import RMSD_path, log
 from haddock.core.defaults import FAST_RMSDMATRIX_EXEC, MODULE_DEFAULT_YAML
-from haddock.core.typing import Any, AtomsDict, FilePath
-from haddock.libs.libalign import check_common_atoms, rearrange_xyz_files
-from haddock.libs.libontology import ModuleIO, RMSDFile
+from haddock.core.typing import Any, FilePath, NDFloat, Optional
+from haddock.libs.libalign import (
+    check_common_atoms,
+    read_binary_traj,
+    rearrange_xyz_files,
+    )
+from haddock.libs.libcoords import CoordsStore
+from haddock.libs.libmatrix import (
+    copy_reused_pairs,
+    copy_text_matrix,
+    create_condensed_matrix,
+    find_reusable_matrix,
+    hash_coords,
+    hash_signature,
+    load_condensed_matrix,
+    write_matrix_header,
+    write_text_matrix,
+    )
+from haddock.libs.libontology import ModuleIO, PDBFile, RMSDFile
 from haddock.libs.libparallel import get_index_list
 from haddock.libs.libutil import parse_ncores
 from haddock.modules import BaseHaddockModule, get_engine
 from haddock.modules.analysis import (
     confirm_resdic_chainid_length,
     get_analysis_exec_mode,
+    get_previous_matrices,
     )
 from haddock.modules.analysis.rmsdmatrix.rmsd import (
     RMSDJob,
+    RMSDMatrixJob,
+    RMSDUpdateJob,
     XYZWriter,
     XYZWriterJob,
+    block_dispatcher,
+    load_models_coords,
     rmsd_dispatcher,
+    update_dispatcher,
     )
 
 
 RECIPE_PATH = Path(__file__).resolve().parent
 DEFAULT_CONFIG = Path(RECIPE_PATH, MODULE_DEFAULT_YAML)
 EXEC_PATH = FAST_RMSDMATRIX_EXEC
+RMSD_MATRIX_FNAME = "rmsd.npy"
+RMSD_TEXT_MATRIX_FNAME = "rmsd.matrix"
 
 
 class HaddockModule(BaseHaddockModule):
@@ -81,19 +128,20 @@ class HaddockModule(BaseHaddockModule):
         return
 
     def _rearrange_output(
-        self, output_name: FilePath, path: FilePath, ncores: int
+        self,
+        output_name: FilePath,
+        path: FilePath,
+        ncores: int,
+        starts: list[int],
     ) -> None:
-        """Combine different rmsd outputs in a single file."""
+        """Copy the different rmsd outputs in the binary matrix."""
         output_fname = Path(path, output_name)
         self.log(f"rearranging output files into {output_fname}")
-        # Combine files
-        with open(output_fname, "w") as out_file:
-            for core in range(ncores):
-                tmp_file = Path(path, "rmsd_" + str(core) + ".matrix")
-                with open(tmp_file) as infile:
-                    out_file.write(infile.read())
-                log.debug(f"File number {core} written")
-                tmp_file.unlink()
+        for core in range(ncores):
+            tmp_file = Path(path, "rmsd_" + str(core) + ".matrix")
+            copy_text_matrix(tmp_file, output_fname, starts[core], [3])
+            log.debug(f"File number {core} written")
+            tmp_file.unlink()
         log.info("Completed reconstruction of rmsd files.")
         log.info(f"{output_fname} created.")
 
@@ -118,31 +166,229 @@ class HaddockModule(BaseHaddockModule):
         nmodels = len(models)
         if nmodels > self.params["max_models"]:
             # too many input models : RMSD matrix would be too big => Abort!
-            raise Exception("Too many models for RMSD matrix calculation")
+            raise Exception(
+                f"Too many models ({nmodels} > {self.params['max_models']}) "
+                "for RMSD matrix calculation"
+            )
 
         # index_list for the jobs with linear scaling
         ncores = parse_ncores(n=self.params["ncores"], njobs=len(models))
         index_list = get_index_list(nmodels, ncores)
 
-        traj_filename = Path("traj.xyz")
-
         filter_resdic = {
             key[-1]: value
             for key, value in self.params.items()
             if key.startswith("resdic")
         }
 
+        # models coming from a step with a coordinates store share the
+        #  same atoms: no need to parse all of them
+        coords_store = CoordsStore.from_models(models)
+        if coords_store is not None:
+            self.log("Reading coordinates from the coordinates store")
+
         # check common atoms
         n_atoms, common_keys = check_common_atoms(
-            models,
+            models if coords_store is None else models[:1],
             filter_resdic,
             self.params["allatoms"],
             self.params["atom_similarity"],
         )
 
+        exec_mode = get_analysis_exec_mode(self.params["mode"])
+        Engine = get_engine(exec_mode, self.params)
+        tot_npairs = nmodels * (nmodels - 1) // 2
+        log.info(f"total number of pairs {tot_npairs}")
+
+        names = [model.file_name for model in models]
+        # the values depend on the atoms used for the superposition
+        signature = {"module": self.name, "atoms": hash_signature(common_keys)}
+        coords: Optional[NDFloat] = None
+        hashes: Optional[list[str]] = None
+        reuse = None
+        if self.params["rmsd_engine"] == "numpy" or self.params["incremental"]:
+            coords = self._load_coords(
+                Engine,
+                models,
+                index_list,
+                common_keys,
+                filter_resdic,
+                coords_store,
+            )
+            hashes = hash_coords(coords)
+            coords -= coords.mean(axis=1, keepdims=True)
+        if self.params["incremental"]:
+            reuse = find_reusable_matrix(
+                get_previous_matrices(self.name, RMSD_MATRIX_FNAME),
+                hashes,
+                signature,
+            )
+
+        # the matrix is filled on disk block by block
+        create_condensed_matrix(
+            RMSD_MATRIX_FNAME,
+            names,
+            decimals=[3],
+            hashes=hashes,
+            signature=signature,
+        )
+        if reuse is not None:
+            self._update_rmsd_matrix(Engine, coords, *reuse)
+        elif self.params["rmsd_engine"] == "numpy":
+            self._calc_rmsd_matrix(Engine, coords, tot_npairs)
+        else:
+            hashes = self._run_fast_rmsdmatrix(
+                Engine,
+                models,
+                index_list,
+                n_atoms,
+                common_keys,
+                filter_resdic,
+                coords_store,
+            )
+            write_matrix_header(
+                RMSD_MATRIX_FNAME,
+                names,
+                decimals=[3],
+                hashes=hashes,
+                signature=signature,
+            )
+
+        if self.params["text_matrix"]:
+            write_text_matrix(
+                RMSD_TEXT_MATRIX_FNAME,
+                load_condensed_matrix(RMSD_MATRIX_FNAME),
+                nmodels,
+            )
+
+        # Sending models to the next step of the workflow
+        self.output_models = models
+        self.export_io_models()
+        # Sending matrix path to the next step of the workflow
+        matrix_io = ModuleIO()
+        rmsd_matrix_file = RMSDFile(RMSD_MATRIX_FNAME, npairs=tot_npairs)
+        matrix_io.add(rmsd_matrix_file)
+        matrix_io.save(filename="rmsd_matrix.json")
+
+    def _load_coords(
+        self,
+        Engine: Any,
+        models: list[PDBFile],
+        index_list: list[int],
+        common_keys: list[tuple],
+        filter_resdic: dict[str, list[int]],
+        coords_store: Optional[CoordsStore],
+    ) -> NDFloat:
+        """Load the coordinates of the common atoms of the models."""
+        coords = load_models_coords(
+            Engine,
+            models,
+            index_list,
+            common_keys,
+            filter_resdic,
+            allatoms=self.params["allatoms"],
+            coords_store=coords_store,
+        )
+        if coords is None:
+            self.finish_with_error("Could not load the model coordinates.")
+        return coords
+
+    def _calc_rmsd_matrix(
+        self,
+        Engine: Any,
+        coords: NDFloat,
+        tot_npairs: int,
+    ) -> None:
+        """Calculate the condensed RMSD matrix in parallel, block by block."""
+        ncores = parse_ncores(n=self.params["ncores"], njobs=tot_npairs)
+        npairs, ref_structs, mod_structs, starts = block_dispatcher(
+            len(coords),
+            tot_npairs,
+            ncores,
+            self.params["block_size"],
+        )
+        self.log(
+            f"running {len(npairs)} RMSDMatrix Jobs with {ncores} cores"
+        )
+        rmsd_jobs = [
+            RMSDMatrixJob(
+                coords,
+                block,
+                npairs[block],
+                ref_structs[block],
+                mod_structs[block],
+                matrix_path=RMSD_MATRIX_FNAME,
+                start=starts[block],
+            )
+            for block in range(len(npairs))
+        ]
+        engine = Engine(rmsd_jobs)
+        engine.run()
+        if len(engine.results) != len(rmsd_jobs):
+            self.finish_with_error("Rmsd results were not all calculated.")
+
+    def _update_rmsd_matrix(
+        self,
+        Engine: Any,
+        coords: NDFloat,
+        previous_matrix: Path,
+        old_idx: NDFloat,
+    ) -> None:
+        """Reuse the pairs of a previous matrix and calculate the others."""
+        reused = old_idx >= 0
+        n_reused = int(np.count_nonzero(reused))
+        self.log(
+            f"Reusing the RMSDs of {n_reused} models from {previous_matrix}"
+        )
+        copy_reused_pairs(
+            previous_matrix,
+            RMSD_MATRIX_FNAME,
+            old_idx,
+            self.params["block_size"],
+        )
+        n_new = len(coords) - n_reused
+        missing = n_reused * n_new + n_new * (n_new - 1) // 2
+        if missing == 0:
+            return
+        ncores = parse_ncores(n=self.params["ncores"], njobs=missing)
+        self.log(f"calculating {missing} missing RMSDs with {ncores} cores")
+        update_jobs = [
+            RMSDUpdateJob(
+                coords,
+                core,
+                refs,
+                reused,
+                RMSD_MATRIX_FNAME,
+                block_size=self.params["block_size"],
+            )
+            for core, refs in enumerate(update_dispatcher(reused, ncores))
+        ]
+        engine = Engine(update_jobs)
+        engine.run()
+        if sum(npairs for _, npairs in engine.results) != missing:
+            self.finish_with_error("Rmsd results were not all calculated.")
+
+    def _run_fast_rmsdmatrix(
+        self,
+        Engine: Any,
+        models: list[PDBFile],
+        index_list: list[int],
+        n_atoms: int,
+        common_keys: list[tuple],
+        filter_resdic: dict[str, list[int]],
+        coords_store: Optional[CoordsStore],
+    ) -> list[str]:
+        """
+        Calculate the RMSD matrix with the fast-rmsdmatrix executable.
+
+        Returns the hashes of the coordinates of the models.
+        """
+        ncores = len(index_list) - 1
+        nmodels = len(models)
+        traj_filename = Path("traj.bin")
         xyzwriter_jobs: list[XYZWriterJob] = []
         for core in range(ncores):
-            output_name = Path("traj_" + str(core) + ".xyz")
+            output_name = Path("traj_" + str(core) + ".bin")
             # init RMSDJobFast
             xyzwriter_obj = XYZWriter(
                 model_list=models[index_list[core] : index_list[core + 1]],
@@ -152,6 +398,8 @@ class HaddockModule(BaseHaddockModule):
                 common_keys=common_keys,
                 filter_resdic=filter_resdic,
                 allatoms=self.params["allatoms"],
+                coords_store=coords_store,
+                binary=True,
             )
             # job_f = output_name
             job = XYZWriterJob(
@@ -160,16 +408,14 @@ class HaddockModule(BaseHaddockModule):
             xyzwriter_jobs.append(job)
 
         # run jobs
-        exec_mode = get_analysis_exec_mode(self.params["mode"])
-        Engine = get_engine(exec_mode, self.params)
         engine = Engine(xyzwriter_jobs)
         engine.run()
 
         rearrange_xyz_files(traj_filename, path=Path("."), ncores=ncores)
+        hashes = hash_coords(read_binary_traj(traj_filename))
 
         # Parallelisation : optimal dispatching of models
         tot_npairs = nmodels * (nmodels - 1) // 2
-        log.info(f"total number of pairs {tot_npairs}")
         ncores = parse_ncores(n=self.params["ncores"], njobs=tot_npairs)
         npairs, ref_structs, mod_structs = rmsd_dispatcher(nmodels, tot_npairs, ncores)
 
@@ -187,7 +433,7 @@ class HaddockModule(BaseHaddockModule):
                 npairs[core],
                 ref_structs[core],
                 mod_structs[core],
-                len(models),
+                nmodels,
                 n_atoms,
             )
             rmsd_jobs.append(job)
@@ -211,18 +457,14 @@ class HaddockModule(BaseHaddockModule):
             # Not all distances were calculated, cannot create the full matrix
             self.finish_with_error("Several files were not generated:" f" {not_found}")
 
-        # Post-processing : single file
-        final_output_name = "rmsd.matrix"
-        self._rearrange_output(final_output_name, path=Path("."), ncores=ncores)
+        # Post-processing : fill the binary matrix
+        self._rearrange_output(
+            RMSD_MATRIX_FNAME,
+            path=Path("."),
+            ncores=ncores,
+            starts=np.cumsum([0] + npairs[:-1]).tolist(),
+        )
         # Delete the trajectory file
         if traj_filename.exists():
             os.unlink(traj_filename)
-
-        # Sending models to the next step of the workflow
-        self.output_models = models
-        self.export_io_models()
-        # Sending matrix path to the next step of the workflow
-        matrix_io = ModuleIO()
-        rmsd_matrix_file = RMSDFile(final_output_name, npairs=tot_npairs)
-        matrix_io.add(rmsd_matrix_file)
-        matrix_io.save(filename="rmsd_matrix.json")
+        return hashes
@@ -1,11 +1,27 @@
 """RMSD calculations."""
+import math
 import os
 import numpy as np
 from pathlib import Path
 
 from haddock import log
-from haddock.core.typing import AtomsDict
-from haddock.libs.libalign import get_atoms, load_coords
+from haddock.core.typing import Any, AtomsDict, FilePath, NDFloat, Optional
+from haddock.libs.libalign import (
+    get_atoms,
+    kabsch_ilrmsd_batch,
+    kabsch_rmsd_batch,
+    load_coords,
+    write_binary_traj,
+    )
+from haddock.libs.libcoords import CoordsStore
+from haddock.libs.libensemble import Ensemble
+from haddock.libs.libmatrix import (
+    condensed_index,
+    write_matrix_block,
+    write_matrix_values,
+    )
+from haddock.libs.libontology import PDBFile
+from haddock.libs.libparallel import GenericTask
 from haddock.libs.libsubprocess import BaseJob
 
 
@@ -64,6 +80,340 @@ def rmsd_dispatcher(nmodels: int, tot_npairs: int,
     return npairs, start_structures, end_structures
 
 
+def block_dispatcher(
+        nmodels: int,
+        tot_npairs: int,
+        ncores: int,
+        block_size: int,
+        ) -> tuple[list[int], list[int], list[int], list[int]]:
+    """
+    Tile the pairs of the condensed matrix in contiguous blocks.
+
+    There are at least as many blocks as cores, and no block holds more than
+    ``block_size`` pairs, so that the memory used by each job is bounded
+    whatever the number of models.
+
+    Returns
+    -------
+    npairs : list[int]
+        Number of pairs of each block.
+    start_structures : list[int]
+        Index of the reference model of the first pair of each block.
+    end_structures : list[int]
+        Index of the mobile model of the first pair of each block.
+    starts : list[int]
+        Condensed index of the first pair of each block.
+    """
+    nblocks = max(ncores, math.ceil(tot_npairs / block_size))
+    nblocks = max(min(nblocks, tot_npairs), 1)
+    npairs, start_structures, end_structures = rmsd_dispatcher(
+        nmodels,
+        tot_npairs,
+        nblocks,
+        )
+    starts = np.concatenate(([0], np.cumsum(npairs[:-1]))).astype(int)
+    return npairs, start_structures, end_structures, starts.tolist()
+
+
+def update_dispatcher(reused: NDFloat, ncores: int) -> list[NDFloat]:
+    """
+    Split the pairs missing from a reused matrix between the cores.
+
+    A pair is missing if at least one of its models is new. Each core gets
+    a contiguous range of reference models with about the same number of
+    missing pairs, ``N_old * N_new + N_new * (N_new - 1) / 2`` in total.
+
+    Parameters
+    ----------
+    reused : np.ndarray dtype=bool
+        Whether each model is in the reused matrix.
+    ncores : int
+        Number of cores.
+
+    Returns
+    -------
+    refs : list[np.ndarray]
+        The indices of the reference models of each core.
+    """
+    reused = np.asarray(reused, dtype=bool)
+    nmodels = len(reused)
+    # number of new models after each model
+    new_after = np.cumsum((~reused)[::-1])[::-1] - ~reused
+    counts = np.where(reused, new_after, nmodels - 1 - np.arange(nmodels))
+    cumulated = np.cumsum(counts)
+    # each core ends with the reference reaching its share of the pairs
+    bounds = np.searchsorted(
+        cumulated,
+        cumulated[-1] * np.arange(1, ncores) / ncores,
+        ) + 1
+    return [
+        refs for refs in np.split(np.arange(nmodels), bounds)
+        if counts[refs].sum() > 0
+        ]
+
+
+def calc_condensed_rmsd(
+        coords: NDFloat,
+        npairs: int,
+        start_ref: int,
+        start_mod: int,
+        lig_coords: Optional[NDFloat] = None,
+        ) -> NDFloat:
+    """
+    Calculate a slice of the condensed RMSD matrix.
+
+    Pairs are taken in the order of the condensed matrix, one row of the
+    matrix at a time, so that each reference is superposed to a contiguous
+    block of models in a single batched call. If ligand coordinates are
+    given, the ligand RMSDs after superposition on the receptors are
+    calculated instead.
+
+    Parameters
+    ----------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+        Coordinates of the models, centered on the origin.
+    npairs : int
+        Number of pairs to calculate.
+    start_ref : int
+        Index of the reference model of the first pair.
+    start_mod : int
+        Index of the mobile model of the first pair.
+    lig_coords : np.ndarray dtype=float, shape=(n_models, n_lig_atoms, 3)
+        Coordinates of the ligands, in the frame of the centered receptors.
+
+    Returns
+    -------
+    rmsd : np.ndarray dtype=float, shape=(npairs,)
+    """
+    nmodels = len(coords)
+    rmsd = np.empty(npairs, dtype=np.float64)
+    ref, mod = start_ref, start_mod
+    done = 0
+    while done < npairs:
+        nrow = min(npairs - done, nmodels - mod)
+        if lig_coords is None:
+            rmsd[done:done + nrow] = kabsch_rmsd_batch(
+                coords[ref],
+                coords[mod:mod + nrow],
+                )
+        else:
+            rmsd[done:done + nrow] = kabsch_ilrmsd_batch(
+                coords[ref],
+                coords[mod:mod + nrow],
+                lig_coords[ref],
+                lig_coords[mod:mod + nrow],
+                )
+        done += nrow
+        ref += 1
+        mod = ref + 1
+    return rmsd
+
+
+def load_rmsd_coords(
+        model_list,
+        common_keys,
+        filter_resdic,
+        allatoms=False,
+        core=0,
+        ) -> tuple[int, NDFloat]:
+    """
+    Load the coordinates of the common atoms of a list of models.
+
+    Returns
+    -------
+    core : int
+        The core, to restore the order of the chunks.
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3)
+    """
+    ensemble = Ensemble.from_pdbfiles(
+        model_list,
+        allatoms=allatoms,
+        filter_resdic=filter_resdic,
+        keys=common_keys,
+        )
+    return core, ensemble.coords
+
+
+def load_models_coords(
+        Engine: Any,
+        models: list[PDBFile],
+        index_list: list[int],
+        common_keys: list[tuple],
+        filter_resdic: dict[str, list[int]],
+        allatoms: bool = False,
+        coords_store: Optional[CoordsStore] = None,
+        ) -> Optional[NDFloat]:
+    """
+    Load the coordinates of the common atoms of the models.
+
+    The coordinates are taken from the coordinates store if given, otherwise
+    the models are parsed in parallel with :py:func:`load_rmsd_coords`.
+
+    Parameters
+    ----------
+    Engine : type
+        The engine running the parsing jobs.
+    models : list[:py:class:`haddock.libs.libontology.PDBFile`]
+        The models.
+    index_list : list[int]
+        The indices of the first model of each job, and the number of models.
+    common_keys : list[tuple]
+        The (chain, resnum, atom) identifiers of the common atoms.
+    filter_resdic : dict
+        The residues to be selected (one list per chain).
+    allatoms : bool
+        Use all the heavy atoms.
+    coords_store : :py:class:`haddock.libs.libcoords.CoordsStore`, optional
+        The coordinates store holding the models.
+
+    Returns
+    -------
+    coords : np.ndarray dtype=float, shape=(n_models, n_atoms, 3) or None
+        The coordinates, None if some of the jobs failed.
+    """
+    if coords_store is not None:
+        coords = coords_store.get_coords(models, common_keys)
+        # PDB coordinates have 3 decimals, restore them from float32
+        return np.round(coords.astype(np.float64), 3)
+
+    ncores = len(index_list) - 1
+    load_jobs = [
+        GenericTask(
+            load_rmsd_coords,
+            models[index_list[core]:index_list[core + 1]],
+            common_keys,
+            filter_resdic,
+            allatoms=allatoms,
+            core=core,
+            )
+        for core in range(ncores)
+        ]
+    engine = Engine(load_jobs)
+    engine.run()
+    if len(engine.results) != ncores or None in engine.results:
+        return None
+    return np.concatenate([
+        chunk for _, chunk in sorted(
+            engine.results,
+            key=lambda result: result[0],
+            )
+        ])
+
+
+class RMSDMatrixJob:
+    """
+    A Job calculating a slice of the RMSD matrix in memory.
+
+    If a ``matrix_path`` is given, the slice is written in the binary
+    condensed matrix at the ``start`` index instead of being returned. If
+    ligand coordinates are given, the ligand RMSDs after superposition on the
+    receptors are calculated instead.
+    """
+
+    def __init__(
+            self,
+            coords: NDFloat,
+            core: int,
+            npairs: int,
+            start_ref: int,
+            start_mod: int,
+            matrix_path: Optional[FilePath] = None,
+            start: int = 0,
+            lig_coords: Optional[NDFloat] = None,
+            ) -> None:
+        """Initialise RMSDMatrixJob."""
+        self.coords = coords
+        self.core = core
+        self.npairs = npairs
+        self.start_ref = start_ref
+        self.start_mod = start_mod
+        self.matrix_path = matrix_path
+        self.start = start
+        self.lig_coords = lig_coords
+
+    def run(self) -> tuple[int, Optional[NDFloat]]:
+        """Run this RMSDMatrixJob."""
+        log.info(f"core {self.core}, calculating {self.npairs} RMSDs...")
+        rmsd = calc_condensed_rmsd(
+            self.coords,
+            self.npairs,
+            self.start_ref,
+            self.start_mod,
+            lig_coords=self.lig_coords,
+            )
+        if self.matrix_path is None:
+            return self.core, rmsd
+        write_matrix_block(self.matrix_path, self.start, rmsd, decimals=[3])
+        return self.core, None
+
+
+class RMSDUpdateJob:
+    """
+    A Job calculating the pairs missing from a reused matrix.
+
+    The RMSDs between the reference models and the following new models
+    (all the following models for new references) are written in the
+    binary condensed matrix. If ligand coordinates are given, the ligand
+    RMSDs after superposition on the receptors are calculated instead.
+    """
+
+    def __init__(
+            self,
+            coords: NDFloat,
+            core: int,
+            refs: NDFloat,
+            reused: NDFloat,
+            matrix_path: FilePath,
+            lig_coords: Optional[NDFloat] = None,
+            block_size: int = 1000000,
+            ) -> None:
+        """Initialise RMSDUpdateJob."""
+        self.coords = coords
+        self.core = core
+        self.refs = refs
+        self.reused = reused
+        self.matrix_path = matrix_path
+        self.lig_coords = lig_coords
+        self.block_size = block_size
+
+    def run(self) -> tuple[int, int]:
+        """Run this RMSDUpdateJob."""
+        nmodels = len(self.coords)
+        npairs = nbuffered = 0
+        indices: list[NDFloat] = []
+        values: list[NDFloat] = []
+        for row, ref in enumerate(self.refs, start=1):
+            mods = np.arange(ref + 1, nmodels)
+            if self.reused[ref]:
+                mods = mods[~self.reused[mods]]
+            if len(mods) > 0:
+                indices.append(condensed_index(ref, mods, nmodels))
+                values.append(self._calc(ref, mods))
+                nbuffered += len(mods)
+            last_row = row == len(self.refs)
+            if nbuffered and (nbuffered >= self.block_size or last_row):
+                write_matrix_values(
+                    self.matrix_path,
+                    np.concatenate(indices),
+                    np.concatenate(values),
+                    decimals=[3],
+                    )
+                npairs += nbuffered
+                indices, values, nbuffered = [], [], 0
+        log.info(f"core {self.core}, {npairs} missing RMSDs calculated")
+        return self.core, npairs
+
+    def _calc(self, ref: int, mods: NDFloat) -> NDFloat:
+        if self.lig_coords is None:
+            return kabsch_rmsd_batch(self.coords[ref], self.coords[mods])
+        return kabsch_ilrmsd_batch(
+            self.coords[ref],
+            self.coords[mods],
+            self.lig_coords[ref],
+            self.lig_coords[mods],
+            )
+
+
 class XYZWriterJob:
     """A Job dedicated to the parallel writing of xyz files."""
 
@@ -93,6 +443,8 @@ class XYZWriter:
             common_keys,
             filter_resdic,
             allatoms=False,
+            coords_store=None,
+            binary=False,
             ):
         """Initialise Contact class."""
         self.model_list = model_list
@@ -102,9 +454,17 @@ class XYZWriter:
         self.common_keys = common_keys
         self.filter_resdic = filter_resdic
         self.allatoms = allatoms
-        
+        self.coords_store = coords_store
+        self.binary = binary
+
     def run(self) -> None:
         """write xyz coordinates."""
+        if self.binary:
+            self._run_binary()
+            return
+        if self.coords_store is not None:
+            self._run_from_store()
+            return
         with open(self.output_name, "w") as traj_xyz:
             for mod in self.model_list:
                 atoms: AtomsDict = get_atoms(mod, self.allatoms)
@@ -120,5 +480,44 @@ class XYZWriter:
                 for k in self.common_keys:
                     v = common_coord_dic[k]
                     at_string = ''.join([str(el) for el in k])
+                    traj_xyz.write(
+                        f"{at_string} {v[0]} {v[1]} {v[2]}{os.linesep}"
+                        )
+        return
+
+    def _run_binary(self) -> None:
+        """Write the coordinates to a binary trajectory file."""
+        if self.coords_store is not None:
+            coords = self.coords_store.get_coords(
+                self.model_list,
+                self.common_keys,
+                )
+        else:
+            coords = np.empty(
+                (len(self.model_list), self.n_atoms, 3),
+                dtype=np.float32,
+                )
+            for i, mod in enumerate(self.model_list):
+                atoms: AtomsDict = get_atoms(mod, self.allatoms)
+                ref_coord_dic, _ = load_coords(
+                    mod, atoms, self.filter_resdic
+                    )
+                coords[i] = [ref_coord_dic[k] for k in self.common_keys]
+        write_binary_traj(self.output_name, coords)
+        return
+
+    def _run_from_store(self) -> None:
+        """Write xyz coordinates read from the step coordinates store."""
+        coords = self.coords_store.get_coords(
+            self.model_list,
+            self.common_keys,
+            )
+        # PDB coordinates have 3 decimals, restore them from float32
+        coords = np.round(coords.astype(np.float64), 3)
+        at_strings = [''.join([str(el) for el in k]) for k in self.common_keys]
+        with open(self.output_name, "w") as traj_xyz:
+            for mod_coords in coords:
+                traj_xyz.write(f"{self.n_atoms}{os.linesep}{os.linesep}")
+                for at_string, v in zip(at_strings, mod_coords.tolist()):
                     traj_xyz.write(f"{at_string} {v[0]} {v[1]} {v[2]}{os.linesep}")
         return
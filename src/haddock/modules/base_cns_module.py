@@ -8,9 +8,12 @@ from haddock import toppar_path as global_toppar
 from haddock.core.defaults import cns_exec as global_cns_exec
 from haddock.core.typing import Any, FilePath, Optional, Union
 from haddock.gear.expandable_parameters import populate_mol_parameters_in_module
-from haddock.libs.libio import working_directory
+from haddock.gear.haddockmodel import score_models
+from haddock.libs.libcache import clear_cache
+from haddock.libs.libio import remove_unpacked, working_directory
 from haddock.libs.libutil import sort_numbered_paths
-from haddock.modules import BaseHaddockModule
+from haddock.modules import BaseHaddockModule, get_engine
+from haddock.modules.analysis import get_analysis_exec_mode
 
 
 class BaseCNSModule(BaseHaddockModule):
@@ -58,7 +61,12 @@ class BaseCNSModule(BaseHaddockModule):
             self.make_self_contained()
 
         with working_directory(self.path):
-            self._run()
+            try:
+                self._run()
+            finally:
+                clear_cache()
+                # the inputs decompressed for CNS are no longer needed
+                remove_unpacked()
 
         log.info(f'Module [{self.name}] finished.')
 
@@ -113,6 +121,26 @@ class BaseCNSModule(BaseHaddockModule):
             shutil.copystat(_cns_exec, new_cns)
             self.params["cns_exec"] = Path("..", Path(_cns_exec).name)
 
+    def score_output_models(self, weights: dict[str, float]) -> None:
+        """
+        Score the output models written by the CNS jobs.
+
+        The energies are read by python jobs, run locally in batch mode.
+
+        Parameters
+        ----------
+        weights : dict[str, float]
+            The weights of the HADDOCK score, e.g. ``{"w_vdw": 1.0}``.
+        """
+        exec_mode = get_analysis_exec_mode(self.params["mode"])
+        Engine = get_engine(exec_mode, self.params)
+        score_models(
+            self.output_models,
+            weights,
+            Engine,
+            ncores=self.params["ncores"],
+            )
+
     def get_ambig_fnames(
             self, prev_ambig_fnames: list[Union[None, FilePath]]
             ) -> Union[list[FilePath], None]:
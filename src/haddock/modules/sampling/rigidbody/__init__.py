@@ -34,7 +34,6 @@ from pathlib import Path
 
 from haddock.core.defaults import MODULE_DEFAULT_YAML
 from haddock.core.typing import FilePath, Sequence, Union
-from haddock.gear.haddockmodel import HaddockModel
 from haddock.libs.libcns import prepare_cns_input
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libparallel import GenericTask, Scheduler
@@ -236,13 +235,6 @@ class HaddockModule(BaseCNSModule):
         _weight_keys = ("w_vdw", "w_elec", "w_desolv", "w_air", "w_bsa")
         weights = {e: self.params[e] for e in _weight_keys}
 
-        for model in self.output_models:
-            if model.is_present():
-                # Score the model
-                haddock_model = HaddockModel(model.file_name)
-                model.unw_energies = haddock_model.energies
-
-                haddock_score = haddock_model.calc_haddock_score(**weights)
-                model.score = haddock_score
+        self.score_output_models(weights)
 
         self.export_io_models(faulty_tolerance=self.params["tolerance"])
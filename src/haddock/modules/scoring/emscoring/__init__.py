@@ -8,7 +8,6 @@ from pathlib import Path
 
 from haddock.core.defaults import MODULE_DEFAULT_YAML
 from haddock.core.typing import FilePath
-from haddock.gear.haddockmodel import HaddockModel
 from haddock.libs.libcns import prepare_cns_input, prepare_expected_pdb
 from haddock.libs.libontology import PDBFile
 from haddock.libs.libsubprocess import CNSJob
@@ -88,13 +87,7 @@ class HaddockModule(CNSScoringModule):
         weights = {e: self.params[e] for e in _weight_keys}
 
         # Check for generated output, fail it not all expected files are found
-        for pdb in self.output_models:
-            if pdb.is_present():
-                haddock_model = HaddockModel(pdb.file_name)
-                pdb.unw_energies = haddock_model.energies
-
-                haddock_score = haddock_model.calc_haddock_score(**weights)
-                pdb.score = haddock_score
+        self.score_output_models(weights)
 
         output_fname = "emscoring.tsv"
         self.log(f"Saving output to {output_fname}")
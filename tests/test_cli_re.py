@@ -179,3 +179,14 @@ def test_cli_reclustrmsd():
         clustrmsd_html_matrix = Path(interactive_folder, "rmsd_matrix.html")
         assert clustrmsd_html_matrix.exists()
         assert clustrmsd_html_matrix.stat().st_size != 0
+
+        # scan several clustering distances
+        subprocess.run([
+            "haddock3-re", "clustrmsd", nested_tmpdir,
+            "-s", "1", "100",
+            ])
+        scan_tsv = Path(interactive_folder, "clustrmsd_scan.tsv")
+        assert scan_tsv.exists()
+        lines = scan_tsv.read_text().splitlines()
+        assert len(lines) == 3
+        assert lines[2].startswith("100.000\t1\t1\t0\t")
@@ -1,11 +1,16 @@
 """Test HaddockModel gear."""
 
+import gzip
+import shutil
+import tempfile
 from pathlib import Path
 
 import pytest
 
-from haddock.gear.haddockmodel import HaddockModel
+from haddock.gear.haddockmodel import HaddockModel, score_models
+from haddock.libs.libio import working_directory
 from haddock.libs.libontology import PDBFile
+from haddock.modules import get_engine
 
 from . import golden_data
 
@@ -84,3 +89,78 @@ def test_haddockmodel_score(protprot_input_list):
     weights["w_bsa"] = -0.01
 
     assert haddock_mod.calc_haddock_score(**weights) == -13.38146
+
+
+def test_haddockmodel_gzipped(protprot_input_list):
+    """Test energies are read from gzipped models."""
+    src = protprot_input_list[0].rel_path
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdb_f = Path(tmpdir, "model.pdb")
+        with open(src, "rb") as fin, \
+                gzip.open(f"{pdb_f}.gz", "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+        gz_mod = HaddockModel(pdb_f)
+    assert gz_mod.energies == HaddockModel(src).energies
+
+
+def test_haddockmodel_stops_at_coordinates():
+    """Test REMARK lines after the coordinates are not parsed."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdb_f = Path(tmpdir, "model.pdb")
+        pdb_f.write_text(
+            "REMARK Desolvation energy: 3.25569\n"
+            "ATOM      1  N   MET A   1      15.935   1.055 -11.263\n"
+            "REMARK Symmetry energy: 1.0\n"
+            )
+        assert HaddockModel(pdb_f).energies == {"desolv": 3.25569}
+
+
+@pytest.mark.parametrize("ncores", [1, 2])
+def test_score_models(ncores):
+    """Test the scoring of a list of models."""
+    weights = {
+        "w_vdw": 1.0,
+        "w_elec": 1.0,
+        "w_desolv": 1.0,
+        "w_air": 0.1,
+        "w_bsa": -0.01,
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        models = []
+        for name in ("protprot_complex_1.pdb", "protprot_complex_2.pdb"):
+            shutil.copy(Path(golden_data, name), Path(tmpdir, name))
+            models.append(PDBFile(name, path=tmpdir))
+        models.append(PDBFile("missing.pdb", path=tmpdir))
+
+        with working_directory(tmpdir):
+            Engine = get_engine("local", {"ncores": ncores, "max_cpus": False})
+            score_models(models, weights, Engine, ncores=ncores)
+
+    assert models[1].score == -13.38146
+    assert models[0].unw_energies["vdw"] == 1.85709
+    # missing models are not scored
+    assert models[2].unw_energies is None
+
+
+def test_haddockmodel_truncated_energies(tmp_path):
+    """Test a truncated energies remark is rejected."""
+    pdb_f = Path(tmp_path, "model.pdb")
+    pdb_f.write_text(
+        "REMARK energies: 474.936, 0.0, 0.0, 0.0, 0.0, 1.85709, -9.41558\n"
+        "ATOM      1  N   MET A   1      15.935   1.055 -11.263  1.00  0.00\n"
+        )
+    with pytest.raises(ValueError):
+        HaddockModel(pdb_f)
+
+
+def test_score_models_truncated_energies(tmp_path):
+    """Test the scoring fails when some energies cannot be read."""
+    pdb_f = Path(tmp_path, "model.pdb")
+    pdb_f.write_text(
+        "REMARK energies: 474.936, 0.0, 0.0, 0.0, 0.0, 1.85709, -9.41558\n"
+        "ATOM      1  N   MET A   1      15.935   1.055 -11.263  1.00  0.00\n"
+        )
+    models = [PDBFile(pdb_f.name, path=tmp_path)]
+    Engine = get_engine("local", {"ncores": 1, "max_cpus": False})
+    with working_directory(tmp_path), pytest.raises(RuntimeError):
+        score_models(models, {"w_vdw": 1.0}, Engine)
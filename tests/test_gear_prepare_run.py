@@ -9,6 +9,7 @@ import pytest
 from haddock.core.exceptions import ConfigurationError
 from haddock.core.typing import Union
 from haddock.gear.prepare_run import (
+    _read_defaults,
     check_if_path_exists,
     copy_molecules_to_topology,
     fuzzy_match,
@@ -17,6 +18,7 @@ from haddock.gear.prepare_run import (
     populate_topology_molecule_params,
     update_step_contents_to_step_names,
     validate_module_names_are_not_misspelled,
+    validate_modules_params,
     validate_ncs_params,
     validate_param_range,
     validate_param_type,
@@ -72,6 +74,27 @@ def test_get_expandable_parameters_topoaa(inp, expected):
     assert result == expected
 
 
+@pytest.mark.parametrize("module_name", ["rmsdmatrix", "clustleader"])
+def test_validate_modules_params_resdic(module_name):
+    """Test the resdic parameters are accepted by the modules using them."""
+    defaults = _read_defaults(module_name)
+    user_config = {"resdic_A": [1, 2]}
+    expandable = get_expandable_parameters(
+        user_config,
+        defaults,
+        module_name,
+        20,
+        )
+    assert expandable == {"resdic_A"}
+    validate_modules_params({f"{module_name}.1": user_config}, 20)
+
+
+def test_validate_modules_params_clustfcc_executable():
+    """Test the deprecated clustfcc executable is still accepted."""
+    user_config = {"executable": "src/contact_fcc"}
+    validate_modules_params({"clustfcc.1": user_config}, 20)
+
+
 def test_populate_topoaa_molecules():
     """Test mols are polated."""
     topoaa = {
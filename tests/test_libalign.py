@@ -1,6 +1,8 @@
 """Test the libalign library."""
 
+import gzip
 import os
+import shutil
 import tempfile
 from pathlib import Path
 
@@ -15,13 +17,19 @@ from haddock.libs.libalign import (
     check_chains,
     check_common_atoms,
     dump_as_izone,
+    find_common_keys,
     get_align,
     get_atoms,
+    get_sequence_signature,
     kabsch,
+    kabsch_ilrmsd_batch,
+    kabsch_rmsd_batch,
     load_coords,
     make_range,
     pdb2fastadic,
+    read_binary_traj,
     rearrange_xyz_files,
+    write_binary_traj,
     )
 
 from . import golden_data
@@ -103,6 +111,55 @@ def test_calc_rmsd():
     assert round(rmsd, 2) == 12.02
 
 
+def test_kabsch_rmsd_batch():
+    """Test the batched RMSD against the Kabsch superposition."""
+    rng = np.random.default_rng(42)
+    P = rng.normal(scale=10.0, size=(20, 3))
+    Q = rng.normal(scale=10.0, size=(5, 20, 3))
+    # add a mirror image of P, needing the reflection correction
+    Q[0] = P * [1, 1, -1]
+    P -= P.mean(axis=0)
+    Q -= Q.mean(axis=1, keepdims=True)
+
+    observed = kabsch_rmsd_batch(P, Q)
+
+    expected = [calc_rmsd(np.dot(P, kabsch(P, q)), q) for q in Q]
+    assert observed.shape == (5,)
+    np.testing.assert_allclose(observed, expected, atol=1e-8)
+    # identical structures
+    np.testing.assert_allclose(
+        kabsch_rmsd_batch(P, P[np.newaxis]),
+        [0.0],
+        atol=1e-5,
+        )
+
+
+def test_kabsch_ilrmsd_batch():
+    """Test the batched ligand RMSD after superposition on the receptor."""
+    rng = np.random.default_rng(7)
+    P = rng.normal(scale=10.0, size=(15, 3))
+    Q = rng.normal(scale=10.0, size=(4, 15, 3))
+    P_lig = rng.normal(scale=10.0, size=(6, 3))
+    Q_lig = rng.normal(scale=10.0, size=(4, 6, 3))
+    Q[0] = P * [1, 1, -1]
+
+    observed = kabsch_ilrmsd_batch(P, Q, P_lig, Q_lig)
+
+    expected = [
+        calc_rmsd(np.dot(q_lig, kabsch(q, P)), P_lig)
+        for q, q_lig in zip(Q, Q_lig)
+        ]
+    np.testing.assert_allclose(observed, expected, atol=1e-8)
+    # a rigid rotation of the whole complex
+    rotation = kabsch(Q[1], P)
+    np.testing.assert_allclose(
+        kabsch_ilrmsd_batch(P, (P @ rotation)[np.newaxis], P_lig,
+                            (P_lig @ rotation)[np.newaxis]),
+        [0.0],
+        atol=1e-6,
+        )
+
+
 def test_centroid():
     """Test the centroid calculation."""
     X = [
@@ -417,6 +474,30 @@ def test_align_seq():
         assert observed_aln == expected_aln
 
 
+def test_align_seq_no_output(tmp_path):
+    """Test the sequence alignment without the alignment files."""
+    os.chdir(tmp_path)
+    ref = Path(golden_data, "protein.pdb")
+    mod = Path(golden_data, "protein_renumb.pdb")
+
+    observed_numb_dic, observed_chm_dict = align_seq(ref, mod, None)
+    assert observed_numb_dic == {"B": {101: 1, 102: 2, 110: 3, 112: 5}}
+    assert observed_chm_dict == {"B": "B"}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_get_sequence_signature():
+    """Test the signature of the sequences of a structure."""
+    ref = Path(golden_data, "protein.pdb")
+    mod = Path(golden_data, "protein_renumb.pdb")
+
+    signature = get_sequence_signature(ref)
+    assert signature == get_sequence_signature(ref)
+    assert signature[0][0] == "B"
+    assert signature != get_sequence_signature(mod)
+    hash(signature)
+
+
 def test_align_seq_chm():
     """Test the sequence alignment with chain matching."""
     ref = Path(golden_data, "protein.pdb")
@@ -510,6 +591,20 @@ def test_check_common_atoms():
         n_atoms, obs_common_keys = check_common_atoms(models, None, False, 90.0)
 
 
+def test_find_common_keys():
+    """Test the common keys keep the order of the first model."""
+    keys = [
+        [("A", 2, "CA"), ("A", 1, "CA"), ("A", 3, "CA")],
+        [("A", 1, "CA"), ("A", 2, "CA"), ("A", 3, "CA"), ("A", 4, "CA")],
+        ]
+    n_atoms, common_keys = find_common_keys(keys, 70.0)
+    assert n_atoms == 3
+    assert common_keys == [("A", 2, "CA"), ("A", 1, "CA"), ("A", 3, "CA")]
+
+    with pytest.raises(ALIGNError):
+        find_common_keys(keys, 80.0)
+
+
 def test_rearrange_xyz_files():
     """Test the rearrange_xyz_files function."""
     with tempfile.TemporaryDirectory() as tmpdirname:
@@ -533,6 +628,23 @@ def test_rearrange_xyz_files():
         assert obs_content == exp_content
 
 
+def test_binary_traj(tmp_path):
+    """Test writing, reading and merging binary trajectories."""
+    coords = np.arange(2 * 4 * 3, dtype=float).reshape(2, 4, 3) / 1000
+    write_binary_traj(Path(tmp_path, "file_0.bin"), coords[:1])
+    write_binary_traj(Path(tmp_path, "file_1.bin"), coords[1:])
+
+    rearrange_xyz_files("file.bin", path=tmp_path, ncores=2)
+
+    assert not Path(tmp_path, "file_0.bin").exists()
+    observed = read_binary_traj(Path(tmp_path, "file.bin"))
+    assert observed.dtype == np.float32
+    np.testing.assert_allclose(observed, coords, rtol=1e-6)
+
+    with pytest.raises(ALIGNError):
+        read_binary_traj(Path(golden_data, "protprot_complex_1.pdb"))
+
+
 def test_check_chains():
     """Test correct checking of chains."""
     obs_ch = [
@@ -569,3 +681,17 @@ def test_check_chains():
         assert obs_r_chain == exp_r_chain
         assert obs_l_chain == exp_l_chain
 
+
+
+def test_load_coords_gzipped():
+    """Test coordinates are loaded from gzipped models."""
+    src = Path(golden_data, "protprot_complex_1.pdb")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdb_f = Path(tmpdir, src.name)
+        with open(src, "rb") as fin, gzip.open(f"{pdb_f}.gz", "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+        atoms = get_atoms(pdb_f)
+        observed = load_coords(pdb_f, atoms)
+    expected = load_coords(src, get_atoms(src))
+    assert observed[1] == expected[1]
+    assert observed[0].keys() == expected[0].keys()
@@ -0,0 +1,135 @@
+"""Test the libcache library."""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from haddock.libs.libcache import (
+    STRUCTURE_CACHE,
+    StructureCache,
+    clear_cache,
+    get_coord_records,
+    prewarm_cache,
+    )
+from haddock.libs.libontology import PDBFile
+from haddock.modules.analysis.seletopclusts import DEFAULT_CONFIG
+from haddock.modules.analysis.seletopclusts import \
+    HaddockModule as SeleTopClustModule
+
+from . import golden_data
+
+
+@pytest.fixture(name="pdb_copy")
+def fixture_pdb_copy():
+    """Copy a golden data PDB to a temporary file."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dst = Path(tmpdir, "protprot_complex_1.pdb")
+        shutil.copy(Path(golden_data, "protprot_complex_1.pdb"), dst)
+        yield dst
+
+
+@pytest.fixture(name="empty_cache", autouse=True)
+def fixture_empty_cache():
+    """Make sure every test starts and ends with an empty cache."""
+    max_bytes = STRUCTURE_CACHE.max_bytes
+    clear_cache()
+    yield
+    clear_cache(max_bytes)
+
+
+def test_get_coord_records(pdb_copy):
+    """Test the coordinate records are read and cached."""
+    records = get_coord_records(pdb_copy)
+    expected = [
+        line
+        for line in open(pdb_copy)
+        if line.startswith(("ATOM", "HETATM"))
+        ]
+    assert list(records) == expected
+    assert STRUCTURE_CACHE.misses == 1
+    assert pdb_copy in STRUCTURE_CACHE
+
+    # second read comes from the cache
+    assert get_coord_records(PDBFile(pdb_copy)) is records
+    assert STRUCTURE_CACHE.hits == 1
+
+
+def test_cache_invalidated_on_change(pdb_copy):
+    """Test a modified file is read again."""
+    records = get_coord_records(pdb_copy)
+    with open(pdb_copy, "a") as fh:
+        fh.write(records[0])
+    # make sure the mtime changes even on coarse filesystems
+    stat = os.stat(pdb_copy)
+    os.utime(pdb_copy, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    new_records = get_coord_records(pdb_copy)
+    assert len(new_records) == len(records) + 1
+    assert STRUCTURE_CACHE.misses == 2
+
+
+def test_lru_eviction():
+    """Test the least recently used entries are evicted."""
+    records = ("ATOM  line\n",) * 10
+    size = StructureCache.sizeof(records)
+    cache = StructureCache(max_bytes=2 * size)
+    cache.put(("a", 0, 0), records)
+    cache.put(("b", 0, 0), records)
+    # touch "a" so that "b" becomes the oldest entry
+    cache._entries.move_to_end(("a", 0, 0))
+    cache.put(("c", 0, 0), records)
+    assert list(cache._entries) == [("a", 0, 0), ("c", 0, 0)]
+    assert cache.nbytes == 2 * size
+
+
+def test_entry_over_budget_not_stored(pdb_copy):
+    """Test files larger than the budget are read but not cached."""
+    clear_cache(max_bytes=10)
+    records = get_coord_records(pdb_copy)
+    assert records
+    assert len(STRUCTURE_CACHE) == 0
+    assert STRUCTURE_CACHE.nbytes == 0
+
+
+def test_prewarm_cache(pdb_copy):
+    """Test the cache pre-warming."""
+    prewarm_cache([pdb_copy, Path("does_not_exist.pdb")])
+    assert len(STRUCTURE_CACHE) == 1
+    assert pdb_copy in STRUCTURE_CACHE
+
+
+def test_worker_does_not_store(pdb_copy):
+    """Test a forked process reads the cache without filling it."""
+    prewarm_cache([Path(golden_data, "protprot_complex_2.pdb")])
+    owner_pid = STRUCTURE_CACHE.owner_pid
+    # pretend to be a worker process
+    STRUCTURE_CACHE.owner_pid = -1
+    try:
+        get_coord_records(Path(golden_data, "protprot_complex_2.pdb"))
+        records = get_coord_records(pdb_copy)
+    finally:
+        STRUCTURE_CACHE.owner_pid = owner_pid
+    assert records
+    assert STRUCTURE_CACHE.hits == 1
+    assert len(STRUCTURE_CACHE) == 1
+    assert pdb_copy not in STRUCTURE_CACHE
+
+
+def test_cache_cleared_after_step(pdb_copy, mocker, tmp_path):
+    """Test the cache is emptied once a step has run."""
+    module = SeleTopClustModule(
+        order=1,
+        path=tmp_path,
+        initial_params=DEFAULT_CONFIG,
+        )
+
+    def read_structure():
+        get_coord_records(pdb_copy)
+        assert pdb_copy in STRUCTURE_CACHE
+
+    mocker.patch.object(module, "_run", side_effect=read_structure)
+    module.run()
+    assert len(STRUCTURE_CACHE) == 0
@@ -5,11 +5,16 @@ import pytest
 import random
 import tempfile
 
+import numpy as np
+
 from haddock.libs.libclust import (
     MAX_NB_ENTRY_HTML_MATRIX,
+    _read_binary_submatrix,
+    _read_text_submatrix,
     plot_cluster_matrix,
     write_structure_list,
     )
+from haddock.libs.libmatrix import write_condensed_matrix, write_text_matrix
 from haddock.libs.libontology import PDBFile
 
 from . import golden_data
@@ -119,3 +124,18 @@ def test_plot_cluster_matrix(small_distance_matrix_data):
         assert Path(figure_path).suffix == '.html'
         Path(figure_path).unlink(missing_ok=False)
         Path(matrix_path).unlink(missing_ok=False)
+
+
+def test_read_binary_submatrix(tmp_path):
+    """Test the submatrix read from a binary matrix matches the text one."""
+    values = np.random.default_rng(0).uniform(0, 1, size=(45, 2))
+    binary_path = Path(tmp_path, "fcc.npy")
+    text_path = Path(tmp_path, "fcc.matrix")
+    write_condensed_matrix(binary_path, values, list("abcdefghij"), [2, 3])
+    write_text_matrix(text_path, values, 10, fmt=("{:.2f}", "{:.3f}"))
+    order = [4, 0, 9, 2, 7]
+
+    observed = _read_binary_submatrix(binary_path, order, 1)
+    expected = _read_text_submatrix(text_path, order, 1)
+
+    assert observed.tolist() == expected.tolist()
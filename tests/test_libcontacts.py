@@ -0,0 +1,62 @@
+"""Test the contacts library."""
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from haddock.libs.libcontacts import find_atom_contacts, get_residue_contacts
+
+
+def test_find_atom_contacts():
+    """Test the KD-tree search matches all the pairwise distances."""
+    rng = np.random.default_rng(0)
+    xyz_a = np.round(rng.uniform(0, 20, size=(300, 3)), 3)
+    xyz_b = np.round(rng.uniform(0, 20, size=(200, 3)), 3)
+    # a pair exactly on the cutoff is not a contact
+    xyz_b[0] = xyz_a[0] + [3.0, 4.0, 0.0]
+
+    idx_a, idx_b = find_atom_contacts(xyz_a, xyz_b, 5.0)
+
+    expected = np.argwhere(cdist(xyz_a, xyz_b) < 5.0)
+    assert idx_a.tolist() == expected[:, 0].tolist()
+    assert idx_b.tolist() == expected[:, 1].tolist()
+    assert (0, 0) not in set(zip(idx_a.tolist(), idx_b.tolist()))
+
+
+def test_find_atom_contacts_empty():
+    """Test sets without atoms have no contacts."""
+    idx_a, idx_b = find_atom_contacts(np.empty((0, 3)), np.ones((4, 3)), 5.0)
+    assert len(idx_a) == len(idx_b) == 0
+
+
+def test_find_atom_contacts_float32():
+    """Test the single precision check of the squared distances."""
+    xyz_a = np.zeros((1, 3))
+    # 4.9999999 is below 5.0 in double precision only
+    xyz_b = np.array([[4.9999999, 0.0, 0.0], [4.9, 0.0, 0.0]])
+
+    idx_a, idx_b = find_atom_contacts(xyz_a, xyz_b, 5.0)
+    assert idx_b.tolist() == [0, 1]
+
+    idx_a, idx_b = find_atom_contacts(xyz_a, xyz_b, 5.0, dtype=np.float32)
+    assert idx_b.tolist() == [1]
+
+
+def test_get_residue_contacts():
+    """Test the residue contacts between each pair of chains."""
+    chains = ["B", "B", "A", "A", "C"]
+    resids = [1, 2, 10, 11, 5]
+    coords = np.array([
+        [0.0, 0.0, 0.0],
+        [20.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0],
+        [2.0, 0.0, 0.0],
+        [21.0, 0.0, 0.0],
+        ])
+
+    observed = get_residue_contacts(chains, resids, coords, cutoff=5.0)
+
+    assert observed == {
+        ("A", 10, "B", 1),
+        ("A", 11, "B", 1),
+        ("B", 2, "C", 5),
+        }
@@ -0,0 +1,118 @@
+"""Test the libcoords library."""
+
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from haddock.gear.clean_steps import (
+    clean_output,
+    unpack_compressed_and_archived_files,
+    )
+from haddock.libs.libalign import get_atoms, load_coords
+from haddock.libs.libcoords import (
+    COORDS_ATOMS_FNAME,
+    COORDS_FNAME,
+    CoordsStore,
+    read_model_coords,
+    write_coords_store,
+    )
+from haddock.libs.libontology import PDBFile
+
+from . import golden_data
+
+
+@pytest.fixture(name="step_models")
+def fixture_step_models():
+    """Copy two models sharing the same atoms in a step folder."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        models = []
+        for i in (1, 2):
+            dst = Path(tmpdir, f"protdna_complex_{i}.pdb")
+            shutil.copy(Path(golden_data, f"protdna_complex_{i}.pdb"), dst)
+            models.append(PDBFile(dst, path=tmpdir))
+        yield models, tmpdir
+
+
+def test_read_model_coords():
+    """Test atoms and coordinates reading."""
+    atoms, coords = read_model_coords(
+        Path(golden_data, "protdna_complex_1.pdb")
+        )
+    assert len(atoms) == coords.shape[0]
+    assert coords.shape[1] == 3
+    assert atoms[0] == ("A", -1, "MET", "N")
+    assert np.allclose(coords[0], [15.935, 1.055, -11.263])
+
+
+def test_write_coords_store(step_models):
+    """Test the coordinates store writing and memory-mapping."""
+    models, path = step_models
+    assert write_coords_store(models, path)
+    assert Path(path, COORDS_FNAME).exists()
+    with open(Path(path, COORDS_ATOMS_FNAME)) as fh:
+        table = json.load(fh)
+    assert table["models"] == [m.file_name for m in models]
+
+    store = CoordsStore.load(path)
+    assert isinstance(store.coords, np.memmap)
+    assert store.coords.dtype == np.float32
+    assert store.coords.shape == (2, len(table["atoms"]), 3)
+
+    # the coordinates match the ones of load_coords
+    keys = [("A", 10, "N"), ("B", 38, "C6")]
+    observed = store.get_coords(models[::-1], keys)
+    for i, model in enumerate(models[::-1]):
+        coord_dic, _ = load_coords(model, get_atoms(model, full=True))
+        expected = [coord_dic[k] for k in keys]
+        assert np.allclose(observed[i], expected, atol=1e-3)
+
+
+def test_write_coords_store_heterogeneous(protprot_1bkd_input_list):
+    """Test the store is not written for heterogeneous models."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert not write_coords_store(protprot_1bkd_input_list, tmpdir)
+        assert not Path(tmpdir, COORDS_FNAME).exists()
+
+
+def test_load_missing_store():
+    """Test loading a store from a folder without one."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert CoordsStore.load(tmpdir) is None
+
+
+def test_from_models(step_models, tmp_path):
+    """Test the store is found from the models and checked against them."""
+    models, path = step_models
+    assert write_coords_store(models, path)
+    # the store is found whatever the working directory
+    os.chdir(tmp_path)
+    store = CoordsStore.from_models(models)
+    assert store is not None
+    assert store.is_up_to_date(models)
+
+    # a model modified after the store was written
+    stat = os.stat(models[1].full_name)
+    os.utime(
+        models[1].full_name,
+        ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000),
+        )
+    assert CoordsStore.from_models(models) is None
+    assert CoordsStore.from_models(models[:1]) is not None
+
+
+def test_from_models_cleaned(step_models):
+    """Test the store is still used once the step is cleaned and unpacked."""
+    models, path = step_models
+    assert write_coords_store(models, path)
+    clean_output(path)
+    assert not Path(models[0].full_name).exists()
+    assert CoordsStore.from_models(models) is not None
+
+    unpack_compressed_and_archived_files([path])
+    assert Path(models[0].full_name).exists()
+    assert CoordsStore.from_models(models) is not None
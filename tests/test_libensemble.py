@@ -0,0 +1,100 @@
+"""Test the libensemble library."""
+
+import tempfile
+from multiprocessing import Process, Queue
+
+import numpy as np
+import pytest
+
+from haddock.libs.libalign import get_atoms, load_coords
+from haddock.libs.libcoords import CoordsStore, write_coords_store
+from haddock.libs.libensemble import Ensemble
+
+
+def _remote_sum(descriptor, queue):
+    """Sum the coordinates of a shared ensemble in another process."""
+    ensemble = Ensemble.from_shared_memory(descriptor)
+    queue.put(float(ensemble.coords.sum()))
+    ensemble.release_shared_memory()
+
+
+@pytest.fixture(name="ensemble")
+def fixture_ensemble(protdna_input_list):
+    """Ensemble of the protein-DNA models."""
+    protdna_input_list[0].score = -10.0
+    protdna_input_list[1].clt_id = 1
+    return Ensemble.from_pdbfiles(protdna_input_list)
+
+
+def test_from_pdbfiles(ensemble, protdna_input_list):
+    """Test building an ensemble from PDB files."""
+    assert len(ensemble) == 2
+    assert ensemble.coords.shape == (2, ensemble.n_atoms, 3)
+    assert ensemble.coords.flags["C_CONTIGUOUS"]
+    assert ensemble.chains == ["A", "B"]
+    assert ensemble.scores[0] == -10.0
+    assert ensemble.clt_ids == [None, 1]
+
+    model = protdna_input_list[1]
+    coord_dic, _ = load_coords(model, get_atoms(model))
+    assert ensemble.atom_keys() == list(coord_dic.keys())
+    assert np.allclose(ensemble.coords[1], list(coord_dic.values()))
+
+
+def test_from_pdbfiles_keys(protdna_input_list):
+    """Test building an ensemble with a given set of atoms."""
+    keys = [("B", 38, "C6"), ("A", 10, "CA")]
+    ensemble = Ensemble.from_pdbfiles(protdna_input_list, keys=keys)
+    assert ensemble.atom_keys() == keys
+    assert ensemble.atoms[1] == ("A", 10, "ARG", "CA")
+    assert np.allclose(ensemble.coords[0, 1], [11.392, -5.83, -0.759])
+
+
+def test_select(ensemble):
+    """Test atom selections."""
+    idx = ensemble.select(chain="A", resnums=[10], names=["CA"])
+    assert [ensemble.atoms[i] for i in idx] == [("A", 10, "ARG", "CA")]
+    chain_b = ensemble.select(chain="B")
+    assert all(ensemble.atoms[i][0] == "B" for i in chain_b)
+    resdic_idx = ensemble.select_resdic({"A": [10], "B": [38]})
+    assert {ensemble.atoms[i][:2] for i in resdic_idx} == {
+        ("A", 10),
+        ("B", 38),
+        }
+
+
+def test_subset(ensemble):
+    """Test ensemble subsets."""
+    idx = ensemble.select(chain="B")
+    sub = ensemble.subset(atom_idx=idx, model_idx=[1])
+    assert sub.names == ensemble.names[1:]
+    assert sub.clt_ids == [1]
+    assert np.array_equal(sub.coords[0], ensemble.coords[1][idx])
+
+
+def test_from_coords_store(ensemble, protdna_input_list):
+    """Test building an ensemble from a coordinates store."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_coords_store(protdna_input_list, tmpdir)
+        store = CoordsStore.load(tmpdir)
+        store_ensemble = Ensemble.from_coords_store(store, protdna_input_list)
+        assert store_ensemble.scores[0] == -10.0
+        # the store keeps all the atoms, select the backbone ones
+        keys = store_ensemble.atom_keys()
+        idx = [keys.index(key) for key in ensemble.atom_keys()]
+        sub = store_ensemble.subset(atom_idx=idx)
+        assert np.allclose(sub.coords, ensemble.coords, atol=1e-3)
+
+
+def test_shared_memory(ensemble):
+    """Test sharing an ensemble with another process."""
+    expected = float(ensemble.coords.sum())
+    descriptor = ensemble.to_shared_memory()
+    queue = Queue()
+    proc = Process(target=_remote_sum, args=(descriptor, queue))
+    proc.start()
+    observed = queue.get()
+    proc.join()
+    ensemble.release_shared_memory(unlink=True)
+    assert observed == pytest.approx(expected)
+    assert float(ensemble.coords.sum()) == pytest.approx(expected)
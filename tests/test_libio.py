@@ -1,7 +1,10 @@
 """Test libio."""
+import gzip
+import shutil
 import tempfile
 from pathlib import Path
 
+import pandas as pd
 import pytest
 
 from haddock.libs.libio import (
@@ -9,12 +12,29 @@ from haddock.libs.libio import (
     dot_suffix,
     file_exists,
     folder_exists,
+    get_pdb_path,
+    open_pdb,
+    pdb_path_exists,
     read_from_yaml,
+    remove_unpacked,
+    unpack_if_gzipped,
+    write_dataframe_to_file,
     write_dic_to_file,
     write_nested_dic_to_file,
     )
 
-from . import emptycfg, haddock3_yaml_cfg_examples
+from . import emptycfg, golden_data, haddock3_yaml_cfg_examples
+
+
+@pytest.fixture(name="gz_pdb")
+def fixture_gz_pdb():
+    """Gzipped copy of a golden data PDB, without the plain file."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = Path(golden_data, "protprot_complex_1.pdb")
+        with open(src, "rb") as fin, \
+                gzip.open(Path(tmpdir, f"{src.name}.gz"), "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+        yield Path(tmpdir, src.name), src
 
 
 @pytest.mark.parametrize(
@@ -43,6 +63,26 @@ def test_write_nested_dic_to_file():
     Path(f.name).unlink()
 
 
+def test_write_dataframe_to_file():
+    """Test a data frame is written as the nested dictionaries."""
+    table = pd.DataFrame({
+        "model": [Path("m1.pdb"), Path("m2.pdb")],
+        "n": [2, 10],
+        "id": pd.Series([None, 4], dtype=object),
+        "score": [-1.23456, float("nan")],
+        })
+    data_dict = {
+        1: {"model": Path("m1.pdb"), "n": 2, "id": None, "score": -1.23456},
+        2: {"model": Path("m2.pdb"), "n": 10, "id": 4, "score": float("nan")},
+        }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        expected = Path(tmpdir, "expected.tsv")
+        observed = Path(tmpdir, "observed.tsv")
+        write_nested_dic_to_file(data_dict, expected, info_header="# info")
+        write_dataframe_to_file(table, observed, info_header="# info")
+        assert observed.read_text() == expected.read_text()
+
+
 def test_write_dic_to_file():
     """Test write dictionary to file."""
     f = tempfile.NamedTemporaryFile(delete=False)
@@ -133,3 +173,44 @@ def test_folder_exists_wrong(i):
 def test_folder_exists_wrong_othererror():
     with pytest.raises(TypeError):
         folder_exists("some_bad_path", exception=TypeError)
+
+
+def test_open_pdb_gzipped(gz_pdb):
+    """Test gzipped PDB files are read transparently."""
+    pdb_path, src = gz_pdb
+    assert not pdb_path.exists()
+    assert get_pdb_path(pdb_path) == Path(f"{pdb_path}.gz")
+    assert pdb_path_exists(pdb_path) == (True, None)
+    with open_pdb(pdb_path) as fh:
+        assert fh.read() == src.read_text()
+
+
+def test_open_pdb_plain():
+    """Test plain PDB files are preferred."""
+    src = Path(golden_data, "protprot_complex_1.pdb")
+    assert get_pdb_path(src) == src
+    with open_pdb(src) as fh:
+        assert fh.read() == src.read_text()
+
+
+def test_pdb_path_exists_missing():
+    """Test missing PDB files."""
+    exists, msg = pdb_path_exists(Path("does_not_exist.pdb"))
+    assert not exists
+    assert msg == "PDB file does_not_exist.pdb not found."
+
+
+def test_unpack_if_gzipped(gz_pdb):
+    """Test decompression of gzipped files for plain file consumers."""
+    pdb_path, src = gz_pdb
+    dest = Path(pdb_path.parent, "unpacked")
+    plain_path = unpack_if_gzipped(pdb_path, dest)
+    assert plain_path == Path(dest, pdb_path.parent.name, pdb_path.name)
+    assert plain_path.read_text() == src.read_text()
+    # the folder of the compressed file is left untouched
+    assert Path(f"{pdb_path}.gz").exists()
+    assert not pdb_path.exists()
+    # plain files are used as they are
+    assert unpack_if_gzipped(src, dest) == src
+    remove_unpacked(dest)
+    assert not dest.exists()
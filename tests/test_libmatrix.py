@@ -0,0 +1,222 @@
+"""Test the binary condensed matrices."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from scipy.spatial.distance import squareform
+
+from haddock.libs.libmatrix import (
+    condensed_index,
+    copy_reused_pairs,
+    copy_text_matrix,
+    create_condensed_matrix,
+    find_reusable_matrix,
+    get_header_path,
+    hash_coords,
+    hash_signature,
+    load_condensed_matrix,
+    read_condensed_matrix,
+    read_matrix_header,
+    read_matrix_values,
+    read_text_matrix,
+    round_decimals,
+    stored_values,
+    write_condensed_matrix,
+    write_matrix_block,
+    write_matrix_values,
+    write_text_matrix,
+    )
+from haddock.libs.libontology import RMSDFile
+
+
+def test_round_decimals():
+    """Test values are rounded as the text formatting does."""
+    rng = np.random.default_rng(0)
+    values = np.round(rng.uniform(0, 30, size=5000), 4)
+    rounded = round_decimals(values, 3)
+    expected = [float(f"{value:.3f}") for value in values.tolist()]
+    assert rounded.tolist() == expected
+
+
+def test_write_read_condensed_matrix(tmp_path):
+    """Test the binary matrix round trip."""
+    matrix = Path(tmp_path, "rmsd.npy")
+    values = np.array([1.0, 2.2574, 3.1])
+    write_condensed_matrix(matrix, values, ["a", "b", "c"], decimals=[3])
+
+    assert get_header_path(matrix) == Path(tmp_path, "rmsd.header.json")
+    header = read_matrix_header(matrix)
+    assert header == {
+        "n_models": 3,
+        "npairs": 3,
+        "models": ["a", "b", "c"],
+        "decimals": [3],
+        "hashes": None,
+        "signature": None,
+        }
+    assert load_condensed_matrix(matrix).dtype == np.float32
+    assert read_condensed_matrix(matrix).tolist() == [1.0, 2.257, 3.1]
+
+
+def test_write_read_condensed_matrix_columns(tmp_path):
+    """Test a matrix with one column per value."""
+    matrix = Path(tmp_path, "fcc.npy")
+    values = np.array([[0.05, 0.0625], [1.0, 0.333333], [0.5, 0.5]])
+    write_condensed_matrix(matrix, values, ["a", "b", "c"], decimals=[2, 3])
+    observed = read_condensed_matrix(matrix)
+    assert observed.tolist() == [[0.05, 0.062], [1.0, 0.333], [0.5, 0.5]]
+
+
+def test_stored_values(tmp_path):
+    """Test the values match the ones read back from a matrix."""
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, size=(105, 2))
+    matrix = Path(tmp_path, "fcc.npy")
+    names = [f"model_{i}" for i in range(15)]
+    write_condensed_matrix(matrix, values, names, decimals=[2, 3])
+    assert (
+        stored_values(values, [2, 3]).tolist()
+        == read_condensed_matrix(matrix).tolist()
+        )
+
+
+def test_write_condensed_matrix_error(tmp_path):
+    """Test the number of values must match the number of pairs."""
+    with pytest.raises(ValueError):
+        write_condensed_matrix(
+            Path(tmp_path, "rmsd.npy"),
+            np.array([1.0, 2.0]),
+            ["a", "b", "c"],
+            )
+
+
+def test_text_matrix(tmp_path):
+    """Test the text matrix format."""
+    output = Path(tmp_path, "rmsd.matrix")
+    write_text_matrix(output, np.array([1.0, 2.2574, 3.1]), 3)
+    expected = ["1 2 1.000", "1 3 2.257", "2 3 3.100"]
+    assert output.read_text() == os.linesep.join(expected) + os.linesep
+    assert read_text_matrix(output).tolist() == [1.0, 2.257, 3.1]
+
+
+def test_rmsdfile_load(tmp_path):
+    """Test RMSDFile loads a binary matrix."""
+    matrix = Path(tmp_path, "rmsd.npy")
+    write_condensed_matrix(matrix, np.array([2.257]), ["a", "b"], [3])
+    rmsd_file = RMSDFile(matrix.name, npairs=1, path=tmp_path)
+    np.testing.assert_allclose(rmsd_file.load(), [2.257], atol=1e-6)
+
+
+def test_condensed_index():
+    """Test the condensed indices match scipy's squareform."""
+    n_models = 7
+    square = squareform(np.arange(21, dtype=float))
+    i, j = np.triu_indices(n_models, k=1)
+    assert condensed_index(i, j, n_models).tolist() == square[i, j].tolist()
+
+
+def test_write_matrix_blocks(tmp_path):
+    """Test a matrix filled block by block, in any order."""
+    matrix = Path(tmp_path, "rmsd.npy")
+    values = np.arange(10) + 0.12345
+    create_condensed_matrix(matrix, [str(i) for i in range(5)], [3])
+    write_matrix_block(matrix, 6, values[6:], decimals=[3])
+    write_matrix_block(matrix, 0, values[:6], decimals=[3])
+
+    expected = [float(f"{value:.3f}") for value in values]
+    assert read_condensed_matrix(matrix).tolist() == expected
+    assert read_matrix_values(matrix, [9, 2]).tolist() == [9.123, 2.123]
+
+    with pytest.raises(ValueError):
+        write_matrix_block(matrix, 8, values[:3])
+
+
+def test_create_condensed_matrix_columns(tmp_path):
+    """Test an empty matrix with one column per value."""
+    matrix = Path(tmp_path, "fcc.npy")
+    create_condensed_matrix(matrix, ["a", "b", "c"], [2, 3], n_values=2)
+    assert load_condensed_matrix(matrix).shape == (3, 2)
+
+    create_condensed_matrix(matrix, ["a"], [3])
+    assert read_condensed_matrix(matrix).shape == (0,)
+
+
+def test_copy_text_matrix(tmp_path):
+    """Test copying a text matrix into a block of a binary matrix."""
+    text = Path(tmp_path, "rmsd_1.matrix")
+    text.write_text("2 3 4.500\n2 4 1.250\n")
+    matrix = Path(tmp_path, "rmsd.npy")
+    create_condensed_matrix(matrix, ["a", "b", "c", "d"], [3])
+
+    assert copy_text_matrix(text, matrix, start=3, decimals=[3]) == 2
+    assert read_condensed_matrix(matrix).tolist() == [0, 0, 0, 4.5, 1.25, 0]
+
+
+def test_hash_coords():
+    """Test the hashes only depend on the float32 coordinates."""
+    coords = np.arange(24, dtype=float).reshape(2, 4, 3)
+    hashes = hash_coords(coords)
+    assert len(hashes) == 2 and hashes[0] != hashes[1]
+    assert hash_coords(coords.astype(np.float32)) == hashes
+    assert hash_coords(coords[::-1]) == hashes[::-1]
+    assert hash_signature(["a", 1]) == hash_signature(("a", 1))
+
+
+def test_find_reusable_matrix(tmp_path):
+    """Test the matrix sharing the most models is found."""
+    signature = {"module": "rmsdmatrix"}
+    small = Path(tmp_path, "small.npy")
+    large = Path(tmp_path, "large.npy")
+    other = Path(tmp_path, "other.npy")
+    create_condensed_matrix(small, ["a", "b"], [3], hashes=["ha", "hb"],
+                            signature=signature)
+    create_condensed_matrix(large, ["c", "b", "a"], [3],
+                            hashes=["hc", "hb", "ha"], signature=signature)
+    create_condensed_matrix(other, ["c", "b", "a", "d"], [3],
+                            hashes=["hc", "hb", "ha", "hd"],
+                            signature={"module": "ilrmsdmatrix"})
+
+    candidates = [small, large, other, Path(tmp_path, "missing.npy")]
+    path, old_idx = find_reusable_matrix(
+        candidates,
+        ["ha", "hd", "hc"],
+        signature,
+        )
+    assert path == large
+    assert old_idx.tolist() == [2, -1, 0]
+    assert find_reusable_matrix(candidates, ["hx"], signature) is None
+
+    with pytest.raises(ValueError):
+        create_condensed_matrix(small, ["a", "b"], [3], hashes=["ha"])
+
+
+def test_copy_reused_pairs(tmp_path):
+    """Test the pairs of reused models are copied in the new order."""
+    old = Path(tmp_path, "old.npy")
+    old_values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    write_condensed_matrix(old, old_values, ["a", "b", "c", "d"], [3])
+    new = Path(tmp_path, "new.npy")
+    create_condensed_matrix(new, ["d", "x", "b", "b2"], [3])
+    old_square = squareform(old_values)
+
+    old_idx = np.array([3, -1, 1, 1])
+    assert copy_reused_pairs(old, new, old_idx, block_size=2) == 3
+
+    observed = squareform(read_condensed_matrix(new))
+    assert observed[0, 2] == old_square[3, 1]
+    assert observed[0, 3] == old_square[3, 1]
+    # the same model twice
+    assert observed[2, 3] == 0
+    assert observed[0, 1] == observed[1, 2] == observed[1, 3] == 0
+
+
+def test_write_matrix_values(tmp_path):
+    """Test values scattered in the matrix."""
+    matrix = Path(tmp_path, "rmsd.npy")
+    create_condensed_matrix(matrix, ["a", "b", "c"], [3])
+    write_matrix_values(matrix, np.array([2, 0]), np.array([1.23456, 7.0]),
+                        decimals=[3])
+    assert read_condensed_matrix(matrix).tolist() == [7.0, 0.0, 1.235]
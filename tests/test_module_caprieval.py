@@ -1,6 +1,7 @@
 """Test the CAPRI module."""
 
 import os
+import pickle
 import random
 import shutil
 import tempfile
@@ -11,14 +12,21 @@ import numpy as np
 import pytest
 
 from haddock.libs.libontology import PDBFile
+from haddock.modules.analysis.caprieval import DEFAULT_CONFIG, HaddockModule
 from haddock.modules.analysis.caprieval.capri import (
     CAPRI,
-    calc_stats,
+    CAPRI_METRICS,
+    CAPRIBatch,
+    CAPRIReference,
+    CAPRIResult,
     capri_cluster_analysis,
     extract_data_from_capri_class,
+    get_best_results,
+    get_dockq,
     get_previous_cns_step,
     load_contacts,
-    rank_according_to_score,
+    parse_capri_models,
+    sample_has_same_atoms,
 )
 
 from . import golden_data
@@ -539,6 +547,220 @@ def test_load_contacts(protprot_input_list):
     assert observed_con_set == expected_con_set
 
 
+def test_capri_reference(protprot_input_list, params):
+    """Test the reference data is calculated once and shared by the models."""
+    reference, model = protprot_input_list
+    capri_reference = CAPRIReference(reference)
+    capri_reference.prepare(
+        {
+            **params,
+            "fnat": True,
+            "fnat_cutoff": 5.0,
+            "irmsd": True,
+            "ilrmsd": True,
+            "irmsd_cutoff": 10.0,
+        }
+    )
+
+    assert capri_reference.get_contacts(5.0) == load_contacts(reference, 5.0)
+    assert capri_reference.get_contacts(5.0) is capri_reference.get_contacts(5.0)
+    expected_interface = CAPRI.identify_interface(reference, 10.0)
+    observed_interface = capri_reference.get_interface(10.0)
+    assert {ch: sorted(res) for ch, res in observed_interface.items()} == {
+        ch: sorted(res) for ch, res in expected_interface.items()
+    }
+    assert capri_reference.get_chain_ranges() == {"A": (0, 609), "B": (610, 949)}
+
+    capris = [
+        CAPRI(
+            identificator=i,
+            reference=ref,
+            model=model,
+            path=reference.path,
+            params=params,
+        )
+        for i, ref in enumerate((capri_reference, reference))
+    ]
+    for capri in capris:
+        capri.calc_fnat()
+        capri.calc_irmsd(cutoff=10.0)
+        capri.calc_lrmsd()
+        capri.calc_ilrmsd()
+        capri.calc_global_rmsd()
+        remove_aln_files(capri)
+    for metric in ("fnat", "irmsd", "lrmsd", "ilrmsd", "rmsd"):
+        assert np.isclose(getattr(capris[0], metric), getattr(capris[1], metric))
+    assert capris[0].capri_reference is capri_reference
+    assert capris[0].reference is reference
+
+
+def test_capri_reference_align(mocker, protprot_input_list):
+    """Test the sequence alignments are shared by the identical models."""
+    alignment = ({"A": {1: 1}, "B": {1: 1}}, {"A": "A", "B": "B"})
+    align_func = mocker.Mock(return_value=alignment)
+    mocker.patch(
+        "haddock.modules.analysis.caprieval.capri.get_align",
+        return_value=align_func,
+    )
+    reference, model = protprot_input_list
+    capri_reference = CAPRIReference(reference)
+    params = {"alignment_method": "sequence", "lovoalign_exec": None}
+
+    assert capri_reference.align(model, params) == alignment
+    assert capri_reference.align(Path(model.rel_path), params) == alignment
+    assert align_func.call_count == 1
+
+    params["alignment_method"] = "structure"
+    capri_reference.align(model, params)
+    capri_reference.align(model, params)
+    assert align_func.call_count == 3
+
+
+@pytest.mark.parametrize("allatoms", [False, True])
+def test_capri_batch(protprot_input_list, allatoms, tmp_path):
+    """Test the batch evaluation gives the metrics of each model."""
+    os.chdir(tmp_path)
+    reference, model = protprot_input_list
+    params = {
+        "fnat": True,
+        "irmsd": True,
+        "lrmsd": True,
+        "ilrmsd": True,
+        "dockq": True,
+        "global_rmsd": True,
+        "allatoms": allatoms,
+        "receptor_chain": "A",
+        "ligand_chains": ["B"],
+        "alignment_method": "sequence",
+        "lovoalign_exec": None,
+        "fnat_cutoff": 5.0,
+        "irmsd_cutoff": 10.0,
+    }
+    capri_references = [CAPRIReference(reference), CAPRIReference(model)]
+    models = [model, reference, model]
+
+    _, keys, rmsd_coords, fnat_coords = parse_capri_models(
+        models,
+        capri_references,
+        params,
+    )
+    assert keys is not None
+    assert len(keys) == len(rmsd_coords) == len(fnat_coords) == 2
+
+    for ref_idx, capri_reference in enumerate(capri_references):
+        rmsd_keys, fnat_keys = keys[ref_idx]
+        assert rmsd_coords[ref_idx].shape == (3, len(rmsd_keys), 3)
+        assert fnat_coords[ref_idx].shape == (3, len(fnat_keys), 3)
+        batch = CAPRIBatch(
+            capri_reference,
+            params,
+            keys[ref_idx],
+            rmsd_coords[ref_idx],
+            fnat_coords[ref_idx],
+        )
+        batch.run()
+        results = batch.get_results()
+        assert [result.identificator for result in results] == [1, 2, 3]
+        for i, result in enumerate(results, start=1):
+            expected = CAPRI(
+                i, models[i - 1], Path("."), capri_reference, params
+            ).run()
+            for metric in CAPRI_METRICS:
+                assert np.isclose(getattr(result, metric), getattr(expected, metric))
+        # the model identical to the reference
+        identical = results[1] if ref_idx == 0 else results[0]
+        assert identical.irmsd == pytest.approx(0.0)
+        assert identical.fnat == pytest.approx(1.0)
+        assert identical.dockq == pytest.approx(1.0)
+
+
+def test_parse_capri_models_heterogeneous(protprot_input_list, params):
+    """Test the models with different atoms are not evaluated at once."""
+    reference, model = protprot_input_list
+    params = {
+        **params,
+        "fnat": True,
+        "fnat_cutoff": 5.0,
+        "alignment_method": "sequence",
+        "lovoalign_exec": None,
+    }
+    one_chain = PDBFile(Path(golden_data, "protprot_onechain.pdb"))
+    _, keys, rmsd_coords, _ = parse_capri_models(
+        [model, one_chain],
+        [CAPRIReference(reference)],
+        params,
+    )
+    assert keys is None
+    assert rmsd_coords is None
+
+
+def test_get_best_results():
+    """Test the best metrics over several references."""
+    results = [
+        [CAPRIResult(1, irmsd=2.0, fnat=0.5), CAPRIResult(2, irmsd=1.0)],
+        [CAPRIResult(1, irmsd=3.0, fnat=0.7), CAPRIResult(2, irmsd=5.0)],
+    ]
+    best = get_best_results(results)
+    assert [result.identificator for result in best] == [1, 2]
+    assert best[0].irmsd == 2.0
+    assert best[0].fnat == 0.7
+    assert best[1].irmsd == 1.0
+    assert np.isnan(best[1].fnat)
+    assert best[0].references == [results[0][0], results[1][0]]
+
+
+def test_extract_data_references(tmp_path):
+    """Test the metrics against each reference are written."""
+    os.chdir(tmp_path)
+    results = [[CAPRIResult(1, irmsd=2.0)], [CAPRIResult(1, irmsd=3.0)]]
+    best = get_best_results(results)
+    best[0].model = PDBFile(file_name="model.pdb", score=-1.0)
+
+    data = extract_data_from_capri_class(
+        capri_objects=best,
+        sort_key="score",
+        sort_ascending=True,
+        output_fname=Path("capri_ss.tsv"),
+    )
+    assert data.loc[1, "irmsd"] == 2.0
+    assert data.loc[1, "irmsd_ref1"] == 2.0
+    assert data.loc[1, "irmsd_ref2"] == 3.0
+    header = Path("capri_ss.tsv").read_text().splitlines()[0].split("\t")
+    assert header[-6:] == [f"{metric}_ref2" for metric in CAPRI_METRICS]
+
+
+def test_get_references(tmp_path):
+    """Test the models of an ensemble are used as references."""
+    os.chdir(tmp_path)
+    ensemble = Path(tmp_path, "ensemble.pdb")
+    structure = Path(golden_data, "protprot_complex_1.pdb")
+    atoms = [
+        line
+        for line in structure.read_text().splitlines(keepends=True)
+        if line.startswith("ATOM")
+    ]
+    with open(ensemble, "w") as fh:
+        for model in (1, 2):
+            fh.write(f"MODEL        {model}\n")
+            fh.writelines(atoms)
+            fh.write("ENDMDL\n")
+        fh.write("END\n")
+
+    references = HaddockModule.get_references(str(ensemble))
+    assert [ref.name for ref in references] == ["ensemble_1.pdb", "ensemble_2.pdb"]
+    assert HaddockModule.get_references([structure]) == [structure]
+
+
+def test_get_dockq():
+    """Test the DockQ metric."""
+    assert get_dockq(1.0, 1e-8, 1e-8) == pytest.approx(1.0)
+    # null values do not contribute
+    assert get_dockq(1.0, 0.0, 0.0) == pytest.approx(1 / 3)
+    assert get_dockq(0.0, 0.0, 0.0) == 0.0
+    assert get_dockq(0.0, 1.5, 8.5) == pytest.approx(1 / 3)
+    assert np.isnan(get_dockq(0.5, float("nan"), 1.0))
+
+
 def test_add_chain_from_segid(protprot_caprimodule):
     """Test replacing the chainID with segID."""
     tmp = tempfile.NamedTemporaryFile(delete=True)
@@ -553,13 +775,6 @@ def test_add_chain_from_segid(protprot_caprimodule):
                 assert line[21] == "A"
 
 
-def test_calc_stats():
-    """Test the calculation of statistics."""
-    observed_mean, observed_std = calc_stats([2, 2, 4, 5])
-    assert np.isclose(observed_mean, 3.25, atol=0.01)
-    assert np.isclose(observed_std, 1.3, atol=0.01)
-
-
 def test_capri_cluster_analysis(protprot_caprimodule, protprot_input_list):
     """Test the cluster analysis."""
     model1, model2 = protprot_input_list[0], protprot_input_list[1]
@@ -720,6 +935,55 @@ def test_capri_cluster_analysis(protprot_caprimodule, protprot_input_list):
         ]
 
 
+def test_capri_cluster_analysis_top_models(tmp_path):
+    """Test the statistics of the top models of each cluster."""
+    os.chdir(tmp_path)
+    energies = dict.fromkeys(["air", "bsa", "desolv", "elec", "total", "vdw"])
+    clusters = [(1, 3), (1, 3), (None, None), (1, 3), (2, 7)]
+    models, results = [], []
+    for i, (clt_rank, clt_id) in enumerate(clusters, start=1):
+        model = PDBFile(
+            file_name=f"model_{i}.pdb",
+            score=-12.0 + 2 * i,
+            unw_energies=None if clt_id is None else dict(energies, air=i),
+        )
+        model.clt_rank, model.clt_id = clt_rank, clt_id
+        models.append(model)
+        results.append(CAPRIResult(i, model=model, irmsd=float(i), fnat=0.5))
+
+    capri_cluster_analysis(
+        capri_list=results,
+        model_list=models,
+        output_fname="capri_clt.tsv",
+        clt_threshold=2,
+        sort_key="cluster_rank",
+        sort_ascending=False,
+        path=Path("."),
+    )
+
+    lines = [
+        line.split("\t")
+        for line in Path("capri_clt.tsv").read_text().splitlines()
+        if not line.startswith("#")
+    ]
+    header = lines[0]
+    observed = [dict(zip(header, line)) for line in lines[1:]]
+    # the models without cluster go last
+    assert [row["cluster_id"] for row in observed] == ["7", "3", "-"]
+    assert [row["n"] for row in observed] == ["1", "3", "1"]
+    assert [row["under_eval"] for row in observed] == ["yes", "-", "yes"]
+    assert [row["caprieval_rank"] for row in observed] == ["3", "1", "2"]
+    # only the first two models of the cluster are considered
+    assert observed[1]["score"] == "-9.000"
+    assert observed[1]["score_std"] == "1.000"
+    assert observed[1]["irmsd"] == "1.500"
+    assert observed[1]["fnat_std"] == "0.000"
+    assert observed[1]["air"] == "1.500"
+    assert observed[1]["bsa"] == "nan"
+    assert observed[2]["air"] == "nan"
+    assert observed[2]["dockq"] == "nan"
+
+
 def test_single_chain_reference(protprot_onechain_ref_caprimodule, params):
     """Test correct values if reference has a single chain."""
     # fnat
@@ -858,7 +1122,7 @@ def test_capri_run(mocker):
         )
 
 
-        capri.run()
+        result = capri.run()
 
         # The only logic to be tested is if the methods are called
         assert capri.fnat == pytest.approx(rand_fnat)
@@ -868,38 +1132,38 @@ def test_capri_run(mocker):
         assert capri.dockq == pytest.approx(rand_dockq)
         assert capri.rmsd == pytest.approx(rand_global_rmsd)
 
+        # only the metrics are returned
+        assert isinstance(result, CAPRIResult)
+        assert result.identificator == "test"
+        assert result.model is None
+        assert result.fnat == pytest.approx(rand_fnat)
+        assert result.rmsd == pytest.approx(rand_global_rmsd)
 
-def test_rank_according_to_score():
-    """test ranking according to score."""
-    data = {
-        1: {
-            "score": 3.0,
-            "caprieval_rank": 99999,
-        },
-        2: {
-            "score": 2.0,
-            "caprieval_rank": 99999,
-        },
-        3: {
-            "score": 1.0,
-            "caprieval_rank": 99999,
-        },
-    }
 
-    ranked_data = rank_according_to_score(
-        data=data, sort_key="score", sort_ascending=True
-    )
+def test_capri_result(tmp_path):
+    """Test the records of the CAPRI metrics."""
+    os.chdir(tmp_path)
+    result = CAPRIResult(3, fnat=0.5, irmsd=1)
+    assert result.fnat == 0.5
+    assert result.irmsd == 1.0
+    assert np.isnan(result.lrmsd)
+    assert np.isnan(result.score)
+    assert result.md5 == ""
 
-    assert ranked_data[1]["caprieval_rank"] == 1
-    assert ranked_data[2]["caprieval_rank"] == 2
-    assert ranked_data[3]["caprieval_rank"] == 3
+    restored = pickle.loads(pickle.dumps(result))
+    assert restored.identificator == 3
+    assert restored.fnat == 0.5
+
+    result.model = PDBFile(file_name="model.pdb", score=-42.0, md5="abc")
+    assert result.score == -42.0
+    assert result.md5 == "abc"
 
 
 def test_extract_data_from_capri_class(mocker):
     """???"""
 
     mocker.patch(
-        "haddock.modules.analysis.caprieval.capri.write_nested_dic_to_file",
+        "haddock.modules.analysis.caprieval.capri.write_dataframe_to_file",
         return_value=None,
     )
     mocker.patch.object(CAPRI, "_load_atoms", return_value=None)
@@ -961,16 +1225,36 @@ def test_extract_data_from_capri_class(mocker):
 
         assert observed_data is not None
 
-        assert observed_data[1]["model"] == random_model
-        assert observed_data[1]["md5"] == random_md5
-        assert observed_data[1]["score"] == random_score
-        assert observed_data[1]["irmsd"] == random_irmsd
-        assert observed_data[1]["fnat"] == random_fnat
-        assert observed_data[1]["lrmsd"] == random_lrmsd
-        assert observed_data[1]["ilrmsd"] == random_ilrmsd
-        assert observed_data[1]["dockq"] == random_dockq
-        assert observed_data[1]["rmsd"] == random_rmsd
-        assert observed_data[1]["energy"] == random_energy
-        assert observed_data[1]["cluster_id"] == random_clt_id
-        assert observed_data[1]["cluster_ranking"] == random_clt_rank
-        assert observed_data[1]["model-cluster_ranking"] == random_clt_model_rank
+        assert observed_data.loc[1, "model"] == random_model
+        assert observed_data.loc[1, "md5"] == random_md5
+        assert observed_data.loc[1, "score"] == random_score
+        assert observed_data.loc[1, "irmsd"] == random_irmsd
+        assert observed_data.loc[1, "fnat"] == random_fnat
+        assert observed_data.loc[1, "lrmsd"] == random_lrmsd
+        assert observed_data.loc[1, "ilrmsd"] == random_ilrmsd
+        assert observed_data.loc[1, "dockq"] == random_dockq
+        assert observed_data.loc[1, "rmsd"] == random_rmsd
+        assert observed_data.loc[1, "energy"] == random_energy
+        assert observed_data.loc[1, "cluster_id"] == random_clt_id
+        assert observed_data.loc[1, "cluster_ranking"] == random_clt_rank
+        assert observed_data.loc[1, "model-cluster_ranking"] == random_clt_model_rank
+
+
+def test_sample_has_same_atoms(protprot_input_list, protprot_1bkd_input_list):
+    """Test the detection of heterogeneous models from a sample."""
+    assert sample_has_same_atoms(protprot_input_list)
+    assert not sample_has_same_atoms(protprot_1bkd_input_list)
+    models = protprot_input_list * 10 + protprot_1bkd_input_list[:1]
+    # the first and last models are always compared
+    assert not sample_has_same_atoms(models, sample_size=2)
+
+
+def test_evaluate_batch_heterogeneous(protprot_1bkd_input_list, mocker, tmp_path):
+    """Test heterogeneous models are not parsed for the batch evaluation."""
+    os.chdir(tmp_path)
+    module = HaddockModule(order=1, path=Path("."), init_params=DEFAULT_CONFIG)
+    parse = mocker.patch(
+        "haddock.modules.analysis.caprieval.parse_capri_models",
+    )
+    assert module._evaluate_batch(protprot_1bkd_input_list, []) is None
+    parse.assert_not_called()
@@ -4,11 +4,19 @@ import os
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pytest
 
-from haddock.libs.libontology import ModuleIO
+from haddock.libs import libfcc
+from haddock.libs.libmatrix import (
+    create_condensed_matrix,
+    write_condensed_matrix,
+    write_text_matrix,
+    )
+from haddock.libs.libontology import ModuleIO, PDBFile
 from haddock.modules.analysis.clustfcc import DEFAULT_CONFIG as clustfcc_pars
 from haddock.modules.analysis.clustfcc import HaddockModule as ClustFCCModule
+from haddock.modules.analysis.clustfcc.clustfcc import iterate_clustering
 
 
 @pytest.fixture(name="fcc_module")
@@ -36,3 +44,322 @@ def test_io_json(fcc_module, protprot_input_list):
     io.load(expected_io)
     assert io.input[0].file_name == protprot_input_list[0].file_name
     assert io.output[1].file_name == protprot_input_list[1].file_name
+
+
+def test_models_without_atoms(fcc_module, protprot_input_list):
+    """Test the models without atoms are reported."""
+    Path("empty.pdb").write_text("REMARK no atoms\nEND\n")
+    fcc_module.previous_io.output = protprot_input_list + [
+        PDBFile("empty.pdb", path=".")
+        ]
+    with pytest.raises(RuntimeError, match=r"No atoms found .*empty\.pdb"):
+        fcc_module._run()
+
+
+def test_read_binary_matrix(tmp_path):
+    """Test the binary and text FCC matrices give the same clusters."""
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, size=(45, 2))
+    names = [f"model_{i}.pdb" for i in range(10)]
+    binary = Path(tmp_path, "fcc.npy")
+    text = Path(tmp_path, "fcc.matrix")
+    write_condensed_matrix(binary, values, names, decimals=[2, 3])
+    write_text_matrix(text, values, len(names), fmt=("{:.2f}", "{:.3f}"))
+
+    assert list(libfcc.iter_matrix(binary)) == list(libfcc.iter_matrix(text))
+
+    clusters = [
+        libfcc.cluster_elements(
+            libfcc.read_matrix(matrix, 0.6, 0.75),
+            threshold=2,
+            )[1]
+        for matrix in (binary, text)
+        ]
+    observed = [
+        [(clt.center.name, sorted(m.name for m in clt.members)) for clt in cl]
+        for cl in clusters
+        ]
+    assert observed[0]
+    assert observed[0] == observed[1]
+
+
+@pytest.fixture(name="contacts")
+def fixture_contacts():
+    """Contacts of models around three interfaces."""
+    rng = np.random.default_rng(0)
+    interfaces = [
+        set(rng.integers(0, 500, size=40).tolist())
+        for _ in range(3)
+        ]
+    contacts = [
+        {con for con in interfaces[i % 3] if rng.random() < 0.8}
+        | set(rng.integers(0, 500, size=5).tolist())
+        for i in range(30)
+        ]
+    # a model without contacts
+    contacts[4] = set()
+    return contacts
+
+
+def test_build_contact_matrix():
+    """Test the contacts are encoded as rows of a binary matrix."""
+    matrix = libfcc.build_contact_matrix([{10, 3}, set(), {3, 7}])
+    assert matrix.toarray().tolist() == [[1, 0, 1], [0, 0, 0], [1, 1, 0]]
+
+
+def test_fcc_row_dispatcher():
+    """Test the blocks of rows cover the condensed matrix."""
+    blocks = libfcc.fcc_row_dispatcher(10, 2, 1000)
+    assert blocks == [(0, 3), (3, 9)]
+    blocks = libfcc.fcc_row_dispatcher(10, 1, 10)
+    assert blocks[0] == (0, 1)
+    assert blocks[-1][1] == 9
+    assert all(prev[1] == curr[0] for prev, curr in zip(blocks, blocks[1:]))
+    assert libfcc.fcc_row_dispatcher(1, 4, 1000) == []
+
+
+def test_calc_fcc_block(contacts):
+    """Test the sparse products give the pairwise FCC values."""
+    expected = np.array([
+        data[2:]
+        for data in libfcc.calculate_pairwise_matrix(contacts, False)
+        ])
+    matrix = libfcc.build_contact_matrix(contacts)
+    observed = np.concatenate([
+        libfcc.calc_fcc_block(matrix, start_row, end_row)
+        for start_row, end_row in libfcc.fcc_row_dispatcher(30, 3, 1000)
+        ])
+    assert observed.tolist() == expected.tolist()
+
+
+def test_calc_fcc_neighbors(contacts, tmp_path):
+    """Test the neighbors match the ones read from the FCC matrix."""
+    names = [f"model_{i}.pdb" for i in range(30)]
+    values = np.array([
+        data[2:]
+        for data in libfcc.calculate_pairwise_matrix(contacts, False)
+        ])
+    expected_matrix = Path(tmp_path, "expected.npy")
+    write_condensed_matrix(expected_matrix, values, names, decimals=[2, 3])
+    expected = libfcc.read_matrix(expected_matrix, 0.6, 0.75)
+
+    matrix = libfcc.build_contact_matrix(contacts)
+    fcc_matrix = Path(tmp_path, "fcc.npy")
+    create_condensed_matrix(fcc_matrix, names, decimals=[2, 3], n_values=2)
+    neighbors = [
+        libfcc.calc_fcc_neighbors(
+            matrix,
+            start_row,
+            end_row,
+            0.6,
+            0.75,
+            matrix_path=fcc_matrix,
+            block=block,
+            )[1]
+        for block, (start_row, end_row) in enumerate(
+            libfcc.fcc_row_dispatcher(30, 4, 1000)
+            )
+        ]
+    observed = libfcc.build_elements(30, neighbors)
+
+    assert np.array_equal(np.load(fcc_matrix), np.load(expected_matrix))
+    assert list(observed) == list(expected)
+    assert any(element.neighbors for element in observed.values())
+    for name, element in observed.items():
+        assert (
+            {e.name for e in element.neighbors}
+            == {e.name for e in expected[name].neighbors}
+            )
+
+
+def test_read_contact_atoms(tmp_path):
+    """Test hydrogens are ignored and segments follow the segment IDs."""
+    pdb_f = Path(tmp_path, "model.pdb")
+    lines = [
+        ("N", 1, "A", 0.0),
+        ("H", 1, "A", 0.5),
+        ("1HB", 2, "A", 0.5),
+        ("CA", 2, "A", 1.0),
+        ("CA", 7, "B", 2.0),
+        ("CA", 9, "A", 3.0),
+        ]
+    pdb_f.write_text("".join(
+        f"ATOM  {i:5d} {name:<4s} ALA A{resid:4d}    "
+        f"{x:8.3f}{0.0:8.3f}{0.0:8.3f}  1.00  0.00      {seg:<4s}\n"
+        for i, (name, resid, seg, x) in enumerate(lines, start=1)
+        ))
+
+    segments, resids, coords = libfcc.read_contact_atoms(pdb_f)
+
+    assert segments.tolist() == [1, 1, 2, 3]
+    assert resids.tolist() == [1, 2, 7, 9]
+    assert coords.dtype == np.float32
+    assert coords[:, 0].tolist() == [0.0, 1.0, 2.0, 3.0]
+
+
+def test_load_fcc_contacts(protprot_input_list, tmp_path):
+    """Test the contacts are those of the contact_fcc executable."""
+    os.chdir(tmp_path)
+    expected = {
+        100371100522, 100381100162, 100381100512, 100391100512, 100391100522,
+        100391100532, 100391100542, 100431100542, 100451100112, 100451100122,
+        100451100562, 100711100172, 100751100172, 100901100162, 100901100172,
+        100941100162, 100941100512, 100961100172, 101321100482, 101321100512,
+        }
+
+    core, contacts = libfcc.load_fcc_contacts(
+        protprot_input_list[:1],
+        5.0,
+        write_contacts=True,
+        core=3,
+        )
+
+    assert core == 3
+    assert contacts == [expected]
+    con_f = Path(protprot_input_list[0].file_name.replace(".pdb", ".con"))
+    observed = [int(line) for line in con_f.read_text().splitlines()]
+    assert observed == sorted(expected)
+
+
+def brute_force_clustering(adjacency, threshold):
+    """Greedy clustering scanning all the models at each step."""
+    labels = np.full(len(adjacency), -1)
+    clusters = []
+    while (labels == -1).any():
+        unclustered = labels == -1
+        counts = (adjacency & unclustered).sum(axis=1)
+        candidates = np.flatnonzero(unclustered)
+        ranking = sorted(zip(counts[candidates].tolist(), candidates.tolist()))
+        count, center = ranking[-1]
+        if count < threshold - 1:
+            break
+        members = np.flatnonzero(adjacency[center] & unclustered)
+        labels[members] = len(clusters)
+        labels[center] = len(clusters)
+        clusters.append((center + 1, (members + 1).tolist()))
+    return clusters
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_greedy_clustering(seed):
+    """Test the clusters of all the thresholds come from a single pass."""
+    rng = np.random.default_rng(seed)
+    adjacency = rng.random((40, 40)) < 0.15
+    np.fill_diagonal(adjacency, False)
+    graph = libfcc.build_neighbor_graph(40, [np.nonzero(adjacency)])
+
+    centers, counts, labels = libfcc.greedy_clustering(graph)
+
+    assert (labels >= 0).all()
+    assert (np.diff(counts) <= 0).all()
+    for threshold in range(1, 10):
+        clusters = libfcc.make_clusters(centers, counts, labels, threshold)
+        observed = [
+            (clt.center.name, [m.name for m in clt.members])
+            for clt in clusters
+            ]
+        assert observed == brute_force_clustering(adjacency, threshold)
+        assert [clt.name for clt in clusters] == list(
+            range(1, len(clusters) + 1)
+            )
+
+
+def test_read_neighbor_graph(tmp_path):
+    """Test the neighbor graph of binary and text matrices."""
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 1, size=(45, 2))
+    names = [f"model_{i}.pdb" for i in range(10)]
+    binary = Path(tmp_path, "fcc.npy")
+    text = Path(tmp_path, "fcc.matrix")
+    write_condensed_matrix(binary, values, names, decimals=[2, 3])
+    write_text_matrix(text, values, len(names), fmt=("{:.2f}", "{:.3f}"))
+    elements = libfcc.read_matrix(binary, 0.6, 0.75)
+    expected = {
+        (name - 1, neighbor.name - 1)
+        for name, element in elements.items()
+        for neighbor in element.neighbors
+        }
+
+    for matrix in (binary, text):
+        graph = libfcc.read_neighbor_graph(matrix, 0.6, 0.75)
+        assert graph.shape == (10, 10)
+        assert set(zip(*graph.nonzero())) == expected
+
+
+def test_iterate_clustering():
+    """Test the min_population is lowered to the largest cluster."""
+    graph = libfcc.build_neighbor_graph(
+        6,
+        [(np.array([0, 0, 1, 3]), np.array([1, 2, 2, 4]))],
+        )
+
+    clusters, min_population = iterate_clustering(graph, 4)
+    assert min_population == 3
+    assert [(clt.center.name, len(clt)) for clt in clusters] == [(1, 3)]
+
+    clusters, min_population = iterate_clustering(graph, 1)
+    assert min_population == 1
+    assert [(clt.center.name, len(clt)) for clt in clusters] == [
+        (1, 3),
+        (4, 2),
+        (6, 1),
+        ]
+
+    clusters, min_population = iterate_clustering(
+        libfcc.build_neighbor_graph(1, []),
+        4,
+        )
+    assert clusters == []
+    assert min_population == 1
+
+
+def test_incremental_fcc_clustering(contacts):
+    """Test the clusters of models given in batches match clustfcc."""
+    def batch_clusters(models_contacts, min_population):
+        matrix = libfcc.build_contact_matrix(models_contacts)
+        n_models = len(models_contacts)
+        neighbors = [
+            libfcc.calc_fcc_neighbors(matrix, start_row, end_row, 0.6, 0.75)[1]
+            for start_row, end_row in libfcc.fcc_row_dispatcher(
+                n_models,
+                2,
+                1000,
+                )
+            ]
+        graph = libfcc.build_neighbor_graph(n_models, neighbors)
+        return graph, iterate_clustering(graph, min_population)
+
+    def describe(clusters):
+        return [
+            (clt.name, clt.center.name, [m.name for m in clt.members])
+            for clt in clusters
+            ]
+
+    clustering = libfcc.IncrementalFCCClustering(0.6, 0.75)
+    for start, end in [(0, 7), (7, 8), (8, 20), (20, 30)]:
+        new_neighbors = clustering.add_contacts(contacts[start:end])
+        assert clustering.n_models == end
+        # only the pairs with a new model are calculated
+        assert (np.maximum(*new_neighbors) >= start).all()
+
+        graph, (expected, expected_min) = batch_clusters(contacts[:end], 4)
+        observed, observed_min = clustering.get_clusters(4)
+        assert (clustering.get_neighbor_graph() != graph).nnz == 0
+        assert describe(observed) == describe(expected)
+        assert observed_min == expected_min
+    assert observed_min == 4
+    assert len(observed) == 3
+
+
+def test_incremental_fcc_clustering_empty_batch(contacts):
+    """Test an empty batch of models adds no neighbors."""
+    clustering = libfcc.IncrementalFCCClustering(0.6, 0.75)
+    for new_neighbors in clustering.add_contacts([]):
+        assert new_neighbors.size == 0
+    assert clustering.n_models == 0
+
+    clustering.add_contacts(contacts[:7])
+    for new_neighbors in clustering.add_contacts([]):
+        assert new_neighbors.size == 0
+    assert clustering.n_models == 7
+    assert clustering.get_neighbor_graph().shape == (7, 7)
@@ -0,0 +1,139 @@
+"""Test the clustleader module."""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from haddock.libs.libalign import kabsch_rmsd_batch
+from haddock.modules.analysis.clustleader import DEFAULT_CONFIG
+from haddock.modules.analysis.clustleader import HaddockModule
+from haddock.modules.analysis.clustleader.clustleader import (
+    assign_to_centers,
+    get_medoid,
+    leader_clustering,
+    refine_clusters,
+    )
+
+
+@pytest.fixture(name="coords")
+def fixture_coords():
+    """Models around three well separated structures."""
+    rng = np.random.default_rng(0)
+    templates = rng.normal(scale=8.0, size=(3, 20, 3))
+    sizes = (12, 7, 3)
+    coords = np.concatenate([
+        template + rng.normal(scale=0.5, size=(size, 20, 3))
+        for template, size in zip(templates, sizes)
+        ])
+    coords = coords[rng.permutation(len(coords))]
+    return coords - coords.mean(axis=1, keepdims=True)
+
+
+def brute_force_leader(coords, cutoff, order):
+    """Leader clustering without pruning."""
+    labels = np.full(len(coords), -1)
+    centers = []
+    for idx in order:
+        if centers:
+            dist = kabsch_rmsd_batch(coords[idx], coords[centers])
+            closest = int(np.argmin(dist))
+            if dist[closest] <= cutoff:
+                labels[idx] = closest
+                continue
+        labels[idx] = len(centers)
+        centers.append(idx)
+    return labels, np.array(centers)
+
+
+@pytest.mark.parametrize("cutoff", [0.5, 1.0, 3.0, 100.0])
+def test_leader_clustering(coords, cutoff):
+    """Test the pruning does not change the clusters."""
+    order = np.arange(len(coords))[::-1]
+    labels, centers = leader_clustering(coords, cutoff, order, n_anchors=2)
+    expected_labels, expected_centers = brute_force_leader(
+        coords,
+        cutoff,
+        order,
+        )
+    assert labels.tolist() == expected_labels.tolist()
+    assert centers.tolist() == expected_centers.tolist()
+
+
+def test_leader_clustering_populations(coords):
+    """Test the three groups of models are found."""
+    labels, centers = leader_clustering(coords, 3.0)
+    assert len(centers) == 3
+    assert sorted(np.bincount(labels).tolist()) == [3, 7, 12]
+    assert centers[0] == 0
+    assert labels[centers].tolist() == [0, 1, 2]
+
+
+def test_assign_to_centers(coords):
+    """Test the pruned assignment matches the closest centers."""
+    centers = np.array([0, 5, 9, 13])
+    labels = np.arange(len(coords)) % 4
+    labels[centers] = np.arange(4)
+
+    observed, dist = assign_to_centers(coords, centers, labels)
+
+    all_dist = np.array([
+        kabsch_rmsd_batch(coords[center], coords) for center in centers
+        ])
+    expected = np.argmin(all_dist, axis=0)
+    expected[centers] = np.arange(4)
+    assert observed.tolist() == expected.tolist()
+    np.testing.assert_allclose(
+        dist,
+        all_dist[observed, np.arange(len(coords))],
+        atol=1e-6,
+        )
+
+
+def test_get_medoid(coords):
+    """Test the medoid is a member of the cluster."""
+    labels, centers = leader_clustering(coords, 3.0)
+    members = np.flatnonzero(labels == 0)
+    medoid = get_medoid(coords, centers[0], members)
+    assert medoid in members
+
+
+def test_refine_clusters(coords):
+    """Test k-medoids iterations recover a bad initial clustering."""
+    labels, centers = leader_clustering(coords, 100.0)
+    assert len(centers) == 1
+    # start from three centers in the same group
+    centers = np.flatnonzero(labels == 0)[:1]
+    first = np.argmax(kabsch_rmsd_batch(coords[centers[0]], coords))
+    second = np.argmax(kabsch_rmsd_batch(coords[first], coords))
+    centers = np.array([centers[0], first, second])
+    labels, _ = assign_to_centers(
+        coords,
+        centers,
+        np.zeros(len(coords), dtype=int),
+        )
+
+    labels, centers = refine_clusters(coords, labels, centers, 10)
+    assert sorted(np.bincount(labels).tolist()) == [3, 7, 12]
+    assert labels[centers].tolist() == [0, 1, 2]
+
+
+def test_clustleader_output(protdna_input_list, tmp_path):
+    """Test the clustleader module output."""
+    os.chdir(tmp_path)
+    module = HaddockModule(
+        order=1,
+        path=Path("."),
+        initial_params=DEFAULT_CONFIG,
+        )
+    module.previous_io.output = protdna_input_list
+    module._run()
+
+    observed = Path("cluster.out").read_text()
+    assert observed == f"Cluster 1 -> 1 2{os.linesep}"
+    assert Path("clustleader.txt").exists()
+    assert Path("clustleader.tsv").exists()
+    assert module.params["min_population"] == 2
+    assert [model.clt_id for model in module.output_models] == [1, 1]
+    assert [model.clt_rank for model in module.output_models] == [1, 1]
@@ -7,6 +7,7 @@ from pathlib import Path
 import numpy as np
 import pytest
 
+from haddock.libs.libmatrix import write_condensed_matrix
 from haddock.libs.libontology import ModuleIO, RMSDFile
 from haddock.modules.analysis.clustrmsd import DEFAULT_CONFIG as clustrmsd_pars
 from haddock.modules.analysis.clustrmsd import HaddockModule
@@ -16,9 +17,13 @@ from haddock.modules.analysis.clustrmsd.clustrmsd import (
     get_cluster_center,
     get_clusters,
     get_dendrogram,
+    iter_cluster_members,
     iterate_min_population,
+    load_dendrogram,
     order_clusters,
     read_matrix,
+    scan_clust_cutoffs,
+    write_clust_cutoffs_scan,
     )
 from haddock.modules.analysis.rmsdmatrix import DEFAULT_CONFIG as rmsd_pars
 from haddock.modules.analysis.rmsdmatrix import HaddockModule as HaddockRMSD
@@ -28,6 +33,8 @@ from haddock.modules.analysis.rmsdmatrix import HaddockModule as HaddockRMSD
 def fixture_output_list():
     """Clustrmsd output list."""
     return [
+        "rmsd.npy",
+        "rmsd.header.json",
         "rmsd.matrix",
         "rmsd_matrix.json",
         "cluster.out",
@@ -129,6 +136,22 @@ def test_read_rmsd_matrix(correct_rmsd_vec):
             assert rmsd_vec[n][2] == matrix[n]
 
 
+def test_read_binary_rmsd_matrix(tmp_path, correct_rmsd_vec):
+    """Check correct reading of a binary rmsd matrix."""
+    output_name = Path(tmp_path, "rmsd.npy")
+    write_condensed_matrix(
+        output_name,
+        [data[2] for data in correct_rmsd_vec],
+        ["a.pdb", "b.pdb", "c.pdb"],
+        decimals=[3],
+        )
+    rmsd_file = RMSDFile(output_name.name, npairs=3, path=tmp_path)
+
+    matrix = read_matrix(rmsd_file)
+
+    assert matrix.tolist() == [data[2] for data in correct_rmsd_vec]
+
+
 def test_read_matrix_input(correct_rmsd_vec):
     """Test wrong input to read_matrix."""
     rmsd_vec = correct_rmsd_vec
@@ -226,6 +249,41 @@ def test_correct_clusters(correct_rmsd_array):
 
         assert (observed_clusters == expected_clusters).all()
 
+        # the binary dendrogram is preferred to the text one
+        Path("dendrogram.txt").unlink()
+        assert (load_dendrogram(".") == observed_dendrogram).all()
+
+
+def test_load_text_dendrogram(tmp_path):
+    """Test the text dendrogram of older runs is read."""
+    os.chdir(tmp_path)
+    dendrogram = np.array([[2.0, 3.0, 0.5, 2.0], [0.0, 1.0, 1.0, 2.0]])
+    np.savetxt(Path(tmp_path, "dendrogram.txt"), dendrogram, fmt="%.5f")
+    assert (load_dendrogram(tmp_path) == dendrogram).all()
+
+
+def test_scan_clust_cutoffs(correct_rmsd_array, tmp_path):
+    """Test the dendrogram is cut at several distances."""
+    os.chdir(tmp_path)
+    dendrogram = get_dendrogram(correct_rmsd_array, linkage_type="average")
+    scan = scan_clust_cutoffs(dendrogram, [0.4, 0.75, 3.0], min_population=2)
+    assert [cut["n_clusters"] for cut in scan] == [4, 3, 1]
+    assert [cut["n_valid_clusters"] for cut in scan] == [0, 1, 1]
+    assert [cut["n_unclustered"] for cut in scan] == [4, 2, 0]
+    assert [cut["populations"] for cut in scan] == [[], [2], [4]]
+
+    write_clust_cutoffs_scan(scan, "scan.tsv")
+    lines = Path("scan.tsv").read_text().splitlines()
+    assert lines[0].split("\t") == [
+        "clust_cutoff",
+        "n_clusters",
+        "n_valid_clusters",
+        "n_unclustered",
+        "populations",
+        ]
+    assert lines[1] == "0.400\t4\t0\t4\t-"
+    assert lines[3] == "3.000\t1\t1\t0\t4"
+
 
 # TODO: add tests for the other categories of clustering
 
@@ -276,6 +334,38 @@ def test_get_cluster_center(correct_rmsd_array):
     assert obs_clt_center == exp_clt_center
 
 
+def test_get_cluster_center_blocks():
+    """Test the center does not depend on the blocks of pairs."""
+    rng = np.random.default_rng(0)
+    n_obs = 40
+    # few distinct values, many ties between the sums
+    rmsd_matrix = rng.integers(0, 3, n_obs * (n_obs - 1) // 2).astype(float)
+    npw = np.sort(rng.choice(n_obs, size=25, replace=False))
+
+    # reference double loop over the members
+    sums = {el: 0.0 for el in npw}
+    for m_idx, ref in enumerate(npw):
+        for el in npw[m_idx + 1:]:
+            value = rmsd_matrix[int(cond_index(ref, el, n_obs))]
+            sums[ref] += value
+            sums[el] += value
+    expected = min(sums, key=sums.get)
+
+    for block_size in (1, 7, 1000000):
+        observed = get_cluster_center(npw, n_obs, rmsd_matrix, block_size)
+        assert observed == expected
+
+
+def test_iter_cluster_members():
+    """Test the members of each cluster are grouped."""
+    cluster_arr = np.array([3, -1, 1, 3, 1, 2])
+    observed = [
+        (cl_id, npw.tolist())
+        for cl_id, npw in iter_cluster_members(cluster_arr)
+        ]
+    assert observed == [(-1, [1]), (1, [2, 4]), (2, [5]), (3, [0, 3])]
+
+
 def test_cond_index():
     """Test cond_index function."""
     n_obs = 10
@@ -311,6 +401,14 @@ def test_iterate_min_population():
     exp_cluster_arr = np.array([1, 1, -1, -1, -1])
     assert obs_min_population == 2
     assert (obs_cluster_arr == exp_cluster_arr).all()
+    # unclustered structures are not a cluster
+    cluster_arr = np.array([-1, -1, -1, 2, 3])
+    obs_cluster_arr, obs_min_population = iterate_min_population(
+        cluster_arr,
+        min_population=4,
+    )
+    assert obs_min_population == 1
+    assert (obs_cluster_arr == cluster_arr).all()
 
 
 def test_order_clusters():
@@ -1,4 +1,4 @@
-"""Test the rmsdmatrix module."""
+"""Test the ilrmsdmatrix module."""
 
 import os
 import tempfile
@@ -7,17 +7,16 @@ from pathlib import Path
 import numpy as np
 import pytest
 
+from haddock.libs.libalign import get_atoms, load_coords
 from haddock.modules.analysis.ilrmsdmatrix import \
     DEFAULT_CONFIG as ILRMSD_DEFAULT_PARAMS
 from haddock.modules.analysis.ilrmsdmatrix import \
     HaddockModule as IlrmsdmatrixModule
-from haddock.modules.analysis.ilrmsdmatrix.ilrmsd import Contact, ContactJob
-
-
-@pytest.fixture(name="params")
-def fixture_params():
-    """???"""
-    return {"receptor_chain": "A", "ligand_chains": ["B"]}
+from haddock.modules.analysis.ilrmsdmatrix.ilrmsd import (
+    get_common_coords,
+    get_interface_residues,
+    parse_ilrmsd_models,
+)
 
 
 @pytest.fixture
@@ -32,68 +31,90 @@ def ilrmsdmatrix():
         )
 
 
-@pytest.fixture(name="contact_obj")
-def fixture_contact_obj(protprot_input_list, params):
-    """Return example Contact object."""
-    with tempfile.TemporaryDirectory() as tempdir:
-        os.chdir(tempdir)
-        yield Contact(
-            model_list=protprot_input_list,
-            output_name="contact",
-            path=Path("."),
-            core=0,
-            contact_distance_cutoff=5.0,
-            params=params,
-        )
-
-
-@pytest.fixture(name="contact_job_obj")
-def fixture_contact_job_obj(contact_obj, params):
-    """Return example ContactJob object."""
-    with tempfile.TemporaryDirectory() as tempdir:
-        os.chdir(tempdir)
-        yield ContactJob(
-            Path("contact_output"),
-            params,
-            contact_obj,
-        )
-
+def test_parse_ilrmsd_models(protprot_input_list):
+    """Test the interfaces and coordinates read from the models."""
+    core, interfaces, atom_keys, key_ids, coords = parse_ilrmsd_models(
+        protprot_input_list,
+        contact_distance_cutoff=5.0,
+        core=3,
+    )
+    assert core == 3
+    assert len(interfaces) == len(key_ids) == len(coords) == 2
+    # both models have the same atoms
+    assert key_ids == [0, 0]
+    assert len(atom_keys) == 1
+    # same atoms as the RMSD modules
+    exp_coords, _ = load_coords(
+        protprot_input_list[0],
+        get_atoms(protprot_input_list[0]),
+    )
+    assert atom_keys[0] == tuple(exp_coords)
+    np.testing.assert_allclose(
+        coords[0],
+        np.array(list(exp_coords.values())),
+        atol=1e-4,
+    )
 
-def test_contact(contact_obj):
-    """Test the contact class."""
-    contact_obj.run()
-    contact_obj.output()
-    assert Path(contact_obj.output_name).exists()
+    res_resdic = get_interface_residues(interfaces, "A", ["B"])
     exp_lig_res = np.array([10, 11, 12, 16, 17, 48, 51, 52, 53, 54, 56, 57])
-    # assert that they are all equal
-    assert np.array_equal(contact_obj.unique_lig_res, exp_lig_res)
-    # assert contact_obj.unique_lig_res == exp_lig_res
+    assert np.array_equal(res_resdic["B"], exp_lig_res)
     exp_rec_res = np.array(
         [37, 38, 39, 40, 43, 44, 45, 69, 71, 72, 75, 90, 93, 94, 96, 132]
     )
-    assert np.array_equal(contact_obj.unique_rec_res, exp_rec_res)
+    assert np.array_equal(res_resdic["A"], exp_rec_res)
 
 
-def test_contact_cutoff(contact_obj):
-    """Test the contact class with reduced contact cutoff."""
-    # Modify cutoff of the object
-    contact_obj.contact_distance_cutoff = 3.9
-    contact_obj.run()
-    contact_obj.output()
-    assert Path(contact_obj.output_name).exists()
+def test_parse_ilrmsd_models_cutoff(protprot_input_list):
+    """Test the interfaces with reduced contact cutoff."""
+    _, interfaces, *_ = parse_ilrmsd_models(
+        protprot_input_list,
+        contact_distance_cutoff=3.9,
+    )
+    res_resdic = get_interface_residues(interfaces, "A", ["B"])
     exp_lig_res = np.array([11, 12, 16, 17, 48, 51, 52, 56, 57])
-    # assert that they are all equal
-    assert np.array_equal(contact_obj.unique_lig_res, exp_lig_res)
-    # assert contact_obj.unique_lig_res == exp_lig_res
+    assert np.array_equal(res_resdic["B"], exp_lig_res)
     exp_rec_res = np.array([38, 39, 40, 45, 69, 71, 72, 90, 94, 96, 132])
-    assert np.array_equal(contact_obj.unique_rec_res, exp_rec_res)
-
-
-def test_contact_job(contact_job_obj):
-    """Test ContactJob class."""
-    contact_job_obj.run()
-    exp_output = contact_job_obj.contact_obj.output_name
-    assert Path(exp_output).exists()
+    assert np.array_equal(res_resdic["A"], exp_rec_res)
+
+
+def test_get_interface_residues():
+    """Test each ligand chain keeps its own interface residues."""
+    interfaces = [
+        {
+            "A": {"B": {1, 2}, "C": {5}},
+            "B": {"A": {10}, "C": {11}},
+            "C": {"A": {20}, "B": {21}},
+        },
+        {"A": {"B": {3}}, "B": {"A": {12}}},
+    ]
+    res_resdic = get_interface_residues(interfaces, "A", ["B", "C"])
+    assert list(res_resdic) == ["A", "B", "C"]
+    assert res_resdic["A"].tolist() == [1, 2, 3, 5]
+    assert res_resdic["B"].tolist() == [10, 12]
+    assert res_resdic["C"].tolist() == [20]
+
+
+def test_get_common_coords():
+    """Test the coordinates of the common atoms of the models."""
+    atom_keys = [
+        (("A", 1, "CA"), ("A", 2, "CA"), ("B", 1, "CA")),
+        (("A", 2, "CA"), ("A", 1, "CA"), ("A", 3, "CA"), ("B", 1, "CA")),
+    ]
+    key_ids = [0, 1, 0]
+    coords = [
+        np.array([[0.0, 0, 0], [1, 0, 0], [2, 0, 0]]),
+        np.array([[11.0, 0, 0], [10, 0, 0], [12, 0, 0], [13, 0, 0]]),
+        np.array([[20.0, 0, 0], [21, 0, 0], [22, 0, 0]]),
+    ]
+    common_coords, common_keys = get_common_coords(
+        atom_keys,
+        key_ids,
+        coords,
+        {"A": np.array([1, 2, 3])},
+        atom_similarity=50.0,
+    )
+    assert common_keys == [("A", 1, "CA"), ("A", 2, "CA")]
+    assert common_coords[:, :, 0].tolist() == [[0, 1], [10, 11], [20, 21]]
 
 
 def test_ilrmsdmatrix_init(ilrmsdmatrix):
@@ -4,15 +4,36 @@ import os
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pytest
 
+from haddock.libs.libalign import (
+    kabsch_ilrmsd_batch,
+    kabsch_rmsd_batch,
+    read_binary_traj,
+    )
+from haddock.libs.libcoords import CoordsStore, write_coords_store
+from haddock.libs.libmatrix import (
+    create_condensed_matrix,
+    copy_reused_pairs,
+    read_condensed_matrix,
+    read_matrix_header,
+    write_condensed_matrix,
+    )
+from haddock.libs.libparallel import Scheduler
 from haddock.modules.analysis.rmsdmatrix import \
     DEFAULT_CONFIG as DEFAULT_RMSDMATRIX_PARAMS
 from haddock.modules.analysis.rmsdmatrix import HaddockModule as Rmsdmatrix
 from haddock.modules.analysis.rmsdmatrix.rmsd import (
+    RMSDMatrixJob,
+    RMSDUpdateJob,
     XYZWriter,
+    block_dispatcher,
+    calc_condensed_rmsd,
     get_pair,
+    load_models_coords,
     rmsd_dispatcher,
+    update_dispatcher,
     )
 
 
@@ -74,10 +95,12 @@ def test_rmsd_dispatcher():
 def test_overall_rmsd(rmsdmatrix, protdna_input_list):
     """Test overall rmsdmatrix module."""
     rmsdmatrix.previous_io.output = protdna_input_list
+    rmsdmatrix.params["text_matrix"] = True
     rmsdmatrix._run()
 
     ls = os.listdir()
 
+    assert "rmsd.npy" in ls
     assert "rmsd.matrix" in ls
 
     assert "rmsd_matrix.json" in ls
@@ -89,11 +112,161 @@ def test_overall_rmsd(rmsdmatrix, protdna_input_list):
 
     assert rmsd_matrix == expected_rmsd_matrix
 
+    assert read_condensed_matrix("rmsd.npy").tolist() == [2.257]
+    header = read_matrix_header("rmsd.npy")
+    assert header["models"] == [m.file_name for m in protdna_input_list]
+
     # os.unlink(Path("rmsd.matrix"))
     # os.unlink(Path("rmsd_matrix.json"))
     # os.unlink(Path("io.json"))
 
 
+def test_overall_rmsd_c_engine(rmsdmatrix, protdna_input_list):
+    """Test the rmsdmatrix module with the fast-rmsdmatrix executable."""
+    rmsdmatrix.previous_io.output = protdna_input_list
+    rmsdmatrix.params["rmsd_engine"] = "c"
+    rmsdmatrix._run()
+
+    assert read_condensed_matrix("rmsd.npy").tolist() == [2.257]
+    assert not Path("rmsd.matrix").exists()
+    assert not Path("traj.bin").exists()
+
+
+def test_calc_condensed_rmsd():
+    """Test the parallel slices build the whole condensed matrix."""
+    rng = np.random.default_rng(0)
+    coords = rng.normal(scale=5.0, size=(7, 12, 3))
+    coords -= coords.mean(axis=1, keepdims=True)
+    expected = np.concatenate([
+        kabsch_rmsd_batch(coords[i], coords[i + 1:])
+        for i in range(len(coords) - 1)
+        ])
+
+    npairs, refs, mods = rmsd_dispatcher(7, 21, 4)
+    observed = np.concatenate([
+        calc_condensed_rmsd(coords, npairs[core], refs[core], mods[core])
+        for core in range(4)
+        ])
+
+    np.testing.assert_allclose(observed, expected)
+
+
+def test_calc_condensed_ilrmsd():
+    """Test the ligand RMSDs after superposition on the receptors."""
+    rng = np.random.default_rng(0)
+    coords = rng.normal(scale=5.0, size=(6, 12, 3))
+    lig_coords = rng.normal(scale=5.0, size=(6, 5, 3))
+    expected = np.concatenate([
+        kabsch_ilrmsd_batch(
+            coords[i],
+            coords[i + 1:],
+            lig_coords[i],
+            lig_coords[i + 1:],
+            )
+        for i in range(len(coords) - 1)
+        ])
+
+    npairs, refs, mods = rmsd_dispatcher(6, 15, 2)
+    observed = np.concatenate([
+        calc_condensed_rmsd(
+            coords,
+            npairs[core],
+            refs[core],
+            mods[core],
+            lig_coords=lig_coords,
+            )
+        for core in range(2)
+        ])
+
+    np.testing.assert_allclose(observed, expected)
+
+
+def test_block_dispatcher():
+    """Test the blocks tile the condensed matrix."""
+    npairs, refs, mods, starts = block_dispatcher(10, 45, 2, 10)
+    assert npairs == [9, 9, 9, 9, 9]
+    assert starts == [0, 9, 18, 27, 36]
+    assert refs == [0, 1, 2, 3, 5]
+    assert mods == [1, 2, 4, 7, 7]
+
+    # never less blocks than cores, never more blocks than pairs
+    assert len(block_dispatcher(10, 45, 4, 1000)[0]) == 4
+    assert len(block_dispatcher(3, 3, 8, 1000)[0]) == 3
+
+
+def test_rmsd_matrix_blocks(tmp_path):
+    """Test blocks written to the binary matrix build the whole matrix."""
+    rng = np.random.default_rng(0)
+    coords = rng.normal(scale=5.0, size=(9, 12, 3))
+    coords -= coords.mean(axis=1, keepdims=True)
+    matrix = Path(tmp_path, "rmsd.npy")
+    create_condensed_matrix(matrix, [str(i) for i in range(9)], [3])
+
+    npairs, refs, mods, starts = block_dispatcher(9, 36, 2, 5)
+    for block in reversed(range(len(npairs))):
+        job = RMSDMatrixJob(
+            coords,
+            block,
+            npairs[block],
+            refs[block],
+            mods[block],
+            matrix_path=matrix,
+            start=starts[block],
+            )
+        assert job.run() == (block, None)
+
+    expected = calc_condensed_rmsd(coords, 36, 0, 1)
+    np.testing.assert_allclose(
+        read_condensed_matrix(matrix),
+        expected,
+        atol=5e-4,
+        )
+
+
+def test_update_dispatcher():
+    """Test the missing pairs are split between the cores."""
+    reused = np.array([True, True, False, True, False])
+    refs = update_dispatcher(reused, 2)
+    assert [ref.tolist() for ref in refs] == [[0, 1], [2, 3, 4]]
+    # no missing pair at all
+    assert update_dispatcher(np.ones(4, dtype=bool), 2) == []
+
+
+def test_rmsd_update_job(tmp_path):
+    """Test the missing pairs complete a reused matrix."""
+    rng = np.random.default_rng(0)
+    coords = rng.normal(scale=5.0, size=(6, 12, 3))
+    coords -= coords.mean(axis=1, keepdims=True)
+    expected = calc_condensed_rmsd(coords, 15, 0, 1)
+
+    # the previous matrix holds models 4, 1 and 2
+    old_matrix = Path(tmp_path, "old.npy")
+    old_coords = coords[[4, 1, 2]]
+    write_condensed_matrix(
+        old_matrix,
+        calc_condensed_rmsd(old_coords, 3, 0, 1),
+        ["4", "1", "2"],
+        [3],
+        )
+    old_idx = np.array([-1, 1, 2, -1, 0, -1])
+    matrix = Path(tmp_path, "rmsd.npy")
+    create_condensed_matrix(matrix, [str(i) for i in range(6)], [3])
+    assert copy_reused_pairs(old_matrix, matrix, old_idx) == 3
+
+    reused = old_idx >= 0
+    refs = update_dispatcher(reused, 2)
+    npairs = sum(
+        RMSDUpdateJob(coords, core, ref, reused, matrix, block_size=2).run()[1]
+        for core, ref in enumerate(refs)
+        )
+    assert npairs == 12
+    np.testing.assert_allclose(
+        read_condensed_matrix(matrix),
+        expected,
+        atol=5e-4,
+        )
+
+
 def test_xyzwriter(protdna_input_list):
     "test XYZWriter"
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -136,3 +309,84 @@ def test_xyzwriter(protdna_input_list):
 
         exp_content = os.linesep.join(exp_content_list) + os.linesep
         assert content == exp_content
+
+
+def test_xyzwriter_coords_store(protdna_input_list):
+    """Test XYZWriter reading from a coordinates store."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert write_coords_store(protdna_input_list, tmpdir)
+        coords_store = CoordsStore.load(tmpdir)
+        common_keys = [
+            ("A", 10, "N"),
+            ("A", 10, "CA"),
+            ("A", 32, "N"),
+            ("B", 38, "C6"),
+        ]
+        kwargs = {
+            "model_list": protdna_input_list,
+            "core": 1,
+            "n_atoms": 4,
+            "common_keys": common_keys,
+            "filter_resdic": None,
+            "allatoms": False,
+        }
+        XYZWriter(output_name=Path(tmpdir, "ref.xyz"), **kwargs).run()
+        XYZWriter(
+            output_name=Path(tmpdir, "store.xyz"),
+            coords_store=coords_store,
+            **kwargs,
+        ).run()
+
+        ref_content = Path(tmpdir, "ref.xyz").read_text()
+        assert Path(tmpdir, "store.xyz").read_text() == ref_content
+
+
+def test_load_models_coords(protdna_input_list, tmp_path):
+    """Test the coordinates store gives the coordinates of the models."""
+    common_keys = [("A", 10, "N"), ("A", 32, "CA"), ("B", 38, "C6")]
+    expected = load_models_coords(
+        Scheduler,
+        protdna_input_list,
+        [0, 1, 2],
+        common_keys,
+        None,
+    )
+    assert write_coords_store(protdna_input_list, tmp_path)
+    observed = load_models_coords(
+        Scheduler,
+        protdna_input_list,
+        [0, 2],
+        common_keys,
+        None,
+        coords_store=CoordsStore.load(tmp_path),
+    )
+    assert expected.shape == (2, 3, 3)
+    assert np.array_equal(observed, expected)
+
+
+def test_xyzwriter_binary(protdna_input_list, tmp_path):
+    """Test XYZWriter writing a binary trajectory."""
+    common_keys = [("A", 10, "N"), ("B", 38, "C6")]
+    kwargs = {
+        "model_list": protdna_input_list,
+        "core": 0,
+        "n_atoms": 2,
+        "common_keys": common_keys,
+        "filter_resdic": None,
+        "binary": True,
+    }
+    XYZWriter(output_name=Path(tmp_path, "pdb.bin"), **kwargs).run()
+    assert write_coords_store(protdna_input_list, tmp_path)
+    XYZWriter(
+        output_name=Path(tmp_path, "store.bin"),
+        coords_store=CoordsStore.load(tmp_path),
+        **kwargs,
+    ).run()
+
+    expected = [
+        [[12.163, -4.828, -1.492], [-6.564, -18.595, -5.571]],
+        [[-11.179, 7.766, -1.6], [14.422, 15.302, -5.743]],
+    ]
+    for fname in ("pdb.bin", "store.bin"):
+        observed = read_binary_traj(Path(tmp_path, fname))
+        np.testing.assert_allclose(observed, expected, rtol=1e-6)
@@ -1,6 +1,12 @@
 """Test general functions of haddock3 analysis modules."""
 
-from haddock.modules.analysis import get_analysis_exec_mode
+import os
+from pathlib import Path
+
+from haddock.modules.analysis import (
+    get_analysis_exec_mode,
+    get_previous_matrices,
+    )
 
 
 def test_get_analysis_exec_mode():
@@ -8,3 +14,17 @@ def test_get_analysis_exec_mode():
     assert get_analysis_exec_mode("local") == "local"
     assert get_analysis_exec_mode("batch") == "local"
     assert get_analysis_exec_mode("mpi") == "mpi"
+
+
+def test_get_previous_matrices(tmp_path):
+    """Test the matrices of the previous steps are found."""
+    for step in ("1_rmsdmatrix", "2_caprieval", "3_rmsdmatrix", "5_rmsdmatrix"):
+        Path(tmp_path, step).mkdir()
+        Path(tmp_path, step, "rmsd.npy").touch()
+    Path(tmp_path, "4_rmsdmatrix").mkdir()
+    os.chdir(Path(tmp_path, "4_rmsdmatrix"))
+    observed = get_previous_matrices("rmsdmatrix", "rmsd.npy")
+    assert observed == [
+        Path("..", "3_rmsdmatrix", "rmsd.npy"),
+        Path("..", "1_rmsdmatrix", "rmsd.npy"),
+        ]